@@ -6,6 +6,7 @@ import glob, sys, os
 import xarray as xr
 import time, datetime, calendar, pytz
 from pyflextrkr.ft_utilities import load_config
+from pyflextrkr.netcdf_io_pixeltracking import get_pixeltracking_store_filename, open_pixeltracking_dataset
 
 if __name__ == "__main__":
 
@@ -17,15 +18,31 @@ if __name__ == "__main__":
     # Get inputs from configuration file
     config = load_config(config_file)
     pixel_dir = config['pixeltracking_outpath']
+    pixeltracking_storage = config.get('pixeltracking_storage', 'files')
+    pixeltracking_thin = config.get('pixeltracking_thin', 0)
+    pixeltracking_cloudid_path = config.get('pixeltracking_cloudid_path', None)
     output_monthly_dir = config['stats_outpath'] + 'monthly/'
     pcpvarname = 'precipitation'
 
     # Output file name
     output_filename = f'{output_monthly_dir}mcs_rainmap_{year}{month}.nc'
 
-    # Find all pixel files in a month
-    mcsfiles = sorted(glob.glob(f'{pixel_dir}/mcstrack_{year}{month}*_*.nc'))
-    nfiles = len(mcsfiles)
+    # Compute Epoch Time for the month
+    months = np.zeros(1, dtype=int)
+    months[0] = calendar.timegm(datetime.datetime(int(year), int(month), 1, 0, 0, 0, tzinfo=pytz.UTC).timetuple())
+
+    if pixeltracking_storage == 'store':
+        # Select times in the month from the pixel-level store
+        nextmonth = calendar.timegm((datetime.datetime(int(year), int(month), 1, tzinfo=pytz.UTC) +
+                                     datetime.timedelta(days=32)).replace(day=1).timetuple())
+        store_file = get_pixeltracking_store_filename(config, pixel_dir, config['pixeltracking_filebase'])
+        ds = open_pixeltracking_dataset(store_file, start_basetime=months[0], end_basetime=nextmonth - 1,
+                                        cloudid_path=pixeltracking_cloudid_path)
+        nfiles = ds.sizes['time']
+    else:
+        # Find all pixel files in a month
+        mcsfiles = sorted(glob.glob(f'{pixel_dir}/mcstrack_{year}{month}*_*.nc'))
+        nfiles = len(mcsfiles)
     print(pixel_dir)
     print(year, month)
     print('Number of files: ', nfiles)
@@ -33,12 +50,19 @@ if __name__ == "__main__":
 
     if nfiles > 0:
 
-        # Read and concatinate data
-        ds = xr.open_mfdataset(mcsfiles, concat_dim='time', combine='nested')
-        print('Finish reading input files.')
+        if (pixeltracking_storage == 'store') | (pixeltracking_thin == 1):
+            if pixeltracking_storage != 'store':
+                # Join thin pixel files with their cloudid files
+                ds = open_pixeltracking_dataset(mcsfiles, cloudid_path=pixeltracking_cloudid_path)
+            longitude = ds['longitude']
+            latitude = ds['latitude']
+        else:
+            # Read and concatinate data
+            ds = xr.open_mfdataset(mcsfiles, concat_dim='time', combine='nested')
+            print('Finish reading input files.')
+            longitude = ds['longitude'].isel(time=0)
+            latitude = ds['latitude'].isel(time=0)
         ntimes = ds.sizes['time']
-        longitude = ds['longitude'].isel(time=0)
-        latitude = ds['latitude'].isel(time=0)
 
         # Sum MCS counts over time to get number of hours
         mcscloudct = (ds['cloudtracknumber'] > 0).sum(dim='time')
@@ -64,10 +88,6 @@ if __name__ == "__main__":
         # # Sum MCS PF counts overtime to get number of hours
         # mcspcpct = mcspcpmask.sum(dim='time')
 
-        # Compute Epoch Time for the month
-        months = np.zeros(1, dtype=int)
-        months[0] = calendar.timegm(datetime.datetime(int(year), int(month), 1, 0, 0, 0, tzinfo=pytz.UTC).timetuple())
-
         ############################################################################
         # Write output file
         var_dict = {
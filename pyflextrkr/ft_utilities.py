@@ -70,7 +70,9 @@ def load_config(config_file):
                             config["startdate"] + "_" + config["enddate"] + "/"
     cloudid_filebase = "cloudid_"
     singletrack_filebase = "track_"
+    tracklinks_filebase = "tracklinks_"
     tracknumbers_filebase = "tracknumbers_"
+    trackstate_filebase = "trackstate_"
     trackstats_filebase = "trackstats_"
     trackstats_sparse_filebase = "trackstats_sparse_"
 
@@ -94,7 +96,9 @@ def load_config(config_file):
             "pixeltracking_outpath": pixeltracking_outpath,
             "cloudid_filebase": cloudid_filebase,
             "singletrack_filebase": singletrack_filebase,
+            "tracklinks_filebase": tracklinks_filebase,
             "tracknumbers_filebase": tracknumbers_filebase,
+            "trackstate_filebase": trackstate_filebase,
             "trackstats_filebase": trackstats_filebase,
             "trackstats_sparse_filebase": trackstats_sparse_filebase,
             "trackstats_dense_netcdf": trackstats_dense_netcdf,
@@ -543,6 +547,271 @@ def load_sparse_trackstats(
     return ds_1d, sparse_attrs_dict, sparse_dict
 
 
+def expand_index_ranges(starts, counts):
+    """
+    Concatenate index ranges [starts, starts + counts) into a single array.
+
+    Args:
+        starts: np.array
+            Start index of each range.
+        counts: np.array
+            Number of indices in each range.
+
+    Returns:
+        indices: np.array
+            Concatenated indices of all ranges.
+    """
+    counts = np.asarray(counts, dtype=np.int64)
+    range_offsets = np.repeat(np.cumsum(counts) - counts, counts)
+    indices = np.repeat(np.asarray(starts, dtype=np.int64), counts) + np.arange(0, counts.sum()) - range_offsets
+    return indices
+
+
+def get_continuous_periods(rows, cols, gap):
+    """
+    Group indices into continuous periods along the columns of each row, allowing gaps.
+
+    Args:
+        rows: np.array
+            Row (e.g., track) index of each value, sorted.
+        cols: np.array
+            Column (e.g., time) index of each value, sorted within each row.
+        gap: int
+            Maximum column index difference allowed within a period.
+
+    Returns:
+        period_id: np.array
+            Period number of each value.
+        period_starts: np.array
+            Position of the first value of each period.
+        period_ends: np.array
+            Position of the last value of each period.
+    """
+    # A new period starts at a new row or a gap larger than allowed
+    newperiod = np.ones(len(rows), dtype=bool)
+    newperiod[1:] = (rows[1:] != rows[:-1]) | (np.diff(cols) > gap)
+    period_starts = np.where(newperiod)[0]
+    period_ends = np.append(period_starts[1:], len(rows)) - 1
+    period_id = np.cumsum(newperiod) - 1
+    return period_id, period_starts, period_ends
+
+
+def get_mergesplit_index(parent_tracknumber, ntracks):
+    """
+    Build an inverted index of child tracks for each parent track number (CSR style).
+
+    Child tracks of parent track number n are index_children[index_offsets[n]:index_offsets[n+1]],
+    sorted by child track index.
+
+    Args:
+        parent_tracknumber: np.array
+            Parent track number of each track (e.g., end_merge_tracknumber, start_split_tracknumber).
+        ntracks: int
+            Number of tracks.
+
+    Returns:
+        index_offsets: np.array
+            Offsets of each parent track number into index_children, size ntracks + 2.
+        index_children: np.array
+            Child track indices sorted by parent track number.
+    """
+    parent_tracknumber = np.asarray(parent_tracknumber).astype(np.int64)
+    valid = (parent_tracknumber > 0) & (parent_tracknumber <= ntracks)
+    index_children = np.where(valid)[0]
+    # Stable sort keeps the child track indices in ascending order for each parent
+    index_children = index_children[np.argsort(parent_tracknumber[index_children], kind="stable")]
+    counts = np.bincount(parent_tracknumber[index_children], minlength=ntracks + 1)
+    index_offsets = np.concatenate(([0], np.cumsum(counts)))
+    return index_offsets, index_children
+
+
+def get_mergesplit_children(
+        parent_idx,
+        index_offsets,
+        index_children,
+        child_mask,
+        basetime,
+        child_vars,
+        nmaxmerge,
+        max_trackduration,
+        fillval,
+        fillval_f,
+):
+    """
+    Gather merging/splitting child track values at the matching times of the parent tracks.
+
+    Child values at each parent time are ordered by child track index and time,
+    only the first nmaxmerge are saved.
+
+    Args:
+        parent_idx: np.array
+            Parent track indices.
+        index_offsets: np.array
+            Inverted index offsets from get_mergesplit_index.
+        index_children: np.array
+            Inverted index child tracks from get_mergesplit_index.
+        child_mask: np.array
+            Boolean flag of each track that can be a child (e.g., short duration and not a parent track).
+        basetime: scipy.sparse.csr_matrix
+            Track base time sparse array.
+        child_vars: dictionary
+            Dictionary containing track sparse array values to gather, aligned with basetime.data.
+        nmaxmerge: int
+            Maximum number of children saved at each parent time.
+        max_trackduration: int
+            Maximum number of times in a track.
+        fillval: int
+            Missing value for integer variables.
+        fillval_f: float
+            Missing value for float variables.
+
+    Returns:
+        out_dict: dictionary
+            Dictionary containing gathered variables, dimensions (nparents, max_trackduration, nmaxmerge).
+        nchildren: np.array
+            Number of children at each parent time, dimensions (nparents, max_trackduration).
+    """
+    nparents = len(parent_idx)
+    out_dict = {}
+    for key, value in child_vars.items():
+        if np.issubdtype(value.dtype, np.floating):
+            out_dict[key] = np.full((nparents, max_trackduration, nmaxmerge), fillval_f, dtype=np.float32)
+        else:
+            out_dict[key] = np.full((nparents, max_trackduration, nmaxmerge), fillval, dtype=np.int32)
+    nchildren = np.zeros((nparents, max_trackduration), dtype=np.int64)
+
+    # Child tracks of each parent
+    parent_tracknumber = np.asarray(parent_idx, dtype=np.int64) + 1
+    counts = index_offsets[parent_tracknumber + 1] - index_offsets[parent_tracknumber]
+    child_parent = np.repeat(np.arange(0, nparents), counts)
+    child_idx = index_children[expand_index_ranges(index_offsets[parent_tracknumber], counts)]
+    keep = child_mask[child_idx]
+    child_parent = child_parent[keep]
+    child_idx = child_idx[keep]
+
+    # Sparse values of the child and parent tracks
+    indptr = basetime.indptr
+    ncounts = indptr[child_idx + 1] - indptr[child_idx]
+    child_pos = expand_index_ranges(indptr[child_idx], ncounts)
+    child_parent = np.repeat(child_parent, ncounts)
+    pcounts = indptr[parent_idx + 1] - indptr[parent_idx]
+    parent_pos = expand_index_ranges(indptr[parent_idx], pcounts)
+    parent_row = np.repeat(np.arange(0, nparents), pcounts)
+    if (len(child_pos) == 0) | (len(parent_pos) == 0):
+        return out_dict, nchildren
+
+    # Match child base time with parent base time, using (parent, base time rank) as the key
+    bt_unique, bt_rank = np.unique(
+        np.concatenate((basetime.data[parent_pos], basetime.data[child_pos])), return_inverse=True,
+    )
+    nbt = len(bt_unique)
+    parent_key = parent_row * nbt + bt_rank[:len(parent_pos)]
+    child_key = child_parent * nbt + bt_rank[len(parent_pos):]
+    key_order = np.argsort(parent_key, kind="stable")
+    loc = np.minimum(np.searchsorted(parent_key[key_order], child_key), len(parent_key) - 1)
+    match = parent_key[key_order][loc] == child_key
+    child_pos = child_pos[match]
+    child_parent = child_parent[match]
+    child_time = basetime.indices[parent_pos[key_order[loc[match]]]]
+
+    # Position of each child at the parent time, in order of child track and time
+    order = np.lexsort((child_time, child_parent))
+    child_pos = child_pos[order]
+    child_parent = child_parent[order]
+    child_time = child_time[order]
+    np.add.at(nchildren, (child_parent, child_time), 1)
+    newgroup = np.ones(len(child_pos), dtype=bool)
+    newgroup[1:] = (child_parent[1:] != child_parent[:-1]) | (child_time[1:] != child_time[:-1])
+    group_start = np.maximum.accumulate(np.where(newgroup, np.arange(0, len(child_pos)), 0))
+    child_rank = np.arange(0, len(child_pos)) - group_start
+    save = child_rank < nmaxmerge
+    for key, value in child_vars.items():
+        out_dict[key][child_parent[save], child_time[save], child_rank[save]] = value[child_pos[save]]
+    return out_dict, nchildren
+
+
+def get_label_pixel_index(labelmap):
+    """
+    Build an index of pixels for each label number in a 2D label map (CSR style).
+
+    Pixels of label number n are pixel_flatindex[pixel_offsets[n]:pixel_offsets[n+1]],
+    in the same (row-major) order as np.where(labelmap == n).
+
+    Args:
+        labelmap: np.array
+            2D label map, labels <= 0 are ignored.
+
+    Returns:
+        pixel_offsets: np.array
+            Offsets of each label number into pixel_flatindex, size max label + 2.
+        pixel_flatindex: np.array
+            Flat pixel indices sorted by label number.
+    """
+    flatlabel = labelmap.ravel()
+    pixel_flatindex = np.flatnonzero(flatlabel > 0)
+    labels = flatlabel[pixel_flatindex].astype(np.int64)
+    # Stable sort keeps the pixels in row-major order for each label
+    order = np.argsort(labels, kind="stable")
+    pixel_flatindex = pixel_flatindex[order]
+    counts = np.bincount(labels, minlength=1)
+    pixel_offsets = np.concatenate(([0], np.cumsum(counts), [counts.sum()]))
+    return pixel_offsets, pixel_flatindex
+
+
+def get_label_pixels(pixel_offsets, pixel_flatindex, label_numbers, xdim):
+    """
+    Get pixel locations of label numbers from the index built by get_label_pixel_index.
+
+    Args:
+        pixel_offsets: np.array
+            Offsets of each label number into pixel_flatindex.
+        pixel_flatindex: np.array
+            Flat pixel indices sorted by label number.
+        label_numbers: int or np.array
+            Label numbers, pixels are concatenated in the order of the label numbers.
+        xdim: int
+            Label map dimension in x-direction.
+
+    Returns:
+        locationy: np.array
+            Pixel location indices in y-direction.
+        locationx: np.array
+            Pixel location indices in x-direction.
+    """
+    label_numbers = np.atleast_1d(label_numbers).astype(np.int64)
+    # Labels outside of the index have no pixels
+    label_numbers = np.clip(label_numbers, 0, len(pixel_offsets) - 2)
+    flatindex = pixel_flatindex[
+        expand_index_ranges(pixel_offsets[label_numbers], np.diff(pixel_offsets)[label_numbers])
+    ]
+    return flatindex // xdim, flatindex % xdim
+
+
+def get_local_map(data, locationy, locationx, miny, maxy, minx, maxx, fillval=np.nan):
+    """
+    Get a subset of a 2D field within a bounding box, keeping only the given pixel locations.
+
+    Args:
+        data: np.array
+            2D field.
+        locationy: np.array
+            Pixel location indices in y-direction.
+        locationx: np.array
+            Pixel location indices in x-direction.
+        miny, maxy, minx, maxx: int
+            Bounding box [miny:maxy, minx:maxx] containing the pixels.
+        fillval: float, optional. Default: np.nan.
+            Value outside of the pixel locations.
+
+    Returns:
+        local_map: np.array
+            Float subset of the field, shape (maxy - miny, maxx - minx).
+    """
+    local_map = np.full((maxy - miny, maxx - minx), fillval, dtype=float)
+    local_map[locationy - miny, locationx - minx] = data[locationy, locationx]
+    return local_map
+
+
 def convert_trackstats_sparse2dense(
         filename_sparse,
         filename_dense,
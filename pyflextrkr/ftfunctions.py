@@ -2,6 +2,7 @@ import numpy as np
 from collections import deque
 from skimage.segmentation import watershed
 from skimage.feature import peak_local_max
+from skimage.measure import regionprops_table
 
 def sort_renumber(
     labelcell_number2d,
@@ -217,6 +218,172 @@ def sort_renumber2vars(
     )
 
 
+def get_label_pixels_sorted(labelmap, nlabels):
+    """
+    Get pixels of labels 1 to nlabels and their label index, for batched statistics of all labels.
+
+    Args:
+        labelmap: np.ndarray()
+            Labeled feature number array in 2D.
+        nlabels: int
+            Number of labels to get, larger labels are ignored.
+
+    Returns:
+        label_idx: np.ndarray(int)
+            Label index (label number - 1) of each pixel.
+        pixy: np.ndarray(int)
+            Pixel location indices in y-direction.
+        pixx: np.ndarray(int)
+            Pixel location indices in x-direction.
+    """
+    pixy, pixx = np.nonzero((labelmap > 0) & (labelmap <= nlabels))
+    label_idx = labelmap[pixy, pixx].astype(int) - 1
+    return label_idx, pixy, pixx
+
+
+def label_nanmean(values, label_idx, nlabels):
+    """
+    Mean of values for each label ignoring NaN (NaN if a label has no valid value).
+
+    Args:
+        values: np.ndarray()
+            Values of each pixel.
+        label_idx: np.ndarray(int)
+            Label index of each pixel.
+        nlabels: int
+            Number of labels.
+
+    Returns:
+        mean: np.ndarray(float)
+            Mean value of each label.
+    """
+    valid = ~np.isnan(values)
+    total = np.bincount(label_idx[valid], weights=values[valid], minlength=nlabels)
+    count = np.bincount(label_idx[valid], minlength=nlabels)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return total / count
+
+
+def label_nanmax(values, label_idx, nlabels):
+    """
+    Maximum of values for each label ignoring NaN (NaN if a label has no valid value).
+
+    Args:
+        values: np.ndarray()
+            Values of each pixel.
+        label_idx: np.ndarray(int)
+            Label index of each pixel.
+        nlabels: int
+            Number of labels.
+
+    Returns:
+        maximum: np.ndarray(float)
+            Maximum value of each label.
+    """
+    maximum = np.full(nlabels, np.nan, dtype=float)
+    np.fmax.at(maximum, label_idx, values)
+    return maximum
+
+
+def label_skewness(values, label_idx, nlabels):
+    """
+    Skewness (biased, same as scipy.stats.skew) of values for each label.
+
+    Args:
+        values: np.ndarray()
+            Values of each pixel, without NaN.
+        label_idx: np.ndarray(int)
+            Label index of each pixel.
+        nlabels: int
+            Number of labels.
+
+    Returns:
+        skewness: np.ndarray(float)
+            Skewness of each label, NaN if the values of a label are constant.
+    """
+    count = np.bincount(label_idx, minlength=nlabels)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = np.bincount(label_idx, weights=values, minlength=nlabels) / count
+        anomaly = values - mean[label_idx]
+        m2 = np.bincount(label_idx, weights=anomaly**2, minlength=nlabels) / count
+        m3 = np.bincount(label_idx, weights=anomaly**3, minlength=nlabels) / count
+        zero = m2 <= (np.finfo(float).eps * mean)**2
+        skewness = np.where(zero, np.nan, m3 / m2**1.5)
+    return skewness
+
+
+def label_shape_stats(labelmap, nlabels, intensity_image):
+    """
+    Calculate shape statistics of labels 1 to nlabels in a single regionprops_table pass.
+
+    Args:
+        labelmap: np.ndarray()
+            Labeled feature number array in 2D.
+        nlabels: int
+            Number of labels to calculate, larger labels are ignored.
+        intensity_image: np.ndarray()
+            Intensity image for the weighted centroid, must not contain NaN.
+
+    Returns:
+        shape_stats: dictionary
+            Dictionary containing arrays of each label (in pixel units, orientation in radian):
+            eccentricity, major_axis_length, minor_axis_length, orientation, perimeter,
+            centroid-0, centroid-1, weighted_centroid-0, weighted_centroid-1.
+    """
+    properties = [
+        "eccentricity", "major_axis_length", "minor_axis_length", "orientation", "perimeter",
+        "centroid", "weighted_centroid",
+    ]
+    _labelmap = np.where(labelmap <= nlabels, labelmap, 0)
+    props = regionprops_table(_labelmap, intensity_image=intensity_image, properties=["label"] + properties)
+    # Place the statistics by label, labels without pixels are NaN
+    shape_stats = {}
+    for key, values in props.items():
+        if key != "label":
+            shape_stats[key] = np.full(nlabels, np.nan, dtype=float)
+            shape_stats[key][props["label"] - 1] = values
+    return shape_stats
+
+
+def get_centroid_lonlat(ycentroid, xcentroid, miny, minx, lon, lat, fillval_f):
+    """
+    Get lat/lon at centroid locations of features within a subset region.
+
+    Args:
+        ycentroid: np.ndarray(float)
+            Centroid y-location within the subset region.
+        xcentroid: np.ndarray(float)
+            Centroid x-location within the subset region.
+        miny: int
+            Subset region start index in y-direction.
+        minx: int
+            Subset region start index in x-direction.
+        lon: np.ndarray()
+            Longitude of the full image.
+        lat: np.ndarray()
+            Latitude of the full image.
+        fillval_f: float
+            Missing value for centroids outside of the full image.
+
+    Returns:
+        centroid_lon: np.ndarray(float)
+            Longitude at the centroids.
+        centroid_lat: np.ndarray(float)
+            Latitude at the centroids.
+    """
+    ny, nx = lon.shape
+    centroid_lon = np.full(len(ycentroid), fillval_f, dtype=float)
+    centroid_lat = np.full(len(ycentroid), fillval_f, dtype=float)
+    # Round the centroid values as indices in the full image
+    ivalid = np.where(~np.isnan(ycentroid) & ~np.isnan(xcentroid))[0]
+    yidx = np.round(ycentroid[ivalid] + miny).astype(int)
+    xidx = np.round(xcentroid[ivalid] + minx).astype(int)
+    inside = (0 < yidx) & (yidx < ny) & (0 < xidx) & (xidx < nx)
+    centroid_lon[ivalid[inside]] = lon[yidx[inside], xidx[inside]]
+    centroid_lat[ivalid[inside]] = lat[yidx[inside], xidx[inside]]
+    return centroid_lon, centroid_lat
+
+
 def link_pf_tb(
     convcold_cloudnumber,
     cloudnumber,
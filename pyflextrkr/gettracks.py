@@ -3,9 +3,15 @@ import time
 import sys
 import os
 from netCDF4 import Dataset
-import xarray as xr
 import logging
+import dask
+from dask.distributed import wait
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components, breadth_first_order
 from pyflextrkr.ft_utilities import subset_files_timerange
+from pyflextrkr.netcdf_io_tracklinks import read_tracklinks_store, get_tracklinks_filename, get_pair_link_index
+from pyflextrkr.netcdf_io_tracknumbers import ragged_varnames, read_tracknumbers, write_tracknumbers, \
+    read_tracknumbers_state, write_tracknumbers_state
 
 def gettracknumbers(config):
     """
@@ -33,6 +39,19 @@ def gettracknumbers(config):
     start_basetime = config["start_basetime"]
     end_basetime = config["end_basetime"]
     fillval = config["fillval"]
+    tracklinks_store = config.get("tracklinks_store", 0)
+    # Method to resolve links in each pair: 'loop' (default), 'graph'
+    gettracks_method = config.get("gettracks_method", "loop")
+    run_parallel = config.get("run_parallel", 0)
+    # Track numbers storage: 'dense' (default, files by maxnclouds), 'ragged' (per-file offsets + flat arrays)
+    tracknumbers_storage = config.get("tracknumbers_storage", "dense")
+    trackstate_filebase = config.get("trackstate_filebase", "trackstate_")
+    # Save the tail state after the last file, to extend the run later in append mode
+    save_track_state = config.get("save_track_state", 0)
+    # Extend a previous run from its saved tail state
+    append_mode = config.get("append_mode", 0)
+    # Write the track number counter of each file (used to stitch time partitions)
+    write_track_counter = config.get("write_track_counter", 0)
 
     logger = logging.getLogger(__name__)
     np.set_printoptions(threshold=np.inf)
@@ -40,15 +59,64 @@ def gettracknumbers(config):
 
     # Set track numbers output file name
     tracknumbers_outfile = f"{stats_outpath}{tracknumbers_filebase}{startdate}_{enddate}.nc"
+    # Set tail state file name (one per start date, updated by each appended run)
+    trackstate_file = f"{stats_outpath}{trackstate_filebase}tracknumbers_{startdate}.nc"
+
+    nfiles_prev = 0
+    if append_mode == 1:
+        tail_state = read_tracknumbers_state(trackstate_file)
+        nfiles_prev = tail_state["nfiles"]
+        logger.info(f"Appending to previous run: {tail_state['tracknumbers_file']}")
+        # Only track files after the last file of the previous run
+        start_basetime = tail_state["basetime"] + 1
+        if tracknumbers_storage != "ragged":
+            logger.info("Append mode writes track numbers in ragged storage")
+            tracknumbers_storage = "ragged"
+
+    if tracklinks_store == 1:
+        # Read all pairs from the consolidated link store
+        link_store_file = get_tracklinks_filename(config)
+        logger.info(f"Reading link store: {link_store_file}")
+        pair_list = read_tracklinks_store(link_store_file, start_basetime, end_basetime, fillval)
+        files = [pairdata["new_date"] for pairdata in pair_list]
+    else:
+        # Identify files to process
+        files, \
+        files_basetime, \
+        files_datestring, \
+        files_timestring = subset_files_timerange(tracking_outpath,
+                                                  singletrack_filebase,
+                                                  start_basetime,
+                                                  end_basetime)
+
+    if len(files) == 0:
+        if append_mode == 1:
+            logger.info("No new files to append")
+            return tail_state["tracknumbers_file"]
+        logger.warning(f"No single track files found between {startdate} and {enddate}")
+        return None
 
-    # Identify files to process
-    files, \
-    files_basetime, \
-    files_datestring, \
-    files_timestring = subset_files_timerange(tracking_outpath,
-                                              singletrack_filebase,
-                                              start_basetime,
-                                              end_basetime)
+    ############################################################################
+    # Two-phase tracking with the graph method in parallel:
+    # Phase 1 resolves links of all pairs in parallel,
+    # Phase 2 (loop below) sequentially assigns track numbers and reset flags.
+    if (gettracks_method == "graph") & (run_parallel >= 1):
+        logger.info("Resolving links of all pairs in parallel")
+        results = []
+        for ifile in range(0, len(files)):
+            if tracklinks_store == 1:
+                result = dask.delayed(get_pair_links)(
+                    pair_list[ifile], None, tracking_outpath, featuresize_varname,
+                )
+            else:
+                result = dask.delayed(get_pair_links)(
+                    None, files[ifile], tracking_outpath, featuresize_varname,
+                )
+            results.append(result)
+        final_result = dask.compute(*results)
+        wait(final_result)
+        pair_list = list(final_result)
+        tracklinks_store = 1
 
     ############################################################################
     # Initialize matrices
@@ -57,53 +125,98 @@ def gettracknumbers(config):
 
     fillval_f = np.nan
     missingfrac = 0.3
-    nfiles_m = int(nfiles*(1.+missingfrac))
-    tracknumber = np.full((1, nfiles_m, maxnclouds), fillval, dtype=int)
-    referencetrackstatus = np.full((nfiles_m, maxnclouds), fillval_f, dtype=float)
-    newtrackstatus = np.full((nfiles_m, maxnclouds), fillval_f, dtype=float)
-    trackstatus = np.full((1, nfiles_m, maxnclouds), fillval, dtype=int)
-    trackmergenumber = np.full((1, nfiles_m, maxnclouds), fillval, dtype=int)
-    tracksplitnumber = np.full((1, nfiles_m, maxnclouds), fillval, dtype=int)
+    # Add the first reference file and one data gap for short periods
+    nfiles_m = int(nfiles*(1.+missingfrac)) + 2 + nfiles_prev
+    if tracknumbers_storage == "ragged":
+        # Rolling buffer holding the reference file, the new file and one extra file for a data gap.
+        # Completed files are moved from the buffer to the ragged arrays.
+        nrows = 3
+    else:
+        nrows = nfiles_m
+    # Index of the first buffer row in the output files
+    row0 = 0
+    tracknumber = np.full((1, nrows, maxnclouds), fillval, dtype=int)
+    referencetrackstatus = np.full((nrows, maxnclouds), fillval_f, dtype=float)
+    newtrackstatus = np.full((nrows, maxnclouds), fillval_f, dtype=float)
+    trackstatus = np.full((1, nrows, maxnclouds), fillval, dtype=int)
+    trackmergenumber = np.full((1, nrows, maxnclouds), fillval, dtype=int)
+    tracksplitnumber = np.full((1, nrows, maxnclouds), fillval, dtype=int)
     basetime = np.empty(nfiles_m, dtype="datetime64[s]")
-    trackreset = np.full((1, nfiles_m, maxnclouds), fillval, dtype=int)
+    trackreset = np.full((1, nrows, maxnclouds), fillval, dtype=int)
+    # Number of clouds in each file and the ragged track arrays
+    nclouds_files = np.zeros(nfiles_m, dtype=np.int32)
+    ragged_data = {varname: [] for varname in ragged_varnames}
+    # Track number counter before the tracks starting in each file are created
+    track_counter = np.zeros(nfiles_m, dtype=np.int64)
 
     ############################################################################
     # Load first file
-    logger.debug("Processing first file")
-    logger.debug(f"tracking_outpath: {tracking_outpath}")
-    logger.debug(f"files[0]: {files[0]}")
-    # singletracking_data = Dataset(tracking_outpath + files[0], "r")
-    singletracking_data = Dataset(files[0], "r")
+    if append_mode == 1:
+        # Start from the last file of the previous run.
+        # Files before it are final, the last file is kept in the buffer to be updated.
+        logger.debug("Loading previous run")
+        prev_data = read_tracknumbers(tail_state["tracknumbers_file"])
+        file_offsets_prev = prev_data["file_offsets"]
+        row0 = nfiles_prev - 1
+
+        strlength = len(tail_state["cloudid_file"])
+        cloudidfiles = np.chararray((nfiles_m, int(strlength)))
+        cloudidfiles[0:nfiles_prev, :] = prev_data["cloudid_files"]
+        basetime[0:nfiles_prev] = prev_data["basetimes"].astype("datetime64[s]")
+        nclouds_files[0:nfiles_prev] = np.diff(file_offsets_prev)
+        for varname in ragged_varnames:
+            ragged_data[varname].append(prev_data[varname][0:file_offsets_prev[row0]])
+        if "track_counter" in prev_data:
+            track_counter[0:nfiles_prev] = prev_data["track_counter"]
+
+        # Restore the track matrices of the last file
+        nclouds_reference = nclouds_files[row0]
+        tracknumber[0, 0, 0:nclouds_reference] = tail_state["track_numbers"]
+        newtrackstatus[0, 0:nclouds_reference] = tail_state["new_track_status"]
+        trackmergenumber[0, 0, 0:nclouds_reference] = tail_state["track_mergenumbers"]
+        tracksplitnumber[0, 0, 0:nclouds_reference] = tail_state["track_splitnumbers"]
+        trackreset[0, 0, 0:nclouds_reference] = tail_state["track_reset"]
+        itrack = tail_state["ntracks"]
+        time_prev = tail_state["basetime"]
+    else:
+        logger.debug("Processing first file")
+        logger.debug(f"tracking_outpath: {tracking_outpath}")
+        logger.debug(f"files[0]: {files[0]}")
+        if tracklinks_store == 1:
+            pairdata = pair_list[0]
+        else:
+            pairdata = load_singletrack_pair(files[0], tracking_outpath, featuresize_varname)
 
-    # Number of clouds in reference file
-    nclouds_reference = int(np.nanmax(singletracking_data["nclouds_ref"][:]) + 1)
-    basetime_ref = singletracking_data["basetime_ref"][:]
-    ref_file = f"{tracking_outpath}{singletracking_data.getncattr('ref_file')}"
-    singletracking_data.close()
+        # Number of clouds in reference file
+        nclouds_reference = pairdata["nclouds_ref"]
+        basetime_ref = pairdata["basetime_ref"]
+        ref_file = f"{tracking_outpath}{pairdata['ref_file']}"
 
-    # Make sure number of clouds does not exceed maximum.
-    if nclouds_reference > maxnclouds:
-        logger.critical(f"Error: Number of clouds in reference file exceed allowed maximum number of clouds")
-        logger.critical(f"nclouds_reference: {nclouds_reference}, nmaxclouds: {maxnclouds}")
-        logger.critical("Increase maxnclouds in the config file.")
-        sys.exit("Code exits in gettracks.py")
+        # Make sure number of clouds does not exceed maximum.
+        if nclouds_reference > maxnclouds:
+            logger.critical(f"Error: Number of clouds in reference file exceed allowed maximum number of clouds")
+            logger.critical(f"nclouds_reference: {nclouds_reference}, nmaxclouds: {maxnclouds}")
+            logger.critical("Increase maxnclouds in the config file.")
+            sys.exit("Code exits in gettracks.py")
 
-    # Isolate file name and add it to the filelist
-    basetime[0] = basetime_ref.item()
+        # Isolate file name and add it to the filelist
+        basetime[0] = basetime_ref.item()
+        nclouds_files[0] = nclouds_reference
 
-    temp_referencefile = os.path.basename(ref_file)
-    strlength = len(temp_referencefile)
-    cloudidfiles = np.chararray((nfiles_m, int(strlength)))
-    cloudidfiles[0, :] = list(os.path.basename(ref_file))
+        temp_referencefile = os.path.basename(ref_file)
+        strlength = len(temp_referencefile)
+        cloudidfiles = np.chararray((nfiles_m, int(strlength)))
+        cloudidfiles[0, :] = list(os.path.basename(ref_file))
 
-    # Initate track numbers
-    tracknumber[0, 0, 0 : int(nclouds_reference)] = (
-        np.arange(0, int(nclouds_reference)) + 1
-    )
-    itrack = nclouds_reference + 1
+        # Initate track numbers
+        tracknumber[0, 0, 0 : int(nclouds_reference)] = (
+            np.arange(0, int(nclouds_reference)) + 1
+        )
+        itrack = nclouds_reference + 1
+        track_counter[0] = 1
 
-    # Record that the tracks are being reset / initialized
-    trackreset[0, 0, :] = 1
+        # Record that the tracks are being reset / initialized
+        trackreset[0, 0, :] = 1
 
     ###########################################################################
     # Loop over files and generate tracks
@@ -116,29 +229,28 @@ def gettracknumbers(config):
         logger.info(os.path.basename(files[ifile]))
 
         ######################################################################
-        # Load single track file
-        # logger.debug('Load track data')
-        # logger.debug((time.ctime()))
-        # singletracking_data = Dataset(tracking_outpath + files[ifile], "r")
-        singletracking_data = Dataset(files[ifile], "r")
+        # Load single track data
+        if tracklinks_store == 1:
+            pairdata = pair_list[ifile]
+        else:
+            pairdata = load_singletrack_pair(files[ifile], tracking_outpath, featuresize_varname)
         # Number of clouds in reference file
-        nclouds_reference = int(np.nanmax(singletracking_data["nclouds_ref"][:]) + 1)
-        nclouds_new = int(np.nanmax(singletracking_data["nclouds_new"][:]) + 1)
-        basetime_ref = singletracking_data["basetime_ref"][:]
-        basetime_new = singletracking_data["basetime_new"][:]
+        nclouds_reference = pairdata["nclouds_ref"]
         # Number of clouds in new file
-        refcloud_forward_index = singletracking_data["refcloud_forward_index"][:].astype(int)
-        # Each row represents a cloud in the reference file and
+        nclouds_new = pairdata["nclouds_new"]
+        basetime_ref = pairdata["basetime_ref"]
+        basetime_new = pairdata["basetime_new"]
+        # refcloud_forward_index: each row represents a cloud in the reference file and
         # the numbers in that row are indices of clouds in new file linked that cloud in the reference file
-        newcloud_backward_index = singletracking_data["newcloud_backward_index"][:].astype(int)
-        # Each row represents a cloud in the new file and
+        # newcloud_backward_index: each row represents a cloud in the new file and
         # the numbers in that row are indices of clouds in the reference file linked that cloud in the new file
-        ref_file = f"{tracking_outpath}{singletracking_data.getncattr('ref_file')}"
-        new_file = f"{tracking_outpath}{singletracking_data.getncattr('new_file')}"
-        ref_date = f"{singletracking_data.getncattr('ref_date')}"
-        new_date = f"{singletracking_data.getncattr('new_date')}"
-
-        singletracking_data.close()
+        refcloud_forward_index, newcloud_backward_index = get_pair_link_index(pairdata)
+        ref_file = f"{tracking_outpath}{pairdata['ref_file']}"
+        new_file = f"{tracking_outpath}{pairdata['new_file']}"
+        ref_date = pairdata["ref_date"]
+        new_date = pairdata["new_date"]
+        npix_reference = pairdata["npix_reference"]
+        npix_new = pairdata["npix_new"]
 
         # Make sure number of clouds does not exceed maximum
         if nclouds_reference > maxnclouds:
@@ -147,20 +259,6 @@ def gettracknumbers(config):
             logger.critical("Increase maxnclouds in the config file.")
             sys.exit("Code exits in gettracks.py")
 
-        ########################################################################
-        # Load cloudid files
-        # logger.debug('Load cloudid files')
-        # logger.debug((time.ctime()))
-        # Reference cloudid file
-        referencecloudid_data = Dataset(ref_file, "r")
-        npix_reference = referencecloudid_data[featuresize_varname][:]
-        referencecloudid_data.close()
-
-        # New cloudid file
-        newcloudid_data = Dataset(new_file, "r")
-        npix_new = newcloudid_data[featuresize_varname][:]
-        newcloudid_data.close()
-
         # Remove possible extra time dimension to make sure npix is a 1D array
         # npix_reference = npix_reference.squeeze()
         # npix_new = npix_new.squeeze()
@@ -171,18 +269,20 @@ def gettracknumbers(config):
         # logger.debug((time.ctime()))
 
         # Set previous and new times
-        if ifile < 1:
+        if (ifile < 1) & (append_mode == 0):
             time_prev = np.copy(basetime_new[0])
 
         time_new = np.copy(basetime_new[0])
 
         # Check if files immediately follow each other. Missing files can exist.
         # If missing files exist need to increment track numbers
-        if ifile > 0:
+        if (ifile > 0) | (append_mode == 1):
             time_diff = np.array([time_new - time_prev]).astype(float)
+            # In append mode the first pair must start from the last file of the previous run
+            ref_mismatch = (ifile == 0) & (append_mode == 1) & (basetime_ref[0] != time_prev)
             # Convert timegap from [hour] to [second]
             # if time_diff > (timegap * 3.6 * 10 ** 12):
-            if time_diff > (timegap * 3600):
+            if (time_diff > (timegap * 3600)) | ref_mismatch:
                 logger.info(f"Track terminates on: {ref_date}")
                 logger.info(f"Time difference: {time_diff}")
                 logger.info(f"Maximum timegap allowed: {timegap * 3600}")
@@ -196,251 +296,324 @@ def gettracknumbers(config):
                 ifill = ifill + 1
 
                 # Fill tracking matrices with reference data and record that the track ended
-                cloudidfiles[ifill, :] = list(os.path.basename(ref_file))
-                basetime[ifill] = basetime_ref.item()
+                cloudidfiles[row0 + ifill, :] = list(os.path.basename(ref_file))
+                basetime[row0 + ifill] = basetime_ref.item()
+                nclouds_files[row0 + ifill] = nclouds_reference
 
                 # Record that break in data occurs
                 trackreset[0, ifill, :] = 1
 
                 # Treat all clouds in the reference file as new clouds
-                for ncr in range(1, nclouds_reference + 1):
-                    tracknumber[0, ifill, ncr - 1] = itrack
-                    itrack = itrack + 1
+                track_counter[row0 + ifill] = itrack
+                tracknumber[0, ifill, 0:nclouds_reference] = itrack + np.arange(0, nclouds_reference)
+                itrack = itrack + nclouds_reference
 
         time_prev = time_new
-        cloudidfiles[ifill + 1, :] = list(os.path.basename(new_file))
-        basetime[ifill + 1] = basetime_new.item()
-
-        ########################################################################################
-        # Compare forward and backward single track matirces to link new and reference clouds
-        # Intiailize matrix for this time period
-        # logger.debug('Generating tracks')
-        # logger.debug((time.ctime()))
-        trackfound = np.ones(nclouds_reference + 1, dtype=int) * -9999
-
-        # Loop over all reference clouds
-        # logger.debug('Looping over all clouds in the reference file')
-        # logger.debug(('Number of clouds to process: ' + str(nclouds_reference)))
-        # logger.debug((time.ctime()))
-        for ncr in np.arange(
-            1, nclouds_reference + 1
-        ):  # Looping over each reference cloud. Start at 1 since clouds numbered starting at 1.
-            # logger.debug(('Reference cloud #: ' + str(ncr)))
+        cloudidfiles[row0 + ifill + 1, :] = list(os.path.basename(new_file))
+        basetime[row0 + ifill + 1] = basetime_new.item()
+        nclouds_files[row0 + ifill + 1] = nclouds_new
+        track_counter[row0 + ifill + 1] = itrack
+
+        if gettracks_method == "graph":
+            # Resolve all links in the pair as a graph (if not already done in parallel),
+            # then apply them to the track matrices
+            pair_links = pairdata.get("pair_links")
+            if pair_links is None:
+                pair_links = resolve_pair_links(
+                    refcloud_forward_index,
+                    newcloud_backward_index,
+                    nclouds_reference,
+                    nclouds_new,
+                    npix_reference,
+                    npix_new,
+                )
+            itrack = apply_pair_links(
+                pair_links,
+                ifill,
+                itrack,
+                tracknumber,
+                referencetrackstatus,
+                newtrackstatus,
+                trackmergenumber,
+                tracksplitnumber,
+                trackreset,
+            )
+        else:
+            ########################################################################################
+            # Compare forward and backward single track matirces to link new and reference clouds
+            # Intiailize matrix for this time period
+            # logger.debug('Generating tracks')
             # logger.debug((time.ctime()))
-            if trackfound[ncr - 1] < 1:
-
-                # Find all clouds (both forward and backward) associated with this reference cloud
-                nreferenceclouds = 0
-                ntemp_referenceclouds = 1  # Start by forcing to see if track exists
-                temp_referenceclouds = [ncr]
+            trackfound = np.ones(nclouds_reference + 1, dtype=int) * -9999
 
-                trackpresent = 0
-                # logger.debug('Finding all associated clouds')
+            # Loop over all reference clouds
+            # logger.debug('Looping over all clouds in the reference file')
+            # logger.debug(('Number of clouds to process: ' + str(nclouds_reference)))
+            # logger.debug((time.ctime()))
+            for ncr in np.arange(
+                1, nclouds_reference + 1
+            ):  # Looping over each reference cloud. Start at 1 since clouds numbered starting at 1.
+                # logger.debug(('Reference cloud #: ' + str(ncr)))
                 # logger.debug((time.ctime()))
-                while ntemp_referenceclouds > nreferenceclouds:
-                    associated_referenceclouds = np.copy(temp_referenceclouds).astype(
-                        int
-                    )
-                    nreferenceclouds = ntemp_referenceclouds
-
-                    for nr in range(0, nreferenceclouds):
-                        # logger.debug(('Processing cloud #: ' + str(nr)))
-                        # logger.debug((time.ctime()))
-                        tempncr = associated_referenceclouds[nr]
-
-                        # Find indices of forward linked clouds.
-                        # Need to subtract one since looping based on core number and
-                        # since python starts with indices at zero.
-                        # Row of that core is one less than its number.
-                        newforwardindex = np.array(
-                            np.where(refcloud_forward_index[0, tempncr - 1, :] > 0)
-                        )
-                        nnewforward = np.shape(newforwardindex)[1]
-                        if nnewforward > 0:
-                            core_newforward = refcloud_forward_index[
-                                0, tempncr - 1, newforwardindex[0, :]
-                            ]
-
-                        # Find indices of backwards linked clouds
-                        newbackwardindex = np.array(
-                            np.where(newcloud_backward_index[0, :, :] == tempncr)
+                if trackfound[ncr - 1] < 1:
+
+                    # Find all clouds (both forward and backward) associated with this reference cloud
+                    nreferenceclouds = 0
+                    ntemp_referenceclouds = 1  # Start by forcing to see if track exists
+                    temp_referenceclouds = [ncr]
+
+                    trackpresent = 0
+                    # logger.debug('Finding all associated clouds')
+                    # logger.debug((time.ctime()))
+                    while ntemp_referenceclouds > nreferenceclouds:
+                        associated_referenceclouds = np.copy(temp_referenceclouds).astype(
+                            int
                         )
-                        nnewbackward = np.shape(newbackwardindex)[1]
-                        if nnewbackward > 0:
-                            # Need to add one since want the core index, which starts at one.
-                            # But this is using that row number, which starts at zero.
-                            core_newbackward = (newbackwardindex[0, :] + 1)
-
-                        # Put all the indices associated with new clouds linked to the reference cloud in one vector
-                        if nnewforward > 0:
-                            if trackpresent == 0:
-                                associated_newclouds = core_newforward[:].astype(int)
-                                trackpresent = trackpresent + 1
-                            else:
-                                associated_newclouds = np.append(
-                                    associated_newclouds, core_newforward.astype(int)
-                                )
-
-                        if nnewbackward > 0:
-                            if trackpresent == 0:
-                                associated_newclouds = core_newbackward[:]
-                                trackpresent = trackpresent + 1
-                            else:
-                                associated_newclouds = np.append(
-                                    associated_newclouds, core_newbackward.astype(int)
-                                )
-
-                        if nnewbackward == 0 and nnewforward == 0:
-                            associated_newclouds = []
-
-                        # If the reference cloud is linked to a new cloud
-                        if trackpresent > 0:
-                            # Sort and find the unique new clouds associated with the reference cloud
-                            if len(associated_newclouds) > 1:
-                                associated_newclouds = np.unique(
-                                    np.sort(associated_newclouds)
-                                )
-                            nnewclouds = len(associated_newclouds)
-
-                            # Find reference clouds associated with each new cloud.
-                            # Look to see if these new clouds are linked to other cells in the reference file as well.
-                            for nnew in range(0, nnewclouds):
-                                # Find associated reference clouds
-                                referencecloudindex = np.array(
-                                    np.where(
-                                        refcloud_forward_index[0, :, :]
-                                        == associated_newclouds[nnew]
-                                    )
-                                )
-                                nassociatedreference = np.shape(referencecloudindex)[1]
-                                if nassociatedreference > 0:
-                                    temp_referenceclouds = np.append(
-                                        temp_referenceclouds, referencecloudindex[0] + 1
-                                    )
-                                    temp_referenceclouds = np.unique(
-                                        np.sort(temp_referenceclouds)
+                        nreferenceclouds = ntemp_referenceclouds
+
+                        for nr in range(0, nreferenceclouds):
+                            # logger.debug(('Processing cloud #: ' + str(nr)))
+                            # logger.debug((time.ctime()))
+                            tempncr = associated_referenceclouds[nr]
+
+                            # Find indices of forward linked clouds.
+                            # Need to subtract one since looping based on core number and
+                            # since python starts with indices at zero.
+                            # Row of that core is one less than its number.
+                            newforwardindex = np.array(
+                                np.where(refcloud_forward_index[0, tempncr - 1, :] > 0)
+                            )
+                            nnewforward = np.shape(newforwardindex)[1]
+                            if nnewforward > 0:
+                                core_newforward = refcloud_forward_index[
+                                    0, tempncr - 1, newforwardindex[0, :]
+                                ]
+
+                            # Find indices of backwards linked clouds
+                            newbackwardindex = np.array(
+                                np.where(newcloud_backward_index[0, :, :] == tempncr)
+                            )
+                            nnewbackward = np.shape(newbackwardindex)[1]
+                            if nnewbackward > 0:
+                                # Need to add one since want the core index, which starts at one.
+                                # But this is using that row number, which starts at zero.
+                                core_newbackward = (newbackwardindex[0, :] + 1)
+
+                            # Put all the indices associated with new clouds linked to the reference cloud in one vector
+                            if nnewforward > 0:
+                                if trackpresent == 0:
+                                    associated_newclouds = core_newforward[:].astype(int)
+                                    trackpresent = trackpresent + 1
+                                else:
+                                    associated_newclouds = np.append(
+                                        associated_newclouds, core_newforward.astype(int)
                                     )
 
-                            ntemp_referenceclouds = len(temp_referenceclouds)
-                        else:
-                            nnewclouds = 0
-
-                #################################################################
-                # Now get the track status
-
-                if nnewclouds > 0:
-                    ############################################################
-                    # Find the largest reference and new clouds
-                    # Largest reference cloud
-                    # Need to subtract one since associated_referenceclouds gives core index and matrix starts at zero
-                    allreferencepix = npix_reference[associated_referenceclouds - 1]
-                    largestreferenceindex = np.argmax(allreferencepix)
-                    # Cloud number of the largest reference cloud
-                    largest_referencecloud = associated_referenceclouds[largestreferenceindex]
-
-                    # Largest new cloud
-                    # Need to subtract one since associated_newclouds gives cloud number and the matrix starts at zero
-                    allnewpix = npix_new[associated_newclouds - 1]
-                    largestnewindex = np.argmax(allnewpix)
-                    # Cloud number of the largest new cloud
-                    largest_newcloud = associated_newclouds[largestnewindex]
-
-                    if nnewclouds == 1 and nreferenceclouds == 1:
-                        ############################################################
-                        # Simple continuation
-
-                        # Check trackstatus already has a valid value.
-                        # This will prtrack splits from a previous step being overwritten
+                            if nnewbackward > 0:
+                                if trackpresent == 0:
+                                    associated_newclouds = core_newbackward[:]
+                                    trackpresent = trackpresent + 1
+                                else:
+                                    associated_newclouds = np.append(
+                                        associated_newclouds, core_newbackward.astype(int)
+                                    )
 
-                        # logger.debug(trackstatus[ifill,ncr-1])
-                        referencetrackstatus[ifill, ncr - 1] = 1
-                        trackfound[ncr - 1] = 1
-                        tracknumber[0, ifill + 1, associated_newclouds - 1] = np.copy(
-                            tracknumber[0, ifill, ncr - 1]
-                        )
+                            if nnewbackward == 0 and nnewforward == 0:
+                                associated_newclouds = []
 
-                    elif nreferenceclouds > 1:
-                        ##############################################################
-                        # Merging only
-
-                        # Loop through the reference clouds and assign the track to the largest one,
-                        # the rest just go away
-                        if nnewclouds == 1:
-                            for tempreferencecloud in associated_referenceclouds:
-                                trackfound[tempreferencecloud - 1] = 1
-
-                                # If this reference cloud is the largest fragment of the merger,
-                                # label this reference time (file) as the larger part of merger (2)
-                                # and merging at the next time (ifile + 1)
-                                if tempreferencecloud == largest_referencecloud:
-                                    referencetrackstatus[
-                                        ifill, tempreferencecloud - 1
-                                    ] = 2
-                                    tracknumber[
-                                        0, ifill + 1, associated_newclouds - 1
-                                    ] = np.copy(
-                                        tracknumber[
-                                            0, ifill, largest_referencecloud - 1
-                                        ]
+                            # If the reference cloud is linked to a new cloud
+                            if trackpresent > 0:
+                                # Sort and find the unique new clouds associated with the reference cloud
+                                if len(associated_newclouds) > 1:
+                                    associated_newclouds = np.unique(
+                                        np.sort(associated_newclouds)
                                     )
-                                # If this reference cloud is the smaller fragment of the merger,
-                                # label the reference time (ifile) as the small merger (12)
-                                # and merging at the next time (file + 1)
-                                else:
-                                    referencetrackstatus[
-                                        ifill, tempreferencecloud - 1
-                                    ] = 21
-                                    trackmergenumber[
-                                        0, ifill, tempreferencecloud - 1
-                                    ] = np.copy(
-                                        tracknumber[
-                                            0, ifill, largest_referencecloud - 1
-                                        ]
+                                nnewclouds = len(associated_newclouds)
+
+                                # Find reference clouds associated with each new cloud.
+                                # Look to see if these new clouds are linked to other cells in the reference file as well.
+                                for nnew in range(0, nnewclouds):
+                                    # Find associated reference clouds
+                                    referencecloudindex = np.array(
+                                        np.where(
+                                            refcloud_forward_index[0, :, :]
+                                            == associated_newclouds[nnew]
+                                        )
                                     )
+                                    nassociatedreference = np.shape(referencecloudindex)[1]
+                                    if nassociatedreference > 0:
+                                        temp_referenceclouds = np.append(
+                                            temp_referenceclouds, referencecloudindex[0] + 1
+                                        )
+                                        temp_referenceclouds = np.unique(
+                                            np.sort(temp_referenceclouds)
+                                        )
+
+                                ntemp_referenceclouds = len(temp_referenceclouds)
+                            else:
+                                nnewclouds = 0
 
-                        #################################################################
-                        # Merging and spliting
-                        else:
+                    #################################################################
+                    # Now get the track status
 
-                            # Loop over the reference clouds and assign the track the largest one
-                            for tempreferencecloud in associated_referenceclouds:
-                                trackfound[tempreferencecloud - 1] = 1
-
-                                # If this is the larger fragment ofthe merger,
-                                # label the reference time (ifill) as large merger (2)
-                                # and the actual merging track at the next time [ifill+1]
-                                if tempreferencecloud == largest_referencecloud:
-                                    referencetrackstatus[
-                                        ifill, tempreferencecloud - 1
-                                    ] = (2 + 13)
-                                    tracknumber[
-                                        0, ifill + 1, largest_newcloud - 1
-                                    ] = np.copy(
-                                        tracknumber[
-                                            0, ifill, largest_referencecloud - 1
-                                        ]
-                                    )
-                                # For the smaller fragment of the merger,
-                                # label the reference time (ifill) as the small merge and
-                                # have the actual merging occur at the next time (ifill+1)
-                                else:
-                                    referencetrackstatus[
-                                        ifill, tempreferencecloud - 1
-                                    ] = (21 + 13)
-                                    trackmergenumber[
-                                        0, ifill, tempreferencecloud - 1
-                                    ] = np.copy(
+                    if nnewclouds > 0:
+                        ############################################################
+                        # Find the largest reference and new clouds
+                        # Largest reference cloud
+                        # Need to subtract one since associated_referenceclouds gives core index and matrix starts at zero
+                        allreferencepix = npix_reference[associated_referenceclouds - 1]
+                        largestreferenceindex = np.argmax(allreferencepix)
+                        # Cloud number of the largest reference cloud
+                        largest_referencecloud = associated_referenceclouds[largestreferenceindex]
+
+                        # Largest new cloud
+                        # Need to subtract one since associated_newclouds gives cloud number and the matrix starts at zero
+                        allnewpix = npix_new[associated_newclouds - 1]
+                        largestnewindex = np.argmax(allnewpix)
+                        # Cloud number of the largest new cloud
+                        largest_newcloud = associated_newclouds[largestnewindex]
+
+                        if nnewclouds == 1 and nreferenceclouds == 1:
+                            ############################################################
+                            # Simple continuation
+
+                            # Check trackstatus already has a valid value.
+                            # This will prtrack splits from a previous step being overwritten
+
+                            # logger.debug(trackstatus[ifill,ncr-1])
+                            referencetrackstatus[ifill, ncr - 1] = 1
+                            trackfound[ncr - 1] = 1
+                            tracknumber[0, ifill + 1, associated_newclouds - 1] = np.copy(
+                                tracknumber[0, ifill, ncr - 1]
+                            )
+
+                        elif nreferenceclouds > 1:
+                            ##############################################################
+                            # Merging only
+
+                            # Loop through the reference clouds and assign the track to the largest one,
+                            # the rest just go away
+                            if nnewclouds == 1:
+                                for tempreferencecloud in associated_referenceclouds:
+                                    trackfound[tempreferencecloud - 1] = 1
+
+                                    # If this reference cloud is the largest fragment of the merger,
+                                    # label this reference time (file) as the larger part of merger (2)
+                                    # and merging at the next time (ifile + 1)
+                                    if tempreferencecloud == largest_referencecloud:
+                                        referencetrackstatus[
+                                            ifill, tempreferencecloud - 1
+                                        ] = 2
                                         tracknumber[
-                                            0, ifill, largest_referencecloud - 1
-                                        ]
-                                    )
+                                            0, ifill + 1, associated_newclouds - 1
+                                        ] = np.copy(
+                                            tracknumber[
+                                                0, ifill, largest_referencecloud - 1
+                                            ]
+                                        )
+                                    # If this reference cloud is the smaller fragment of the merger,
+                                    # label the reference time (ifile) as the small merger (12)
+                                    # and merging at the next time (file + 1)
+                                    else:
+                                        referencetrackstatus[
+                                            ifill, tempreferencecloud - 1
+                                        ] = 21
+                                        trackmergenumber[
+                                            0, ifill, tempreferencecloud - 1
+                                        ] = np.copy(
+                                            tracknumber[
+                                                0, ifill, largest_referencecloud - 1
+                                            ]
+                                        )
+
+                            #################################################################
+                            # Merging and spliting
+                            else:
 
-                            # Loop through the new clouds and assign the smaller ones a new track
+                                # Loop over the reference clouds and assign the track the largest one
+                                for tempreferencecloud in associated_referenceclouds:
+                                    trackfound[tempreferencecloud - 1] = 1
+
+                                    # If this is the larger fragment ofthe merger,
+                                    # label the reference time (ifill) as large merger (2)
+                                    # and the actual merging track at the next time [ifill+1]
+                                    if tempreferencecloud == largest_referencecloud:
+                                        referencetrackstatus[
+                                            ifill, tempreferencecloud - 1
+                                        ] = (2 + 13)
+                                        tracknumber[
+                                            0, ifill + 1, largest_newcloud - 1
+                                        ] = np.copy(
+                                            tracknumber[
+                                                0, ifill, largest_referencecloud - 1
+                                            ]
+                                        )
+                                    # For the smaller fragment of the merger,
+                                    # label the reference time (ifill) as the small merge and
+                                    # have the actual merging occur at the next time (ifill+1)
+                                    else:
+                                        referencetrackstatus[
+                                            ifill, tempreferencecloud - 1
+                                        ] = (21 + 13)
+                                        trackmergenumber[
+                                            0, ifill, tempreferencecloud - 1
+                                        ] = np.copy(
+                                            tracknumber[
+                                                0, ifill, largest_referencecloud - 1
+                                            ]
+                                        )
+
+                                # Loop through the new clouds and assign the smaller ones a new track
+                                for tempnewcloud in associated_newclouds:
+
+                                    # For the smaller fragment of the split,
+                                    # label the new time (ifill+1) as the small split
+                                    # because the cloud only occurs at the new time step
+                                    if tempnewcloud != largest_newcloud:
+                                        newtrackstatus[ifill + 1, tempnewcloud - 1] = 31
+
+                                        tracknumber[0, ifill + 1, tempnewcloud - 1] = itrack
+                                        itrack = itrack + 1
+
+                                        tracksplitnumber[
+                                            0, ifill + 1, tempnewcloud - 1
+                                        ] = np.copy(
+                                            tracknumber[
+                                                0, ifill, largest_referencecloud - 1
+                                            ]
+                                        )
+
+                                        trackreset[0, ifill + 1, tempnewcloud - 1] = 0
+                                    # For the larger fragment of the split,
+                                    # label the new time (ifill+1) as the large split
+                                    # so that is consistent with the small fragments.
+                                    # The track continues to follow this cloud so the tracknumber is not incramented.
+                                    else:
+                                        newtrackstatus[ifill + 1, tempnewcloud - 1] = 3
+                                        tracknumber[
+                                            0, ifill + 1, tempnewcloud - 1
+                                        ] = np.copy(
+                                            tracknumber[
+                                                0, ifill, largest_referencecloud - 1
+                                            ]
+                                        )
+
+                        #####################################################################
+                        # Splitting only
+                        elif nnewclouds > 1:
+                            # logger.debug('Splitting only')
+                            # logger.debug((time.ctime()))
+                            # Label reference cloud as a pure split
+                            referencetrackstatus[ifill, ncr - 1] = 13
+                            tracknumber[0, ifill, ncr - 1] = np.copy(
+                                tracknumber[0, ifill, largest_referencecloud - 1]
+                            )
+
+                            # Loop over the clouds and assign new tracks to the smaller ones
                             for tempnewcloud in associated_newclouds:
-
                                 # For the smaller fragment of the split,
-                                # label the new time (ifill+1) as the small split
-                                # because the cloud only occurs at the new time step
+                                # label the new time (ifill+1) as teh small split (13)
+                                # because the cloud only occurs at the new time.
                                 if tempnewcloud != largest_newcloud:
                                     newtrackstatus[ifill + 1, tempnewcloud - 1] = 31
 
@@ -449,89 +622,56 @@ def gettracknumbers(config):
 
                                     tracksplitnumber[
                                         0, ifill + 1, tempnewcloud - 1
-                                    ] = np.copy(
-                                        tracknumber[
-                                            0, ifill, largest_referencecloud - 1
-                                        ]
-                                    )
+                                    ] = np.copy(tracknumber[0, ifill, ncr - 1])
 
                                     trackreset[0, ifill + 1, tempnewcloud - 1] = 0
                                 # For the larger fragment of the split,
-                                # label the new time (ifill+1) as the large split
-                                # so that is consistent with the small fragments.
-                                # The track continues to follow this cloud so the tracknumber is not incramented.
+                                # label new time (ifill+1) as the large split (3)
+                                # so that is consistent with the small fragments
                                 else:
                                     newtrackstatus[ifill + 1, tempnewcloud - 1] = 3
-                                    tracknumber[
-                                        0, ifill + 1, tempnewcloud - 1
-                                    ] = np.copy(
-                                        tracknumber[
-                                            0, ifill, largest_referencecloud - 1
-                                        ]
+                                    tracknumber[0, ifill + 1, tempnewcloud - 1] = np.copy(
+                                        tracknumber[0, ifill, ncr - 1]
                                     )
 
-                    #####################################################################
-                    # Splitting only
-                    elif nnewclouds > 1:
-                        # logger.debug('Splitting only')
-                        # logger.debug((time.ctime()))
-                        # Label reference cloud as a pure split
-                        referencetrackstatus[ifill, ncr - 1] = 13
-                        tracknumber[0, ifill, ncr - 1] = np.copy(
-                            tracknumber[0, ifill, largest_referencecloud - 1]
-                        )
-
-                        # Loop over the clouds and assign new tracks to the smaller ones
-                        for tempnewcloud in associated_newclouds:
-                            # For the smaller fragment of the split,
-                            # label the new time (ifill+1) as teh small split (13)
-                            # because the cloud only occurs at the new time.
-                            if tempnewcloud != largest_newcloud:
-                                newtrackstatus[ifill + 1, tempnewcloud - 1] = 31
-
-                                tracknumber[0, ifill + 1, tempnewcloud - 1] = itrack
-                                itrack = itrack + 1
-
-                                tracksplitnumber[
-                                    0, ifill + 1, tempnewcloud - 1
-                                ] = np.copy(tracknumber[0, ifill, ncr - 1])
-
-                                trackreset[0, ifill + 1, tempnewcloud - 1] = 0
-                            # For the larger fragment of the split,
-                            # label new time (ifill+1) as the large split (3)
-                            # so that is consistent with the small fragments
-                            else:
-                                newtrackstatus[ifill + 1, tempnewcloud - 1] = 3
-                                tracknumber[0, ifill + 1, tempnewcloud - 1] = np.copy(
-                                    tracknumber[0, ifill, ncr - 1]
-                                )
+                        else:
+                            sys.exit(str(ncr) + " How did we get here?")
 
+                    ######################################################################################
+                    # No new clouds. Track dissipated
                     else:
-                        sys.exit(str(ncr) + " How did we get here?")
-
-                ######################################################################################
-                # No new clouds. Track dissipated
-                else:
 
-                    trackfound[ncr - 1] = 1
+                        trackfound[ncr - 1] = 1
 
-                    referencetrackstatus[ifill, ncr - 1] = 0
+                        referencetrackstatus[ifill, ncr - 1] = 0
 
         ##############################################################################
         # Find any clouds in the new track that don't have a track number.
         # These are new clouds this file
 
-        for ncn in range(1, int(nclouds_new) + 1):
-            if tracknumber[0, ifill + 1, ncn - 1] < 0:
-                tracknumber[0, ifill + 1, ncn - 1] = itrack
-                itrack = itrack + 1
+        newclouds_notrack = np.where(tracknumber[0, ifill + 1, 0:int(nclouds_new)] < 0)[0]
+        tracknumber[0, ifill + 1, newclouds_notrack] = itrack + np.arange(0, len(newclouds_notrack))
+        itrack = itrack + len(newclouds_notrack)
 
-                trackreset[0, ifill + 1, ncn - 1] = 0
+        trackreset[0, ifill + 1, newclouds_notrack] = 0
 
         #############################################################################
         # Flag the last file in the dataset
         if ifile == nfiles - 1:
             logger.debug("WE ARE AT THE LAST FILE")
+            # Keep the track matrices of the last file before flagging the end of the data
+            ncloud = int(nclouds_new)
+            tail_state = {
+                "ntracks": itrack,
+                "basetime": basetime[row0 + ifill + 1].astype(np.int64),
+                "cloudid_file": os.path.basename(new_file),
+                "tracknumbers_file": tracknumbers_outfile,
+                "track_numbers": np.copy(tracknumber[0, ifill + 1, 0:ncloud]),
+                "new_track_status": np.copy(newtrackstatus[ifill + 1, 0:ncloud]),
+                "track_mergenumbers": np.copy(trackmergenumber[0, ifill + 1, 0:ncloud]),
+                "track_splitnumbers": np.copy(tracksplitnumber[0, ifill + 1, 0:ncloud]),
+                "track_reset": np.copy(trackreset[0, ifill + 1, 0:ncloud]),
+            }
             for ncn in range(1, int(nclouds_new) + 1):
                 trackreset[0, ifill + 1, :] = 2
             ifill = ifill + 1
@@ -541,15 +681,34 @@ def gettracknumbers(config):
         # Increment to next fill
         ifill = ifill + 1
 
-    trackstatus[0, :, :] = np.nansum(
-        np.dstack((referencetrackstatus, newtrackstatus)), 2
-    )
-    trackstatus[np.isnan(trackstatus)] = -9999
+        # Move completed files from the buffer to the ragged arrays
+        if tracknumbers_storage == "ragged":
+            row0 = move_rows_to_ragged(
+                ifill, row0, nclouds_files, ragged_data,
+                tracknumber, referencetrackstatus, newtrackstatus,
+                trackmergenumber, tracksplitnumber, trackreset, fillval,
+            )
+            ifill = 0
+
+    if tracknumbers_storage == "ragged":
+        # Move the remaining files in the buffer
+        row0 = move_rows_to_ragged(
+            ifill + 1, row0, nclouds_files, ragged_data,
+            tracknumber, referencetrackstatus, newtrackstatus,
+            trackmergenumber, tracksplitnumber, trackreset, fillval,
+        )
+        for varname in ragged_varnames:
+            ragged_data[varname] = np.concatenate(ragged_data[varname]).astype(np.int32)
+        nfiles = row0
+    else:
+        trackstatus[0, :, :] = np.nansum(
+            np.dstack((referencetrackstatus, newtrackstatus)), 2
+        )
+        trackstatus[np.isnan(trackstatus)] = -9999
+        nfiles = ifill + 1
 
     logger.debug("Tracking Done")
 
-    nfiles = ifill + 1
-
     # #################################################################
     # # Create histograms of the values in tracknumber.
     # # This effectively counts the number of times each track number appaers in tracknumber,
@@ -605,135 +764,466 @@ def gettracknumbers(config):
     logger.debug("Writing all track statistics file")
     logger.debug((time.ctime()))
 
-    # Check if file already exists. If exists, delete
-    if os.path.isfile(tracknumbers_outfile):
-        os.remove(tracknumbers_outfile)
-
-    # Define output variables dictionary
-    var_dict = {
-        "ntracks": (["time"], np.array([itrack])),
-        "basetimes": (["nfiles"], basetime[:nfiles].astype("datetime64[ns]")),
-        "cloudid_files": (["nfiles", "ncharacters"], cloudidfiles[:nfiles,:]),
-        "track_numbers": (["time", "nfiles", "nclouds"], tracknumber[:,:nfiles,:]),
-        "track_status": (["time", "nfiles", "nclouds"], trackstatus[:,:nfiles,:].astype(int)),
-        "track_mergenumbers": (["time", "nfiles", "nclouds"], trackmergenumber[:,:nfiles,:]),
-        "track_splitnumbers": (["time", "nfiles", "nclouds"], tracksplitnumber[:,:nfiles,:]),
-        "track_reset": (["time", "nfiles", "nclouds"], trackreset[:,:nfiles,:]),
+    if tracknumbers_storage == "ragged":
+        track_vars = ragged_data
+    else:
+        track_vars = {
+            "track_numbers": tracknumber[:,:nfiles,:],
+            "track_status": trackstatus[:,:nfiles,:].astype(int),
+            "track_mergenumbers": trackmergenumber[:,:nfiles,:],
+            "track_splitnumbers": tracksplitnumber[:,:nfiles,:],
+            "track_reset": trackreset[:,:nfiles,:],
         }
-    coord_dict = {
-        "time": (["time"], np.arange(0, 1)),
-        "nfiles": (["nfiles"], np.arange(nfiles)),
-        "nclouds": (["nclouds"], np.arange(0, maxnclouds)),
-        "ncharacters": (["ncharacters"], np.arange(0, strlength)),
-    }
-    gattr_dict = {
-        "Title": "Indicates the track each cloud is linked to. " + \
-                 "Flags indicate how the clouds transition(evolve) between files.",
-        # "Conventions": "CF-1.6",
-        "Insitution": "Pacific Northwest National Laboratory",
-        "Contact": "Zhe Feng: zhe.feng@pnnl.gov",
-        "Created": time.ctime(time.time()),
-        # "source": datasource,
-        # "description": datadescription,
-        "singletrack_filebase": singletrack_filebase,
-        "startdate": startdate,
-        "enddate": enddate,
-        "timegap": str(timegap) + "-hours",
-    }
-    # Define Xarray dataset
-    ds_out = xr.Dataset(var_dict, coords=coord_dict, attrs=gattr_dict,)
-
-    # Set variable attributes
-    ds_out.ntracks.attrs["long_name"] = "number of cloud tracks"
-    ds_out.ntracks.attrs["units"] = "unitless"
-
-    ds_out.basetimes.attrs["long_name"] = "epoch time (seconds since 01/01/1970 00:00) of cloudid_files"
-    ds_out.basetimes.attrs["standard_name"] = "time"
-
-    ds_out.cloudid_files.attrs["long_name"] = "filename of each cloudid file used during tracking"
-    ds_out.cloudid_files.attrs["units"] = "unitless"
-
-    ds_out.track_numbers.attrs["long_name"] = "cloud track number"
-    ds_out.track_numbers.attrs["usage"] = "size: 1 by time by number of clouds. " + \
-    "Each column represents a cloudid file (time dimension). " + \
-    "Each row represents a cloud in that file (ex. row 0=cloud 1, row 1000=cloud 1001) through time. " + \
-    "The values indicate the track that cloud is in. This follows the largest cloud in mergers and splits."
-
-    ds_out.track_numbers.attrs["units"] = "unitless"
-    ds_out.track_numbers.attrs["valid_min"] = 1
-    ds_out.track_numbers.attrs["valid_max"] = itrack - 1
-
-    ds_out.track_status.attrs[
-        "long_name"
-    ] = "Flag indicating evolution / behavior for each cloud in a track"
-    ds_out.track_status.attrs["units"] = "unitless"
-    ds_out.track_status.attrs["valid_min"] = 0
-    ds_out.track_status.attrs["valid_max"] = 65
-
-    ds_out.track_mergenumbers.attrs[
-        "long_name"
-    ] = "Number of the track that this small cloud merges into"
-    ds_out.track_mergenumbers.attrs[
-        "usage"
-    ] = "size: 1 by time by number of clouds. Each column represents a cloudid file (time dimension). " + \
-        "Each row represets a cloud in that file through time. " + \
-        "Values give the track number associated with the small clouds in mergers."
-
-    ds_out.track_mergenumbers.attrs["units"] = "unitless"
-    ds_out.track_mergenumbers.attrs["valid_min"] = 1
-    ds_out.track_mergenumbers.attrs["valid_max"] = itrack - 1
-
-    ds_out.track_splitnumbers.attrs[
-        "long_name"
-    ] = "Number of the track that this small cloud splits from"
-    ds_out.track_splitnumbers.attrs[
-        "usage"
-    ] = "size: 1 by time by number of clouds. Each column represents a cloudid file (time). " + \
-        "Each row represets a cloud in that file through time. " + \
-        "Values give the track number associated with the small clouds in the split"
-    ds_out.track_splitnumbers.attrs["units"] = "unitless"
-    ds_out.track_splitnumbers.attrs["valid_min"] = 1
-    ds_out.track_splitnumbers.attrs["valid_max"] = itrack - 1
-
-    ds_out.track_reset.attrs[
-        "long_name"
-    ] = "flag of track starts and abrupt track stops"
-    ds_out.track_reset.attrs[
-        "usage"
-    ] = "Each row represents a cloudid file. Each column represents a cloud in that file. " + \
-        "Numbers indicate if the track started or adruptly ended during this file."
-    ds_out.track_reset.attrs[
-        "values"
-    ] = "0=Track starts and ends within a period of continuous data. " + \
-        "1=Track starts as the first file in the data set or after a data gap. " + \
-        "2=Track ends because data ends or gap in data."
-    ds_out.track_reset.attrs["units"] = "unitless"
-    ds_out.track_reset.attrs["valid_min"] = 0
-    ds_out.track_reset.attrs["valid_max"] = 2
-
-    # Write netcdf file
-    ds_out.to_netcdf(
-        path=tracknumbers_outfile,
-        mode="w",
-        format="NETCDF4_CLASSIC",
-        # unlimited_dims="ntracks",
-        encoding={
-            "ntracks": {"dtype": "int", "zlib": True},
-            "basetimes": {
-                "dtype": "int64",
-                "zlib": True,
-                "units": "seconds since 1970-01-01",
-            },
-            "cloudid_files": {
-                "zlib": True,
-            },
-            "track_numbers": {"dtype": "int", "zlib": True, "_FillValue": -9999},
-            "track_status": {"dtype": "int", "zlib": True, "_FillValue": -9999},
-            "track_mergenumbers": {"dtype": "int", "zlib": True, "_FillValue": -9999},
-            "track_splitnumbers": {"dtype": "int", "zlib": True, "_FillValue": -9999},
-            "track_reset": {"dtype": "int", "zlib": True, "_FillValue": -9999},
-        },
+    write_tracknumbers(
+        tracknumbers_outfile,
+        track_vars,
+        basetime[:nfiles],
+        cloudidfiles[:nfiles,:],
+        itrack,
+        config,
+        tracknumbers_storage=tracknumbers_storage,
+        file_nclouds=nclouds_files[:nfiles],
+        track_counter=track_counter[:nfiles] if write_track_counter == 1 else None,
     )
     logger.info(tracknumbers_outfile)
+
+    # Save tail state to extend the run in append mode
+    if (save_track_state == 1) | (append_mode == 1):
+        tail_state["nfiles"] = nfiles
+        write_tracknumbers_state(trackstate_file, tail_state)
+        logger.info(f"Track state saved: {trackstate_file}")
+
     logger.info('Get track numbers done.')
     return tracknumbers_outfile
+
+
+def move_rows_to_ragged(
+    nrows_done,
+    row0,
+    nclouds_files,
+    ragged_data,
+    tracknumber,
+    referencetrackstatus,
+    newtrackstatus,
+    trackmergenumber,
+    tracksplitnumber,
+    trackreset,
+    fillval,
+):
+    """
+    Move completed files from the rolling buffer of track matrices to the ragged arrays.
+
+    The remaining buffer rows are shifted to the start of the buffer and the rest is reset.
+
+    Arguments:
+        nrows_done: int
+            Number of completed rows at the start of the buffer.
+        row0: int
+            Index of the first buffer row in the output files.
+        nclouds_files: numpy array
+            Number of clouds in each file.
+        ragged_data: dictionary
+            Lists of ragged track arrays, appended in place.
+        tracknumber, referencetrackstatus, newtrackstatus, trackmergenumber, tracksplitnumber, trackreset: numpy arrays
+            Track matrix buffers, updated in place.
+        fillval: int
+            Missing value.
+
+    Returns:
+        row0: int
+            Index of the first buffer row in the output files after the move.
+    """
+    for irow in range(0, nrows_done):
+        ncloud = nclouds_files[row0 + irow]
+        # Track status is the sum of the reference and new status (0 if neither is set)
+        status = np.nansum(
+            np.vstack((referencetrackstatus[irow, 0:ncloud], newtrackstatus[irow, 0:ncloud])), 0
+        )
+        ragged_data["track_numbers"].append(tracknumber[0, irow, 0:ncloud].astype(np.int32))
+        ragged_data["track_status"].append(status.astype(np.int32))
+        ragged_data["track_mergenumbers"].append(trackmergenumber[0, irow, 0:ncloud].astype(np.int32))
+        ragged_data["track_splitnumbers"].append(tracksplitnumber[0, irow, 0:ncloud].astype(np.int32))
+        ragged_data["track_reset"].append(trackreset[0, irow, 0:ncloud].astype(np.int32))
+
+    # Shift the remaining rows to the start of the buffer
+    nrows = tracknumber.shape[1]
+    nkeep = nrows - nrows_done
+    for matrix in [tracknumber, trackmergenumber, tracksplitnumber, trackreset]:
+        matrix[0, 0:nkeep, :] = matrix[0, nrows_done:, :]
+        matrix[0, nkeep:, :] = fillval
+    for matrix in [referencetrackstatus, newtrackstatus]:
+        matrix[0:nkeep, :] = matrix[nrows_done:, :]
+        matrix[nkeep:, :] = np.nan
+    return row0 + nrows_done
+
+
+def resolve_pair_links(
+    refcloud_forward_index,
+    newcloud_backward_index,
+    nclouds_reference,
+    nclouds_new,
+    npix_reference,
+    npix_new,
+):
+    """
+    Resolve links between reference and new clouds of a file pair using a bipartite graph.
+
+    The forward and backward links are built once as a sparse directed graph
+    (reference -> new for all links, new -> reference for forward links only),
+    which reproduces how the loop method grows the associated clouds.
+    Components are found with a single connected-components pass and classified
+    into continuation/merge/split vectorially. Components where the associated clouds
+    depend on which reference cloud starts the search (backward-only links with multiple
+    reference clouds) are resolved sequentially within the component.
+
+    Track numbers are not assigned here. Instead, each new cloud records the reference cloud
+    it inherits the track number from, or the order in which it starts a new track,
+    so that the result does not depend on the track numbers of previous files.
+
+    Arguments:
+        refcloud_forward_index: np.array
+            New cloud indices linked to each reference cloud.
+        newcloud_backward_index: np.array
+            Reference cloud indices linked to each new cloud.
+        nclouds_reference: int
+            Number of reference clouds (+1).
+        nclouds_new: int
+            Number of new clouds (+1).
+        npix_reference: np.array
+            Number of pixels for each reference cloud.
+        npix_new: np.array
+            Number of pixels for each new cloud.
+
+    Returns:
+        pair_links: dictionary
+            Dictionary containing:
+            ref_status: track status of reference clouds (NaN if not set)
+            ref_mergesrc: reference cloud number whose track a reference cloud merges into (0 if not set)
+            new_status: track status of new clouds (NaN if not set)
+            new_tracksrc: reference cloud number a new cloud inherits the track number from (> 0),
+                          or negative order of the new track started by the new cloud (< 0), 0 if not set
+            new_splitsrc: reference cloud number whose track a new cloud splits from (0 if not set)
+            new_reset: flag for new clouds that start a track from a split
+            nnewtracks: number of new tracks started from splits
+    """
+    nref = int(nclouds_reference)
+    nnew = int(nclouds_new)
+
+    ref_status = np.full(nref, np.nan, dtype=float)
+    ref_mergesrc = np.zeros(nref, dtype=int)
+    new_status = np.full(nnew, np.nan, dtype=float)
+    new_tracksrc = np.zeros(nnew, dtype=int)
+    new_splitsrc = np.zeros(nnew, dtype=int)
+    new_reset = np.zeros(nnew, dtype=bool)
+
+    # Feature sizes padded to the number of clouds (extra cloud has 0 pixels)
+    npix_ref = np.zeros(nref, dtype=np.int64)
+    npix_ref[:min(nref, len(npix_reference))] = np.ma.filled(npix_reference, 0)[:nref]
+    npix_nw = np.zeros(nnew, dtype=np.int64)
+    npix_nw[:min(nnew, len(npix_new))] = np.ma.filled(npix_new, 0)[:nnew]
+
+    # Get link pairs (0-based cloud indices)
+    forward_index = np.ma.filled(refcloud_forward_index[0], 0)
+    backward_index = np.ma.filled(newcloud_backward_index[0], 0)
+    f_ref, f_col = np.nonzero(forward_index > 0)
+    f_new = forward_index[f_ref, f_col] - 1
+    b_new, b_col = np.nonzero(backward_index > 0)
+    b_ref = backward_index[b_new, b_col] - 1
+
+    # Directed graph: nodes [0, nref) are reference clouds, [nref, nref+nnew) are new clouds
+    nnodes = nref + nnew
+    row = np.concatenate((f_ref, b_ref, nref + f_new))
+    col = np.concatenate((nref + f_new, nref + b_new, f_ref))
+    graph = csr_matrix((np.ones(len(row), dtype=np.int8), (row, col)), shape=(nnodes, nnodes))
+    ncomp, comp = connected_components(graph, directed=True, connection="weak")
+    ref_comp = comp[:nref]
+    new_comp = comp[nref:]
+    nref_comp = np.bincount(ref_comp, minlength=ncomp)
+    nnew_comp = np.bincount(new_comp, minlength=ncomp)
+
+    # Components with backward-only links and multiple reference clouds are resolved sequentially
+    backward_only = ~np.isin(b_ref * nnew + b_new, f_ref * nnew + f_new)
+    comp_sequential = np.zeros(ncomp, dtype=bool)
+    comp_sequential[comp[b_ref[backward_only]]] = True
+    comp_sequential &= (nref_comp > 1)
+
+    # First reference cloud in each component (where the search starts)
+    start_comp = np.full(ncomp, -1, dtype=int)
+    ucomp, ufirst = np.unique(ref_comp, return_index=True)
+    start_comp[ucomp] = ufirst
+    # Largest reference/new cloud in each component (first one if tied)
+    largest_ref_comp = np.full(ncomp, -1, dtype=int)
+    order = np.lexsort((np.arange(nref), -npix_ref, ref_comp))
+    ucomp, ufirst = np.unique(ref_comp[order], return_index=True)
+    largest_ref_comp[ucomp] = order[ufirst]
+    largest_new_comp = np.full(ncomp, -1, dtype=int)
+    order = np.lexsort((np.arange(nnew), -npix_nw, new_comp))
+    ucomp, ufirst = np.unique(new_comp[order], return_index=True)
+    largest_new_comp[ucomp] = order[ufirst]
+
+    ######################################################################
+    # Classify reference clouds
+    iref = np.nonzero(~comp_sequential[ref_comp])[0]
+    c = ref_comp[iref]
+    nr = nref_comp[c]
+    nn = nnew_comp[c]
+    is_largest = iref == largest_ref_comp[c]
+    # Track dissipated
+    ref_status[iref[nn == 0]] = 0
+    # Simple continuation
+    ref_status[iref[(nr == 1) & (nn == 1)]] = 1
+    # Splitting only
+    ref_status[iref[(nr == 1) & (nn > 1)]] = 13
+    # Merging only
+    ref_status[iref[(nr > 1) & (nn == 1) & is_largest]] = 2
+    ref_status[iref[(nr > 1) & (nn == 1) & ~is_largest]] = 21
+    # Merging and splitting
+    ref_status[iref[(nr > 1) & (nn > 1) & is_largest]] = 2 + 13
+    ref_status[iref[(nr > 1) & (nn > 1) & ~is_largest]] = 21 + 13
+    # Smaller merging fragments merge into the track of the largest reference cloud
+    imerge = (nr > 1) & ~is_largest
+    ref_mergesrc[iref[imerge]] = largest_ref_comp[c[imerge]] + 1
+
+    ######################################################################
+    # Classify new clouds
+    inew = np.nonzero((nref_comp[new_comp] > 0) & ~comp_sequential[new_comp])[0]
+    c = new_comp[inew]
+    nn = nnew_comp[c]
+    is_largest = inew == largest_new_comp[c]
+    # Single new cloud or largest split fragment continue the track of the largest reference cloud
+    icont = (nn == 1) | is_largest
+    new_tracksrc[inew[icont]] = largest_ref_comp[c[icont]] + 1
+    new_status[inew[(nn > 1) & is_largest]] = 3
+    # Smaller split fragments start new tracks
+    isplit = (nn > 1) & ~is_largest
+    new_status[inew[isplit]] = 31
+    new_splitsrc[inew[isplit]] = largest_ref_comp[c[isplit]] + 1
+    new_reset[inew[isplit]] = True
+    # New tracks are ordered by the reference cloud processed, then by new cloud number
+    event_start = [start_comp[c[isplit]]]
+    event_new = [inew[isplit]]
+    new_tracksrc[inew[isplit]] = -(np.arange(np.count_nonzero(isplit)) + 1)
+
+    ######################################################################
+    # Resolve components sequentially in the order of reference clouds
+    nevents = np.count_nonzero(isplit)
+    seq_start = []
+    seq_new = []
+    for icomp in np.nonzero(comp_sequential)[0]:
+        trackfound = np.zeros(nref, dtype=bool)
+        for ncr in np.nonzero(ref_comp == icomp)[0]:
+            if trackfound[ncr]:
+                continue
+            # All clouds reachable from this reference cloud
+            nodes = breadth_first_order(graph, ncr, directed=True, return_predecessors=False)
+            refclouds = np.sort(nodes[nodes < nref])
+            newclouds = np.sort(nodes[nodes >= nref] - nref)
+            largest_refcloud = refclouds[np.argmax(npix_ref[refclouds])]
+            largest_newcloud = newclouds[np.argmax(npix_nw[newclouds])]
+            if len(refclouds) > 1:
+                trackfound[refclouds] = True
+                is_largest = refclouds == largest_refcloud
+                if len(newclouds) == 1:
+                    ref_status[refclouds[is_largest]] = 2
+                    ref_status[refclouds[~is_largest]] = 21
+                else:
+                    ref_status[refclouds[is_largest]] = 2 + 13
+                    ref_status[refclouds[~is_largest]] = 21 + 13
+                ref_mergesrc[refclouds[~is_largest]] = largest_refcloud + 1
+            elif len(newclouds) == 1:
+                trackfound[ncr] = True
+                ref_status[ncr] = 1
+            else:
+                ref_status[ncr] = 13
+            if len(newclouds) == 1:
+                new_tracksrc[newclouds] = largest_refcloud + 1
+            else:
+                for tempnewcloud in newclouds:
+                    if tempnewcloud != largest_newcloud:
+                        new_status[tempnewcloud] = 31
+                        nevents = nevents + 1
+                        new_tracksrc[tempnewcloud] = -nevents
+                        new_splitsrc[tempnewcloud] = largest_refcloud + 1
+                        new_reset[tempnewcloud] = True
+                        seq_start.append(ncr)
+                        seq_new.append(tempnewcloud)
+                    else:
+                        new_status[tempnewcloud] = 3
+                        new_tracksrc[tempnewcloud] = largest_refcloud + 1
+    event_start.append(np.array(seq_start, dtype=int))
+    event_new.append(np.array(seq_new, dtype=int))
+
+    # Convert the new track events to the order they would be assigned track numbers
+    event_start = np.concatenate(event_start)
+    event_new = np.concatenate(event_new)
+    event_rank = np.empty(nevents, dtype=int)
+    event_rank[np.lexsort((event_new, event_start))] = np.arange(nevents)
+    inewtrack = new_tracksrc < 0
+    new_tracksrc[inewtrack] = -(event_rank[-new_tracksrc[inewtrack] - 1] + 1)
+
+    pair_links = {
+        "ref_status": ref_status,
+        "ref_mergesrc": ref_mergesrc,
+        "new_status": new_status,
+        "new_tracksrc": new_tracksrc,
+        "new_splitsrc": new_splitsrc,
+        "new_reset": new_reset,
+        "nnewtracks": nevents,
+    }
+    return pair_links
+
+
+def get_pair_links(
+    pairdata,
+    singletrack_file,
+    tracking_outpath,
+    featuresize_varname,
+):
+    """
+    Resolve links of a file pair for the parallel (Phase 1) step of the graph method.
+
+    Arguments:
+        pairdata: dictionary
+            Link data of the file pair. If None, it is loaded from singletrack_file.
+        singletrack_file: string
+            Single track filename.
+        tracking_outpath: string
+            Tracking output directory containing the cloudid files.
+        featuresize_varname: string
+            Feature size variable name.
+
+    Returns:
+        pairdata: dictionary
+            Link data of the file pair with the link index arrays replaced by the resolved links.
+    """
+    if pairdata is None:
+        pairdata = load_singletrack_pair(singletrack_file, tracking_outpath, featuresize_varname)
+    refcloud_forward_index, newcloud_backward_index = get_pair_link_index(pairdata)
+    pair_links = resolve_pair_links(
+        refcloud_forward_index,
+        newcloud_backward_index,
+        pairdata["nclouds_ref"],
+        pairdata["nclouds_new"],
+        pairdata["npix_reference"],
+        pairdata["npix_new"],
+    )
+    # Drop the link data that are no longer needed
+    pairdata = {key: value for key, value in pairdata.items()
+                if key not in ["refcloud_forward_index", "newcloud_backward_index", "link_records"]}
+    pairdata["pair_links"] = pair_links
+    return pairdata
+
+
+def apply_pair_links(
+    pair_links,
+    ifill,
+    itrack,
+    tracknumber,
+    referencetrackstatus,
+    newtrackstatus,
+    trackmergenumber,
+    tracksplitnumber,
+    trackreset,
+):
+    """
+    Apply resolved links of a file pair to the track matrices.
+
+    Arguments:
+        pair_links: dictionary
+            Resolved links from resolve_pair_links.
+        ifill: int
+            Time index of the reference file in the track matrices.
+        itrack: int
+            Next available track number.
+        tracknumber, referencetrackstatus, newtrackstatus,
+        trackmergenumber, tracksplitnumber, trackreset: np.array
+            Track matrices, updated in place.
+
+    Returns:
+        itrack: int
+            Next available track number.
+    """
+    # Reference clouds
+    ref_status = pair_links["ref_status"]
+    iref = np.nonzero(~np.isnan(ref_status))[0]
+    referencetrackstatus[ifill, iref] = ref_status[iref]
+    ref_mergesrc = pair_links["ref_mergesrc"]
+    iref = np.nonzero(ref_mergesrc > 0)[0]
+    trackmergenumber[0, ifill, iref] = tracknumber[0, ifill, ref_mergesrc[iref] - 1]
+
+    # New clouds
+    new_status = pair_links["new_status"]
+    inew = np.nonzero(~np.isnan(new_status))[0]
+    newtrackstatus[ifill + 1, inew] = new_status[inew]
+    new_tracksrc = pair_links["new_tracksrc"]
+    inew = np.nonzero(new_tracksrc > 0)[0]
+    tracknumber[0, ifill + 1, inew] = tracknumber[0, ifill, new_tracksrc[inew] - 1]
+    inew = np.nonzero(new_tracksrc < 0)[0]
+    tracknumber[0, ifill + 1, inew] = itrack - new_tracksrc[inew] - 1
+    itrack = itrack + pair_links["nnewtracks"]
+    new_splitsrc = pair_links["new_splitsrc"]
+    inew = np.nonzero(new_splitsrc > 0)[0]
+    tracksplitnumber[0, ifill + 1, inew] = tracknumber[0, ifill, new_splitsrc[inew] - 1]
+    trackreset[0, ifill + 1, np.nonzero(pair_links["new_reset"])[0]] = 0
+    return itrack
+
+
+def load_singletrack_pair(
+    singletrack_file,
+    tracking_outpath,
+    featuresize_varname,
+):
+    """
+    Load link data from a single track file and feature sizes from its cloudid files.
+
+    Arguments:
+        singletrack_file: string
+            Single track filename.
+        tracking_outpath: string
+            Tracking output directory containing the cloudid files.
+        featuresize_varname: string
+            Feature size variable name.
+
+    Returns:
+        pairdata: dictionary
+            Dictionary containing link data of the file pair.
+    """
+    singletracking_data = Dataset(singletrack_file, "r")
+    # Number of clouds in reference and new files
+    nclouds_reference = int(np.nanmax(singletracking_data["nclouds_ref"][:]) + 1)
+    nclouds_new = int(np.nanmax(singletracking_data["nclouds_new"][:]) + 1)
+    basetime_ref = singletracking_data["basetime_ref"][:]
+    basetime_new = singletracking_data["basetime_new"][:]
+    refcloud_forward_index = singletracking_data["refcloud_forward_index"][:].astype(int)
+    newcloud_backward_index = singletracking_data["newcloud_backward_index"][:].astype(int)
+    ref_file = singletracking_data.getncattr('ref_file')
+    new_file = singletracking_data.getncattr('new_file')
+    ref_date = f"{singletracking_data.getncattr('ref_date')}"
+    new_date = f"{singletracking_data.getncattr('new_date')}"
+    singletracking_data.close()
+
+    # Reference cloudid file
+    referencecloudid_data = Dataset(f"{tracking_outpath}{ref_file}", "r")
+    npix_reference = referencecloudid_data[featuresize_varname][:]
+    referencecloudid_data.close()
+
+    # New cloudid file
+    newcloudid_data = Dataset(f"{tracking_outpath}{new_file}", "r")
+    npix_new = newcloudid_data[featuresize_varname][:]
+    newcloudid_data.close()
+
+    pairdata = {
+        "nclouds_ref": nclouds_reference,
+        "nclouds_new": nclouds_new,
+        "basetime_ref": basetime_ref,
+        "basetime_new": basetime_new,
+        "refcloud_forward_index": refcloud_forward_index,
+        "newcloud_backward_index": newcloud_backward_index,
+        "ref_file": ref_file,
+        "new_file": new_file,
+        "ref_date": ref_date,
+        "new_date": new_date,
+        "npix_reference": npix_reference,
+        "npix_new": npix_new,
+    }
+    return pairdata
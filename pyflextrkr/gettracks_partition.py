@@ -0,0 +1,343 @@
+import numpy as np
+import pandas as pd
+import copy
+import os
+import sys
+import logging
+import xarray as xr
+import dask
+from dask.distributed import wait
+from pyflextrkr.gettracks import gettracknumbers
+from pyflextrkr.netcdf_io_tracklinks import get_tracklinks_filename
+from pyflextrkr.netcdf_io_tracknumbers import ragged_varnames, read_tracknumbers, write_tracknumbers, \
+    ragged_to_dense_tracknumbers
+
+def gettracks_partitioned(config):
+    """
+    Track features in overlapping time blocks independently, then stitch the blocks into one tracknumbers file.
+
+    Arguments:
+        config: dictionary
+            Dictionary containing config parameters.
+
+    Returns:
+        tracknumbers_outfile: string
+            Track numbers output filename.
+    """
+    logger = logging.getLogger(__name__)
+    run_parallel = config["run_parallel"]
+
+    blocks = get_partition_blocks(config)
+    logger.info(f"Tracking features in {len(blocks)} time blocks")
+
+    results = []
+    # Serial
+    if run_parallel == 0:
+        for block in blocks:
+            result = gettracks_block(config, block)
+            results.append(result)
+        final_result = results
+    # Parallel
+    elif run_parallel >= 1:
+        for block in blocks:
+            result = dask.delayed(gettracks_block)(config, block)
+            results.append(result)
+        final_result = dask.compute(*results)
+        wait(final_result)
+    else:
+        sys.exit('Valid parallelization flag not provided.')
+
+    tracknumbers_outfile = stitch_tracknumbers(config, blocks)
+
+    # Optionally check the stitched file against a single-pass run
+    if config.get("partition_check", 0) == 1:
+        check_stitched_tracknumbers(config, tracknumbers_outfile)
+    return tracknumbers_outfile
+
+
+def get_partition_blocks(config):
+    """
+    Split the tracking period into time blocks with a halo on both sides.
+
+    Arguments:
+        config: dictionary
+            Dictionary containing config parameters.
+
+    Returns:
+        blocks: list
+            List of block dictionaries, each containing:
+            core_start_basetime, core_end_basetime: int
+                Core period [start, end) of the block, whose tracks are kept when stitching.
+            start_basetime, end_basetime: int
+                Tracking period of the block, including the halo.
+            startdate, enddate: string
+                Start/end date of the tracking period, used in the block output filename.
+    """
+    logger = logging.getLogger(__name__)
+    start_basetime = config["start_basetime"]
+    end_basetime = config["end_basetime"]
+    timegap = config["timegap"]
+    partition_hours = config["partition_hours"]
+    # The halo must cover the maximum time gap, so that the first and last core files are linked as in a single run
+    partition_halo_hours = config.get("partition_halo_hours", timegap)
+    if partition_halo_hours < timegap:
+        logger.warning(f"partition_halo_hours ({partition_halo_hours}) is less than timegap ({timegap}), " + \
+                       "tracks may not be consistent across block boundaries.")
+
+    core_starts = np.arange(start_basetime, end_basetime, int(partition_hours * 3600))
+    halo = int(partition_halo_hours * 3600)
+    blocks = []
+    for ib, core_start in enumerate(core_starts):
+        if ib < len(core_starts) - 1:
+            core_end = core_starts[ib + 1]
+        else:
+            # The end time is included in the last block
+            core_end = end_basetime + 1
+        block_start = max(start_basetime, core_start - halo)
+        block_end = min(end_basetime, core_end + halo)
+        blocks.append({
+            "core_start_basetime": int(core_start),
+            "core_end_basetime": int(core_end),
+            "start_basetime": int(block_start),
+            "end_basetime": int(block_end),
+            "startdate": pd.to_datetime(block_start, unit='s').strftime("%Y%m%d.%H%M"),
+            "enddate": pd.to_datetime(block_end, unit='s').strftime("%Y%m%d.%H%M"),
+        })
+    return blocks
+
+
+def get_block_config(config, block):
+    """
+    Get config parameters to track a time block.
+
+    Arguments:
+        config: dictionary
+            Dictionary containing config parameters.
+        block: dictionary
+            Block dictionary from get_partition_blocks.
+
+    Returns:
+        block_config: dictionary
+            Dictionary containing config parameters of the block.
+    """
+    block_config = copy.deepcopy(config)
+    block_config.update({
+        # Read links from the link store of the whole period
+        "tracklinks_file": get_tracklinks_filename(config),
+        "start_basetime": block["start_basetime"],
+        "end_basetime": block["end_basetime"],
+        "startdate": block["startdate"],
+        "enddate": block["enddate"],
+        "tracknumbers_filebase": f"{config['tracknumbers_filebase']}block_",
+        "run_parallel": 0,
+        "append_mode": 0,
+        "save_track_state": 0,
+        "write_track_counter": 1,
+    })
+    return block_config
+
+
+def gettracks_block(config, block):
+    """
+    Track features in a time block. Blocks are independent and can run on separate nodes.
+
+    Arguments:
+        config: dictionary
+            Dictionary containing config parameters.
+        block: dictionary
+            Block dictionary from get_partition_blocks.
+
+    Returns:
+        tracknumbers_outfile: string
+            Track numbers output filename of the block.
+    """
+    block_config = get_block_config(config, block)
+    tracknumbers_outfile = gettracknumbers(block_config)
+    return tracknumbers_outfile
+
+
+def stitch_tracknumbers(config, blocks):
+    """
+    Stitch track numbers of time blocks into one tracknumbers file with consistent track numbers.
+
+    Tracks continuing from the halo are matched through the last file before the block core,
+    which is tracked in both the previous and the current block.
+    Tracks starting in the block core are shifted by the difference of the track number counters
+    at the first core file.
+
+    Arguments:
+        config: dictionary
+            Dictionary containing config parameters.
+        blocks: list
+            List of block dictionaries from get_partition_blocks.
+
+    Returns:
+        tracknumbers_outfile: string
+            Track numbers output filename.
+    """
+    logger = logging.getLogger(__name__)
+    stats_outpath = config["stats_outpath"]
+    tracknumbers_filebase = config["tracknumbers_filebase"]
+    startdate = config["startdate"]
+    enddate = config["enddate"]
+    fillval = config["fillval"]
+    maxnclouds = config["maxnclouds"]
+    tracknumbers_storage = config.get("tracknumbers_storage", "dense")
+
+    tracknumbers_outfile = f"{stats_outpath}{tracknumbers_filebase}{startdate}_{enddate}.nc"
+    logger.info("Stitching time blocks")
+
+    out_data = {varname: [] for varname in ragged_varnames}
+    out_basetime = []
+    out_cloudidfiles = []
+    out_nclouds = []
+    prev_block = None
+    for ib, block in enumerate(blocks):
+        block_config = get_block_config(config, block)
+        block_file = f"{stats_outpath}{block_config['tracknumbers_filebase']}{block['startdate']}_{block['enddate']}.nc"
+        if os.path.isfile(block_file) is False:
+            logger.info(f"No tracks in block: {block['startdate']}_{block['enddate']}")
+            continue
+        data = read_tracknumbers(block_file)
+        basetimes = data["basetimes"]
+        offsets = data["file_offsets"]
+        counter = data["track_counter"]
+
+        # Core files of the block
+        core_mask = np.ones(len(basetimes), dtype=bool)
+        if ib > 0:
+            core_mask &= basetimes >= block["core_start_basetime"]
+        if ib < len(blocks) - 1:
+            core_mask &= basetimes < block["core_end_basetime"]
+        core_rows = np.where(core_mask)[0]
+        if len(core_rows) == 0:
+            logger.warning(f"No files in block core: {block_file}")
+            continue
+        r0 = core_rows[0]
+
+        # Lookup table from block track numbers to global track numbers
+        ntracks_block = int(data["ntracks"])
+        lookup = np.full(ntracks_block + 1, fillval, dtype=np.int64)
+        if prev_block is None:
+            lookup[1:] = np.arange(1, ntracks_block + 1)
+            offset = 0
+        else:
+            # Counter offset for the tracks starting from the first core file
+            prow = np.where(prev_block["basetimes"] == basetimes[r0])[0]
+            if len(prow) > 0:
+                global_counter = prev_block["track_counter"][prow[0]]
+            else:
+                # First core file is not tracked in the previous block (data gap)
+                global_counter = prev_block["ntracks"]
+            offset = global_counter - counter[r0]
+            lookup[counter[r0]:] = np.arange(counter[r0], ntracks_block + 1) + offset
+            # Tracks continuing from the halo are matched through the last file before the core
+            if r0 > 0:
+                prow = np.where(prev_block["basetimes"] == basetimes[r0 - 1])[0]
+                if len(prow) == 0:
+                    logger.critical(f"Overlap file between blocks not found: {block_file}")
+                    sys.exit("Code exits in gettracks_partition.py")
+                block_numbers = data["track_numbers"][offsets[r0 - 1]:offsets[r0]]
+                global_numbers = prev_block["track_numbers"][prow[0]]
+                valid = (block_numbers > 0) & (block_numbers < counter[r0])
+                lookup[block_numbers[valid]] = global_numbers[valid]
+
+        # Map track numbers in the core files
+        core_idx = np.concatenate([np.arange(offsets[ir], offsets[ir + 1]) for ir in core_rows])
+        for varname in ragged_varnames:
+            values = data[varname][core_idx]
+            if varname in ["track_numbers", "track_mergenumbers", "track_splitnumbers"]:
+                valid = values > 0
+                mapped = lookup[values[valid]]
+                if np.any(mapped == fillval):
+                    logger.warning(f"{np.count_nonzero(mapped == fillval)} {varname} not matched between blocks")
+                values = values.copy()
+                values[valid] = mapped
+            out_data[varname].append(values.astype(np.int32))
+        out_basetime.append(basetimes[core_rows])
+        out_cloudidfiles.append(data["cloudid_files"][core_rows])
+        out_nclouds.append(np.diff(offsets)[core_rows])
+
+        # Keep global track numbers of the block files to stitch the next block
+        prev_block = {
+            "basetimes": basetimes,
+            "track_counter": counter + offset,
+            "ntracks": ntracks_block + offset,
+            "track_numbers": [],
+        }
+        for ir in range(0, len(basetimes)):
+            values = data["track_numbers"][offsets[ir]:offsets[ir + 1]]
+            valid = values > 0
+            values = values.copy()
+            values[valid] = lookup[values[valid]]
+            prev_block["track_numbers"].append(values)
+
+    # Combine the core files of all blocks
+    for varname in ragged_varnames:
+        out_data[varname] = np.concatenate(out_data[varname])
+    out_basetime = np.concatenate(out_basetime).astype("datetime64[s]")
+    out_cloudidfiles = np.concatenate(out_cloudidfiles, axis=0)
+    out_nclouds = np.concatenate(out_nclouds).astype(np.int32)
+    ntracks = prev_block["ntracks"]
+
+    if tracknumbers_storage != "ragged":
+        # Convert to dense arrays, padded as in a single-pass run
+        out_data = ragged_to_dense_tracknumbers(out_data, out_nclouds, maxnclouds, fillval)
+
+    write_tracknumbers(
+        tracknumbers_outfile,
+        out_data,
+        out_basetime,
+        out_cloudidfiles,
+        ntracks,
+        config,
+        tracknumbers_storage=tracknumbers_storage,
+        file_nclouds=out_nclouds,
+    )
+    logger.info(tracknumbers_outfile)
+    return tracknumbers_outfile
+
+
+def check_stitched_tracknumbers(config, tracknumbers_outfile):
+    """
+    Check a stitched tracknumbers file against a single-pass run over the whole period.
+
+    The single-pass run writes its own tracknumbers file (tracknumbers_filebase + 'check_'),
+    the track variables of both files must be identical.
+
+    Arguments:
+        config: dictionary
+            Dictionary containing config parameters.
+        tracknumbers_outfile: string
+            Stitched track numbers filename.
+
+    Returns:
+        identical: bool
+            True if the track variables of both files are identical.
+    """
+    logger = logging.getLogger(__name__)
+    check_config = copy.deepcopy(config)
+    check_config.update({
+        "tracknumbers_filebase": f"{config['tracknumbers_filebase']}check_",
+        "append_mode": 0,
+        "save_track_state": 0,
+        "write_track_counter": 0,
+    })
+    logger.info("Checking stitched track numbers against a single-pass run")
+    check_outfile = gettracknumbers(check_config)
+    if check_outfile is None:
+        logger.warning("No single-pass track numbers to check the stitched file against")
+        return False
+
+    ds_stitched = xr.open_dataset(tracknumbers_outfile, mask_and_scale=False, decode_times=False)
+    ds_check = xr.open_dataset(check_outfile, mask_and_scale=False, decode_times=False)
+    varnames = ["ntracks", "basetimes", "cloudid_files"] + ragged_varnames
+    mismatch = [varname for varname in varnames if not ds_stitched[varname].equals(ds_check[varname])]
+    ds_stitched.close()
+    ds_check.close()
+
+    if len(mismatch) > 0:
+        logger.warning(f"Stitched track numbers differ from the single-pass run in: {mismatch}")
+    else:
+        logger.info(f"Stitched track numbers are identical to the single-pass run: {check_outfile}")
+    return len(mismatch) == 0
@@ -4,7 +4,8 @@ import os
 import sys
 import xarray as xr
 import logging
-from pyflextrkr.ft_utilities import load_sparse_trackstats
+from pyflextrkr.ft_utilities import load_sparse_trackstats, get_continuous_periods, \
+    get_mergesplit_index, get_mergesplit_children
 
 def identifymcs_tb(config):
     """
@@ -82,60 +83,22 @@ def identifymcs_tb(config):
 
     ###################################################################
     # Identify MCSs
-    trackidx_mcs = []
-    trackid_nonmcs = []
-
-    mcstype = np.zeros(ntracks_all, dtype=np.int16)
-    mcsstatus = np.full((ntracks_all, max_trackduration), fillval, dtype=np.int16)
+    # Get the sparse (track, time) indices shared by all sparse arrays
+    tracks_idx = np.repeat(np.arange(0, ntracks_all), np.diff(trackstat_corearea.indptr))
+    times_idx = trackstat_corearea.indices
+    track_corearea = trackstat_corearea.data
+    # Get CCS area
+    track_ccsarea = trackstat_corearea.data + trackstat_coldarea.data
 
     logger.debug(f"Total number of tracks to check: {ntracks_all}")
-    for nt in range(0, ntracks_all):
-        # Get data for a given track
-        track_corearea = trackstat_corearea[nt, :].data
-        # Get CCS area
-        track_ccsarea = trackstat_corearea[nt, :].data + trackstat_coldarea[nt, :].data
-
-        # Remove fill values
-        track_corearea = track_corearea[
-            (~np.isnan(track_corearea)) & (track_corearea != 0)
-        ]
-        track_ccsarea = track_ccsarea[~np.isnan(track_ccsarea)]
-
-        # Must have a cold core
-        if np.shape(track_corearea)[0] != 0 and np.nanmax(track_corearea > 0):
-
-            # Cold cloud shield area requirement
-            iccs = np.array(np.where(track_ccsarea > mcs_tb_area_thresh))[0, :]
-            nccs = len(iccs)
-
-            # Find continuous times
-            groups = np.split(iccs, np.where(np.diff(iccs) > timegap)[0] + 1)
-            nbreaks = len(groups)
-
-            # System may have multiple periods satisfying area and duration requirements
-            # Loop over each period
-            if len(iccs) > 0:
-                for t in range(0, nbreaks):
-                    # Duration requirement
-                    # Duration length should be group's last index - first index + 1
-                    duration_group = np.multiply(
-                        (groups[t][-1] - groups[t][0] + 1), time_resolution
-                    )
-                    if duration_group >= duration_thresh:
-                        mcstype[nt] = 1
-                        mcsstatus[nt, groups[t][:]] = 1
-                        trackidx_mcs = np.append(trackidx_mcs, nt)
-                    else:
-                        # Size requirement met but too short of a period
-                        trackid_nonmcs = np.append(trackid_nonmcs, nt)
-
-            else:
-                # Size requirement not met
-                trackid_nonmcs = np.append(trackid_nonmcs, nt)
+    mcstype, mcsstatus = get_mcs_periods(
+        tracks_idx, times_idx, track_corearea, track_ccsarea,
+        ntracks_all, max_trackduration, mcs_tb_area_thresh,
+        duration_thresh, timegap, time_resolution, fillval,
+    )
+    trackidx_mcs = np.where(mcstype == 1)[0]
 
     ################################################################
-    # Get unique track indices
-    trackidx_mcs = np.unique(np.asarray(trackidx_mcs).astype(int))
     nmcs = len(trackidx_mcs)
     # Provide warning message and exit if no MCS identified
     if nmcs == 0:
@@ -152,96 +115,51 @@ def identifymcs_tb(config):
     # Get duration when MCS status is met
     mcs_duration = np.nansum(mcsstatus > 0, axis=1)
 
-    # trackidx_mcs is the index number, want the track number so add one
-    mcstracknumbers = np.copy(trackidx_mcs) + 1
-
 
     ###############################################################
     # Find small merging and spliting clouds and add to MCS
-    mcs_merge_cloudnumber = np.full((nmcs, max_trackduration, nmaxmerge), fillval, dtype=np.int32)
-    mcs_merge_status = np.full((nmcs, max_trackduration, nmaxmerge), fillval, dtype=np.int32)
-    mcs_merge_ccsarea = np.full((nmcs, max_trackduration, nmaxmerge), fillval_f, dtype=np.float32)
-    mcs_split_cloudnumber = np.full((nmcs, max_trackduration, nmaxmerge), fillval, dtype=np.int32)
-    mcs_split_status = np.full((nmcs, max_trackduration, nmaxmerge), fillval, dtype=np.int32)
-    mcs_split_ccsarea = np.full((nmcs, max_trackduration, nmaxmerge), fillval_f, dtype=np.float32)
-
-    # Loop through each MCS and link small clouds merging in
-    for imcs in np.arange(0, nmcs):
-        ###################################################################################
-        # Find tracks that end as merging with the MCS
-        mergetrack_idx = np.where(end_merge_tracknumber == mcstracknumbers[imcs])[0]
-        if len(mergetrack_idx) > 0:
-            # Isolate merge tracks that have short duration
-            mergetrack_idx = mergetrack_idx[trackstat_lifetime[mergetrack_idx] < merge_duration]
-
-            # Make sure the merge tracks are not MCS
-            mergetrack_idx = mergetrack_idx[np.isin(mergetrack_idx, trackidx_mcs, invert=True)]
-            if len(mergetrack_idx) > 0:
-                # Get data for merging tracks
-                mergingcloudnumber = cloudnumbers[mergetrack_idx, :].data
-                mergingbasetime = basetime[mergetrack_idx, :].data
-                mergingstatus = track_status[mergetrack_idx, :].data
-                mergingccsarea = trackstat_corearea[mergetrack_idx, :].data +\
-                                 trackstat_coldarea[mergetrack_idx, :].data
-
-                # Get MCS basetime
-                imcsbasetime = basetime[int(mcstracknumbers[imcs])-1, :].data
-
-                # Loop through each timestep in the MCS track
-                for t in np.arange(0, len(imcsbasetime)):
-                    # Find merging cloud times that match current MCS track time
-                    timematch = np.where(mergingbasetime == imcsbasetime[int(t)])[0]
-                    nmergers = len(timematch)
-                    if nmergers > 0:
-                        # Find the smaller value between the two
-                        # to make sure it fits into the array
-                        nmergers_sav = np.min([nmergers, nmaxmerge])
-                        mcs_merge_cloudnumber[imcs, int(t), 0:nmergers_sav] = mergingcloudnumber[timematch[0:nmergers_sav]]
-                        mcs_merge_status[imcs, int(t), 0:nmergers_sav] = mergingstatus[timematch[0:nmergers_sav]]
-                        mcs_merge_ccsarea[imcs, int(t), 0:nmergers_sav] = mergingccsarea[timematch[0:nmergers_sav]]
-                        if (nmergers > nmaxmerge):
-                            logger.warning(f'WARNING: nmergers ({nmergers}) > nmaxmerge ({nmaxmerge}), ' + \
-                                'only partial merge clouds are saved.')
-                            logger.warning(f'MCS track index: {imcs}')
-                            logger.warning(f'Increase nmaxmerge to avoid this WARNING.')
-
-        ###################################################################################
-        # Find tracks that split from the MCS
-        splittrack_idx = np.where(start_split_tracknumber == mcstracknumbers[imcs])[0]
-        if len(splittrack_idx) > 0:
-            # Isolate split tracks that have short duration
-            splittrack_idx = splittrack_idx[trackstat_lifetime[splittrack_idx] < split_duration]
-
-            # Make sure the split tracks are not MCS
-            splittrack_idx = splittrack_idx[np.isin(splittrack_idx, trackidx_mcs, invert=True)]
-            if len(splittrack_idx) > 0:
-                # Get data for split tracks
-                splittingcloudnumber = cloudnumbers[splittrack_idx, :].data
-                splittingbasetime = basetime[splittrack_idx, :].data
-                splittingstatus = track_status[splittrack_idx, :].data
-                splittingccsarea = trackstat_corearea[splittrack_idx, :].data +\
-                                   trackstat_coldarea[splittrack_idx, :].data
-
-                # Get MCS basetime
-                imcsbasetime = basetime[int(mcstracknumbers[imcs]) - 1, :].data
-
-                # Loop through each timestep in the MCS track
-                for t in np.arange(0, len(imcsbasetime)):
-                    # Find splitting cloud times that match current MCS track time
-                    timematch = np.where(splittingbasetime == imcsbasetime[int(t)])[0]
-                    nspliters = len(timematch)
-                    if nspliters > 0:
-                        # Find the smaller value between the two
-                        # to make sure it fits into the array
-                        nspliters_sav = np.min([nspliters, nmaxmerge])
-                        mcs_split_cloudnumber[imcs, int(t), 0:nspliters_sav] = splittingcloudnumber[timematch[0:nspliters_sav]]
-                        mcs_split_status[imcs, int(t), 0:nspliters_sav] = splittingstatus[timematch[0:nspliters_sav]]
-                        mcs_split_ccsarea[imcs, int(t), 0:nspliters_sav] = splittingccsarea[timematch[0:nspliters_sav]]
-                        if (nspliters > nmaxmerge):
-                            logger.warning(f'WARNING: nspliters ({nspliters}) > nmaxmerge ({nmaxmerge}), ' + \
-                                'only partial split clouds are saved.')
-                            logger.warning(f'MCS track index: {imcs}')
-                            logger.warning(f'Increase nmaxmerge to avoid this WARNING.')
+    # Build inverted indices of merging/splitting tracks for each parent track number
+    merge_offsets, merge_children = get_mergesplit_index(end_merge_tracknumber, ntracks_all)
+    split_offsets, split_children = get_mergesplit_index(start_split_tracknumber, ntracks_all)
+    # Make sure the merge/split tracks are not MCS
+    isnotmcs = np.ones(ntracks_all, dtype=bool)
+    isnotmcs[trackidx_mcs] = False
+    # Variables to gather from merging/splitting tracks
+    child_vars = {
+        "cloudnumber": cloudnumbers.data,
+        "status": track_status.data,
+        "ccsarea": track_ccsarea,
+    }
+
+    # Find tracks that end as merging with the MCS and have short duration
+    merge_dict, nmergers = get_mergesplit_children(
+        trackidx_mcs, merge_offsets, merge_children,
+        isnotmcs & (trackstat_lifetime < merge_duration),
+        basetime, child_vars, nmaxmerge, max_trackduration, fillval, fillval_f,
+    )
+    mcs_merge_cloudnumber = merge_dict["cloudnumber"]
+    mcs_merge_status = merge_dict["status"]
+    mcs_merge_ccsarea = merge_dict["ccsarea"]
+    for imcs, t in zip(*np.where(nmergers > nmaxmerge)):
+        logger.warning(f'WARNING: nmergers ({nmergers[imcs, t]}) > nmaxmerge ({nmaxmerge}), ' + \
+            'only partial merge clouds are saved.')
+        logger.warning(f'MCS track index: {imcs}')
+        logger.warning(f'Increase nmaxmerge to avoid this WARNING.')
+
+    # Find tracks that split from the MCS and have short duration
+    split_dict, nspliters = get_mergesplit_children(
+        trackidx_mcs, split_offsets, split_children,
+        isnotmcs & (trackstat_lifetime < split_duration),
+        basetime, child_vars, nmaxmerge, max_trackduration, fillval, fillval_f,
+    )
+    mcs_split_cloudnumber = split_dict["cloudnumber"]
+    mcs_split_status = split_dict["status"]
+    mcs_split_ccsarea = split_dict["ccsarea"]
+    for imcs, t in zip(*np.where(nspliters > nmaxmerge)):
+        logger.warning(f'WARNING: nspliters ({nspliters[imcs, t]}) > nmaxmerge ({nmaxmerge}), ' + \
+            'only partial split clouds are saved.')
+        logger.warning(f'MCS track index: {imcs}')
+        logger.warning(f'Increase nmaxmerge to avoid this WARNING.')
 
 
     ###########################################################################
@@ -394,3 +312,81 @@ def identifymcs_tb(config):
     logger.info(f"{statistics_outfile}")
 
     return statistics_outfile
+
+
+def get_mcs_periods(
+        tracks_idx,
+        times_idx,
+        core_area,
+        ccs_area,
+        ntracks,
+        max_trackduration,
+        area_thresh,
+        duration_thresh,
+        timegap,
+        time_resolution,
+        fillval,
+):
+    """
+    Find periods meeting the MCS area and duration requirements for all tracks at once.
+
+    Times exceeding the cold cloud shield area threshold are grouped into continuous periods
+    within each track, allowing gaps up to timegap. A track is an MCS if it has a cold core and
+    any period lasts at least duration_thresh.
+
+    Args:
+        tracks_idx: np.array
+            Track index of each sparse value.
+        times_idx: np.array
+            Time index of each sparse value.
+        core_area: np.array
+            Cold core area of each sparse value.
+        ccs_area: np.array
+            Cold cloud shield area of each sparse value.
+        ntracks: int
+            Number of tracks.
+        max_trackduration: int
+            Maximum number of times in a track.
+        area_thresh: float
+            Cold cloud shield area threshold.
+        duration_thresh: float
+            Duration threshold.
+        timegap: int
+            Maximum time index gap allowed within a period.
+        time_resolution: float
+            Time resolution of the data.
+        fillval: int
+            Missing value.
+
+    Returns:
+        mcstype: np.array
+            MCS flag of each track (1 = MCS, 0 = not MCS).
+        mcsstatus: np.array
+            MCS status of each track and time (1 = in a period meeting the MCS requirements).
+    """
+    mcstype = np.zeros(ntracks, dtype=np.int16)
+    mcsstatus = np.full((ntracks, max_trackduration), fillval, dtype=np.int16)
+
+    # Must have a cold core
+    has_core = np.zeros(ntracks, dtype=bool)
+    has_core[tracks_idx[core_area > 0]] = True
+
+    # Cold cloud shield area requirement
+    iccs = np.where((ccs_area > area_thresh) & has_core[tracks_idx])[0]
+    if len(iccs) == 0:
+        return mcstype, mcsstatus
+    # Sort by track, then by time
+    iccs = iccs[np.lexsort((times_idx[iccs], tracks_idx[iccs]))]
+    ccs_tracks = tracks_idx[iccs]
+    ccs_times = times_idx[iccs]
+
+    # Find continuous periods
+    period_id, period_starts, period_ends = get_continuous_periods(ccs_tracks, ccs_times, timegap)
+
+    # Duration requirement
+    # Duration length should be period's last index - first index + 1
+    duration_period = (ccs_times[period_ends] - ccs_times[period_starts] + 1) * time_resolution
+    ismcs = (duration_period >= duration_thresh)[period_id]
+    mcstype[ccs_tracks[ismcs]] = 1
+    mcsstatus[ccs_tracks[ismcs], ccs_times[ismcs]] = 1
+    return mcstype, mcsstatus
@@ -8,6 +8,7 @@ import logging
 from scipy.ndimage import label
 from pyflextrkr.ftfunctions import sort_renumber, skimage_watershed
 from pyflextrkr.ft_utilities import get_timestamp_from_filename_single
+from pyflextrkr.trackstats_func import write_feature_table
 
 def idfeature_generic(
     input_filename,
@@ -257,4 +258,8 @@ def idfeature_generic(
         )
         logger.info(f"{cloudid_outfile}")
 
+        # Write the feature statistics table while the pixel data is in memory
+        if config.get("feature_stats_table", 0) == 1:
+            write_feature_table(cloudid_outfile, dsout, config)
+
     return cloudid_outfile
\ No newline at end of file
@@ -4,7 +4,7 @@ import os
 import sys
 import xarray as xr
 import logging
-from pyflextrkr.ft_utilities import load_sparse_trackstats
+from pyflextrkr.ft_utilities import load_sparse_trackstats, get_mergesplit_index, get_mergesplit_children
 
 def link_mergesplit_tracks(config):
     """
@@ -67,7 +67,6 @@ def link_mergesplit_tracks(config):
     trackstat_area = sparse_dict["area"]
     basetime = sparse_dict["base_time"]
     cloudnumbers = sparse_dict["cloudnumber"]
-    track_status = sparse_dict["track_status"]
 
     logger.info(f"Number of tracks to process: {ntracks_all}")
 
@@ -94,95 +93,47 @@ def link_mergesplit_tracks(config):
     ntracks_main = len(maintrack_idx)
     logger.info(f"Number of main track defined: {ntracks_main}")
 
-    # maintrack_idx is the index number, want the track number so add one
-    maintracknumbers = np.copy(maintrack_idx) + 1
-
     ###################################################################################
     # Find small merge or split tracks and link to main tracks
-    merge_cloudnumber = np.full((ntracks_main, max_trackduration, nmaxmerge), fillval, dtype=np.int32)
-    merge_status = np.full((ntracks_main, max_trackduration, nmaxmerge), fillval, dtype=np.int32)
-    merge_area = np.full((ntracks_main, max_trackduration, nmaxmerge), fillval_f, dtype=np.float32)
-    split_cloudnumber = np.full((ntracks_main, max_trackduration, nmaxmerge), fillval, dtype=np.int32)
-    split_status = np.full((ntracks_main, max_trackduration, nmaxmerge), fillval, dtype=np.int32)
-    split_area = np.full((ntracks_main, max_trackduration, nmaxmerge), fillval_f, dtype=np.float32)
-
-    # Loop through each main track and link small clouds merging in
-    for itrack in np.arange(0, ntracks_main):
-        ###################################################################################
-        # Find tracks that end as merging with the main track
-        mergetrack_idx = np.where(end_merge_tracknumber == maintracknumbers[itrack])[0]
-        if len(mergetrack_idx) > 0:
-            # Isolate merge tracks that have short duration
-            mergetrack_idx = mergetrack_idx[trackstat_lifetime[mergetrack_idx] < merge_duration]
-
-            # Make sure the merge tracks are not main track
-            mergetrack_idx = mergetrack_idx[np.isin(mergetrack_idx, maintrack_idx, invert=True)]
-            if len(mergetrack_idx) > 0:
-                # Get data for merging tracks
-                mergingcloudnumber = cloudnumbers[mergetrack_idx, :].data
-                mergingbasetime = basetime[mergetrack_idx, :].data
-                mergingstatus = track_status[mergetrack_idx, :].data
-                mergingarea = trackstat_area[mergetrack_idx, :].data
-
-                # Get main track basetime
-                itrack_bt = basetime[int(maintracknumbers[itrack]) - 1, :].data
-
-                # Loop through each timestep in the main track
-                for t in np.arange(0, len(itrack_bt)):
-                    # Find merging cloud times that match current main track time
-                    timematch = np.where(mergingbasetime == itrack_bt[int(t)])[0]
-                    nmergers = len(timematch)
-                    if nmergers > 0:
-                        # Find the smaller value between the two
-                        # to make sure it fits into the array
-                        nmergers_sav = np.min([nmergers, nmaxmerge])
-                        merge_cloudnumber[itrack, int(t), 0:nmergers_sav] = mergingcloudnumber[
-                            timematch[0:nmergers_sav]]
-                        merge_status[itrack, int(t), 0:nmergers_sav] = mergingstatus[timematch[0:nmergers_sav]]
-                        merge_area[itrack, int(t), 0:nmergers_sav] = mergingarea[timematch[0:nmergers_sav]]
-                        if (nmergers > nmaxmerge):
-                            logger.warning(f'WARNING: nmergers ({nmergers}) > nmaxmerge ({nmaxmerge}), ' + \
-                                           'only partial merge clouds are saved.')
-                            logger.warning(f'Main track index: {itrack}')
-                            logger.warning(f'Increase nmaxmerge to avoid this WARNING.')
-
-        ###################################################################################
-        # Find tracks that split from the main track
-        splittrack_idx = np.where(start_split_tracknumber == maintracknumbers[itrack])[0]
-        if len(splittrack_idx) > 0:
-            # Isolate split tracks that have short duration
-            splittrack_idx = splittrack_idx[trackstat_lifetime[splittrack_idx] < split_duration]
-
-            # Make sure the split tracks are not main track
-            splittrack_idx = splittrack_idx[np.isin(splittrack_idx, maintrack_idx, invert=True)]
-            if len(splittrack_idx) > 0:
-                # Get data for split tracks
-                splittingcloudnumber = cloudnumbers[splittrack_idx, :].data
-                splittingbasetime = basetime[splittrack_idx, :].data
-                splittingstatus = track_status[splittrack_idx, :].data
-                splittingarea = trackstat_area[splittrack_idx, :].data
-
-                # Get main track basetime
-                itrack_bt = basetime[int(maintracknumbers[itrack]) - 1, :].data
+    # Build inverted indices of merging/splitting tracks for each parent track number
+    merge_offsets, merge_children = get_mergesplit_index(end_merge_tracknumber, ntracks_all)
+    split_offsets, split_children = get_mergesplit_index(start_split_tracknumber, ntracks_all)
+    # Make sure the merge/split tracks are not main track
+    isnotmain = np.ones(ntracks_all, dtype=bool)
+    isnotmain[maintrack_idx] = False
+    # Variables to gather from merging/splitting tracks
+    child_vars = {
+        "cloudnumber": cloudnumbers.data,
+        "area": trackstat_area.data,
+    }
 
-                # Loop through each timestep in the main track
-                for t in np.arange(0, len(itrack_bt)):
-                    # Find splitting cloud times that match current main track time
-                    timematch = np.where(splittingbasetime == itrack_bt[int(t)])[0]
-                    nspliters = len(timematch)
-                    if nspliters > 0:
-                        # Find the smaller value between the two
-                        # to make sure it fits into the array
-                        nspliters_sav = np.min([nspliters, nmaxmerge])
-                        split_cloudnumber[itrack, int(t), 0:nspliters_sav] = splittingcloudnumber[
-                            timematch[0:nspliters_sav]]
-                        split_status[itrack, int(t), 0:nspliters_sav] = splittingstatus[timematch[0:nspliters_sav]]
-                        split_area[itrack, int(t), 0:nspliters_sav] = splittingarea[timematch[0:nspliters_sav]]
-                        if (nspliters > nmaxmerge):
-                            logger.warning(f'WARNING: nspliters ({nspliters}) > nmaxmerge ({nmaxmerge}), ' + \
-                                           'only partial split clouds are saved.')
-                            logger.warning(f'Main track index: {itrack}')
-                            logger.warning(f'Increase nmaxmerge to avoid this WARNING.')
+    # Find tracks that end as merging with the main track and have short duration
+    merge_dict, nmergers = get_mergesplit_children(
+        maintrack_idx, merge_offsets, merge_children,
+        isnotmain & (trackstat_lifetime < merge_duration),
+        basetime, child_vars, nmaxmerge, max_trackduration, fillval, fillval_f,
+    )
+    merge_cloudnumber = merge_dict["cloudnumber"]
+    merge_area = merge_dict["area"]
+    for itrack, t in zip(*np.where(nmergers > nmaxmerge)):
+        logger.warning(f'WARNING: nmergers ({nmergers[itrack, t]}) > nmaxmerge ({nmaxmerge}), ' + \
+                       'only partial merge clouds are saved.')
+        logger.warning(f'Main track index: {itrack}')
+        logger.warning(f'Increase nmaxmerge to avoid this WARNING.')
+
+    # Find tracks that split from the main track and have short duration
+    split_dict, nspliters = get_mergesplit_children(
+        maintrack_idx, split_offsets, split_children,
+        isnotmain & (trackstat_lifetime < split_duration),
+        basetime, child_vars, nmaxmerge, max_trackduration, fillval, fillval_f,
+    )
+    split_cloudnumber = split_dict["cloudnumber"]
+    split_area = split_dict["area"]
+    for itrack, t in zip(*np.where(nspliters > nmaxmerge)):
+        logger.warning(f'WARNING: nspliters ({nspliters[itrack, t]}) > nmaxmerge ({nmaxmerge}), ' + \
+                       'only partial split clouds are saved.')
+        logger.warning(f'Main track index: {itrack}')
+        logger.warning(f'Increase nmaxmerge to avoid this WARNING.')
 
 
     ###########################################################################
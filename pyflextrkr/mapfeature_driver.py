@@ -6,7 +6,8 @@ import xarray as xr
 import dask
 from dask.distributed import wait
 from pyflextrkr.ft_utilities import subset_files_timerange
-from pyflextrkr.mapfeature_func import map_feature
+from pyflextrkr.mapfeature_func import map_feature, get_pixeltracking_dataset
+from pyflextrkr.netcdf_io_pixeltracking import get_pixeltracking_store_filename, create_pixeltracking_store
 
 def mapfeature_driver(
         config,
@@ -56,50 +57,27 @@ def mapfeature_driver(
     match_pixel_dt_thresh = config["match_pixel_dt_thresh"]
     run_parallel = config["run_parallel"]
     # feature_type = config["feature_type"]
-    nmaxlinks = config["nmaxlinks"]
-    tracks_dimname = config.get("tracks_dimname", "tracks")
-    times_dimname = config.get("times_dimname", "times")
-    fillval = config.get("fillval", -9999)
+    # Pixel-level output: 'files' (one file per time), 'store' (single store for all times)
+    pixeltracking_storage = config.get("pixeltracking_storage", "files")
 
     #########################################################################################
-    # Read track stats
+    # Read track stats variables needed for mapping at valid track/time entries
     trackstats_file = f"{stats_path}{trackstats_filebase}{startdate}_{enddate}.nc"
-    ds = xr.open_dataset(
-        trackstats_file,
-        mask_and_scale=False,
-        decode_times=False,
-    ).compute()
-    # Get track stats variable names
-    stats_varnames = list(ds.data_vars)
-    # Get track stats dimensions
-    ntracks = ds.sizes[tracks_dimname]
-    ntimes = ds.sizes[times_dimname]
-    # Get track variables
-    stats_basetime = ds["base_time"].data
-    stats_cloudnumber = ds["cloudnumber"].data
-    stats_trackstatus = ds["track_status"].data
-    trackstats_comments = ds["track_status"].comments
-    ds.close()
-
-    # Put merge/split tracknumbers & cloudnumbers in a list
-    ms_tracknumber = ["merge_tracknumbers", "split_tracknumbers"]
-    ms_cloudnumber = ["merge_cloudnumber", "split_cloudnumber"]
+    entry_trackindex, \
+    entry_timeindex, \
+    entry_values, \
+    trackstats_comments = read_trackstats_entries(trackstats_file, config)
+    entry_basetime = entry_values["base_time"]
+    entry_cloudnumber = entry_values["cloudnumber"]
+    entry_trackstatus = entry_values["track_status"]
+    entry_mergetracknumber = entry_values["merge_tracknumbers"]
+    entry_splittracknumber = entry_values["split_tracknumbers"]
+    entry_mergecloudnumber = entry_values["merge_cloudnumber"]
+    entry_splitcloudnumber = entry_values["split_cloudnumber"]
 
-    # Check if tracknumber are in the stats dataset
-    if (set(ms_tracknumber).issubset(set(stats_varnames))):
-        stats_mergetracknumber = ds["merge_tracknumbers"].data
-        stats_splittracknumber = ds["split_tracknumbers"].data
-    else:
-        stats_mergetracknumber = np.full((ntracks, ntimes), fillval, dtype=int)
-        stats_splittracknumber = np.full((ntracks, ntimes), fillval, dtype=int)
-
-    # Check if cloudnumber are in the stats dataset
-    if (set(ms_cloudnumber).issubset(set(stats_varnames))):
-        stats_mergecloudnumber = ds["merge_cloudnumber"].data
-        stats_splitcloudnumber = ds["split_cloudnumber"].data
-    else:
-        stats_mergecloudnumber = np.full((ntracks, ntimes, nmaxlinks), fillval, dtype=int)
-        stats_splitcloudnumber = np.full((ntracks, ntimes, nmaxlinks), fillval, dtype=int)
+    # Time index: entries sorted by base time
+    basetime_order = np.argsort(entry_basetime, kind="stable")
+    sorted_basetime = entry_basetime[basetime_order]
 
     #########################################################################################
     # Identify files to process
@@ -115,23 +93,41 @@ def mapfeature_driver(
     nfiles = len(cloudidfiles)
     logger.info(f"Total number of files to process: {nfiles}")
 
+    if (pixeltracking_storage == "store") & (nfiles > 0):
+        # Preallocate the store for all files, using the variables of the first file
+        ds_template = get_pixeltracking_dataset(
+            cloudidfiles[0],
+            np.array([], dtype=int),
+            np.array([], dtype=int),
+            np.array([], dtype=int),
+            np.array([], dtype=int),
+            np.array([], dtype=int),
+            np.zeros((0, 0), dtype=int),
+            np.zeros((0, 0), dtype=int),
+            trackstats_comments,
+            config,
+        )
+        store_file = get_pixeltracking_store_filename(config, pixeltracking_outpath, pixeltracking_filebase)
+        create_pixeltracking_store(store_file, ds_template, cloudidfiles_basetime)
+        logger.info(f"Created pixel-level store: {store_file}")
+
     results = []
     # Loop over each pixel file
     for ifile in range(0, nfiles):
-        # Find all matching time indices from stats file to the current cloudid file
-        itrack, itime = np.array(
-            np.where(
-                np.abs(stats_basetime - cloudidfiles_basetime[ifile]) < match_pixel_dt_thresh)
-        )
+        # Find all matching entries from stats file to the current cloudid file
+        istart = np.searchsorted(sorted_basetime, cloudidfiles_basetime[ifile] - match_pixel_dt_thresh, side="right")
+        iend = np.searchsorted(sorted_basetime, cloudidfiles_basetime[ifile] + match_pixel_dt_thresh, side="left")
+        # Keep the entries in track order
+        ientry = np.sort(basetime_order[istart:iend])
 
         # Get cloudnumbers for this time (file)
-        file_trackindex = itrack
-        file_cloudnumber = stats_cloudnumber[itrack, itime]
-        file_trackstatus = stats_trackstatus[itrack, itime]
+        file_trackindex = entry_trackindex[ientry]
+        file_cloudnumber = entry_cloudnumber[ientry]
+        file_trackstatus = entry_trackstatus[ientry]
 
         # Cloudnumbers for merge/split
-        file_mergecloudnumber = stats_mergecloudnumber[itrack, itime, :]
-        file_splitcloudnumber = stats_splitcloudnumber[itrack, itime, :]
+        file_mergecloudnumber = entry_mergecloudnumber[ientry, :]
+        file_splitcloudnumber = entry_splitcloudnumber[ientry, :]
         if (file_mergecloudnumber.size > 0) & (file_splitcloudnumber.size > 0):
             # Get number of max merge/split for all clouds at this time (file)
             max_merge = np.sum(file_mergecloudnumber > 0, axis=1).max()
@@ -141,8 +137,8 @@ def mapfeature_driver(
             file_splitcloudnumber = file_splitcloudnumber[:, :max_split]
 
         # General merge/split tracknumber
-        file_mergetracknumber = stats_mergetracknumber[itrack, itime]
-        file_splittracknumber = stats_splittracknumber[itrack, itime]
+        file_mergetracknumber = entry_mergetracknumber[ientry]
+        file_splittracknumber = entry_splittracknumber[ientry]
 
         # Serial
         if run_parallel == 0:
@@ -160,6 +156,7 @@ def mapfeature_driver(
                 config,
                 pixeltracking_outpath,
                 pixeltracking_filebase,
+                store_timeindex=ifile,
             )
         # Parallel
         elif run_parallel >= 1:
@@ -177,6 +174,7 @@ def mapfeature_driver(
                 config,
                 pixeltracking_outpath,
                 pixeltracking_filebase,
+                store_timeindex=ifile,
             )
             results.append(result)
         else:
@@ -188,4 +186,78 @@ def mapfeature_driver(
         wait(final_result)
 
     logger.info('Done with mapping features to pixel-level files')
-    return
\ No newline at end of file
+    return
+
+
+def read_trackstats_entries(
+        trackstats_file,
+        config,
+):
+    """
+    Read track stats variables needed for mapping at valid track/time entries.
+
+    Variables are read one at a time from a dense (tracks, times) or a sparse trackstats file,
+    and only values at entries with a valid base time are kept.
+
+    Args:
+        trackstats_file: string
+            Track statistics file name.
+        config: dictionary
+            Dictionary containing config parameters.
+
+    Returns:
+        entry_trackindex: np.array
+            Track index of each entry, in (tracks, times) order.
+        entry_timeindex: np.array
+            Time index of each entry.
+        entry_values: dictionary
+            Dictionary containing track stats variables at each entry.
+        trackstats_comments: string
+            Track status explanation.
+    """
+    nmaxlinks = config["nmaxlinks"]
+    tracks_dimname = config.get("tracks_dimname", "tracks")
+    times_dimname = config.get("times_dimname", "times")
+    fillval = config.get("fillval", -9999)
+    sparse_dimname = "sparse_index"
+
+    ds = xr.open_dataset(
+        trackstats_file,
+        mask_and_scale=False,
+        decode_times=False,
+    )
+    if sparse_dimname in ds.dims:
+        # Sparse trackstats: entries are stored with their track/time indices
+        entry_basetime = ds["base_time"].values
+        sparse_trackindex = ds[f"{tracks_dimname}_indices"].values
+        sparse_timeindex = ds[f"{times_dimname}_indices"].values
+        # Valid entries sorted in (tracks, times) order
+        ivalid = np.where(np.isfinite(entry_basetime))[0]
+        ientry = ivalid[np.lexsort((sparse_timeindex[ivalid], sparse_trackindex[ivalid]))]
+        entry_trackindex = sparse_trackindex[ientry]
+        entry_timeindex = sparse_timeindex[ientry]
+        entry_index = (ientry,)
+    else:
+        # Dense trackstats: valid entries in (tracks, times) order
+        entry_basetime = ds["base_time"].values
+        entry_trackindex, entry_timeindex = np.nonzero(np.isfinite(entry_basetime))
+        entry_index = (entry_trackindex, entry_timeindex)
+    nentries = len(entry_trackindex)
+
+    entry_values = {"base_time": entry_basetime[entry_index]}
+    for varname in ["cloudnumber", "track_status"]:
+        entry_values[varname] = ds[varname].values[entry_index]
+    trackstats_comments = ds["track_status"].comments
+    # Merge/split tracknumbers & cloudnumbers may not be in the stats file
+    for varname in ["merge_tracknumbers", "split_tracknumbers"]:
+        if varname in ds.data_vars:
+            entry_values[varname] = ds[varname].values[entry_index]
+        else:
+            entry_values[varname] = np.full(nentries, fillval, dtype=int)
+    for varname in ["merge_cloudnumber", "split_cloudnumber"]:
+        if varname in ds.data_vars:
+            entry_values[varname] = ds[varname].values[entry_index]
+        else:
+            entry_values[varname] = np.full((nentries, nmaxlinks), fillval, dtype=int)
+    ds.close()
+    return entry_trackindex, entry_timeindex, entry_values, trackstats_comments
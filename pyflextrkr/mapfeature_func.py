@@ -3,6 +3,9 @@ import time
 import os
 import logging
 import xarray as xr
+from dask.distributed import Lock
+from pyflextrkr.netcdf_io_pixeltracking import get_pixeltracking_store_filename, write_pixeltracking_store, \
+    cloudid_file_varname
 
 def map_feature(
         cloudid_filename,
@@ -18,6 +21,7 @@ def map_feature(
         config,
         pixeltracking_outpath,
         pixeltracking_filebase,
+        store_timeindex=None,
 ):
     """
     Map track numbers to pixel level files for all feature tracking.
@@ -49,10 +53,115 @@ def map_feature(
             Output directory for pixel-level files.
         pixeltracking_filebase: string
             Output pixel-level file basename.
+        store_timeindex: int, optional. Default: None.
+            Time index in the pixel-level store, used if config["pixeltracking_storage"] is "store".
 
     Returns:
         tracksmap_outfile: string
-            Track number pixel-level file name.
+            Track number pixel-level file name (or pixel-level store name).
+    """
+    pixeltracking_storage = config.get("pixeltracking_storage", "files")
+    run_parallel = config.get("run_parallel", 0)
+    np.set_printoptions(threshold=np.inf)
+    logger = logging.getLogger(__name__)
+
+    file_datetime = time.strftime("%Y%m%d_%H%M%S", time.gmtime(np.copy(filebasetime)))
+    ds_out = get_pixeltracking_dataset(
+        cloudid_filename,
+        file_trackindex,
+        file_cloudnumber,
+        file_trackstatus,
+        file_mergetracknumber,
+        file_splittracknumber,
+        file_mergecloudnumber,
+        file_splitcloudnumber,
+        trackstats_comments,
+        config,
+    )
+
+    #####################################################################
+    # Output to a single pixel-level store
+    if pixeltracking_storage == "store":
+        store_file = get_pixeltracking_store_filename(config, pixeltracking_outpath, pixeltracking_filebase)
+        if run_parallel >= 1:
+            # Tasks write to the same store one at a time
+            with Lock(store_file):
+                write_pixeltracking_store(store_file, ds_out, store_timeindex)
+        else:
+            write_pixeltracking_store(store_file, ds_out, store_timeindex)
+        logger.info(f"{store_file}: {file_datetime}")
+        return store_file
+
+    #####################################################################
+    # Output to netcdf file
+
+    # Define output filename
+    tracksmap_outfile = (
+        pixeltracking_outpath +
+        pixeltracking_filebase +
+        file_datetime + ".nc"
+    )
+
+    # Delete file if it already exists
+    if os.path.isfile(tracksmap_outfile):
+        os.remove(tracksmap_outfile)
+
+    # Set encoding/compression for all variables (variable-length strings cannot be compressed)
+    comp = dict(zlib=True)
+    encoding = {var: comp for var in ds_out.data_vars if ds_out[var].dtype.kind != "O"}
+    # Write to netCDF file
+    ds_out.to_netcdf(
+        path=tracksmap_outfile,
+        mode="w",
+        format="NETCDF4",
+        unlimited_dims="time",
+        encoding=encoding,
+    )
+    logger.info(f"{tracksmap_outfile}")
+
+    return tracksmap_outfile
+
+
+def get_pixeltracking_dataset(
+        cloudid_filename,
+        file_trackindex,
+        file_cloudnumber,
+        file_trackstatus,
+        file_mergetracknumber,
+        file_splittracknumber,
+        file_mergecloudnumber,
+        file_splitcloudnumber,
+        trackstats_comments,
+        config,
+):
+    """
+    Create pixel-level track number maps and add them to the cloudid dataset.
+
+    Args:
+        cloudid_filename: string
+            Cloudid file name.
+        file_trackindex: np.array
+            Track indices for the features in the cloudid file.
+        file_cloudnumber: np.array
+            Matched feature numbers in the cloudid file.
+        file_trackstatus: np.array
+            Track status for the features in the cloudid file.
+        file_mergetracknumber: np.array
+            Merge feature track number.
+        file_splittracknumber: np.array
+            Split feature track number.
+        file_mergecloudnumber: np.array
+            Merge feature cloud number in the cloudid file.
+        file_splitcloudnumber: np.array
+            Split feature cloud number in the cloudid file.
+        trackstats_comments: string
+            Track status explanation.
+        config: dictionary
+            Dictionary containing config parameters.
+
+    Returns:
+        ds_out: Xarray Dataset
+            Pixel-level dataset containing cloudid and track number variables.
     """
     feature_varname = config.get("feature_varname", "feature_number")
     feature_type = config.get("feature_type", None)
@@ -60,13 +169,11 @@ def map_feature(
     y_dimname = "lat"
     x_dimname = "lon"
     fillval = config.get("fillval", -9999)
+    pixeltracking_thin = config.get("pixeltracking_thin", 0)
 
-    np.set_printoptions(threshold=np.inf)
     logger = logging.getLogger(__name__)
 
     #########################################################################
-    # Get cloudid file associated with this time
-    file_datetime = time.strftime("%Y%m%d_%H%M%S", time.gmtime(np.copy(filebasetime)))
     # Load cloudid data
     ds_in = xr.open_dataset(
         cloudid_filename,
@@ -90,97 +197,54 @@ def map_feature(
 
     ################################################################
     # Create map of status and track number for every feature in this file
-    statusmap = np.full((1, ny, nx), fillval, dtype=int)
-    trackmap = np.zeros((1, ny, nx), dtype=int)
-    allmergemap = np.zeros((1, ny, nx), dtype=int)
-    allsplitmap = np.zeros((1, ny, nx), dtype=int)
+    # Each map is a lookup table indexed by feature number, gathered at every pixel
+    nmatchcloud = len(file_cloudnumber)
+    trackindex = np.asarray(file_trackindex, dtype=int) + 1
+    cloudnumber = np.asarray(file_cloudnumber, dtype=int)
+    jjcloud = np.arange(0, nmatchcloud)
 
-    trackmap_include_ms = np.zeros((1, ny, nx), dtype=int)
-    trackmap_merge = np.zeros((1, ny, nx), dtype=int)
-    trackmap_split = np.zeros((1, ny, nx), dtype=int)
+    # Merge/split clouds of each matched feature, in the order of the matched features
+    split_jj, split_idx = np.nonzero(file_splitcloudnumber > 0)
+    merge_jj, merge_idx = np.nonzero(file_mergecloudnumber > 0)
+    split_number = file_splitcloudnumber[split_jj, split_idx].astype(int)
+    merge_number = file_mergecloudnumber[merge_jj, merge_idx].astype(int)
+    # Track number this feature merges with/splits from
+    allsplit = np.nonzero(np.asarray(file_splittracknumber) > 0)[0]
+    allmerge = np.nonzero(np.asarray(file_mergetracknumber) > 0)[0]
 
-    # Check number of matched features
-    nmatchcloud = len(file_cloudnumber)
-    if nmatchcloud > 0:
-        ##############################################################
-        # Loop over each instance matching the trackstats time
-        for jj in range(0, nmatchcloud):
-            # Get cloud number
-            jjcloudnumber = file_cloudnumber[jj]
-            jjstatus = file_trackstatus[jj]
-
-            # Get the mask matching this feature number
-            cmask = feature_number == jjcloudnumber
-
-            # Label this feature with the track number.
-            # Need to add one to the cloud number since have the index number and we want the track number
-            if np.count_nonzero(cmask) > 0:
-                trackmap[0, cmask] = file_trackindex[jj] + 1
-                trackmap_include_ms[0, cmask] = file_trackindex[jj] + 1
-                statusmap[0, cmask] = jjstatus
-            else:
-                logger.warning(f"Warning: No matching cloud pixel found: {jjcloudnumber}")
-
-            ###########################################################
-            # Find splitting clouds
-            jjsplit = np.where(file_splitcloudnumber[jj, :] > 0)[0]
-            # Loop through splitting clouds if present
-            if len(jjsplit) > 0:
-                for isplit in jjsplit:
-                    # Get mask matching the splitting cloud
-                    is_number = file_splitcloudnumber[jj, isplit]
-                    s_cmask = feature_number == is_number
-                    # Label this cloud with the track number
-                    if np.count_nonzero(s_cmask) > 0:
-                        trackmap_include_ms[0, s_cmask] = file_trackindex[jj] + 1
-                        trackmap_split[0, s_cmask] = file_trackindex[jj] + 1
-                    else:
-                        logger.warning(f"Warning: No matching splitting cloud found: {is_number}")
-
-            ###########################################################
-            # Find merging clouds
-            jjmerge = np.where(file_mergecloudnumber[jj, :] > 0)[0]
-            # Loop through merging clouds if present
-            if len(jjmerge) > 0:
-                for imerge in jjmerge:
-                    # Get mask matching the merging cloud
-                    im_number = file_mergecloudnumber[jj, imerge]
-                    m_cmask = feature_number == im_number
-                    # Label this cloud with the track number
-                    if np.count_nonzero(m_cmask) > 0:
-                        trackmap_include_ms[0, m_cmask] = file_trackindex[jj] + 1
-                        trackmap_merge[0, m_cmask] = file_trackindex[jj] + 1
-                    else:
-                        logger.warning(f"Warning: No matching merging cloud found: {im_number}")
-
-            ###########################################################
-            # Get split tracknumber within this time
-            jjallsplit = file_splittracknumber[jj]
-            # Count valid split cloudnumbers (> 0)
-            splitpresent = np.count_nonzero(jjallsplit > 0)
-            if splitpresent > 0:
-                # Find valid split tracknumbers (> 0)
-                splittracks = jjallsplit[jjallsplit > 0]
-                splitcloudid = jjcloudnumber[jjallsplit > 0]
-                if len(splittracks) > 0:
-                    for isplit in range(0, len(splittracks)):
-                        s_cmask = feature_number == splitcloudid[isplit]
-                        allsplitmap[0, s_cmask] = splittracks[isplit]
-
-            ###########################################################
-            # Get merge tracknumber within this time
-            jjallmerge = file_mergetracknumber[jj]
-            # Count valid split cloudnumbers (> 0)
-            mergepresent = np.count_nonzero(jjallmerge > 0)
-            if mergepresent > 0:
-                # Find valid merge tracknumbers (> 0)
-                mergetracks = jjallmerge[jjallmerge > 0]
-                mergecloudid = jjcloudnumber[jjallmerge > 0]
-                if len(mergetracks) > 0:
-                    for imerge in range(0, len(mergetracks)):
-                        m_cmask = feature_number == mergecloudid[imerge]
-                        allmergemap[0, m_cmask] = mergetracks[imerge]
+    # Size of the lookup tables
+    nlut = max(np.max(feature_number, initial=0), np.max(cloudnumber, initial=0),
+               np.max(split_number, initial=0), np.max(merge_number, initial=0)) + 1
+    # Number of pixels for each feature number
+    npix_feature = np.bincount(feature_number[feature_number >= 0].ravel(), minlength=nlut)
 
+    # Report matched features not found in the file
+    for jjcloudnumber in cloudnumber[npix_feature[np.clip(cloudnumber, 0, None)] == 0]:
+        logger.warning(f"Warning: No matching cloud pixel found: {jjcloudnumber}")
+    for is_number in split_number[npix_feature[split_number] == 0]:
+        logger.warning(f"Warning: No matching splitting cloud found: {is_number}")
+    for im_number in merge_number[npix_feature[merge_number] == 0]:
+        logger.warning(f"Warning: No matching merging cloud found: {im_number}")
+
+    # Track number including merge/split: each matched feature, followed by its splitting and merging clouds
+    nlinks = file_splitcloudnumber.shape[1] + file_mergecloudnumber.shape[1] + 1
+    ms_order = np.argsort(np.concatenate((
+        jjcloud * nlinks,
+        split_jj * nlinks + 1 + split_idx,
+        merge_jj * nlinks + 1 + file_splitcloudnumber.shape[1] + merge_idx,
+    )), kind="stable")
+    ms_number = np.concatenate((cloudnumber, split_number, merge_number))[ms_order]
+    ms_track = np.concatenate((trackindex, trackindex[split_jj], trackindex[merge_jj]))[ms_order]
+
+    trackmap = remap_feature(feature_number, nlut, cloudnumber, trackindex, 0)
+    statusmap = remap_feature(feature_number, nlut, cloudnumber, file_trackstatus, fillval)
+    trackmap_include_ms = remap_feature(feature_number, nlut, ms_number, ms_track, 0)
+    trackmap_split = remap_feature(feature_number, nlut, split_number, trackindex[split_jj], 0)
+    trackmap_merge = remap_feature(feature_number, nlut, merge_number, trackindex[merge_jj], 0)
+    allsplitmap = remap_feature(feature_number, nlut, cloudnumber[allsplit],
+                                np.asarray(file_splittracknumber)[allsplit], 0)
+    allmergemap = remap_feature(feature_number, nlut, cloudnumber[allmerge],
+                                np.asarray(file_mergetracknumber)[allmerge], 0)
 
     # Handle special variables for specific feature_type
     if "tb_pf" in feature_type:
@@ -268,8 +332,16 @@ def map_feature(
         }
         dbztrackmap = xr.DataArray(dbztrackmap, coords=coords, dims=dims_keep, attrs=dbztrackmap_attrs)
 
-    # Create a copy of the input dataset
-    ds_out = ds_in.copy(deep=True)
+    if pixeltracking_thin == 1:
+        # Thin output only contains the track number variables and references the cloudid file
+        ds_out = xr.Dataset(coords=coords, attrs=ds_in.attrs)
+        ds_out[cloudid_file_varname] = xr.DataArray(
+            np.array([os.path.abspath(cloudid_filename)], dtype=object), dims=[time_dimname],
+            attrs={"long_name": "Cloudid file containing the other pixel-level variables"},
+        )
+    else:
+        # Create a copy of the input dataset
+        ds_out = ds_in.copy(deep=True)
 
     # Assign new variables to output dataset
     ds_out = ds_out.assign(tracknumber=trackmap)
@@ -287,31 +359,37 @@ def map_feature(
     ds_out.attrs["Title"] = "Pixel-level feature tracking data"
     ds_out.attrs["Created_on"] = time.ctime(time.time())
 
-    #####################################################################
-    # Output to netcdf file
+    return ds_out
 
-    # Define output filename
-    tracksmap_outfile = (
-        pixeltracking_outpath +
-        pixeltracking_filebase +
-        file_datetime + ".nc"
-    )
 
-    # Delete file if it already exists
-    if os.path.isfile(tracksmap_outfile):
-        os.remove(tracksmap_outfile)
+def remap_feature(feature_number, nlut, feature_keys, values, fillval):
+    """
+    Map values of features to pixels with a lookup table indexed by feature number.
 
-    # Set encoding/compression for all variables
-    comp = dict(zlib=True)
-    encoding = {var: comp for var in ds_out.data_vars}
-    # Write to netCDF file
-    ds_out.to_netcdf(
-        path=tracksmap_outfile,
-        mode="w",
-        format="NETCDF4",
-        unlimited_dims="time",
-        encoding=encoding,
-    )
-    logger.info(f"{tracksmap_outfile}")
+    Args:
+        feature_number: np.array
+            2D feature number map.
+        nlut: int
+            Size of the lookup table, must be larger than all feature numbers.
+        feature_keys: np.array
+            Feature numbers to map. If a feature number repeats, the last value is used.
+        values: np.array
+            Values of each feature number.
+        fillval: int
+            Value of pixels without a mapped feature.
 
-    return tracksmap_outfile
+    Returns:
+        value_map: np.array
+            Mapped values, with an added time dimension (1, ny, nx).
+    """
+    feature_keys = np.asarray(feature_keys, dtype=int)
+    values = np.asarray(values)
+    lut = np.full(nlut, fillval, dtype=int)
+    if len(feature_keys) > 0:
+        # Keep the last value of repeated feature numbers
+        _, ilast = np.unique(feature_keys[::-1], return_index=True)
+        ilast = len(feature_keys) - 1 - ilast
+        valid = feature_keys[ilast] >= 0
+        lut[feature_keys[ilast][valid]] = values[ilast][valid]
+    value_map = np.where(feature_number >= 0, lut[np.clip(feature_number, 0, None)], fillval)
+    return value_map[None, :, :].astype(int)
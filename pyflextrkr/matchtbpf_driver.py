@@ -7,6 +7,7 @@ import logging
 import dask
 from dask.distributed import wait
 from pyflextrkr.ft_utilities import subset_files_timerange
+from pyflextrkr.pfstats_records import pf_records_dimname, pf_nrecords_varname, get_pf_records, sort_pf_records
 # from pyflextrkr.matchtbpf_func import matchtbpf_singlefile
 
 def match_tbpf_tracks(config):
@@ -34,6 +35,8 @@ def match_tbpf_tracks(config):
     tracks_dimname = config["tracks_dimname"]
     times_dimname = config["times_dimname"]
     pf_dimname = config["pf_dimname"]
+    # PF statistics storage: 'dense' (tracks, times, nmaxpf), 'ragged' (flat PF records)
+    pfstats_storage = config.get("pfstats_storage", "dense")
     run_parallel = config["run_parallel"]
     fillval = config["fillval"]
     # Minimum time difference threshold [second] to match track stats and cloudid pixel files
@@ -166,15 +169,24 @@ def match_tbpf_tracks(config):
             break
         counter += 1
 
+    # PF variables have a PF dimension, the rest are cloud variables
+    var_names_pf = [ivar for ivar in var_names if ivar not in var_names_2d]
+
     # Loop over variable list to create the dictionary entry
     pf_dict = {}
     pf_dict_attrs = {}
     for ivar in var_names:
-        pf_dict[ivar] = np.full((numtracks, maxtracklength, nmaxpf), np.nan, dtype=np.float32)
+        if pfstats_storage != "ragged":
+            pf_dict[ivar] = np.full((numtracks, maxtracklength, nmaxpf), np.nan, dtype=np.float32)
         pf_dict_attrs[ivar] = var_attrs[ivar]
     for ivar in var_names_2d:
         pf_dict[ivar] = np.full((numtracks, maxtracklength), np.nan, dtype=np.float32)
 
+    # Lists to store PF records of each pixel file
+    records_all = []
+    rec_trackindices_all = []
+    rec_timeindices_all = []
+
     # Collect results
     for ifile in range(0, nfiles):
         if final_result[ifile] is not None:
@@ -188,10 +200,17 @@ def match_tbpf_tracks(config):
             timeindices = timeindices_all[ifile]
 
             # Loop over each variable and assign values to output dictionary
-            for ivar in var_names:
-                if iResult[ivar].ndim == 1:
-                    pf_dict[ivar][trackindices,timeindices] = iResult[ivar]
-                if iResult[ivar].ndim == 2:
+            for ivar in var_names_2d:
+                pf_dict[ivar][trackindices,timeindices] = iResult[ivar]
+            if pfstats_storage == "ragged":
+                records, rec_trackindices, rec_timeindices = get_pf_records(
+                    iResult, trackindices, timeindices, var_names_pf,
+                )
+                records_all.append(records)
+                rec_trackindices_all.append(rec_trackindices)
+                rec_timeindices_all.append(rec_timeindices)
+            else:
+                for ivar in var_names_pf:
                     pf_dict[ivar][trackindices,timeindices,:] = iResult[ivar]
 
     # Define a dataset containing all PF variables
@@ -209,15 +228,35 @@ def match_tbpf_tracks(config):
     coordlist = {
         tracks_dimname: ([tracks_dimname], np.arange(0, numtracks)),
         times_dimname: ([times_dimname], np.arange(0, maxtracklength)),
-        pf_dimname: ([pf_dimname], np.arange(0, nmaxpf)),
     }
 
+    if pfstats_storage == "ragged":
+        # Combine PF records of all pixel files, sorted by track and time
+        records, pf_nrecords = sort_pf_records(
+            {ivar: np.concatenate([irec[ivar] for irec in records_all]) for ivar in var_names_pf},
+            np.concatenate(rec_trackindices_all),
+            np.concatenate(rec_timeindices_all),
+            numtracks,
+            maxtracklength,
+        )
+        logger.debug(f"Number of PF records: {len(records[var_names_pf[0]])}")
+        for ivar in var_names_pf:
+            varlist[ivar] = ([pf_records_dimname], records[ivar], pf_dict_attrs[ivar])
+        varlist[pf_nrecords_varname] = ([tracks_dimname, times_dimname], pf_nrecords, {
+            "long_name": "Number of PF records in the cloud",
+            "units": "unitless",
+            "comments": f"PF variables on the {pf_records_dimname} dimension are ordered by track, time and PF",
+        })
+    else:
+        coordlist[pf_dimname] = ([pf_dimname], np.arange(0, nmaxpf))
+
     # Define global attributes
     gattrlist = {
         "nmaxpf": nmaxpf,
         "PF_rainrate_thresh": config["pf_rr_thres"],
         "heavy_rainrate_thresh": config["heavy_rainrate_thresh"],
         "landfrac_thresh": config["landfrac_thresh"],
+        "pfstats_storage": pfstats_storage,
     }
 
     # Define output Xarray dataset
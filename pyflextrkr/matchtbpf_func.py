@@ -4,12 +4,11 @@ import sys
 import logging
 import xarray as xr
 from scipy.ndimage import label
-from skimage.measure import regionprops
 from math import pi
-from scipy.stats import skew
 import warnings
-from pyflextrkr.ftfunctions import sort_renumber
-from pyflextrkr.ft_utilities import subset_ds_geolimit
+from pyflextrkr.ftfunctions import sort_renumber, get_label_pixels_sorted, label_nanmean, label_nanmax, \
+    label_skewness, label_shape_stats, get_centroid_lonlat
+from pyflextrkr.ft_utilities import subset_ds_geolimit, get_label_pixel_index, get_label_pixels, get_local_map
 
 def matchtbpf_singlefile(
     cloudid_filename,
@@ -97,6 +96,9 @@ def matchtbpf_singlefile(
         # Get dimensions of data
         ydim, xdim = np.shape(lat)
 
+        # Index pixels of each cloud number once for all matched clouds
+        pixel_offsets, pixel_flatindex = get_label_pixel_index(cloudnumbermap)
+
         # Number of clouds
         nmatchcloud = len(ir_cloudnumber)
 
@@ -114,26 +116,26 @@ def matchtbpf_singlefile(
             total_rain = np.full(nmatchcloud, fillval_f, dtype=float)
             total_heavyrain = np.full(nmatchcloud, fillval_f, dtype=float)
             rainrate_heavyrain = np.full(nmatchcloud, fillval_f, dtype=float)
-            pf_lon = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=float)
-            pf_lat = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=float)
-            pf_area = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=float)
-            pf_rainrate = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=float)
-            pf_skewness = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=float)
-            pf_maxrainrate = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=float)
-            pf_majoraxis = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=float)
-            pf_minoraxis = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=float)
-            pf_aspectratio = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=float)
-            pf_orientation = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=float)
-            pf_eccentricity = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=float)
-            pf_perimeter = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=float)
-            pf_lon_centroid = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=float)
-            pf_lat_centroid = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=float)
-            pf_lon_weightedcentroid = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=float)
-            pf_lat_weightedcentroid = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=float)
-            pf_accumrain = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=float)
-            pf_accumrainheavy = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=float)
-            pf_lon_maxrainrate = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=float)
-            pf_lat_maxrainrate = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=float)
+            pf_lon = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=np.float32)
+            pf_lat = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=np.float32)
+            pf_area = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=np.float32)
+            pf_rainrate = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=np.float32)
+            pf_skewness = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=np.float32)
+            pf_maxrainrate = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=np.float32)
+            pf_majoraxis = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=np.float32)
+            pf_minoraxis = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=np.float32)
+            pf_aspectratio = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=np.float32)
+            pf_orientation = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=np.float32)
+            pf_eccentricity = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=np.float32)
+            pf_perimeter = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=np.float32)
+            pf_lon_centroid = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=np.float32)
+            pf_lat_centroid = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=np.float32)
+            pf_lon_weightedcentroid = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=np.float32)
+            pf_lat_weightedcentroid = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=np.float32)
+            pf_accumrain = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=np.float32)
+            pf_accumrainheavy = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=np.float32)
+            pf_lon_maxrainrate = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=np.float32)
+            pf_lat_maxrainrate = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=np.float32)
             basetime = np.full(nmatchcloud, fillval_f, dtype=float)
 
             # Loop over each matched cloud number
@@ -144,17 +146,10 @@ def matchtbpf_singlefile(
                 ittsplitcloudnumber = ir_splitcloudnumber[imatchcloud]
                 basetime[imatchcloud] = cloudid_basetime
 
-                #########################################################################
-                # Intialize matrices for only MCS data
-                rainrate_map = np.full((ydim, xdim), np.nan, dtype=float)
-                logger.debug(
-                    ("rainrate_map allocation size: ", rainrate_map.shape)
-                )
-
                 ############################################################################
                 # Find matching cloud number
-                icloudlocationy, icloudlocationx = np.array(
-                    np.where(cloudnumbermap == ittcloudnumber)
+                icloudlocationy, icloudlocationx = get_label_pixels(
+                    pixel_offsets, pixel_flatindex, ittcloudnumber, xdim,
                 )
                 ncloudpix = len(icloudlocationy)
 
@@ -162,20 +157,15 @@ def matchtbpf_singlefile(
                     logger.debug("IR Clouds Present")
                     # Add merge/split cloud pixel locations
                     icloudlocationx, \
-                    icloudlocationy = add_merge_split_cloud_locations(cloudnumbermap,
+                    icloudlocationy = add_merge_split_cloud_locations(pixel_offsets,
+                                                                      pixel_flatindex,
+                                                                      xdim,
                                                                       icloudlocationx,
                                                                       icloudlocationy,
                                                                       ittmergecloudnumber,
                                                                       ittsplitcloudnumber,
                                                                       logger)
 
-                    ########################################################################
-                    # Fill matrices with MCS data
-                    logger.debug("Fill map with data")
-                    rainrate_map[icloudlocationy, icloudlocationx] = np.copy(
-                        rawrainratemap[icloudlocationy, icloudlocationx]
-                    )
-
                     ########################################################################
                     ## Isolate small region of cloud data around mcs at this time
                     logger.debug("Calculate new shape statistics")
@@ -186,8 +176,10 @@ def matchtbpf_singlefile(
                                                                 xdim,
                                                                 ydim)
 
-                    # Isolate region over the cloud shield
-                    sub_rainrate_map = np.copy(rainrate_map[miny:maxy, minx:maxx])
+                    # Fill MCS data within the cloud boundary
+                    logger.debug("Fill map with data")
+                    sub_rainrate_map = get_local_map(rawrainratemap, icloudlocationy, icloudlocationx,
+                                                     miny, maxy, minx, maxx)
 
                     # Calculate total rainfall within the cold cloud shield
                     total_rain[imatchcloud] = np.nansum(sub_rainrate_map)
@@ -502,150 +494,63 @@ def calc_pf_stats(
             Dictionary containing PF statistics variables.
     """
     logger = logging.getLogger(__name__)
-    # Initialize arrays
     npf_save = np.nanmin([nmaxpf, numpf])
-    pfnpix = np.zeros(npf_save, dtype=float)
-    pfid = np.full(npf_save, fillval, dtype=int)
-    pflon = np.full(npf_save, fillval_f, dtype=float)
-    pflat = np.full(npf_save, fillval_f, dtype=float)
-    pfrainrate = np.full(npf_save, fillval_f, dtype=float)
-    pfmaxrainrate = np.full(npf_save, fillval_f, dtype=float)
-    pfskewness = np.full(npf_save, fillval_f, dtype=float)
-    pfmajoraxis = np.full(npf_save, fillval_f, dtype=float)
-    pfminoraxis = np.full(npf_save, fillval_f, dtype=float)
-    pfaspectratio = np.full(npf_save, fillval_f, dtype=float)
-    pflon_centroid = np.full(npf_save, fillval_f, dtype=float)
-    pflat_centroid = np.full(npf_save, fillval_f, dtype=float)
-    pflon_weightedcentroid = np.full(npf_save, fillval_f, dtype=float)
-    pflat_weightedcentroid = np.full(npf_save, fillval_f, dtype=float)
-    pflon_maxrainrate = np.full(npf_save, fillval_f, dtype=float)
-    pflat_maxrainrate = np.full(npf_save, fillval_f, dtype=float)
-    pfeccentricity = np.full(npf_save, fillval_f, dtype=float)
-    pfperimeter = np.full(npf_save, fillval_f, dtype=float)
-    pforientation = np.full(npf_save, fillval_f, dtype=float)
-    pfaccumrain = np.full(npf_save, fillval_f, dtype=float)
-    pfaccumrainheavy = np.full(npf_save, fillval_f, dtype=float)
-    logger.debug(
-        "Looping through each feature to calculate statistics"
-    )
     logger.debug(("Number of PFs " + str(numpf)))
 
-    # Get the shape of the full data array
-    ny, nx = lon.shape
-
-    ###############################################
-    # Loop through each PF
-    for ipf in range(1, npf_save + 1):
-
-        #######################################
-        # Find indices of the PF
-        iipfy, iipfx = np.array(
-            np.where(pfnumberlabelmap == ipf)
-        )
-        iipfnpix = len(iipfy)
-
-        # Find indices of the PF with heavy rain
-        iipfy_heavy, iipfx_heavy = np.array(
-            np.where(
-                (pfnumberlabelmap == ipf)
-                & (sub_rainrate_map > heavy_rainrate_thresh)
-            )
-        )
-        iipfnpix_heavy = len(iipfy_heavy)
-
-        # Find indices of the PF with max rain rate
-        iipfy_max, iipfx_max = np.unravel_index(
-            np.nanargmax(sub_rainrate_map), sub_rainrate_map.shape
-        )
-
-        # Double check to make sure PF pixel count is the same
-        if iipfnpix == pf_npix[ipf - 1]:
-            ##########################################
-            # Compute PF statistics
-
-            # Basic statistics
-            pfnpix[ipf - 1] = np.copy(iipfnpix)
-            pfid[ipf - 1] = np.copy(int(ipf))
-            pflon[ipf - 1] = np.nanmean(lon[iipfy[:] + miny, iipfx[:] + minx])
-            pflat[ipf - 1] = np.nanmean(lat[iipfy[:] + miny, iipfx[:] + minx])
-
-            pfrainrate[ipf - 1] = np.nanmean(sub_rainrate_map[iipfy[:], iipfx[:]])
-            pfmaxrainrate[ipf - 1] = np.nanmax(sub_rainrate_map[iipfy[:], iipfx[:]])
-            pfskewness[ipf - 1] = skew(sub_rainrate_map[iipfy[:], iipfx[:]])
-            pfaccumrain[ipf - 1] = np.nansum(sub_rainrate_map[iipfy[:], iipfx[:]])
-            if iipfnpix_heavy > 0:
-                pfaccumrainheavy[ipf - 1] = np.nansum(
-                    sub_rainrate_map[iipfy_heavy[:], iipfx_heavy[:]]
-                )
-
-            # Generate a binary map of PF
-            iipfflagmap = np.zeros((subdimy, subdimx), dtype=int)
-            iipfflagmap[iipfy, iipfx] = 1
-
-            # Geometric statistics
-            _sub_rainrate_map = np.copy(sub_rainrate_map)
-            _sub_rainrate_map[np.isnan(_sub_rainrate_map)] = -9999
-            pfproperties = regionprops(
-                iipfflagmap,
-                intensity_image=_sub_rainrate_map,
-            )
-            pfeccentricity[ipf - 1] = pfproperties[0].eccentricity
-            pfmajoraxis[ipf - 1] = (
-                    pfproperties[0].major_axis_length * pixel_radius
-            )
-
-            # Need to treat minor axis length with an error except
-            # since the python algorithm occasionally throws an error.
-            try:
-                pfminoraxis[ipf - 1] = (
-                        pfproperties[0].minor_axis_length
-                        * pixel_radius
-                )
-            except ValueError:
-                pass
-            if ~np.isnan(pfminoraxis[ipf - 1]) or \
-                    ~np.isnan(pfmajoraxis[ipf - 1]):
-                pfaspectratio[ipf - 1] = np.divide(
-                    pfmajoraxis[ipf - 1], pfminoraxis[ipf - 1]
-                )
-            pforientation[ipf - 1] = (
-                                         pfproperties[0].orientation
-                                     ) * (180 / float(pi))
-            pfperimeter[ipf - 1] = (
-                    pfproperties[0].perimeter * pixel_radius
-            )
-            [
-                ycentroid,
-                xcentroid,
-            ] = pfproperties[0].centroid
-            [
-                yweightedcentroid,
-                xweightedcentroid,
-            ] = pfproperties[0].weighted_centroid
-
-            # Shift the centroids by minx/miny
-            # since the PF is a subset from the full image
-            # Round the centroid values as indices
-            ycentroid = int(np.round(ycentroid + miny))
-            xcentroid = int(np.round(xcentroid + minx))
-            yweightedcentroid = int(np.round(yweightedcentroid + miny))
-            xweightedcentroid = int(np.round(xweightedcentroid + minx))
-
-            # Apply the indices to get centroid lat/lon
-            if (0 < (ycentroid) < ny) & (0 < (xcentroid) < nx):
-                pflon_centroid[ipf-1] = lon[ycentroid, xcentroid]
-                pflat_centroid[ipf-1] = lat[ycentroid, xcentroid]
-            if (0 < (yweightedcentroid) < ny) & (0 < (xweightedcentroid) < nx):
-                pflon_weightedcentroid[ipf-1] = lon[yweightedcentroid, xweightedcentroid]
-                pflat_weightedcentroid[ipf-1] = lat[yweightedcentroid, xweightedcentroid]
-
-            # Shift the x, y indices by minx/miny
-            pflon_maxrainrate[ipf - 1] = lon[iipfy_max + miny, iipfx_max + minx]
-            pflat_maxrainrate[ipf - 1] = lat[iipfy_max + miny, iipfx_max + minx]
+    # Get pixels of the saved PFs, and label index of each pixel
+    pf_idx, iipfy, iipfx = get_label_pixels_sorted(pfnumberlabelmap, npf_save)
+    pfnpix = np.bincount(pf_idx, minlength=npf_save).astype(float)
+
+    # Double check to make sure PF pixel count is the same
+    if np.any(pfnpix != pf_npix[0:npf_save]):
+        sys.exit("Error: PF pixel count not matching!")
+
+    ##########################################
+    # Compute PF statistics for all PFs at once
+    logger.debug("Calculating statistics for all PFs")
+    iipfrain = sub_rainrate_map[iipfy, iipfx]
+
+    # Basic statistics
+    pflon = label_nanmean(lon[iipfy + miny, iipfx + minx], pf_idx, npf_save)
+    pflat = label_nanmean(lat[iipfy + miny, iipfx + minx], pf_idx, npf_save)
+    pfrainrate = label_nanmean(iipfrain, pf_idx, npf_save)
+    pfmaxrainrate = label_nanmax(iipfrain, pf_idx, npf_save)
+    pfskewness = label_skewness(iipfrain, pf_idx, npf_save)
+    pfaccumrain = np.bincount(pf_idx, weights=np.nan_to_num(iipfrain), minlength=npf_save).astype(float)
+    # Heavy rain accumulation, missing if a PF has no heavy rain
+    heavy = iipfrain > heavy_rainrate_thresh
+    pfaccumrainheavy = np.bincount(pf_idx[heavy], weights=iipfrain[heavy], minlength=npf_save).astype(float)
+    pfaccumrainheavy[np.bincount(pf_idx[heavy], minlength=npf_save) == 0] = fillval_f
+
+    # Geometric statistics
+    _sub_rainrate_map = np.copy(sub_rainrate_map)
+    _sub_rainrate_map[np.isnan(_sub_rainrate_map)] = -9999
+    pfproperties = label_shape_stats(pfnumberlabelmap, npf_save, _sub_rainrate_map)
+    pfeccentricity = pfproperties["eccentricity"]
+    pfmajoraxis = pfproperties["major_axis_length"] * pixel_radius
+    pfminoraxis = pfproperties["minor_axis_length"] * pixel_radius
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pfaspectratio = np.divide(pfmajoraxis, pfminoraxis)
+    pforientation = pfproperties["orientation"] * (180 / float(pi))
+    pfperimeter = pfproperties["perimeter"] * pixel_radius
+
+    # Shift the centroids by minx/miny since the PF is a subset from the full image,
+    # and get lat/lon at the centroids
+    pflon_centroid, pflat_centroid = get_centroid_lonlat(
+        pfproperties["centroid-0"], pfproperties["centroid-1"], miny, minx, lon, lat, fillval_f,
+    )
+    pflon_weightedcentroid, pflat_weightedcentroid = get_centroid_lonlat(
+        pfproperties["weighted_centroid-0"], pfproperties["weighted_centroid-1"], miny, minx, lon, lat, fillval_f,
+    )
 
-        else:
-            sys.exit("Error: PF pixel count not matching!")
-    logger.debug("Loop done")
+    # Find indices of the max rain rate within the subset region
+    iipfy_max, iipfx_max = np.unravel_index(
+        np.nanargmax(sub_rainrate_map), sub_rainrate_map.shape
+    )
+    # Shift the x, y indices by minx/miny
+    pflon_maxrainrate = np.full(npf_save, lon[iipfy_max + miny, iipfx_max + minx], dtype=float)
+    pflat_maxrainrate = np.full(npf_save, lat[iipfy_max + miny, iipfx_max + minx], dtype=float)
+    logger.debug("PF statistics done")
 
     # Put all variables in dictionary for output
     pf_stats_dict = {
@@ -720,7 +625,9 @@ def get_cloud_boundary(icloudlocationx, icloudlocationy, xdim, ydim):
 
 
 def add_merge_split_cloud_locations(
-        cloudnumbermap,
+        pixel_offsets,
+        pixel_flatindex,
+        xdim,
         icloudlocationx,
         icloudlocationy,
         ittmergecloudnumber,
@@ -731,67 +638,35 @@ def add_merge_split_cloud_locations(
     Add pixel location indices of merge and split clouds to the current cloud indices.
 
     Args:
-        cloudnumbermap:
-        icloudlocationt:
-        icloudlocationx:
-        icloudlocationy:
-        ittmergecloudnumber:
-        ittsplitcloudnumber:
+        pixel_offsets: numpy array
+            Offsets of each cloud number into pixel_flatindex.
+        pixel_flatindex: numpy array
+            Flat pixel indices sorted by cloud number.
+        xdim: int
+            Full pixel image dimension in x-direction.
+        icloudlocationx: numpy array
+            Cloud location indices in x-direction.
+        icloudlocationy: numpy array
+            Cloud location indices in y-direction.
+        ittmergecloudnumber: numpy array
+            Cloud numbers of merging clouds.
+        ittsplitcloudnumber: numpy array
+            Cloud numbers of splitting clouds.
         logger:
 
     Returns:
-        icloudlocationt: t-indices
         icloudlocationx: x-indices
         icloudlocationy: y-indices
     """
     ######################################################################
-    # Check if any small clouds merge
-    logger.debug("Finding mergers")
-    idmergecloudnumber = np.array(np.where(ittmergecloudnumber > 0))[0,:]
-    nmergecloud = len(idmergecloudnumber)
-    if nmergecloud > 0:
-        # Loop over each merging cloud
-        for imc in idmergecloudnumber:
-            # Find location of the merging cloud
-            (
-                imergelocationy,
-                imergelocationx,
-            ) = np.array(
-                np.where(cloudnumbermap == ittmergecloudnumber[imc])
-            )
-            nmergepix = len(imergelocationy)
-
-            # Add merge pixes to mcs pixels
-            if nmergepix > 0:
-                icloudlocationy = np.hstack(
-                    (icloudlocationy, imergelocationy)
-                )
-                icloudlocationx = np.hstack(
-                    (icloudlocationx, imergelocationx)
-                )
-    ######################################################################
-    # Check if any small clouds split
-    logger.debug("Finding splits")
-    idsplitcloudnumber = np.array(np.where(ittsplitcloudnumber > 0))[0,:]
-    nsplitcloud = len(idsplitcloudnumber)
-    if nsplitcloud > 0:
-        # Loop over each merging cloud
-        for imc in idsplitcloudnumber:
-            # Find location of the merging cloud
-            (
-                isplitlocationy,
-                isplitlocationx,
-            ) = np.array(
-                np.where(cloudnumbermap == ittsplitcloudnumber[imc])
-            )
-            nsplitpix = len(isplitlocationy)
-
-            # Add split pixels to mcs pixels
-            if nsplitpix > 0:
-                icloudlocationy = np.hstack(
-                    (icloudlocationy, isplitlocationy)
-                )
-                icloudlocationx = np.hstack(
-                    (icloudlocationx, isplitlocationx)
-                )
-    return icloudlocationx, icloudlocationy
\ No newline at end of file
+    # Add locations of merging clouds, followed by splitting clouds
+    logger.debug("Finding mergers and splits")
+    mscloudnumber = np.concatenate((
+        ittmergecloudnumber[ittmergecloudnumber > 0],
+        ittsplitcloudnumber[ittsplitcloudnumber > 0],
+    ))
+    if len(mscloudnumber) > 0:
+        imslocationy, imslocationx = get_label_pixels(pixel_offsets, pixel_flatindex, mscloudnumber, xdim)
+        icloudlocationy = np.hstack((icloudlocationy, imslocationy))
+        icloudlocationx = np.hstack((icloudlocationx, imslocationx))
+    return icloudlocationx, icloudlocationy
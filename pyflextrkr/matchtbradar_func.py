@@ -4,12 +4,10 @@ import sys
 import logging
 import xarray as xr
 from scipy.ndimage import label
-from skimage.measure import regionprops
 from math import pi
-from scipy.stats import skew
-import warnings
-from pyflextrkr.ftfunctions import sort_renumber
-from pyflextrkr.ft_utilities import subset_ds_geolimit
+from pyflextrkr.ftfunctions import sort_renumber, get_label_pixels_sorted, label_nanmean, label_nanmax, \
+    label_skewness, label_shape_stats, get_centroid_lonlat
+from pyflextrkr.ft_utilities import subset_ds_geolimit, get_label_pixel_index, get_label_pixels, get_local_map
 
 def matchtbpf_singlefile(
     cloudid_filename,
@@ -109,6 +107,9 @@ def matchtbpf_singlefile(
         # Get dimensions of data
         ydim, xdim = np.shape(lat)
 
+        # Index pixels of each cloud number once for all matched clouds
+        pixel_offsets, pixel_flatindex = get_label_pixel_index(cloudnumbermap)
+
         # Number of clouds
         nmatchcloud = len(ir_cloudnumber)
 
@@ -129,66 +130,66 @@ def matchtbpf_singlefile(
             total_rain = np.full(nmatchcloud, fillval_f, dtype=float)
             total_heavyrain = np.full(nmatchcloud, fillval_f, dtype=float)
             rainrate_heavyrain = np.full(nmatchcloud, fillval_f, dtype=float)
-            pf_lon = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=float)
-            pf_lat = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=float)
-            pf_area = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=float)
-            pf_rainrate = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=float)
-            pf_skewness = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=float)
-            pf_maxrainrate = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=float)
-            pf_majoraxis = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=float)
-            pf_minoraxis = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=float)
-            pf_aspectratio = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=float)
-            pf_orientation = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=float)
-            pf_eccentricity = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=float)
-            pf_perimeter = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=float)
-            pf_lon_centroid = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=float)
-            pf_lat_centroid = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=float)
-            pf_lon_weightedcentroid = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=float)
-            pf_lat_weightedcentroid = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=float)
-            pf_accumrain = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=float)
-            pf_accumrainheavy = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=float)
-            pf_lon_maxrainrate = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=float)
-            pf_lat_maxrainrate = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=float)
+            pf_lon = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=np.float32)
+            pf_lat = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=np.float32)
+            pf_area = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=np.float32)
+            pf_rainrate = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=np.float32)
+            pf_skewness = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=np.float32)
+            pf_maxrainrate = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=np.float32)
+            pf_majoraxis = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=np.float32)
+            pf_minoraxis = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=np.float32)
+            pf_aspectratio = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=np.float32)
+            pf_orientation = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=np.float32)
+            pf_eccentricity = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=np.float32)
+            pf_perimeter = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=np.float32)
+            pf_lon_centroid = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=np.float32)
+            pf_lat_centroid = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=np.float32)
+            pf_lon_weightedcentroid = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=np.float32)
+            pf_lat_weightedcentroid = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=np.float32)
+            pf_accumrain = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=np.float32)
+            pf_accumrainheavy = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=np.float32)
+            pf_lon_maxrainrate = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=np.float32)
+            pf_lat_maxrainrate = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=np.float32)
             basetime = np.full(nmatchcloud, fillval_f, dtype=float)
             # Radar PF variables
             conv_rain = np.full(nmatchcloud, fillval_f, dtype=float)
             strat_rain = np.full(nmatchcloud, fillval_f, dtype=float)
-            pf_ccarea = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=float)
-            pf_sfarea = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=float)
-            pf_ccrainrate = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=float)
-            pf_sfrainrate = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=float)
-            pf_ccrainamount = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=float)
-            pf_sfrainamount = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=float)
-            pf_ccmaxechotop10 = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=float)
-            pf_ccmaxechotop20 = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=float)
-            pf_ccmaxechotop30 = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=float)
-            pf_ccmaxechotop40 = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=float)
-            pf_ccmaxechotop45 = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=float)
-            pf_ccmaxechotop50 = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=float)
-            pf_ccechotop40area = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=float)
-            pf_ccechotop45area = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=float)
-            pf_ccechotop50area = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=float)
+            pf_ccarea = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=np.float32)
+            pf_sfarea = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=np.float32)
+            pf_ccrainrate = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=np.float32)
+            pf_sfrainrate = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=np.float32)
+            pf_ccrainamount = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=np.float32)
+            pf_sfrainamount = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=np.float32)
+            pf_ccmaxechotop10 = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=np.float32)
+            pf_ccmaxechotop20 = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=np.float32)
+            pf_ccmaxechotop30 = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=np.float32)
+            pf_ccmaxechotop40 = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=np.float32)
+            pf_ccmaxechotop45 = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=np.float32)
+            pf_ccmaxechotop50 = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=np.float32)
+            pf_ccechotop40area = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=np.float32)
+            pf_ccechotop45area = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=np.float32)
+            pf_ccechotop50area = np.full((nmatchcloud, nmaxpf), fillval_f, dtype=np.float32)
             # Radar convective core variables
             pf_ncore = np.full(nmatchcloud, fillval, dtype=np.int16)
-            pf_corearea = np.full((nmatchcloud, nmaxcore), fillval_f, dtype=float)
-            pf_corelon = np.full((nmatchcloud, nmaxcore), fillval_f, dtype=float)
-            pf_corelat = np.full((nmatchcloud, nmaxcore), fillval_f, dtype=float)
-            pf_corelon_centroid = np.full((nmatchcloud, nmaxcore), fillval_f, dtype=float)
-            pf_corelat_centroid = np.full((nmatchcloud, nmaxcore), fillval_f, dtype=float)
-            pf_corelon_weightedcentroid = np.full((nmatchcloud, nmaxcore), fillval_f, dtype=float)
-            pf_corelat_weightedcentroid = np.full((nmatchcloud, nmaxcore), fillval_f, dtype=float)
-            pf_coremajoraxis = np.full((nmatchcloud, nmaxcore), fillval_f, dtype=float)
-            pf_coreminoraxis = np.full((nmatchcloud, nmaxcore), fillval_f, dtype=float)
-            pf_coreaspectratio = np.full((nmatchcloud, nmaxcore), fillval_f, dtype=float)
-            pf_coreorientation = np.full((nmatchcloud, nmaxcore), fillval_f, dtype=float)
-            pf_coreperimeter = np.full((nmatchcloud, nmaxcore), fillval_f, dtype=float)
-            pf_coreeccentricity = np.full((nmatchcloud, nmaxcore), fillval_f, dtype=float)
-            pf_coremaxechotop10 = np.full((nmatchcloud, nmaxcore), fillval_f, dtype=float)
-            pf_coremaxechotop20 = np.full((nmatchcloud, nmaxcore), fillval_f, dtype=float)
-            pf_coremaxechotop30 = np.full((nmatchcloud, nmaxcore), fillval_f, dtype=float)
-            pf_coremaxechotop40 = np.full((nmatchcloud, nmaxcore), fillval_f, dtype=float)
-            pf_coremaxechotop45 = np.full((nmatchcloud, nmaxcore), fillval_f, dtype=float)
-            pf_coremaxechotop50 = np.full((nmatchcloud, nmaxcore), fillval_f, dtype=float)
+            pf_corearea = np.full((nmatchcloud, nmaxcore), fillval_f, dtype=np.float32)
+            pf_corelon = np.full((nmatchcloud, nmaxcore), fillval_f, dtype=np.float32)
+            pf_corelat = np.full((nmatchcloud, nmaxcore), fillval_f, dtype=np.float32)
+            pf_corelon_centroid = np.full((nmatchcloud, nmaxcore), fillval_f, dtype=np.float32)
+            pf_corelat_centroid = np.full((nmatchcloud, nmaxcore), fillval_f, dtype=np.float32)
+            pf_corelon_weightedcentroid = np.full((nmatchcloud, nmaxcore), fillval_f, dtype=np.float32)
+            pf_corelat_weightedcentroid = np.full((nmatchcloud, nmaxcore), fillval_f, dtype=np.float32)
+            pf_coremajoraxis = np.full((nmatchcloud, nmaxcore), fillval_f, dtype=np.float32)
+            pf_coreminoraxis = np.full((nmatchcloud, nmaxcore), fillval_f, dtype=np.float32)
+            pf_coreaspectratio = np.full((nmatchcloud, nmaxcore), fillval_f, dtype=np.float32)
+            pf_coreorientation = np.full((nmatchcloud, nmaxcore), fillval_f, dtype=np.float32)
+            pf_coreperimeter = np.full((nmatchcloud, nmaxcore), fillval_f, dtype=np.float32)
+            pf_coreeccentricity = np.full((nmatchcloud, nmaxcore), fillval_f, dtype=np.float32)
+            pf_coremaxechotop10 = np.full((nmatchcloud, nmaxcore), fillval_f, dtype=np.float32)
+            pf_coremaxechotop20 = np.full((nmatchcloud, nmaxcore), fillval_f, dtype=np.float32)
+            pf_coremaxechotop30 = np.full((nmatchcloud, nmaxcore), fillval_f, dtype=np.float32)
+            pf_coremaxechotop40 = np.full((nmatchcloud, nmaxcore), fillval_f, dtype=np.float32)
+            pf_coremaxechotop45 = np.full((nmatchcloud, nmaxcore), fillval_f, dtype=np.float32)
+            pf_coremaxechotop50 = np.full((nmatchcloud, nmaxcore), fillval_f, dtype=np.float32)
 
             # Loop over each matched cloud number
             for imatchcloud in range(nmatchcloud):
@@ -198,25 +199,10 @@ def matchtbpf_singlefile(
                 ittsplitcloudnumber = ir_splitcloudnumber[imatchcloud]
                 basetime[imatchcloud] = cloudid_basetime
 
-                #########################################################################
-                # Intialize matrices for only MCS data
-                rainrate_map = np.full((ydim, xdim), np.nan, dtype=float)
-                reflectivity_map = np.full((ydim, xdim), np.nan, dtype=float)
-                sl3d_map = np.full((ydim, xdim), np.nan, dtype=float)
-                echotop10_map = np.full((ydim, xdim), np.nan, dtype=float)
-                echotop20_map = np.full((ydim, xdim), np.nan, dtype=float)
-                echotop30_map = np.full((ydim, xdim), np.nan, dtype=float)
-                echotop40_map = np.full((ydim, xdim), np.nan, dtype=float)
-                echotop45_map = np.full((ydim, xdim), np.nan, dtype=float)
-                echotop50_map = np.full((ydim, xdim), np.nan, dtype=float)
-                logger.debug(
-                    ("rainrate_map allocation size: ", rainrate_map.shape)
-                )
-
                 ############################################################################
                 # Find matching cloud number
-                icloudlocationy, icloudlocationx = np.array(
-                    np.where(cloudnumbermap == ittcloudnumber)
+                icloudlocationy, icloudlocationx = get_label_pixels(
+                    pixel_offsets, pixel_flatindex, ittcloudnumber, xdim,
                 )
                 ncloudpix = len(icloudlocationy)
 
@@ -224,44 +210,15 @@ def matchtbpf_singlefile(
                     logger.debug("IR Clouds Present")
                     # Add merge/split cloud pixel locations
                     icloudlocationx, \
-                    icloudlocationy = add_merge_split_cloud_locations(cloudnumbermap,
+                    icloudlocationy = add_merge_split_cloud_locations(pixel_offsets,
+                                                                      pixel_flatindex,
+                                                                      xdim,
                                                                       icloudlocationx,
                                                                       icloudlocationy,
                                                                       ittmergecloudnumber,
                                                                       ittsplitcloudnumber,
                                                                       logger)
 
-                    ########################################################################
-                    # Fill matrices with MCS data
-                    logger.debug("Fill map with data")
-                    rainrate_map[icloudlocationy, icloudlocationx] = np.copy(
-                        rawrainratemap[icloudlocationy, icloudlocationx]
-                    )
-                    reflectivity_map[icloudlocationy, icloudlocationx] = np.copy(
-                        reflectivity[icloudlocationy, icloudlocationx]
-                    )
-                    sl3d_map[icloudlocationy, icloudlocationx] = np.copy(
-                        sl3d[icloudlocationy, icloudlocationx]
-                    )
-                    echotop10_map[icloudlocationy, icloudlocationx] = np.copy(
-                        echotop10[icloudlocationy, icloudlocationx]
-                    )
-                    echotop20_map[icloudlocationy, icloudlocationx] = np.copy(
-                        echotop20[icloudlocationy, icloudlocationx]
-                    )
-                    echotop30_map[icloudlocationy, icloudlocationx] = np.copy(
-                        echotop30[icloudlocationy, icloudlocationx]
-                    )
-                    echotop40_map[icloudlocationy, icloudlocationx] = np.copy(
-                        echotop40[icloudlocationy, icloudlocationx]
-                    )
-                    echotop45_map[icloudlocationy, icloudlocationx] = np.copy(
-                        echotop45[icloudlocationy, icloudlocationx]
-                    )
-                    echotop50_map[icloudlocationy, icloudlocationx] = np.copy(
-                        echotop50[icloudlocationy, icloudlocationx]
-                    )
-
                     ########################################################################
                     ## Isolate small region of cloud data around mcs at this time
                     logger.debug("Calculate new shape statistics")
@@ -272,16 +229,18 @@ def matchtbpf_singlefile(
                                                                 xdim,
                                                                 ydim)
 
-                    # Isolate region over the cloud shield
-                    sub_rainrate_map = np.copy(rainrate_map[miny:maxy, minx:maxx])
-                    sub_reflectivity_map = np.copy(reflectivity_map[miny:maxy, minx:maxx])
-                    sub_sl3d_map = np.copy(sl3d_map[miny:maxy, minx:maxx])
-                    sub_echotop10_map = np.copy(echotop10_map[miny:maxy, minx:maxx])
-                    sub_echotop20_map = np.copy(echotop20_map[miny:maxy, minx:maxx])
-                    sub_echotop30_map = np.copy(echotop30_map[miny:maxy, minx:maxx])
-                    sub_echotop40_map = np.copy(echotop40_map[miny:maxy, minx:maxx])
-                    sub_echotop45_map = np.copy(echotop45_map[miny:maxy, minx:maxx])
-                    sub_echotop50_map = np.copy(echotop50_map[miny:maxy, minx:maxx])
+                    # Fill MCS data within the cloud boundary
+                    logger.debug("Fill map with data")
+                    sub_bounds = (miny, maxy, minx, maxx)
+                    sub_rainrate_map = get_local_map(rawrainratemap, icloudlocationy, icloudlocationx, *sub_bounds)
+                    sub_reflectivity_map = get_local_map(reflectivity, icloudlocationy, icloudlocationx, *sub_bounds)
+                    sub_sl3d_map = get_local_map(sl3d, icloudlocationy, icloudlocationx, *sub_bounds)
+                    sub_echotop10_map = get_local_map(echotop10, icloudlocationy, icloudlocationx, *sub_bounds)
+                    sub_echotop20_map = get_local_map(echotop20, icloudlocationy, icloudlocationx, *sub_bounds)
+                    sub_echotop30_map = get_local_map(echotop30, icloudlocationy, icloudlocationx, *sub_bounds)
+                    sub_echotop40_map = get_local_map(echotop40, icloudlocationy, icloudlocationx, *sub_bounds)
+                    sub_echotop45_map = get_local_map(echotop45, icloudlocationy, icloudlocationx, *sub_bounds)
+                    sub_echotop50_map = get_local_map(echotop50, icloudlocationy, icloudlocationx, *sub_bounds)
 
                     # Calculate total rainfall within the cold cloud shield
                     total_rain[imatchcloud] = np.nansum(sub_rainrate_map)
@@ -976,114 +935,64 @@ def calc_cc_stats(
             Dictionary containing core statistics variables.
     """
     logger = logging.getLogger(__name__)
-    # Initialize arrays
     ncc_save = np.nanmin([nmaxcore, numcc])
-    ccnpix = np.zeros(ncc_save, dtype=float)
-    ccid = np.full(ncc_save, fillval, dtype=int)
-    cclon = np.full(ncc_save, fillval_f, dtype=float)
-    cclat = np.full(ncc_save, fillval_f, dtype=float)
-    cclon_centroid = np.full(ncc_save, fillval_f, dtype=float)
-    cclat_centroid = np.full(ncc_save, fillval_f, dtype=float)
-    cclon_weightedcentroid = np.full(ncc_save, fillval_f, dtype=float)
-    cclat_weightedcentroid = np.full(ncc_save, fillval_f, dtype=float)
-    ccmajoraxis = np.full(ncc_save, fillval_f, dtype=float)
-    ccminoraxis = np.full(ncc_save, fillval_f, dtype=float)
-    ccaspectratio = np.full(ncc_save, fillval_f, dtype=float)
-    ccorientation = np.full(ncc_save, fillval_f, dtype=float)
-    ccperimeter = np.full(ncc_save, fillval_f, dtype=float)
-    cceccentricity = np.full(ncc_save, fillval_f, dtype=float)
-    ccmaxechotop10 = np.full(ncc_save, fillval_f, dtype=float)
-    ccmaxechotop20 = np.full(ncc_save, fillval_f, dtype=float)
-    ccmaxechotop30 = np.full(ncc_save, fillval_f, dtype=float)
-    ccmaxechotop40 = np.full(ncc_save, fillval_f, dtype=float)
-    ccmaxechotop45 = np.full(ncc_save, fillval_f, dtype=float)
-    ccmaxechotop50 = np.full(ncc_save, fillval_f, dtype=float)
-
-    logger.debug(
-        "Looping through each core to calculate statistics"
-    )
     logger.debug(("Number of cores " + str(numcc)))
 
-    # Get the shape of the full data array
-    ny, nx = lon.shape
-
-    ###############################################
-    # Loop through each PF
-    for icc in range(1, ncc_save + 1):
-        #######################################
-        # Find indices of the core
-        iiccy, iiccx = np.where(ccnumberlabelmap == icc)
-        iiccnpix = len(iiccy)
-
-        # Double check to make sure PF pixel count is the same
-        if iiccnpix == cc_npix[icc - 1]:
-            ##########################################
-            # Compute core statistics
-
-            # Basic statistics
-            ccnpix[icc - 1] = np.copy(iiccnpix)
-            ccid[icc - 1] = np.copy(int(icc))
-            cclon[icc - 1] = np.nanmean(lon[iiccy[:] + miny, iiccx[:] + minx])
-            cclat[icc - 1] = np.nanmean(lat[iiccy[:] + miny, iiccx[:] + minx])
-
-            # Convective echotop height statistics
-            if iiccnpix > 0:
-                with warnings.catch_warnings():
-                    warnings.simplefilter("ignore", category=RuntimeWarning)
-                    ccmaxechotop10[icc - 1] = np.nanmax(sub_echotop10_map[iiccy, iiccx])
-                    ccmaxechotop20[icc - 1] = np.nanmax(sub_echotop20_map[iiccy, iiccx])
-                    ccmaxechotop30[icc - 1] = np.nanmax(sub_echotop30_map[iiccy, iiccx])
-                    ccmaxechotop40[icc - 1] = np.nanmax(sub_echotop40_map[iiccy, iiccx])
-                    ccmaxechotop45[icc - 1] = np.nanmax(sub_echotop45_map[iiccy, iiccx])
-                    ccmaxechotop50[icc - 1] = np.nanmax(sub_echotop50_map[iiccy, iiccx])
-
-            # Generate a binary map of core
-            iiccflagmap = np.zeros((subdimy, subdimx), dtype=int)
-            iiccflagmap[iiccy, iiccx] = 1
-
-            # Geometric statistics
-            _sub_reflectivity_map = np.copy(sub_reflectivity_map)
-            _sub_reflectivity_map[np.isnan(_sub_reflectivity_map)] = -9999
-            # _sub_reflectivity_map = np.full((subdimy, subdimx), -9999, dtype=float)
-            # _sub_reflectivity_map[iiccy, iiccx] = sub_reflectivity_map[iiccy, iiccx]
-            ccproperties = regionprops(
-                iiccflagmap,
-                intensity_image=_sub_reflectivity_map,
-            )
-
-            cceccentricity[icc - 1] = ccproperties[0].eccentricity
-            ccmajoraxis[icc - 1] = ccproperties[0].major_axis_length * pixel_radius
-
-            # Need to treat minor axis length with an error except
-            # since the python algorithm occasionally throws an error.
-            try:
-                ccminoraxis[icc - 1] = (ccproperties[0].minor_axis_length * pixel_radius)
-            except ValueError:
-                pass
-            if ~np.isnan(ccminoraxis[icc - 1]) or ~np.isnan(ccmajoraxis[icc - 1]):
-                ccaspectratio[icc - 1] = np.divide(ccmajoraxis[icc - 1], ccminoraxis[icc - 1])
-            ccorientation[icc - 1] = (ccproperties[0].orientation) * (180 / float(pi))
-            ccperimeter[icc - 1] = (ccproperties[0].perimeter * pixel_radius)
-            [ycentroid, xcentroid] = ccproperties[0].centroid
-            [yweightedcentroid, xweightedcentroid] = ccproperties[0].weighted_centroid
-
-            # Shift the centroids by minx/miny
-            # since the core is a subset from the full image
-            # Round the centroid values as indices
-            if (~np.isnan(ycentroid)) & (~np.isnan(xcentroid)):
-                ycentroid = int(np.round(ycentroid + miny))
-                xcentroid = int(np.round(xcentroid + minx))
-            if (~np.isnan(yweightedcentroid)) & (~np.isnan(xweightedcentroid)):
-                yweightedcentroid = int(np.round(yweightedcentroid + miny))
-                xweightedcentroid = int(np.round(xweightedcentroid + minx))
-
-            # Apply the indices to get centroid lat/lon
-            if (0 < (ycentroid) < ny) & (0 < (xcentroid) < nx):
-                cclon_centroid[icc - 1] = lon[ycentroid, xcentroid]
-                cclat_centroid[icc - 1] = lat[ycentroid, xcentroid]
-            if (0 < (yweightedcentroid) < ny) & (0 < (xweightedcentroid) < nx):
-                cclon_weightedcentroid[icc - 1] = lon[yweightedcentroid, xweightedcentroid]
-                cclat_weightedcentroid[icc - 1] = lat[yweightedcentroid, xweightedcentroid]
+    # Get pixels of the saved cores, and label index of each pixel
+    cc_idx, iiccy, iiccx = get_label_pixels_sorted(ccnumberlabelmap, ncc_save)
+    ccnpix = np.bincount(cc_idx, minlength=ncc_save).astype(float)
+    ccid = np.arange(1, ncc_save + 1)
+
+    # Double check to make sure core pixel count is the same
+    valid = ccnpix == cc_npix[0:ncc_save]
+
+    ##########################################
+    # Compute core statistics for all cores at once
+    logger.debug("Calculating statistics for all cores")
+
+    # Basic statistics
+    cclon = label_nanmean(lon[iiccy + miny, iiccx + minx], cc_idx, ncc_save)
+    cclat = label_nanmean(lat[iiccy + miny, iiccx + minx], cc_idx, ncc_save)
+
+    # Convective echotop height statistics
+    ccmaxechotop10 = label_nanmax(sub_echotop10_map[iiccy, iiccx], cc_idx, ncc_save)
+    ccmaxechotop20 = label_nanmax(sub_echotop20_map[iiccy, iiccx], cc_idx, ncc_save)
+    ccmaxechotop30 = label_nanmax(sub_echotop30_map[iiccy, iiccx], cc_idx, ncc_save)
+    ccmaxechotop40 = label_nanmax(sub_echotop40_map[iiccy, iiccx], cc_idx, ncc_save)
+    ccmaxechotop45 = label_nanmax(sub_echotop45_map[iiccy, iiccx], cc_idx, ncc_save)
+    ccmaxechotop50 = label_nanmax(sub_echotop50_map[iiccy, iiccx], cc_idx, ncc_save)
+
+    # Geometric statistics
+    _sub_reflectivity_map = np.copy(sub_reflectivity_map)
+    _sub_reflectivity_map[np.isnan(_sub_reflectivity_map)] = -9999
+    ccproperties = label_shape_stats(ccnumberlabelmap, ncc_save, _sub_reflectivity_map)
+    cceccentricity = ccproperties["eccentricity"]
+    ccmajoraxis = ccproperties["major_axis_length"] * pixel_radius
+    ccminoraxis = ccproperties["minor_axis_length"] * pixel_radius
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ccaspectratio = np.divide(ccmajoraxis, ccminoraxis)
+    ccorientation = ccproperties["orientation"] * (180 / float(pi))
+    ccperimeter = ccproperties["perimeter"] * pixel_radius
+
+    # Shift the centroids by minx/miny since the core is a subset from the full image,
+    # and get lat/lon at the centroids
+    cclon_centroid, cclat_centroid = get_centroid_lonlat(
+        ccproperties["centroid-0"], ccproperties["centroid-1"], miny, minx, lon, lat, fillval_f,
+    )
+    cclon_weightedcentroid, cclat_weightedcentroid = get_centroid_lonlat(
+        ccproperties["weighted_centroid-0"], ccproperties["weighted_centroid-1"], miny, minx, lon, lat, fillval_f,
+    )
+
+    # Cores with mismatched pixel count are missing
+    ccnpix[~valid] = 0
+    ccid[~valid] = fillval
+    for ccvar in [
+        cclon, cclat, ccmaxechotop10, ccmaxechotop20, ccmaxechotop30, ccmaxechotop40, ccmaxechotop45,
+        ccmaxechotop50, cceccentricity, ccmajoraxis, ccminoraxis, ccaspectratio, ccorientation,
+        ccperimeter, cclon_centroid, cclat_centroid, cclon_weightedcentroid, cclat_weightedcentroid,
+    ]:
+        ccvar[~valid] = fillval_f
+    logger.debug("Core statistics done")
 
     # Put all variables in dictionary for output
     cc_stats_dict = {
@@ -1154,210 +1063,94 @@ def calc_pf_stats(
             Dictionary containing PF statistics variables.
     """
     logger = logging.getLogger(__name__)
-    # Initialize arrays
     npf_save = np.nanmin([nmaxpf, numpf])
-    pfnpix = np.zeros(npf_save, dtype=float)
-    pfid = np.full(npf_save, fillval, dtype=int)
-    pflon = np.full(npf_save, fillval_f, dtype=float)
-    pflat = np.full(npf_save, fillval_f, dtype=float)
-    pfrainrate = np.full(npf_save, fillval_f, dtype=float)
-    pfmaxrainrate = np.full(npf_save, fillval_f, dtype=float)
-    pfskewness = np.full(npf_save, fillval_f, dtype=float)
-    pfmajoraxis = np.full(npf_save, fillval_f, dtype=float)
-    pfminoraxis = np.full(npf_save, fillval_f, dtype=float)
-    pfaspectratio = np.full(npf_save, fillval_f, dtype=float)
-    pflon_centroid = np.full(npf_save, fillval_f, dtype=float)
-    pflat_centroid = np.full(npf_save, fillval_f, dtype=float)
-    pflon_weightedcentroid = np.full(npf_save, fillval_f, dtype=float)
-    pflat_weightedcentroid = np.full(npf_save, fillval_f, dtype=float)
-    pflon_maxrainrate = np.full(npf_save, fillval_f, dtype=float)
-    pflat_maxrainrate = np.full(npf_save, fillval_f, dtype=float)
-    pfeccentricity = np.full(npf_save, fillval_f, dtype=float)
-    pfperimeter = np.full(npf_save, fillval_f, dtype=float)
-    pforientation = np.full(npf_save, fillval_f, dtype=float)
-    pfaccumrain = np.full(npf_save, fillval_f, dtype=float)
-    pfaccumrainheavy = np.full(npf_save, fillval_f, dtype=float)
-    # Radar features
-    pfccnpix = np.full(npf_save, fillval_f, dtype=float)
-    pfsfnpix = np.full(npf_save, fillval_f, dtype=float)
-    pfccrainrate = np.full(npf_save, fillval_f, dtype=float)
-    pfsfrainrate = np.full(npf_save, fillval_f, dtype=float)
-    pfccrainamount = np.full(npf_save, fillval_f, dtype=float)
-    pfsfrainamount = np.full(npf_save, fillval_f, dtype=float)
-    pfccmaxechotop10 = np.full(npf_save, fillval_f, dtype=float)
-    pfccmaxechotop20 = np.full(npf_save, fillval_f, dtype=float)
-    pfccmaxechotop30 = np.full(npf_save, fillval_f, dtype=float)
-    pfccmaxechotop40 = np.full(npf_save, fillval_f, dtype=float)
-    pfccmaxechotop45 = np.full(npf_save, fillval_f, dtype=float)
-    pfccmaxechotop50 = np.full(npf_save, fillval_f, dtype=float)
-    pfccechotop40npix = np.full(npf_save, fillval_f, dtype=float)
-    pfccechotop45npix = np.full(npf_save, fillval_f, dtype=float)
-    pfccechotop50npix = np.full(npf_save, fillval_f, dtype=float)
-
-    logger.debug(
-        "Looping through each feature to calculate statistics"
-    )
     logger.debug(("Number of PFs " + str(numpf)))
 
-    # Get the shape of the full data array
-    ny, nx = lon.shape
-
-    ###############################################
-    # Loop through each PF
-    for ipf in range(1, npf_save + 1):
-
-        #######################################
-        # Find indices of the PF
-        iipfy, iipfx = np.array(
-            np.where(pfnumberlabelmap == ipf)
-        )
-        iipfnpix = len(iipfy)
-
-        # Find indices of the PF with heavy rain
-        iipfy_heavy, iipfx_heavy = np.array(
-            np.where(
-                (pfnumberlabelmap == ipf)
-                & (sub_rainrate_map > heavy_rainrate_thresh)
-            )
-        )
-        iipfnpix_heavy = len(iipfy_heavy)
-
-        # Find indices of the PF with max rain rate
-        iipfy_max, iipfx_max = np.unravel_index(
-            np.nanargmax(sub_rainrate_map), sub_rainrate_map.shape
-        )
-
-        # Find convective indices
-        iipfy_cc, iipfx_cc = np.where(
-            (pfnumberlabelmap == ipf) & (sub_sl3d_map >= 1) & (sub_sl3d_map <= 2)
-        )
-        iipfnpix_cc = len(iipfy_cc)
-
-        # Find stratiform indices
-        iipfy_sf, iipfx_sf = np.where(
-            (pfnumberlabelmap == ipf) & (sub_sl3d_map == 3)
-        )
-        iipfnpix_sf = len(iipfy_sf)
-
-        # Double check to make sure PF pixel count is the same
-        if iipfnpix == pf_npix[ipf - 1]:
-            ##########################################
-            # Compute PF statistics
-
-            # Basic statistics
-            pfnpix[ipf - 1] = np.copy(iipfnpix)
-            pfid[ipf - 1] = np.copy(int(ipf))
-            pflon[ipf - 1] = np.nanmean(lon[iipfy[:] + miny, iipfx[:] + minx])
-            pflat[ipf - 1] = np.nanmean(lat[iipfy[:] + miny, iipfx[:] + minx])
-
-            pfrainrate[ipf - 1] = np.nanmean(sub_rainrate_map[iipfy[:], iipfx[:]])
-            pfmaxrainrate[ipf - 1] = np.nanmax(sub_rainrate_map[iipfy[:], iipfx[:]])
-            pfskewness[ipf - 1] = skew(sub_rainrate_map[iipfy[:], iipfx[:]])
-            pfaccumrain[ipf - 1] = np.nansum(sub_rainrate_map[iipfy[:], iipfx[:]])
-            if iipfnpix_heavy > 0:
-                pfaccumrainheavy[ipf - 1] = np.nansum(
-                    sub_rainrate_map[iipfy_heavy[:], iipfx_heavy[:]]
-                )
-
-            # Convective/stratiform rain statistics
-            pfccnpix[ipf - 1] = np.copy(len(iipfy_cc))
-            pfsfnpix[ipf - 1] = np.copy(len(iipfy_sf))
-            if iipfnpix_cc > 0:
-                pfccrainrate[ipf - 1] = np.nanmean(sub_rainrate_map[iipfy_cc, iipfx_cc])
-                pfccrainamount[ipf - 1] = np.nansum(sub_rainrate_map[iipfy_cc, iipfx_cc])
-            if iipfnpix_sf > 0:
-                pfsfrainrate[ipf - 1] = np.nanmean(sub_rainrate_map[iipfy_sf, iipfx_sf])
-                pfsfrainamount[ipf - 1] = np.nansum(sub_rainrate_map[iipfy_sf, iipfx_sf])
-
-            # Convective echotop height statistics
-            if iipfnpix_cc > 0:
-                with warnings.catch_warnings():
-                    warnings.simplefilter("ignore", category=RuntimeWarning)
-                    pfccmaxechotop10[ipf - 1] = np.nanmax(sub_echotop10_map[iipfy_cc, iipfx_cc])
-                    pfccmaxechotop20[ipf - 1] = np.nanmax(sub_echotop20_map[iipfy_cc, iipfx_cc])
-                    pfccmaxechotop30[ipf - 1] = np.nanmax(sub_echotop30_map[iipfy_cc, iipfx_cc])
-                    pfccmaxechotop40[ipf - 1] = np.nanmax(sub_echotop40_map[iipfy_cc, iipfx_cc])
-                    pfccmaxechotop45[ipf - 1] = np.nanmax(sub_echotop45_map[iipfy_cc, iipfx_cc])
-                    pfccmaxechotop50[ipf - 1] = np.nanmax(sub_echotop50_map[iipfy_cc, iipfx_cc])
-                    # Area containing convective echo top > X dBZ
-                    pfccechotop40npix[ipf - 1] = np.count_nonzero(
-                        sub_echotop40_map[iipfy_cc, iipfx_cc] > 0
-                    )
-                    pfccechotop45npix[ipf - 1] = np.count_nonzero(
-                        sub_echotop45_map[iipfy_cc, iipfx_cc] > 0
-                    )
-                    pfccechotop50npix[ipf - 1] = np.count_nonzero(
-                        sub_echotop50_map[iipfy_cc, iipfx_cc] > 0
-                    )
-
-            # Generate a binary map of PF
-            iipfflagmap = np.zeros((subdimy, subdimx), dtype=int)
-            iipfflagmap[iipfy, iipfx] = 1
-
-            # Geometric statistics
-            _sub_rainrate_map = np.copy(sub_rainrate_map)
-            _sub_rainrate_map[np.isnan(_sub_rainrate_map)] = -9999
-            pfproperties = regionprops(
-                iipfflagmap,
-                intensity_image=_sub_rainrate_map,
-            )
-            pfeccentricity[ipf - 1] = pfproperties[0].eccentricity
-            pfmajoraxis[ipf - 1] = (
-                    pfproperties[0].major_axis_length * pixel_radius
-            )
-
-            # Need to treat minor axis length with an error except
-            # since the python algorithm occasionally throws an error.
-            try:
-                pfminoraxis[ipf - 1] = (
-                        pfproperties[0].minor_axis_length
-                        * pixel_radius
-                )
-            except ValueError:
-                pass
-            if ~np.isnan(pfminoraxis[ipf - 1]) or \
-                    ~np.isnan(pfmajoraxis[ipf - 1]):
-                pfaspectratio[ipf - 1] = np.divide(
-                    pfmajoraxis[ipf - 1], pfminoraxis[ipf - 1]
-                )
-            pforientation[ipf - 1] = (
-                                         pfproperties[0].orientation
-                                     ) * (180 / float(pi))
-            pfperimeter[ipf - 1] = (
-                    pfproperties[0].perimeter * pixel_radius
-            )
-            [
-                ycentroid,
-                xcentroid,
-            ] = pfproperties[0].centroid
-            [
-                yweightedcentroid,
-                xweightedcentroid,
-            ] = pfproperties[0].weighted_centroid
-
-            # Shift the centroids by minx/miny
-            # since the PF is a subset from the full image
-            # Round the centroid values as indices
-            ycentroid = int(np.round(ycentroid + miny))
-            xcentroid = int(np.round(xcentroid + minx))
-            yweightedcentroid = int(np.round(yweightedcentroid + miny))
-            xweightedcentroid = int(np.round(xweightedcentroid + minx))
-
-            # Apply the indices to get centroid lat/lon
-            if (0 < (ycentroid) < ny) & (0 < (xcentroid) < nx):
-                pflon_centroid[ipf-1] = lon[ycentroid, xcentroid]
-                pflat_centroid[ipf-1] = lat[ycentroid, xcentroid]
-            if (0 < (yweightedcentroid) < ny) & (0 < (xweightedcentroid) < nx):
-                pflon_weightedcentroid[ipf-1] = lon[yweightedcentroid, xweightedcentroid]
-                pflat_weightedcentroid[ipf-1] = lat[yweightedcentroid, xweightedcentroid]
-
-            # Shift the x, y indices by minx/miny
-            pflon_maxrainrate[ipf - 1] = lon[iipfy_max + miny, iipfx_max + minx]
-            pflat_maxrainrate[ipf - 1] = lat[iipfy_max + miny, iipfx_max + minx]
+    # Get pixels of the saved PFs, and label index of each pixel
+    pf_idx, iipfy, iipfx = get_label_pixels_sorted(pfnumberlabelmap, npf_save)
+    pfnpix = np.bincount(pf_idx, minlength=npf_save).astype(float)
+
+    # Double check to make sure PF pixel count is the same
+    if np.any(pfnpix != pf_npix[0:npf_save]):
+        sys.exit("Error: PF pixel count not matching!")
+
+    ##########################################
+    # Compute PF statistics for all PFs at once
+    logger.debug("Calculating statistics for all PFs")
+    iipfrain = sub_rainrate_map[iipfy, iipfx]
+
+    # Basic statistics
+    pflon = label_nanmean(lon[iipfy + miny, iipfx + minx], pf_idx, npf_save)
+    pflat = label_nanmean(lat[iipfy + miny, iipfx + minx], pf_idx, npf_save)
+    pfrainrate = label_nanmean(iipfrain, pf_idx, npf_save)
+    pfmaxrainrate = label_nanmax(iipfrain, pf_idx, npf_save)
+    pfskewness = label_skewness(iipfrain, pf_idx, npf_save)
+    pfaccumrain = np.bincount(pf_idx, weights=np.nan_to_num(iipfrain), minlength=npf_save).astype(float)
+    # Heavy rain accumulation, missing if a PF has no heavy rain
+    heavy = iipfrain > heavy_rainrate_thresh
+    pfaccumrainheavy = np.bincount(pf_idx[heavy], weights=iipfrain[heavy], minlength=npf_save).astype(float)
+    pfaccumrainheavy[np.bincount(pf_idx[heavy], minlength=npf_save) == 0] = fillval_f
+
+    # Convective/stratiform rain statistics, missing if a PF has no convective/stratiform pixels
+    iipfsl3d = sub_sl3d_map[iipfy, iipfx]
+    cc = (iipfsl3d >= 1) & (iipfsl3d <= 2)
+    sf = iipfsl3d == 3
+    pfccnpix = np.bincount(pf_idx[cc], minlength=npf_save).astype(float)
+    pfsfnpix = np.bincount(pf_idx[sf], minlength=npf_save).astype(float)
+    pfccrainrate = label_nanmean(iipfrain[cc], pf_idx[cc], npf_save)
+    pfsfrainrate = label_nanmean(iipfrain[sf], pf_idx[sf], npf_save)
+    pfccrainamount = np.bincount(pf_idx[cc], weights=np.nan_to_num(iipfrain[cc]), minlength=npf_save).astype(float)
+    pfsfrainamount = np.bincount(pf_idx[sf], weights=np.nan_to_num(iipfrain[sf]), minlength=npf_save).astype(float)
+    pfccrainrate[pfccnpix == 0] = fillval_f
+    pfccrainamount[pfccnpix == 0] = fillval_f
+    pfsfrainrate[pfsfnpix == 0] = fillval_f
+    pfsfrainamount[pfsfnpix == 0] = fillval_f
+
+    # Convective echotop height statistics
+    iiccy, iiccx, cc_idx = iipfy[cc], iipfx[cc], pf_idx[cc]
+    pfccmaxechotop10 = label_nanmax(sub_echotop10_map[iiccy, iiccx], cc_idx, npf_save)
+    pfccmaxechotop20 = label_nanmax(sub_echotop20_map[iiccy, iiccx], cc_idx, npf_save)
+    pfccmaxechotop30 = label_nanmax(sub_echotop30_map[iiccy, iiccx], cc_idx, npf_save)
+    pfccmaxechotop40 = label_nanmax(sub_echotop40_map[iiccy, iiccx], cc_idx, npf_save)
+    pfccmaxechotop45 = label_nanmax(sub_echotop45_map[iiccy, iiccx], cc_idx, npf_save)
+    pfccmaxechotop50 = label_nanmax(sub_echotop50_map[iiccy, iiccx], cc_idx, npf_save)
+    # Area containing convective echo top > X dBZ
+    pfccechotop40npix = np.bincount(cc_idx[sub_echotop40_map[iiccy, iiccx] > 0], minlength=npf_save).astype(float)
+    pfccechotop45npix = np.bincount(cc_idx[sub_echotop45_map[iiccy, iiccx] > 0], minlength=npf_save).astype(float)
+    pfccechotop50npix = np.bincount(cc_idx[sub_echotop50_map[iiccy, iiccx] > 0], minlength=npf_save).astype(float)
+    pfccechotop40npix[pfccnpix == 0] = fillval_f
+    pfccechotop45npix[pfccnpix == 0] = fillval_f
+    pfccechotop50npix[pfccnpix == 0] = fillval_f
+
+    # Geometric statistics
+    _sub_rainrate_map = np.copy(sub_rainrate_map)
+    _sub_rainrate_map[np.isnan(_sub_rainrate_map)] = -9999
+    pfproperties = label_shape_stats(pfnumberlabelmap, npf_save, _sub_rainrate_map)
+    pfeccentricity = pfproperties["eccentricity"]
+    pfmajoraxis = pfproperties["major_axis_length"] * pixel_radius
+    pfminoraxis = pfproperties["minor_axis_length"] * pixel_radius
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pfaspectratio = np.divide(pfmajoraxis, pfminoraxis)
+    pforientation = pfproperties["orientation"] * (180 / float(pi))
+    pfperimeter = pfproperties["perimeter"] * pixel_radius
+
+    # Shift the centroids by minx/miny since the PF is a subset from the full image,
+    # and get lat/lon at the centroids
+    pflon_centroid, pflat_centroid = get_centroid_lonlat(
+        pfproperties["centroid-0"], pfproperties["centroid-1"], miny, minx, lon, lat, fillval_f,
+    )
+    pflon_weightedcentroid, pflat_weightedcentroid = get_centroid_lonlat(
+        pfproperties["weighted_centroid-0"], pfproperties["weighted_centroid-1"], miny, minx, lon, lat, fillval_f,
+    )
 
-        else:
-            sys.exit("Error: PF pixel count not matching!")
-    logger.debug("Loop done")
+    # Find indices of the max rain rate within the subset region
+    iipfy_max, iipfx_max = np.unravel_index(
+        np.nanargmax(sub_rainrate_map), sub_rainrate_map.shape
+    )
+    # Shift the x, y indices by minx/miny
+    pflon_maxrainrate = np.full(npf_save, lon[iipfy_max + miny, iipfx_max + minx], dtype=float)
+    pflat_maxrainrate = np.full(npf_save, lat[iipfy_max + miny, iipfx_max + minx], dtype=float)
+    logger.debug("PF statistics done")
 
     # Put all variables in dictionary for output
     pf_stats_dict = {
@@ -1447,7 +1240,9 @@ def get_cloud_boundary(icloudlocationx, icloudlocationy, xdim, ydim):
 
 
 def add_merge_split_cloud_locations(
-        cloudnumbermap,
+        pixel_offsets,
+        pixel_flatindex,
+        xdim,
         icloudlocationx,
         icloudlocationy,
         ittmergecloudnumber,
@@ -1458,67 +1253,35 @@ def add_merge_split_cloud_locations(
     Add pixel location indices of merge and split clouds to the current cloud indices.
 
     Args:
-        cloudnumbermap:
-        icloudlocationt:
-        icloudlocationx:
-        icloudlocationy:
-        ittmergecloudnumber:
-        ittsplitcloudnumber:
+        pixel_offsets: numpy array
+            Offsets of each cloud number into pixel_flatindex.
+        pixel_flatindex: numpy array
+            Flat pixel indices sorted by cloud number.
+        xdim: int
+            Full pixel image dimension in x-direction.
+        icloudlocationx: numpy array
+            Cloud location indices in x-direction.
+        icloudlocationy: numpy array
+            Cloud location indices in y-direction.
+        ittmergecloudnumber: numpy array
+            Cloud numbers of merging clouds.
+        ittsplitcloudnumber: numpy array
+            Cloud numbers of splitting clouds.
         logger:
 
     Returns:
-        icloudlocationt: t-indices
         icloudlocationx: x-indices
         icloudlocationy: y-indices
     """
     ######################################################################
-    # Check if any small clouds merge
-    logger.debug("Finding mergers")
-    idmergecloudnumber = np.array(np.where(ittmergecloudnumber > 0))[0,:]
-    nmergecloud = len(idmergecloudnumber)
-    if nmergecloud > 0:
-        # Loop over each merging cloud
-        for imc in idmergecloudnumber:
-            # Find location of the merging cloud
-            (
-                imergelocationy,
-                imergelocationx,
-            ) = np.array(
-                np.where(cloudnumbermap == ittmergecloudnumber[imc])
-            )
-            nmergepix = len(imergelocationy)
-
-            # Add merge pixes to mcs pixels
-            if nmergepix > 0:
-                icloudlocationy = np.hstack(
-                    (icloudlocationy, imergelocationy)
-                )
-                icloudlocationx = np.hstack(
-                    (icloudlocationx, imergelocationx)
-                )
-    ######################################################################
-    # Check if any small clouds split
-    logger.debug("Finding splits")
-    idsplitcloudnumber = np.array(np.where(ittsplitcloudnumber > 0))[0,:]
-    nsplitcloud = len(idsplitcloudnumber)
-    if nsplitcloud > 0:
-        # Loop over each merging cloud
-        for imc in idsplitcloudnumber:
-            # Find location of the merging cloud
-            (
-                isplitlocationy,
-                isplitlocationx,
-            ) = np.array(
-                np.where(cloudnumbermap == ittsplitcloudnumber[imc])
-            )
-            nsplitpix = len(isplitlocationy)
-
-            # Add split pixels to mcs pixels
-            if nsplitpix > 0:
-                icloudlocationy = np.hstack(
-                    (icloudlocationy, isplitlocationy)
-                )
-                icloudlocationx = np.hstack(
-                    (icloudlocationx, isplitlocationx)
-                )
-    return icloudlocationx, icloudlocationy
\ No newline at end of file
+    # Add locations of merging clouds, followed by splitting clouds
+    logger.debug("Finding mergers and splits")
+    mscloudnumber = np.concatenate((
+        ittmergecloudnumber[ittmergecloudnumber > 0],
+        ittsplitcloudnumber[ittsplitcloudnumber > 0],
+    ))
+    if len(mscloudnumber) > 0:
+        imslocationy, imslocationx = get_label_pixels(pixel_offsets, pixel_flatindex, mscloudnumber, xdim)
+        icloudlocationy = np.hstack((icloudlocationy, imslocationy))
+        icloudlocationx = np.hstack((icloudlocationx, imslocationx))
+    return icloudlocationx, icloudlocationy
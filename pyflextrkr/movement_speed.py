@@ -6,11 +6,18 @@ import logging
 import numpy as np
 from netCDF4 import Dataset
 import xarray as xr
-from scipy.signal import fftconvolve
+from scipy import fft as sp_fft
+from scipy import ndimage
 from scipy.interpolate import interp1d
 import dask
 from dask.distributed import wait
 from pyflextrkr.ft_utilities import subset_files_timerange
+from pyflextrkr.netcdf_io_pixeltracking import get_pixeltracking_store_filename, cloudid_file_varname, \
+    get_cloudid_filename
+
+# Maximum number of values in the padded FFT grids of a batch of images
+# (spectra, their product and the inverse FFT take several times this in memory)
+max_fft_batch_size = 2 ** 22
 
 def movement_speed(
         config,
@@ -80,13 +87,22 @@ def movement_speed(
     statistics_outfile = f"{stats_outpath}{trackstats_outfilebase}{startdate}_{enddate}.nc"
 
     # Identify pixel files to process
-    filelist, \
-    files_basetime, \
-    files_datestring, \
-    files_timestring = subset_files_timerange(pixeltracking_outpath,
-                                              pixeltracking_filebase,
-                                              start_basetime,
-                                              end_basetime)
+    if config.get("pixeltracking_storage", "files") == "store":
+        # Each time in the pixel-level store is a file
+        store_file = get_pixeltracking_store_filename(config, pixeltracking_outpath, pixeltracking_filebase)
+        with Dataset(store_file, 'r') as dset:
+            store_basetime = dset.variables['time'][:]
+        timeindices = np.where((store_basetime >= start_basetime) & (store_basetime <= end_basetime))[0]
+        filelist = [store_file] * len(timeindices)
+    else:
+        filelist, \
+        files_basetime, \
+        files_datestring, \
+        files_timestring = subset_files_timerange(pixeltracking_outpath,
+                                                  pixeltracking_filebase,
+                                                  start_basetime,
+                                                  end_basetime)
+        timeindices = np.zeros(len(filelist), dtype=int)
     nfiles = len(filelist)
     logger.info(f"Total number of files to process: {nfiles}")
 
@@ -103,6 +119,7 @@ def movement_speed(
 
     # Make file pairs
     filepairs = list(zip(filelist[0:-lag], filelist[lag::]))
+    timeindex_pairs = list(zip(timeindices[0:-lag], timeindices[lag::]))
 
 
     results = []
@@ -112,6 +129,7 @@ def movement_speed(
             result = movement_of_feature_fft(
                 filepairs[ifile], ntracks,
                 config,
+                timeindex_pairs=timeindex_pairs[ifile],
             )
             results.append(result)
         final_result = results
@@ -121,6 +139,7 @@ def movement_speed(
             result = dask.delayed(movement_of_feature_fft)(
                 filepairs[ifile], ntracks,
                 config,
+                timeindex_pairs=timeindex_pairs[ifile],
             )
             results.append(result)
         final_result = dask.compute(*results)
@@ -188,10 +207,13 @@ def movement_of_feature_fft(
         ntracks,
         config,
         optimize_sub_array=True,
+        timeindex_pairs=(0, 0),
 ):
     """
     Calculate movement of tracked features.
 
+    Features present in both files are cross-correlated in batches of similar bounding box sizes.
+
     Args:
         filepairs: tuple
             Pairs of pixel file names.
@@ -201,6 +223,8 @@ def movement_of_feature_fft(
             Dictionary containing config parameters.
         optimize_sub_array: boolean
             Flag to subset each tracked feature from the full image.
+        timeindex_pairs: tuple, optional. Default: (0, 0).
+            Time indices in the pair of pixel files (for the pixel-level store).
 
     Returns:
         y_lag: np.array
@@ -216,6 +240,11 @@ def movement_of_feature_fft(
     tracknumber = config["track_number_for_speed"]
     track_field = config["track_field_for_speed"]
     min_size_thresh = config["min_size_thresh_for_speed"]
+    run_parallel = config["run_parallel"]
+    # Number of threads for FFT, use all CPUs in serial runs
+    fft_workers = config.get("fft_workers_for_speed", 1 if run_parallel >= 1 else -1)
+    # Directory of cloudid files referenced by thin pixel-level output, if they have been moved
+    cloudid_path = config.get("pixeltracking_cloudid_path", None)
     # storm_buffer = None
 
     logger = logging.getLogger(__name__)
@@ -224,137 +253,242 @@ def movement_of_feature_fft(
 
     dset1 = Dataset(filepairs[0], 'r')
     dset2 = Dataset(filepairs[1], 'r')
-    y_lag = np.zeros(ntracks)
-    x_lag = np.zeros(ntracks)
+    y_lag = np.full(ntracks, np.nan)
+    x_lag = np.full(ntracks, np.nan)
+
+    # Get tracknumber and field values, missing field values are set to 0
+    itime1, itime2 = timeindex_pairs
+    tracknumber_1 = np.ma.filled(read_pixel_field(dset1, tracknumber, itime1, cloudid_path), 0)
+    tracknumber_2 = np.ma.filled(read_pixel_field(dset2, tracknumber, itime2, cloudid_path), 0)
+    field_1 = np.ma.filled(read_pixel_field(dset1, track_field, itime1, cloudid_path), np.nan)
+    field_2 = np.ma.filled(read_pixel_field(dset2, track_field, itime2, cloudid_path), np.nan)
+    field_1[np.isnan(field_1)] = 0
+    field_2[np.isnan(field_2)] = 0
 
     # Get minimum size of feature from pixel files
-    min_cloud_size = np.minimum(get_pixel_size_of_clouds(dset1, ntracks, tracknumber),
-                                get_pixel_size_of_clouds(dset2, ntracks, tracknumber))
-    # Get tracknumber and field values
-    tracknumber_1 = dset1.variables[tracknumber][:].squeeze()
-    tracknumber_2 = dset2.variables[tracknumber][:].squeeze()
-    field_1 = dset1.variables[track_field][:].squeeze()
-    field_2 = dset2.variables[track_field][:].squeeze()
-
-    # Loop over each track number
-    for track_number in np.arange(0, ntracks):
-        # In pixel mask files, track number need to +1
-        # track indices start from 0, pixel mask track numbers start from 1
-        track_number_pix = track_number + 1
-        # Check min cloud size against threshold
-        if min_cloud_size[track_number] < min_size_thresh:
-            y_lag[track_number] = np.nan
-            x_lag[track_number] = np.nan
-        else:
-            if optimize_sub_array:
-                # Subset array to only contain the current track mask area
-                # Calculate size of bounding box
-                ymin, ymax, xmin, xmax = get_bounding_box_for_fft(tracknumber_1, tracknumber_2, track_number_pix)
-                masked_field_1 = field_1[ymin:ymax, xmin:xmax].copy()
-                masked_field_2 = field_2[ymin:ymax, xmin:xmax].copy()
-
-                masked_field_1[tracknumber_1[ymin:ymax, xmin:xmax] != track_number_pix] = 0
-                masked_field_1[np.isnan(masked_field_1)] = 0
-
-                masked_field_2[tracknumber_2[ymin:ymax, xmin:xmax] != track_number_pix] = 0
-                masked_field_2[np.isnan(masked_field_2)] = 0
-            else:
-                masked_field_1 = field_1.copy()
-                masked_field_2 = field_2.copy()
-
-                masked_field_1[tracknumber_1 != track_number_pix] = 0
-                masked_field_1[np.isnan(masked_field_1)] = 0
-
-                masked_field_2[tracknumber_2 != track_number_pix] = 0
-                masked_field_2[np.isnan(masked_field_2)] = 0
-
-            # Flip the second image, do an FFT convolution
-            result = fftconvolve(masked_field_1, masked_field_2[::-1, ::-1], mode='same')
-            # Get the index with max value (highest correlation)
-            # then reshape it to 2D to get x, y index
-
-            # ALTERNATIVE No. 1
-            y_step, x_step = np.apply_along_axis(np.mean, 1,
-                np.asarray(np.where(result>np.quantile(result, .995)))).round(0).astype('int')
-
-            y_dim, x_dim = np.shape(masked_field_1)
-            # Get the relative position from the center of the image
-            # This is the movement in x, y direction
-            y_lag[track_number] = np.floor(y_dim/2) - y_step
-            x_lag[track_number] = np.floor(x_dim/2) - x_step
+    min_cloud_size = np.minimum(get_pixel_size_of_clouds(tracknumber_1, ntracks),
+                                get_pixel_size_of_clouds(tracknumber_2, ntracks))
+    # Only features present in both files larger than the size threshold
+    track_idx = np.where((min_cloud_size > 0) & (min_cloud_size >= min_size_thresh))[0]
+    # In pixel mask files, track number need to +1
+    # track indices start from 0, pixel mask track numbers start from 1
+    track_number_pix = track_idx + 1
+
+    if optimize_sub_array:
+        # Subset array to only contain the current track mask area
+        ymin, ymax, xmin, xmax = get_bounding_boxes_for_fft(tracknumber_1, tracknumber_2, track_number_pix)
+    else:
+        ny, nx = tracknumber_1.shape
+        ymin, xmin = np.zeros(len(track_idx), dtype=int), np.zeros(len(track_idx), dtype=int)
+        ymax, xmax = np.full(len(track_idx), ny), np.full(len(track_idx), nx)
+    box_ny = ymax - ymin
+    box_nx = xmax - xmin
+
+    # Group features by bounding box size (power of 2), each batch is zero-padded to its largest box
+    bucket_ny = 2 ** np.ceil(np.log2(np.maximum(box_ny, 1))).astype(int)
+    bucket_nx = 2 ** np.ceil(np.log2(np.maximum(box_nx, 1))).astype(int)
+    valid = (box_ny > 0) & (box_nx > 0)
+    buckets = np.unique(np.stack([bucket_ny[valid], bucket_nx[valid]], axis=1), axis=0)
+    for bny, bnx in buckets:
+        ibucket = np.where(valid & (bucket_ny == bny) & (bucket_nx == bnx))[0]
+        # Limit the number of padded FFT values in each batch
+        fft_ny, fft_nx = get_fft_shape(bny, bnx)
+        nbatch = max(1, max_fft_batch_size // (fft_ny * fft_nx))
+        for ib in range(0, len(ibucket), nbatch):
+            ibatch = ibucket[ib:ib + nbatch]
+            stack_ny, stack_nx = box_ny[ibatch].max(), box_nx[ibatch].max()
+            stack_1 = np.zeros((len(ibatch), stack_ny, stack_nx), dtype=field_1.dtype)
+            stack_2 = np.zeros((len(ibatch), stack_ny, stack_nx), dtype=field_2.dtype)
+            for ii, itrack in enumerate(ibatch):
+                box = (slice(ymin[itrack], ymax[itrack]), slice(xmin[itrack], xmax[itrack]))
+                stack_1[ii, :box_ny[itrack], :box_nx[itrack]] = np.where(
+                    tracknumber_1[box] == track_number_pix[itrack], field_1[box], 0)
+                # Flip the second image for the cross-correlation
+                stack_2[ii, :box_ny[itrack], :box_nx[itrack]] = np.where(
+                    tracknumber_2[box] == track_number_pix[itrack], field_2[box], 0)[::-1, ::-1]
+            result = cross_correlate_fft(stack_1, stack_2, workers=fft_workers)
+
+            for ii, itrack in enumerate(ibatch):
+                y_dim, x_dim = box_ny[itrack], box_nx[itrack]
+                # Crop to the same size as the bounding box, centered on zero lag
+                y0, x0 = (y_dim - 1) // 2, (x_dim - 1) // 2
+                # Get the mean position of the highest correlation values
+                y_step, x_step = get_correlation_peak(result[ii, y0:y0 + y_dim, x0:x0 + x_dim])
+                # Get the relative position from the center of the image
+                # This is the movement in x, y direction
+                y_lag[track_idx[itrack]] = np.floor(y_dim/2) - y_step
+                x_lag[track_idx[itrack]] = np.floor(x_dim/2) - x_step
 
     # Get time difference between the file pair
-    time_lag = dset2.variables['time'][0] - dset1.variables['time'][0]
-    base_time = dset1.variables['time'][0].copy()
+    time_lag = dset2.variables['time'][itime2] - dset1.variables['time'][itime1]
+    base_time = dset1.variables['time'][itime1].copy()
 
     dset1.close()
     dset2.close()
     return y_lag, x_lag, time_lag, base_time
 
 
-def get_pixel_size_of_clouds(
+def read_pixel_field(
         dataset,
-        ntracks,
-        tracknumber,
+        varname,
+        timeindex,
+        cloudid_path=None,
 ):
     """
-    Calculate pixel size of each identified cloud in the file.
+    Read a 2D field at a time from a pixel-level file or store.
+
+    Variables not in thin pixel-level output are read from the referenced cloudid file.
 
     Args:
         dataset: Dataset
             netcdf Dataset
-        tracknumber: string
-            variable that contains pixel level values.
+        varname: string
+            Variable name.
+        timeindex: int
+            Time index in the dataset.
+        cloudid_path: string, optional. Default: None.
+            Directory of cloudid files, if they have been moved since the pixel-level files were written.
 
     Returns:
-        counts: array_like
-            Pixel size of every cloud in file. Cloud 0 is stored at 0.
+        values: np.ma.array
+            2D field.
     """
-    storm_sizes = np.zeros(ntracks + 1)
+    if varname in dataset.variables:
+        return dataset.variables[varname][timeindex]
+    cloudid_file = get_cloudid_filename(dataset.variables[cloudid_file_varname][timeindex], cloudid_path)
+    with Dataset(cloudid_file, 'r') as dset_cloudid:
+        values = dset_cloudid.variables[varname][0]
+    return values
+
 
-    track, counts = np.unique(dataset.variables[tracknumber][:], return_counts=True)
-    storm_sizes[track] = counts
-    # storm_sizes[0] = 0
+def get_pixel_size_of_clouds(
+        tracknumber_map,
+        ntracks,
+):
+    """
+    Calculate pixel size of each identified cloud in the file.
+
+    Args:
+        tracknumber_map: np.array
+            Pixel-level track numbers (0 for background).
+        ntracks: int
+            Number of tracks.
+
+    Returns:
+        counts: array_like
+            Pixel size of every cloud in file. Track number 1 is stored at 0.
+    """
+    storm_sizes = np.bincount(tracknumber_map[tracknumber_map > 0].ravel(), minlength=ntracks + 1)
     # Remove the first value (background, which is not storm)
-    storm_sizes = storm_sizes[1:]
+    storm_sizes = storm_sizes[1:ntracks + 1]
     return storm_sizes
 
 
-def get_bounding_box_for_fft(in1, in2, track_number):
+def get_bounding_boxes_for_fft(in1, in2, track_numbers):
     """
-    Given two masks and a track number, calculate the maximum bounding box to fit both
+    Given two masks and track numbers, calculate the maximum bounding box to fit both for each track.
 
     Args:
         in1: np.array
             First mask array
         in2: np.array
             Second mask array
-        track_number: int
-            Track number for masking.
+        track_numbers: np.array
+            Track numbers present in both masks.
 
     Returns:
-        ymin, ymax, xmin, xmax: int
+        ymin, ymax, xmin, xmax: np.array
             Bounding box x, y indices.
     """
+    max_label = max(in1.max(), in2.max(), 0)
+    objects_1 = ndimage.find_objects(in1, max_label=max_label)
+    objects_2 = ndimage.find_objects(in2, max_label=max_label)
+
+    ymin = np.zeros(len(track_numbers), dtype=int)
+    ymax = np.zeros(len(track_numbers), dtype=int)
+    xmin = np.zeros(len(track_numbers), dtype=int)
+    xmax = np.zeros(len(track_numbers), dtype=int)
+    for ii, track_number in enumerate(track_numbers):
+        box1 = objects_1[track_number - 1]
+        box2 = objects_2[track_number - 1]
+        ymin[ii] = min(box1[0].start, box2[0].start)
+        ymax[ii] = max(box1[0].stop, box2[0].stop) - 1
+        xmin[ii] = min(box1[1].start, box2[1].start)
+        xmax[ii] = max(box1[1].stop, box2[1].stop) - 1
+    return ymin, ymax, xmin, xmax
 
-    a = in1 == track_number
-    b = in2 == track_number
 
-    rows = np.any(a, axis=1)
-    cols = np.any(a, axis=0)
-    rmin1, rmax1 = np.where(rows)[0][[0, -1]]
-    cmin1, cmax1 = np.where(cols)[0][[0, -1]]
+def get_fft_shape(ny, nx):
+    """
+    Get the padded FFT shape for the full linear convolution of images.
 
-    rows = np.any(b, axis=1)
-    cols = np.any(b, axis=0)
-    rmin2, rmax2 = np.where(rows)[0][[0, -1]]
-    cmin2, cmax2 = np.where(cols)[0][[0, -1]]
+    Args:
+        ny: int
+            Number of rows of the images.
+        nx: int
+            Number of columns of the images.
+
+    Returns:
+        fft_shape: tuple
+            FFT shape (fast length of at least 2*ny-1, 2*nx-1).
+    """
+    fft_shape = (sp_fft.next_fast_len(2 * int(ny) - 1, real=True), sp_fft.next_fast_len(2 * int(nx) - 1, real=True))
+    return fft_shape
+
+
+def cross_correlate_fft(stack_1, stack_2, workers=1):
+    """
+    Convolve stacks of images with FFT.
+
+    Args:
+        stack_1: np.array
+            First images, shape (nimages, ny, nx).
+        stack_2: np.array
+            Second images (flipped for cross-correlation), shape (nimages, ny, nx).
+        workers: int, optional. Default: 1.
+            Number of threads for FFT (-1 for all CPUs).
+
+    Returns:
+        result: np.array
+            Full linear convolution of each pair, shape (nimages, 2*ny-1, 2*nx-1).
+    """
+    ny, nx = stack_1.shape[1:]
+    shape = (2 * ny - 1, 2 * nx - 1)
+    fft_shape = get_fft_shape(ny, nx)
+    sp1 = sp_fft.rfft2(stack_1, s=fft_shape, workers=workers)
+    sp2 = sp_fft.rfft2(stack_2, s=fft_shape, workers=workers)
+    result = sp_fft.irfft2(sp1 * sp2, s=fft_shape, workers=workers)
+    return result[:, :shape[0], :shape[1]]
+
+
+def get_correlation_peak(result, quantile=0.995):
+    """
+    Get the mean position of values above a quantile in a correlation image.
+
+    The quantile is computed with a partial sort (same as np.quantile with linear interpolation).
+
+    Args:
+        result: np.array
+            2D correlation image.
+        quantile: float, optional. Default: 0.995.
+            Quantile of the highest correlation values.
+
+    Returns:
+        y_step, x_step: int
+            Mean y, x position of the highest correlation values.
+    """
+    values = result.ravel()
+    position = quantile * (values.size - 1)
+    k = int(np.floor(position))
+    k1 = min(k + 1, values.size - 1)
+    part = np.partition(values, [k, k1])
+    a, b = part[k], part[k1]
+    t = position - k
+    # Linear interpolation between the neighboring values, as in np.quantile
+    threshold = b - (b - a) * (1 - t) if t >= 0.5 else a + (b - a) * t
+    y_step, x_step = np.mean(np.nonzero(result > threshold), axis=1).round(0).astype('int')
+    return y_step, x_step
 
-    ymin = min(rmin1, rmin2)
-    ymax = max(rmax1, rmax2)
-    xmin = min(cmin1, cmin2)
-    xmax = max(cmax1, cmax2)
-    return ymin, ymax, xmin, xmax
 
 def offset_to_speed(x, y, time_lag):
     """
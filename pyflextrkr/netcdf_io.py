@@ -2,6 +2,7 @@ import time
 import numpy as np
 import xarray as xr
 from netCDF4 import stringtochar
+from pyflextrkr.trackstats_func import write_feature_table
 
 # ----------------------------------------------------------------------------------
 def write_cloudid_tb(
@@ -193,6 +194,10 @@ def write_cloudid_tb(
     ds_out.to_netcdf(
         path=cloudid_outfile, mode="w", format="NETCDF4", encoding=encoding,
     )
+
+    # Write the feature statistics table while the pixel data is in memory
+    if config.get("feature_stats_table", 0) == 1:
+        write_feature_table(cloudid_outfile, ds_out, config)
     return cloudid_outfile
 
 # ----------------------------------------------------------------------------------
@@ -382,4 +387,8 @@ def write_radar_cellid(
     ds_out.to_netcdf(
         path=cloudid_outfile, mode='w', format='NETCDF4', unlimited_dims='time', encoding=encoding
     )
+
+    # Write the feature statistics table while the pixel data is in memory
+    if config.get("feature_stats_table", 0) == 1:
+        write_feature_table(cloudid_outfile, ds_out, config)
     return cloudid_outfile
\ No newline at end of file
@@ -0,0 +1,217 @@
+import os
+import time
+import xarray as xr
+from netCDF4 import Dataset
+
+# Thin pixel-level output references its cloudid file with this variable
+cloudid_file_varname = "cloudid_file"
+
+# ----------------------------------------------------------------------------------
+def get_pixeltracking_store_filename(
+        config,
+        pixeltracking_outpath,
+        pixeltracking_filebase,
+):
+    """
+    Get the single-store pixel-level output filename.
+
+    Args:
+        config: dictionary
+            Dictionary containing config parameters.
+        pixeltracking_outpath: string
+            Output directory for pixel-level files.
+        pixeltracking_filebase: string
+            Output pixel-level file basename.
+
+    Returns:
+        store_file: string
+            Pixel-level store filename.
+    """
+    startdate = config["startdate"]
+    enddate = config["enddate"]
+    store_file = f"{pixeltracking_outpath}{pixeltracking_filebase}{startdate}_{enddate}.nc"
+    return store_file
+
+
+# ----------------------------------------------------------------------------------
+def create_pixeltracking_store(
+        store_file,
+        ds_template,
+        basetimes,
+        time_dimname="time",
+):
+    """
+    Create a pixel-level store preallocated for all times, chunked by one time per chunk.
+
+    Variables without the time dimension are written once, variables with the time dimension
+    are filled later by write_pixeltracking_store.
+    The store is re-created in each run: extending a run (append_mode) can change the track numbers
+    mapped at earlier times, so all times are mapped again.
+
+    Args:
+        store_file: string
+            Pixel-level store filename.
+        ds_template: Xarray Dataset
+            Pixel-level dataset of one time, defining the variables in the store.
+            Values must be raw (not masked or scaled).
+        basetimes: np.array
+            Base time (Epoch time) of each time in the store.
+        time_dimname: string, optional. Default: "time".
+            Time dimension name.
+
+    Returns:
+        store_file: string
+            Pixel-level store filename.
+    """
+    if os.path.isfile(store_file):
+        os.remove(store_file)
+
+    rootgrp = Dataset(store_file, "w", format="NETCDF4")
+    rootgrp.set_auto_maskandscale(False)
+    for dimname, dimsize in ds_template.sizes.items():
+        if dimname == time_dimname:
+            dimsize = len(basetimes)
+        rootgrp.createDimension(dimname, dimsize)
+
+    for varname, var in ds_template.variables.items():
+        attrs = dict(var.attrs)
+        fill_value = attrs.pop("_FillValue", var.encoding.get("_FillValue", None))
+        if var.dtype.kind == "O":
+            # Variable-length strings
+            ncvar = rootgrp.createVariable(varname, str, var.dims)
+        elif time_dimname in var.dims:
+            # One time per chunk, so each time can be written independently
+            chunksizes = [1 if dimname == time_dimname else var.sizes[dimname] for dimname in var.dims]
+            ncvar = rootgrp.createVariable(varname, var.dtype, var.dims, zlib=True,
+                                           chunksizes=chunksizes, fill_value=fill_value)
+        else:
+            ncvar = rootgrp.createVariable(varname, var.dtype, var.dims, zlib=True, fill_value=fill_value)
+            ncvar[...] = var.values
+        ncvar.setncatts(attrs)
+    rootgrp[time_dimname][:] = basetimes
+
+    rootgrp.setncatts(ds_template.attrs)
+    rootgrp.Created_on = time.ctime(time.time())
+    rootgrp.close()
+    return store_file
+
+
+# ----------------------------------------------------------------------------------
+def write_pixeltracking_store(
+        store_file,
+        ds_out,
+        store_timeindex,
+        time_dimname="time",
+):
+    """
+    Write variables of one time to a pixel-level store.
+
+    Writes to the same store must not run concurrently.
+
+    Args:
+        store_file: string
+            Pixel-level store filename.
+        ds_out: Xarray Dataset
+            Pixel-level dataset of one time.
+        store_timeindex: int
+            Time index in the store.
+        time_dimname: string, optional. Default: "time".
+            Time dimension name.
+
+    Returns:
+        store_file: string
+            Pixel-level store filename.
+    """
+    rootgrp = Dataset(store_file, "a")
+    rootgrp.set_auto_maskandscale(False)
+    for varname, var in ds_out.variables.items():
+        if (time_dimname in var.dims) & (varname in rootgrp.variables):
+            index = tuple(store_timeindex if dimname == time_dimname else slice(None) for dimname in var.dims)
+            values = var.isel({time_dimname: 0}).values
+            rootgrp[varname][index] = values.item() if var.dtype.kind == "O" else values
+    rootgrp.close()
+    return store_file
+
+
+# ----------------------------------------------------------------------------------
+def get_cloudid_filename(
+        cloudid_file,
+        cloudid_path=None,
+):
+    """
+    Get the cloudid filename referenced by thin pixel-level output.
+
+    Args:
+        cloudid_file: string
+            Cloudid filename referenced by the pixel-level output.
+        cloudid_path: string, optional. Default: None.
+            Directory of cloudid files, if they have been moved since the pixel-level files were written.
+
+    Returns:
+        cloudid_file: string
+            Cloudid filename.
+    """
+    if cloudid_path is not None:
+        cloudid_file = os.path.join(cloudid_path, os.path.basename(cloudid_file))
+    return cloudid_file
+
+
+# ----------------------------------------------------------------------------------
+def open_pixeltracking_dataset(
+        pixeltracking_files,
+        start_basetime=None,
+        end_basetime=None,
+        cloudid_path=None,
+        time_dimname="time",
+):
+    """
+    Open pixel-level files or store as one dataset, joining thin output with its cloudid files.
+
+    Thin output (config["pixeltracking_thin"] = 1) only contains the track number variables,
+    the other variables are read from the cloudid file of each time.
+    Full output is returned as is.
+
+    Args:
+        pixeltracking_files: string or list
+            Pixel-level file name(s) or store name.
+        start_basetime: int, optional. Default: None.
+            Start base time (Epoch time) to subset.
+        end_basetime: int, optional. Default: None.
+            End base time (Epoch time) to subset.
+        cloudid_path: string, optional. Default: None.
+            Directory of cloudid files, if they have been moved since the pixel-level files were written.
+        time_dimname: string, optional. Default: "time".
+            Time dimension name.
+
+    Returns:
+        ds: Xarray Dataset
+            Pixel-level dataset, with time in Epoch time (not decoded).
+    """
+    if isinstance(pixeltracking_files, str):
+        ds = xr.open_dataset(pixeltracking_files, decode_times=False, chunks={time_dimname: 1})
+    else:
+        ds = xr.open_mfdataset(pixeltracking_files, concat_dim=time_dimname, combine="nested",
+                               data_vars="minimal", coords="minimal", compat="override",
+                               decode_times=False, chunks={time_dimname: 1})
+    if (start_basetime is not None) | (end_basetime is not None):
+        ds = ds.sel({time_dimname: slice(start_basetime, end_basetime)})
+    if (cloudid_file_varname not in ds.data_vars) | (ds.sizes[time_dimname] == 0):
+        return ds
+
+    # Open the cloudid files of the thin output
+    cloudid_files = [get_cloudid_filename(ifile, cloudid_path) for ifile in ds[cloudid_file_varname].values.tolist()]
+    ds_cloudid = xr.open_mfdataset(cloudid_files, concat_dim=time_dimname, combine="nested",
+                                   data_vars="minimal", coords="minimal", compat="override",
+                                   decode_times=False, chunks={time_dimname: 1})
+    # Add cloudid variables with time or on the pixel grid (e.g., latitude/longitude),
+    # per-feature variables (e.g., feature sizes) do not align with the pixel-level data.
+    # Times and coordinates must match.
+    spatial_dimnames = set(ds.dims) - {time_dimname}
+    cloudid_varnames = [
+        varname for varname, var in ds_cloudid.data_vars.items()
+        if (varname not in ds.data_vars) &
+           ((time_dimname in var.dims) | ((len(var.dims) > 0) & set(var.dims).issubset(spatial_dimnames)))
+    ]
+    ds = xr.merge([ds, ds_cloudid[cloudid_varnames]],
+                  join="exact", combine_attrs="override")
+    return ds
@@ -0,0 +1,270 @@
+import os
+import time
+import numpy as np
+from netCDF4 import Dataset
+
+# Per-pair variables in the link store: (name, netCDF type, long_name)
+pair_vars = [
+    ("basetime_ref", "i8", "epoch time (seconds since 01/01/1970 00:00) of reference file"),
+    ("basetime_new", "i8", "epoch time (seconds since 01/01/1970 00:00) of new file"),
+    ("nclouds_ref", "i4", "number of cloud in reference file (+1)"),
+    ("nclouds_new", "i4", "number of cloud in new file (+1)"),
+    ("nlinks_forward", "i4", "number of forward links in the pair"),
+    ("nlinks_backward", "i4", "number of backward links in the pair"),
+    ("nfeatures_ref", "i4", "number of feature sizes stored for reference file"),
+    ("nfeatures_new", "i4", "number of feature sizes stored for new file"),
+]
+pair_strvars = ["ref_file", "new_file", "ref_date", "new_date"]
+# Link record variables: (name, dimension, long_name)
+link_vars = [
+    ("forward_ref", "forward_links", "reference cloud number"),
+    ("forward_rank", "forward_links", "link position of the new cloud for the reference cloud"),
+    ("forward_new", "forward_links", "new cloud number linked to the reference cloud"),
+    ("forward_size", "forward_links", "area of the new cloud linked to the reference cloud"),
+    ("backward_new", "backward_links", "new cloud number"),
+    ("backward_rank", "backward_links", "link position of the reference cloud for the new cloud"),
+    ("backward_ref", "backward_links", "reference cloud number linked to the new cloud"),
+    ("backward_size", "backward_links", "area of the reference cloud linked to the new cloud"),
+]
+
+# ----------------------------------------------------------------------------------
+def get_tracklinks_filename(config):
+    """
+    Get the consolidated link store filename.
+
+    The filename can be set with 'tracklinks_file' in config (e.g., to share a store between time partitions).
+    Runs that save the track state or extend a previous run (append mode) use a store named by
+    the start date only, so appended runs with a new end date extend the same store.
+
+    Args:
+        config: dictionary
+            Dictionary containing config parameters.
+
+    Returns:
+        link_store_file: string
+            Link store filename.
+    """
+    tracking_outpath = config["tracking_outpath"]
+    tracklinks_filebase = config.get("tracklinks_filebase", "tracklinks_")
+    startdate = config["startdate"]
+    enddate = config["enddate"]
+    if (config.get("save_track_state", 0) == 1) | (config.get("append_mode", 0) == 1):
+        default_file = f"{tracking_outpath}{tracklinks_filebase}{startdate}.nc"
+    else:
+        default_file = f"{tracking_outpath}{tracklinks_filebase}{startdate}_{enddate}.nc"
+    link_store_file = config.get("tracklinks_file", default_file)
+    return link_store_file
+
+
+# ----------------------------------------------------------------------------------
+def read_tracklinks_basetimes(link_store_file):
+    """
+    Read the new file base times of the pairs in a link store.
+
+    Args:
+        link_store_file: string
+            Link store filename.
+
+    Returns:
+        basetime_new: np.array
+            Base time (Epoch time) of the new file of each pair, empty if the store does not exist.
+    """
+    if os.path.isfile(link_store_file) is False:
+        return np.array([], dtype=np.int64)
+    rootgrp = Dataset(link_store_file, "r")
+    rootgrp.set_auto_mask(False)
+    basetime_new = rootgrp["basetime_new"][:].astype(np.int64)
+    rootgrp.close()
+    return basetime_new
+
+
+# ----------------------------------------------------------------------------------
+def write_tracklinks_store(
+        link_store_file,
+        link_data_list,
+        config,
+        mode="w",
+):
+    """
+    Write link tables of consecutive cloudid file pairs to a consolidated link store.
+
+    The store is a single netCDF file with unlimited dimensions, so pairs can be appended to an existing store.
+
+    Args:
+        link_store_file: string
+            Link store filename.
+        link_data_list: list
+            List of link data dictionaries returned by trackclouds, sorted in time.
+        config: dictionary
+            Dictionary containing config parameters.
+        mode: string, optional. Default: "w".
+            Write mode: "w" (create a new store), "a" (append to an existing store).
+
+    Returns:
+        link_store_file: string
+            Link store filename.
+    """
+    if (mode == "a") & (not os.path.isfile(link_store_file)):
+        mode = "w"
+
+    if mode == "w":
+        rootgrp = Dataset(link_store_file, "w", format="NETCDF4")
+        rootgrp.createDimension("pairs", None)
+        rootgrp.createDimension("forward_links", None)
+        rootgrp.createDimension("backward_links", None)
+        rootgrp.createDimension("features", None)
+        for varname, vartype, long_name in pair_vars:
+            var = rootgrp.createVariable(varname, vartype, ("pairs",), zlib=True)
+            var.long_name = long_name
+        for varname in pair_strvars:
+            rootgrp.createVariable(varname, str, ("pairs",))
+        for varname, dimname, long_name in link_vars:
+            var = rootgrp.createVariable(varname, "i4", (dimname,), zlib=True)
+            var.long_name = long_name
+        var = rootgrp.createVariable("npix_feature", "i8", ("features",), zlib=True)
+        var.long_name = "Number of pixels for each feature in the reference and new files of each pair"
+        rootgrp.Title = "Indices linking clouds in consecutive files " + \
+                        "forward and backward in time and the size of the linked cloud"
+        rootgrp.Institution = "Pacific Northwest National Laboratory"
+        rootgrp.Contact = "Zhe Feng, zhe.feng@pnnl.gov"
+        rootgrp.Created_on = time.ctime(time.time())
+        rootgrp.nlinks = int(config["nmaxlinks"])
+        rootgrp.overlap_threshold = str(int(config["othresh"] * 100)) + "%"
+        rootgrp.maximum_gap_allowed = str(config["timegap"]) + " hr"
+    else:
+        rootgrp = Dataset(link_store_file, "a")
+
+    npairs = len(link_data_list)
+    if npairs > 0:
+        # Pair variables
+        ip0 = rootgrp.dimensions["pairs"].size
+        for varname, vartype, long_name in pair_vars:
+            rootgrp[varname][ip0:ip0 + npairs] = np.array([ldata[varname] for ldata in link_data_list])
+        for varname in pair_strvars:
+            rootgrp[varname][ip0:ip0 + npairs] = np.array([ldata[varname] for ldata in link_data_list], dtype=object)
+
+        # Link record variables
+        # Get the current size of each record dimension before writing, since it grows with the first variable
+        dim_size = {dimname: rootgrp.dimensions[dimname].size for varname, dimname, long_name in link_vars}
+        for varname, dimname, long_name in link_vars:
+            i0 = dim_size[dimname]
+            values = np.concatenate([ldata[varname] for ldata in link_data_list])
+            rootgrp[varname][i0:i0 + len(values)] = values
+
+        # Feature sizes (reference followed by new for each pair)
+        i0 = rootgrp.dimensions["features"].size
+        values = np.concatenate(
+            [np.concatenate([ldata["npix_ref"], ldata["npix_new"]]) for ldata in link_data_list]
+        )
+        rootgrp["npix_feature"][i0:i0 + len(values)] = values
+
+    rootgrp.close()
+    return link_store_file
+
+
+# ----------------------------------------------------------------------------------
+def read_tracklinks_store(
+        link_store_file,
+        start_basetime,
+        end_basetime,
+        fillval,
+):
+    """
+    Read link tables from a consolidated link store with bulk reads.
+
+    Link records are kept flat (each pair holds views into the record arrays),
+    the link index arrays of a pair are built with get_pair_link_index when it is tracked.
+
+    Args:
+        link_store_file: string
+            Link store filename.
+        start_basetime: int
+            Start base time (Epoch time) of new files to read.
+        end_basetime: int
+            End base time (Epoch time) of new files to read.
+        fillval: int
+            Missing value.
+
+    Returns:
+        pair_list: list
+            List of pair dictionaries, sorted by new file base time.
+            Each contains the link records and feature sizes of the pair.
+    """
+    rootgrp = Dataset(link_store_file, "r")
+    rootgrp.set_auto_mask(False)
+    nlinks = int(rootgrp.nlinks)
+    pdata = {varname: rootgrp[varname][:] for varname, vartype, long_name in pair_vars}
+    sdata = {varname: rootgrp[varname][:] for varname in pair_strvars}
+    ldata = {varname: rootgrp[varname][:] for varname, dimname, long_name in link_vars}
+    npix_feature = rootgrp["npix_feature"][:]
+    rootgrp.close()
+
+    # Offsets of each pair into the record variables
+    fwd_offset = np.concatenate(([0], np.cumsum(pdata["nlinks_forward"])))
+    bwd_offset = np.concatenate(([0], np.cumsum(pdata["nlinks_backward"])))
+    feature_offset = np.concatenate(([0], np.cumsum(pdata["nfeatures_ref"] + pdata["nfeatures_new"])))
+
+    # Subset pairs within the time range and sort by new file time
+    pidx = np.where((pdata["basetime_new"] >= start_basetime) & (pdata["basetime_new"] <= end_basetime))[0]
+    pidx = pidx[np.argsort(pdata["basetime_new"][pidx], kind="stable")]
+
+    pair_list = []
+    for ip in pidx:
+        # Link records of the pair
+        fs = slice(fwd_offset[ip], fwd_offset[ip + 1])
+        bs = slice(bwd_offset[ip], bwd_offset[ip + 1])
+        link_records = {varname: ldata[varname][fs if dimname == "forward_links" else bs]
+                        for varname, dimname, long_name in link_vars}
+        # Feature sizes
+        i0 = feature_offset[ip]
+        i1 = i0 + pdata["nfeatures_ref"][ip]
+        i2 = feature_offset[ip + 1]
+        pair_list.append({
+            "nclouds_ref": int(pdata["nclouds_ref"][ip]),
+            "nclouds_new": int(pdata["nclouds_new"][ip]),
+            "basetime_ref": pdata["basetime_ref"][ip:ip + 1],
+            "basetime_new": pdata["basetime_new"][ip:ip + 1],
+            "link_records": link_records,
+            "nlinks": nlinks,
+            "fillval": fillval,
+            "ref_file": sdata["ref_file"][ip],
+            "new_file": sdata["new_file"][ip],
+            "ref_date": sdata["ref_date"][ip],
+            "new_date": sdata["new_date"][ip],
+            "npix_reference": npix_feature[i0:i1],
+            "npix_new": npix_feature[i1:i2],
+        })
+    return pair_list
+
+
+# ----------------------------------------------------------------------------------
+def get_pair_link_index(pairdata):
+    """
+    Get the link index arrays of a file pair, building them from the link records of a link store.
+
+    Args:
+        pairdata: dictionary
+            Link data of the file pair, from a single track file or read_tracklinks_store.
+
+    Returns:
+        refcloud_forward_index: np.array
+            New cloud numbers linked to each reference cloud, dimensions (1, nclouds_ref, nlinks).
+        newcloud_backward_index: np.array
+            Reference cloud numbers linked to each new cloud, dimensions (1, nclouds_new, nlinks).
+            Both are None if the pair has no links data (e.g., links were already resolved).
+    """
+    if "refcloud_forward_index" in pairdata:
+        return pairdata["refcloud_forward_index"], pairdata["newcloud_backward_index"]
+    link_records = pairdata.get("link_records")
+    if link_records is None:
+        return None, None
+
+    nlinks = pairdata["nlinks"]
+    fillval = pairdata["fillval"]
+    refcloud_forward_index = np.full((1, pairdata["nclouds_ref"], nlinks), fillval, dtype=int)
+    refcloud_forward_index[0, link_records["forward_ref"] - 1, link_records["forward_rank"]] = \
+        link_records["forward_new"]
+    newcloud_backward_index = np.full((1, pairdata["nclouds_new"], nlinks), fillval, dtype=int)
+    newcloud_backward_index[0, link_records["backward_new"] - 1, link_records["backward_rank"]] = \
+        link_records["backward_ref"]
+    return refcloud_forward_index, newcloud_backward_index
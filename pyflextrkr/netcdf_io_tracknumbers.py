@@ -0,0 +1,491 @@
+import os
+import time
+import numpy as np
+import xarray as xr
+
+# Track variables stored for each cloud in the tracknumbers file
+ragged_varnames = [
+    "track_numbers",
+    "track_status",
+    "track_mergenumbers",
+    "track_splitnumbers",
+    "track_reset",
+]
+
+# ----------------------------------------------------------------------------------
+def read_tracknumbers(cloudtrack_file):
+    """
+    Read a tracknumbers file into ragged arrays.
+
+    Both the dense (nfiles by maxnclouds) and the ragged (per-file offsets + flat arrays) storage are supported.
+    Dense files are converted by keeping the clouds in each file (those with a valid track number).
+
+    Args:
+        cloudtrack_file: string
+            Tracknumbers filename.
+
+    Returns:
+        track_data: dictionary
+            Dictionary containing:
+            ntracks: int
+                Number of tracks.
+            cloudid_files: numpy array
+                Cloudid filename characters of each file.
+            basetimes: numpy array
+                Base time of each file.
+            file_offsets: numpy array
+                Index of the first cloud of each file in the flat arrays, size nfiles + 1.
+            track_numbers, track_status, track_mergenumbers, track_splitnumbers, track_reset: numpy array
+                Flat int32 arrays of all clouds in all files.
+            track_counter: numpy array
+                Track number counter of each file (only if written in the file).
+    """
+    ds = xr.open_dataset(cloudtrack_file,
+                         mask_and_scale=False,
+                         decode_times=False,
+                         concat_characters=True)
+    track_data = {
+        "ntracks": int(ds["ntracks"].values.item()),
+        "cloudid_files": ds["cloudid_files"].values,
+        "basetimes": ds["basetimes"].values,
+    }
+    if "nfeatures" in ds.dims:
+        # Ragged storage
+        nclouds_files = ds["file_nclouds"].values.astype(np.int64)
+        for varname in ragged_varnames:
+            track_data[varname] = ds[varname].values.astype(np.int32)
+    else:
+        # Dense storage: cloud numbers in each file are contiguous from 1,
+        # and every cloud is assigned a track number
+        tracknumbers = ds["track_numbers"].values.squeeze(axis=0)
+        valid = tracknumbers > 0
+        nclouds_files = np.count_nonzero(valid, axis=1).astype(np.int64)
+        for varname in ragged_varnames:
+            track_data[varname] = ds[varname].values.squeeze(axis=0)[valid].astype(np.int32)
+    if "track_counter" in ds:
+        track_data["track_counter"] = ds["track_counter"].values.astype(np.int64)
+    ds.close()
+
+    track_data["file_offsets"] = np.concatenate(([0], np.cumsum(nclouds_files)))
+    return track_data
+
+
+# ----------------------------------------------------------------------------------
+def ragged_to_dense_tracknumbers(
+        track_data,
+        file_nclouds,
+        maxnclouds,
+        fillval,
+):
+    """
+    Convert ragged track arrays to dense (1, nfiles, maxnclouds) arrays as written by gettracknumbers.
+
+    Slots after the last cloud of each file are filled as gettracknumbers leaves them:
+    track_status is 0 (sum of unset reference and new status), and track_reset keeps the flag set for
+    the whole file at the start of the data or after a gap (1) and at the end of the data or before a gap (2).
+    These files are recognized by all their clouds having the same flag, other slots are set to fillval.
+
+    Args:
+        track_data: dictionary
+            Dictionary containing the flat track arrays (ragged_varnames) of all clouds in all files.
+        file_nclouds: numpy array
+            Number of clouds in each file.
+        maxnclouds: int
+            Maximum number of clouds in one file.
+        fillval: int
+            Missing value.
+
+    Returns:
+        dense_data: dictionary
+            Dictionary containing the dense track arrays.
+    """
+    nfiles = len(file_nclouds)
+    file_row = np.repeat(np.arange(0, nfiles), file_nclouds)
+    cloud_idx = np.arange(0, len(file_row)) - np.repeat(np.cumsum(file_nclouds) - file_nclouds, file_nclouds)
+
+    # Flag set for the whole file: all clouds in the file have the same flag 1 or 2
+    track_reset = track_data["track_reset"]
+    has_clouds = file_nclouds > 0
+    first_reset = np.full(nfiles, fillval, dtype=int)
+    first_reset[has_clouds] = track_reset[(np.cumsum(file_nclouds) - file_nclouds)[has_clouds]]
+    nsame = np.bincount(file_row, weights=(track_reset == first_reset[file_row]), minlength=nfiles)
+    file_reset = np.where(has_clouds & (nsame == file_nclouds) & ((first_reset == 1) | (first_reset == 2)),
+                          first_reset, fillval)
+
+    padded_values = {
+        "track_status": np.zeros(nfiles, dtype=int),
+        "track_reset": file_reset,
+    }
+    dense_data = {}
+    for varname in ragged_varnames:
+        fill_row = padded_values.get(varname, np.full(nfiles, fillval, dtype=int))
+        dense = np.repeat(fill_row[:, np.newaxis], maxnclouds, axis=1)[np.newaxis, :, :]
+        dense[0, file_row, cloud_idx] = track_data[varname]
+        dense_data[varname] = dense
+    return dense_data
+
+
+# ----------------------------------------------------------------------------------
+def write_tracknumbers(
+        tracknumbers_outfile,
+        track_vars,
+        basetime,
+        cloudidfiles,
+        ntracks,
+        config,
+        tracknumbers_storage="dense",
+        file_nclouds=None,
+        track_counter=None,
+):
+    """
+    Write track numbers output file.
+
+    Args:
+        tracknumbers_outfile: string
+            Track numbers output filename.
+        track_vars: dictionary
+            Dictionary containing the track arrays (track_numbers, track_status, track_mergenumbers,
+            track_splitnumbers, track_reset). Dense storage: arrays of (1, nfiles, maxnclouds).
+            Ragged storage: flat arrays of all clouds in all files.
+        basetime: numpy array
+            Base time of each file.
+        cloudidfiles: numpy array
+            Cloudid filename characters of each file.
+        ntracks: int
+            Number of tracks (next track number).
+        config: dictionary
+            Dictionary containing config parameters.
+        tracknumbers_storage: string, optional. Default: "dense".
+            Track numbers storage: 'dense', 'ragged'.
+        file_nclouds: numpy array, optional. Default: None.
+            Number of clouds in each file, required for ragged storage.
+        track_counter: numpy array, optional. Default: None.
+            Track number counter before the tracks starting in each file are created.
+
+    Returns:
+        tracknumbers_outfile: string
+            Track numbers output filename.
+    """
+    # Check if file already exists. If exists, delete
+    if os.path.isfile(tracknumbers_outfile):
+        os.remove(tracknumbers_outfile)
+
+    # Define output variables dictionary
+    var_dict = {
+        "ntracks": (["time"], np.array([ntracks])),
+        "basetimes": (["nfiles"], basetime.astype("datetime64[ns]")),
+        "cloudid_files": (["nfiles", "ncharacters"], cloudidfiles),
+        }
+    coord_dict = {
+        "time": (["time"], np.arange(0, 1)),
+        "nfiles": (["nfiles"], np.arange(len(basetime))),
+        "ncharacters": (["ncharacters"], np.arange(0, cloudidfiles.shape[1])),
+    }
+    if tracknumbers_storage == "ragged":
+        file_offsets = np.concatenate(([0], np.cumsum(file_nclouds, dtype=np.int64)[:-1]))
+        var_dict["file_offsets"] = (["nfiles"], file_offsets)
+        var_dict["file_nclouds"] = (["nfiles"], file_nclouds)
+        for varname in ragged_varnames:
+            var_dict[varname] = (["nfeatures"], track_vars[varname])
+        coord_dict["nfeatures"] = (["nfeatures"], np.arange(0, len(track_vars["track_numbers"])))
+    else:
+        for varname in ragged_varnames:
+            var_dict[varname] = (["time", "nfiles", "nclouds"], track_vars[varname])
+        coord_dict["nclouds"] = (["nclouds"], np.arange(0, track_vars["track_numbers"].shape[2]))
+    if track_counter is not None:
+        var_dict["track_counter"] = (["nfiles"], track_counter)
+    gattr_dict = {
+        "Title": "Indicates the track each cloud is linked to. " + \
+                 "Flags indicate how the clouds transition(evolve) between files.",
+        # "Conventions": "CF-1.6",
+        "Insitution": "Pacific Northwest National Laboratory",
+        "Contact": "Zhe Feng: zhe.feng@pnnl.gov",
+        "Created": time.ctime(time.time()),
+        # "source": datasource,
+        # "description": datadescription,
+        "singletrack_filebase": config["singletrack_filebase"],
+        "startdate": config["startdate"],
+        "enddate": config["enddate"],
+        "timegap": str(config["timegap"]) + "-hours",
+        "tracknumbers_storage": tracknumbers_storage,
+    }
+    # Define Xarray dataset
+    ds_out = xr.Dataset(var_dict, coords=coord_dict, attrs=gattr_dict,)
+
+    # Set variable attributes
+    ds_out.ntracks.attrs["long_name"] = "number of cloud tracks"
+    ds_out.ntracks.attrs["units"] = "unitless"
+
+    ds_out.basetimes.attrs["long_name"] = "epoch time (seconds since 01/01/1970 00:00) of cloudid_files"
+    ds_out.basetimes.attrs["standard_name"] = "time"
+
+    ds_out.cloudid_files.attrs["long_name"] = "filename of each cloudid file used during tracking"
+    ds_out.cloudid_files.attrs["units"] = "unitless"
+
+    ds_out.track_numbers.attrs["long_name"] = "cloud track number"
+    ds_out.track_numbers.attrs["usage"] = "size: 1 by time by number of clouds. " + \
+    "Each column represents a cloudid file (time dimension). " + \
+    "Each row represents a cloud in that file (ex. row 0=cloud 1, row 1000=cloud 1001) through time. " + \
+    "The values indicate the track that cloud is in. This follows the largest cloud in mergers and splits."
+
+    ds_out.track_numbers.attrs["units"] = "unitless"
+    ds_out.track_numbers.attrs["valid_min"] = 1
+    ds_out.track_numbers.attrs["valid_max"] = ntracks - 1
+
+    ds_out.track_status.attrs[
+        "long_name"
+    ] = "Flag indicating evolution / behavior for each cloud in a track"
+    ds_out.track_status.attrs["units"] = "unitless"
+    ds_out.track_status.attrs["valid_min"] = 0
+    ds_out.track_status.attrs["valid_max"] = 65
+
+    ds_out.track_mergenumbers.attrs[
+        "long_name"
+    ] = "Number of the track that this small cloud merges into"
+    ds_out.track_mergenumbers.attrs[
+        "usage"
+    ] = "size: 1 by time by number of clouds. Each column represents a cloudid file (time dimension). " + \
+        "Each row represets a cloud in that file through time. " + \
+        "Values give the track number associated with the small clouds in mergers."
+
+    ds_out.track_mergenumbers.attrs["units"] = "unitless"
+    ds_out.track_mergenumbers.attrs["valid_min"] = 1
+    ds_out.track_mergenumbers.attrs["valid_max"] = ntracks - 1
+
+    ds_out.track_splitnumbers.attrs[
+        "long_name"
+    ] = "Number of the track that this small cloud splits from"
+    ds_out.track_splitnumbers.attrs[
+        "usage"
+    ] = "size: 1 by time by number of clouds. Each column represents a cloudid file (time). " + \
+        "Each row represets a cloud in that file through time. " + \
+        "Values give the track number associated with the small clouds in the split"
+    ds_out.track_splitnumbers.attrs["units"] = "unitless"
+    ds_out.track_splitnumbers.attrs["valid_min"] = 1
+    ds_out.track_splitnumbers.attrs["valid_max"] = ntracks - 1
+
+    ds_out.track_reset.attrs[
+        "long_name"
+    ] = "flag of track starts and abrupt track stops"
+    ds_out.track_reset.attrs[
+        "usage"
+    ] = "Each row represents a cloudid file. Each column represents a cloud in that file. " + \
+        "Numbers indicate if the track started or adruptly ended during this file."
+    ds_out.track_reset.attrs[
+        "values"
+    ] = "0=Track starts and ends within a period of continuous data. " + \
+        "1=Track starts as the first file in the data set or after a data gap. " + \
+        "2=Track ends because data ends or gap in data."
+    ds_out.track_reset.attrs["units"] = "unitless"
+    ds_out.track_reset.attrs["valid_min"] = 0
+    ds_out.track_reset.attrs["valid_max"] = 2
+
+    encoding = {
+        "ntracks": {"dtype": "int", "zlib": True},
+        "basetimes": {
+            "dtype": "int64",
+            "zlib": True,
+            "units": "seconds since 1970-01-01",
+        },
+        "cloudid_files": {
+            "zlib": True,
+        },
+        "track_numbers": {"dtype": "int", "zlib": True, "_FillValue": -9999},
+        "track_status": {"dtype": "int", "zlib": True, "_FillValue": -9999},
+        "track_mergenumbers": {"dtype": "int", "zlib": True, "_FillValue": -9999},
+        "track_splitnumbers": {"dtype": "int", "zlib": True, "_FillValue": -9999},
+        "track_reset": {"dtype": "int", "zlib": True, "_FillValue": -9999},
+    }
+    if tracknumbers_storage == "ragged":
+        ds_out.file_offsets.attrs["long_name"] = "index of the first cloud of each cloudid file in the nfeatures dimension"
+        ds_out.file_offsets.attrs["units"] = "unitless"
+        ds_out.file_nclouds.attrs["long_name"] = "number of clouds in each cloudid file"
+        ds_out.file_nclouds.attrs["units"] = "unitless"
+        for varname in ragged_varnames:
+            ds_out[varname].attrs["usage"] = "Ragged array of all clouds in all cloudid files. " + \
+                "Values of cloudid file i are in [file_offsets[i], file_offsets[i] + file_nclouds[i]), " + \
+                "ordered by cloud number."
+        encoding["file_offsets"] = {"dtype": "int64", "zlib": True}
+        encoding["file_nclouds"] = {"dtype": "int", "zlib": True}
+    if track_counter is not None:
+        ds_out.track_counter.attrs["long_name"] = "track number counter before the tracks starting in each file are created"
+        ds_out.track_counter.attrs["units"] = "unitless"
+        encoding["track_counter"] = {"dtype": "int", "zlib": True}
+
+    # Write netcdf file
+    ds_out.to_netcdf(
+        path=tracknumbers_outfile,
+        mode="w",
+        format="NETCDF4_CLASSIC",
+        # unlimited_dims="ntracks",
+        encoding=encoding,
+    )
+    return tracknumbers_outfile
+
+
+# ----------------------------------------------------------------------------------
+def write_tracknumbers_state(trackstate_file, tail_state):
+    """
+    Write the tail state of a gettracks run, used to extend the run in append mode.
+
+    Args:
+        trackstate_file: string
+            Track state filename.
+        tail_state: dictionary
+            Dictionary containing:
+            ntracks: int
+                Next track number (itrack counter).
+            nfiles: int
+                Number of files in the tracknumbers file.
+            basetime: int
+                Base time (Epoch time) of the last file.
+            cloudid_file: string
+                Cloudid filename of the last file.
+            tracknumbers_file: string
+                Tracknumbers filename of the run.
+            track_numbers, new_track_status, track_mergenumbers, track_splitnumbers, track_reset: numpy array
+                Track matrix rows of the clouds in the last file, before flagging the end of the data.
+
+    Returns:
+        trackstate_file: string
+            Track state filename.
+    """
+    var_dict = {
+        "track_numbers": (["nclouds"], tail_state["track_numbers"].astype(np.int32)),
+        "new_track_status": (["nclouds"], tail_state["new_track_status"].astype(np.float32)),
+        "track_mergenumbers": (["nclouds"], tail_state["track_mergenumbers"].astype(np.int32)),
+        "track_splitnumbers": (["nclouds"], tail_state["track_splitnumbers"].astype(np.int32)),
+        "track_reset": (["nclouds"], tail_state["track_reset"].astype(np.int32)),
+    }
+    gattr_dict = {
+        "Title": "Track numbering state after the last file of a tracking run",
+        "ntracks": int(tail_state["ntracks"]),
+        "nfiles": int(tail_state["nfiles"]),
+        "basetime": int(tail_state["basetime"]),
+        "cloudid_file": tail_state["cloudid_file"],
+        "tracknumbers_file": tail_state["tracknumbers_file"],
+    }
+    ds_out = xr.Dataset(var_dict, attrs=gattr_dict)
+    ds_out.new_track_status.attrs["long_name"] = "Track status of the clouds set as new clouds in the last file"
+    ds_out.track_reset.attrs["long_name"] = "Track reset flag before flagging the end of the data"
+    ds_out.to_netcdf(path=trackstate_file, mode="w", format="NETCDF4")
+    return trackstate_file
+
+
+# ----------------------------------------------------------------------------------
+def read_tracknumbers_state(trackstate_file):
+    """
+    Read the tail state of a gettracks run.
+
+    Args:
+        trackstate_file: string
+            Track state filename.
+
+    Returns:
+        tail_state: dictionary
+            Dictionary with the same keys as written by write_tracknumbers_state.
+    """
+    ds = xr.open_dataset(trackstate_file, mask_and_scale=False, decode_times=False)
+    tail_state = {
+        "ntracks": int(ds.attrs["ntracks"]),
+        "nfiles": int(ds.attrs["nfiles"]),
+        "basetime": int(ds.attrs["basetime"]),
+        "cloudid_file": ds.attrs["cloudid_file"],
+        "tracknumbers_file": ds.attrs["tracknumbers_file"],
+    }
+    for varname in ["track_numbers", "new_track_status", "track_mergenumbers", "track_splitnumbers", "track_reset"]:
+        tail_state[varname] = ds[varname].values
+    ds.close()
+    return tail_state
+
+
+# ----------------------------------------------------------------------------------
+def write_trackstats_state(trackstate_file, nfiles, out_dict, out_dict_attrs, var_names, row_idx, col_idx, file_idx):
+    """
+    Write the per-feature track statistics collected before removing short tracks,
+    used to extend the track statistics in append mode.
+
+    Args:
+        trackstate_file: string
+            Track statistics state filename.
+        nfiles: int
+            Number of files processed.
+        out_dict: dictionary
+            Dictionary containing the collected 1D feature statistics.
+        out_dict_attrs: dictionary
+            Dictionary containing the attributes of the statistics variables.
+        var_names: list
+            Statistics variable names.
+        row_idx: numpy array
+            Track index of each feature.
+        col_idx: numpy array
+            Time index (within the track) of each feature.
+        file_idx: numpy array
+            File index of each feature.
+
+    Returns:
+        trackstate_file: string
+            Track statistics state filename.
+    """
+    var_dict = {}
+    encoding = {}
+    for ivar in var_names:
+        # Keep the fill value as a regular attribute, so that the values are stored unchanged
+        attrs = {key: value for key, value in out_dict_attrs[ivar].items() if key != "_FillValue"}
+        if "_FillValue" in out_dict_attrs[ivar]:
+            attrs["fillvalue"] = out_dict_attrs[ivar]["_FillValue"]
+        var_dict[ivar] = (["features"], out_dict[ivar], attrs)
+        encoding[ivar] = {"_FillValue": None}
+    var_dict["row_idx"] = (["features"], row_idx.astype(np.int32))
+    var_dict["col_idx"] = (["features"], col_idx.astype(np.int32))
+    var_dict["file_idx"] = (["features"], file_idx.astype(np.int32))
+    gattr_dict = {
+        "Title": "Feature statistics collected before removing short tracks",
+        "nfiles": int(nfiles),
+    }
+    ds_out = xr.Dataset(var_dict, attrs=gattr_dict)
+    ds_out.to_netcdf(path=trackstate_file, mode="w", format="NETCDF4", encoding=encoding)
+    return trackstate_file
+
+
+# ----------------------------------------------------------------------------------
+def read_trackstats_state(trackstate_file):
+    """
+    Read the per-feature track statistics state.
+
+    Args:
+        trackstate_file: string
+            Track statistics state filename.
+
+    Returns:
+        stats_state: dictionary
+            Dictionary containing:
+            nfiles: int
+                Number of files processed.
+            var_names: list
+                Statistics variable names.
+            out_dict: dictionary
+                Dictionary containing the collected 1D feature statistics.
+            out_dict_attrs: dictionary
+                Dictionary containing the attributes of the statistics variables.
+            row_idx, col_idx, file_idx: numpy array
+                Track, time and file index of each feature.
+    """
+    ds = xr.open_dataset(trackstate_file, mask_and_scale=False, decode_times=False)
+    var_names = [ivar for ivar in ds.data_vars if ivar not in ["row_idx", "col_idx", "file_idx"]]
+    stats_state = {
+        "nfiles": int(ds.attrs["nfiles"]),
+        "var_names": var_names,
+        "out_dict": {ivar: ds[ivar].values for ivar in var_names},
+        "out_dict_attrs": {ivar: ds[ivar].attrs for ivar in var_names},
+        "row_idx": ds["row_idx"].values.astype(int),
+        "col_idx": ds["col_idx"].values.astype(int),
+        "file_idx": ds["file_idx"].values.astype(int),
+    }
+    ds.close()
+    for ivar in var_names:
+        attrs = dict(stats_state["out_dict_attrs"][ivar])
+        if "fillvalue" in attrs:
+            attrs["_FillValue"] = attrs.pop("fillvalue")
+        stats_state["out_dict_attrs"][ivar] = attrs
+    return stats_state
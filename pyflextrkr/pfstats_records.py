@@ -0,0 +1,214 @@
+import sys
+import warnings
+import numpy as np
+from pyflextrkr.ft_utilities import expand_index_ranges
+
+# Ragged PF storage: PF variables are flat records ordered by track, time and PF,
+# the number of records at each track/time is saved in a 2D (tracks, times) variable
+pf_records_dimname = "pf_records"
+pf_nrecords_varname = "pf_nrecords"
+
+def get_pf_records(
+        pf_values,
+        trackindices,
+        timeindices,
+        var_names_pf,
+):
+    """
+    Convert PF variables of one pixel file from (nclouds, nmaxpf) arrays to flat records.
+
+    Only PFs up to the last valid entry of any variable are kept for each cloud.
+
+    Args:
+        pf_values: dictionary
+            Dictionary containing PF variables of (nclouds, nmaxpf) arrays.
+        trackindices: np.array
+            Track indices of the clouds.
+        timeindices: np.array
+            Time indices of the clouds.
+        var_names_pf: list
+            PF variable names.
+
+    Returns:
+        records: dictionary
+            Dictionary containing PF variables of flat records.
+        rec_trackindices: np.array
+            Track index of each record.
+        rec_timeindices: np.array
+            Time index of each record.
+    """
+    # Number of records for each cloud: 1 + position of the last valid PF entry in any variable
+    valid = np.zeros(pf_values[var_names_pf[0]].shape, dtype=bool)
+    for ivar in var_names_pf:
+        valid |= ~np.isnan(pf_values[ivar])
+    nmaxpf = valid.shape[1]
+    nrecords = np.where(np.any(valid, axis=1), nmaxpf - np.argmax(valid[:, ::-1], axis=1), 0)
+    # PF entries within the records, in (cloud, PF) order
+    keep = np.arange(0, nmaxpf)[None, :] < nrecords[:, None]
+    records = {ivar: pf_values[ivar][keep].astype(np.float32) for ivar in var_names_pf}
+    rec_trackindices = np.repeat(trackindices, nrecords)
+    rec_timeindices = np.repeat(timeindices, nrecords)
+    return records, rec_trackindices, rec_timeindices
+
+
+def sort_pf_records(
+        records,
+        rec_trackindices,
+        rec_timeindices,
+        numtracks,
+        maxtracklength,
+):
+    """
+    Sort PF records by track and time, and count the number of records at each track/time.
+
+    Args:
+        records: dictionary
+            Dictionary containing PF variables of flat records.
+        rec_trackindices: np.array
+            Track index of each record.
+        rec_timeindices: np.array
+            Time index of each record.
+        numtracks: int
+            Number of tracks.
+        maxtracklength: int
+            Maximum track length.
+
+    Returns:
+        records: dictionary
+            Dictionary containing sorted PF variables of flat records.
+        pf_nrecords: np.array
+            Number of PF records at each track/time, shape (numtracks, maxtracklength).
+    """
+    rec_key = rec_trackindices.astype(np.int64) * maxtracklength + rec_timeindices
+    # Stable sort keeps the PF order within each track/time
+    order = np.argsort(rec_key, kind="stable")
+    records = {ivar: values[order] for ivar, values in records.items()}
+    pf_nrecords = np.bincount(rec_key, minlength=numtracks * maxtracklength)
+    pf_nrecords = pf_nrecords.reshape(numtracks, maxtracklength).astype(np.int32)
+    return records, pf_nrecords
+
+
+def is_pf_records(ds):
+    """
+    Check if PF variables in a dataset are stored as flat records.
+
+    Args:
+        ds: Xarray Dataset
+            Dataset containing PF statistics.
+
+    Returns:
+        True if PF variables are stored as flat records, False otherwise.
+    """
+    return pf_records_dimname in ds.dims
+
+
+def get_pf_records_index(ds):
+    """
+    Get track/time and PF position of each PF record.
+
+    Args:
+        ds: Xarray Dataset
+            Dataset containing PF statistics stored as flat records.
+
+    Returns:
+        rec_flatindices: np.array
+            Flat (tracks, times) index of each record.
+        rec_pfindices: np.array
+            PF position (0 for the largest PF) of each record within its track/time.
+    """
+    counts = ds[pf_nrecords_varname].data.ravel()
+    rec_flatindices = np.repeat(np.arange(0, len(counts)), counts)
+    rec_pfindices = np.arange(0, len(rec_flatindices)) - np.repeat(np.cumsum(counts) - counts, counts)
+    return rec_flatindices, rec_pfindices
+
+
+def reduce_pf_var(
+        ds,
+        varname,
+        pf_dimname,
+        method,
+):
+    """
+    Reduce a PF variable over the PF dimension to (tracks, times), for either dense or flat record storage.
+
+    Args:
+        ds: Xarray Dataset
+            Dataset containing PF statistics.
+        varname: string
+            PF variable name.
+        pf_dimname: string
+            PF dimension name of dense storage.
+        method: string
+            Reduction method:
+            'first': the largest PF (1st entry);
+            'nansum': sum over PFs ignoring NaN (0 if there is no PF);
+            'sum': sum over all nmaxpf PF entries (NaN if any entry is NaN);
+            'nanmax': maximum over PFs ignoring NaN (NaN if there is no PF).
+
+    Returns:
+        values: np.array
+            Reduced variable, shape (tracks, times).
+    """
+    if method not in ["first", "nansum", "sum", "nanmax"]:
+        sys.exit(f"Unknown PF reduction method: {method}")
+
+    if not is_pf_records(ds):
+        data = ds[varname]
+        if method == "first":
+            return data.isel({pf_dimname: 0}).data
+        elif method == "nansum":
+            return data.sum(dim=pf_dimname).data
+        elif method == "sum":
+            return np.sum(data.data, axis=2)
+        else:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", category=RuntimeWarning)
+                return np.nanmax(data.data, axis=2)
+
+    nrecords = ds[pf_nrecords_varname].data
+    values = ds[varname].data
+    rec_flatindices, rec_pfindices = get_pf_records_index(ds)
+    if method == "first":
+        out = np.full(nrecords.size, np.nan, dtype=values.dtype)
+        first = rec_pfindices == 0
+        out[rec_flatindices[first]] = values[first]
+    elif method in ["nansum", "sum"]:
+        out = np.zeros(nrecords.size, dtype=values.dtype)
+        np.add.at(out, rec_flatindices, np.nan_to_num(values) if method == "nansum" else values)
+        if method == "sum":
+            # Entries after the last record are missing in dense storage
+            out[nrecords.ravel() < int(ds.attrs["nmaxpf"])] = np.nan
+    else:
+        out = np.full(nrecords.size, np.nan, dtype=values.dtype)
+        np.fmax.at(out, rec_flatindices, values)
+    return out.reshape(nrecords.shape)
+
+
+def subset_pf_tracks(
+        ds,
+        trackid,
+        tracks_dimname,
+):
+    """
+    Subset tracks from a PF statistics dataset, for either dense or flat record storage.
+
+    Args:
+        ds: Xarray Dataset
+            Dataset containing PF statistics.
+        trackid: np.array
+            Sorted track indices to keep.
+        tracks_dimname: string
+            Tracks dimension name.
+
+    Returns:
+        ds_out: Xarray Dataset
+            Dataset containing PF statistics of the subset tracks.
+    """
+    ds_out = ds.isel({tracks_dimname: trackid})
+    if is_pf_records(ds):
+        # Records of each track are contiguous
+        track_counts = ds[pf_nrecords_varname].data.sum(axis=1)
+        track_starts = np.cumsum(track_counts) - track_counts
+        rec_idx = expand_index_ranges(track_starts[trackid], track_counts[trackid])
+        ds_out = ds_out.isel({pf_records_dimname: rec_idx})
+    return ds_out
@@ -6,6 +6,8 @@ import time
 import warnings
 import logging
 import pandas as pd
+from pyflextrkr.ft_utilities import get_continuous_periods
+from pyflextrkr.pfstats_records import reduce_pf_var, subset_pf_tracks
 
 def define_robust_mcs_radar(config):
     """
@@ -53,111 +55,42 @@ def define_robust_mcs_radar(config):
     ntracks = ds_pf.dims[tracks_dimname]
     ntimes = ds_pf.dims[times_dimname]
 
-    ir_trackduration = ds_pf["track_duration"].data
-    pf_area = ds_pf["pf_area"].data
-    pf_majoraxis = ds_pf["pf_majoraxis"].data
-    pf_cc45area = ds_pf["pf_cc45area"].data
-    pf_sfarea = ds_pf["pf_sfarea"].data
-    pf_corearea = ds_pf["pf_corearea"].data
-    pf_coremajoraxis = ds_pf["pf_coremajoraxis"].data
-    pf_ccaspectratio = ds_pf["pf_coreaspectratio"].data
+    ir_trackduration = ds_pf["track_duration"].data.astype(int)
+    # Get the largest precipitation (1st entry in 3rd dimension)
+    pf_majoraxis = reduce_pf_var(ds_pf, "pf_majoraxis", pf_dimname, "first")
+    pf_cc45area = reduce_pf_var(ds_pf, "pf_cc45area", pf_dimname, "first")
     fillval = ds_pf["mcs_status"].attrs["_FillValue"]
     fillval_f = ds_pf["pf_area"].attrs["_FillValue"]
     time_res = float(ds_pf.attrs["time_resolution_hour"])
 
     ##################################################
     # Initialize matrices
-    trackid_mcs = []
-    trackid_nonmcs = []
-
     # pf_mcstype = np.full(ntracks, fillval, dtype=int)
     pf_mcsstatus = np.full((ntracks, ntimes), fillval, dtype=int)
     #pf_cctype = np.full((ntracks, ntimes), fillval, dtype=int)
 
-    ###################################################
-    # Loop through each track
-    for nt in range(0, ntracks):
-        logger.debug(f"Track #: {nt}")
-
-        ############################################
-        # Isolate data from this track
-        ilength = np.copy(ir_trackduration[nt]).astype(int)
-
-        # Get the largest precipitation (1st entry in 3rd dimension)
-        ipf_majoraxis = np.copy(pf_majoraxis[nt, 0:ilength, 0])
-        ipf_area = np.copy(pf_area[nt, 0:ilength, 0])
-        ipf_cc45area = np.copy(pf_cc45area[nt, 0:ilength, 0])
-        ipf_ccmajoraxis = np.copy(pf_coremajoraxis[nt, 0:ilength, 0])
-        ipf_ccaspectratio = np.copy(pf_ccaspectratio[nt, 0:ilength, 0])
-
-        ######################################################
-        # Apply radar defined MCS criteria
-        # PF major axis length > thresh and contains convective echo >= 45 dbZ
-        ipfmcs = np.where(
-                (ipf_majoraxis >= mcs_pf_majoraxis_thresh)
-                # & (ipf_majoraxis <= max_pf_majoraxis_thresh)
-                & (ipf_cc45area > 0)
-            )[0]
-        nipfmcs = len(ipfmcs)
-
-        if nipfmcs > 0:
-            # Apply duration threshold to entire time period
-            if (nipfmcs * time_res) > mcs_pf_durationthresh:
-
-                # Find continuous duration indices
-                groups = np.split(ipfmcs, np.where(np.diff(ipfmcs) > mcs_pf_gap)[0] + 1)
-                nbreaks = len(groups)
-
-                # Loop over each sub-period "group"
-                for igroup in range(0, nbreaks):
-
-                    ############################################################
-                    # Determine if each group satisfies duration threshold
-                    igroup_indices = np.array(np.copy(groups[igroup][:]))
-                    nigroup = len(igroup_indices)
-
-                    # Duration length: group's last index - first index + 1
-                    igroup_duration = np.multiply(
-                        (groups[igroup][-1] - groups[igroup][0] + 1), time_res
-                    )
-
-                    # Group satisfies duration threshold
-                    if igroup_duration >= mcs_pf_durationthresh:
-
-                        # Get radar variables for this group
-                        igroup_pfmajoraxis = np.copy(ipf_majoraxis[igroup_indices])
-                        igroup_ccaspectratio = np.copy(ipf_ccaspectratio[igroup_indices])
-
-                        # Label this period as MCS
-                        pf_mcsstatus[nt, igroup_indices] = 1
-                        logger.debug("MCS")
-
-                        ## Determine type of mcs (squall or non-squall)
-                        # isquall = np.array(np.where(igroup_ccaspectratio > aspectratiothresh))[0, :]
-                        # nisquall = len(isquall)
-
-                        # if nisquall > 0:
-                        #    # Label as squall
-                        #    pf_mcstype[nt] = 1
-                        #    pf_cctype[nt, igroup_indices[isquall]] = 1
-                        # else:
-                        #    # Label as non-squall
-                        #    pf_mcstype[nt] = 2
-                        #    pf_cctype[nt, igroup_indices[isquall]] = 2
-                    else:
-                        logger.debug("Not MCS")
-
-            # Group does not satisfy duration threshold
-            else:
-                trackid_nonmcs = np.append(trackid_nonmcs, int(nt))
-                logger.debug("Not MCS")
-        else:
-            logger.debug("Not MCS")
+    ######################################################
+    # Apply radar defined MCS criteria to all tracks and times within the track duration
+    # PF major axis length > thresh and contains convective echo >= 45 dbZ
+    intrack = np.arange(0, ntimes)[None, :] < ir_trackduration[:, None]
+    pfmcs_mask = intrack & \
+                 (pf_majoraxis >= mcs_pf_majoraxis_thresh) & \
+                 (pf_cc45area > 0)
+                 # & (pf_majoraxis <= max_pf_majoraxis_thresh)
+    # Apply duration threshold to entire time period
+    pfmcs_mask &= (np.count_nonzero(pfmcs_mask, axis=1) * time_res > mcs_pf_durationthresh)[:, None]
+    track_idx, time_idx = np.nonzero(pfmcs_mask)
+
+    # Find continuous duration periods
+    period_id, period_starts, period_ends = get_continuous_periods(track_idx, time_idx, mcs_pf_gap)
+    # Duration length: period's last index - first index + 1
+    period_duration = (time_idx[period_ends] - time_idx[period_starts] + 1) * time_res
+    # Label periods satisfying duration threshold as MCS
+    ismcs = (period_duration >= mcs_pf_durationthresh)[period_id]
+    pf_mcsstatus[track_idx[ismcs], time_idx[ismcs]] = 1
 
     # Find track indices that are robust MCS
-    TEMP_mcsstatus = np.copy(pf_mcsstatus).astype(float)
-    TEMP_mcsstatus[TEMP_mcsstatus == fillval] = np.nan
-    trackid_mcs = np.array(np.where(np.nansum(TEMP_mcsstatus, axis=1) > 0))[0, :]
+    trackid_mcs = np.where(np.any(pf_mcsstatus == 1, axis=1))[0]
     nmcs = len(trackid_mcs)
 
     # Stop code if not robust MCS present
@@ -171,16 +104,13 @@ def define_robust_mcs_radar(config):
 
     # mcs_basetime = basetime[trackid_mcs]
     pf_mcsstatus = pf_mcsstatus[trackid_mcs, :]
-    pf_majoraxis = pf_majoraxis[trackid_mcs, :, :]
-    pf_area = pf_area[trackid_mcs, :, :]
-    pf_coremajoraxis = pf_coremajoraxis[trackid_mcs, :, :]
-    pf_corearea = pf_corearea[trackid_mcs, :, :]
-    pf_sfarea = pf_sfarea[trackid_mcs, :, :]
+    # Subset robust MCS tracks from PF dataset
+    ds_mcs = subset_pf_tracks(ds_pf, trackid_mcs, tracks_dimname)
 
     # Get lifetime when a significant PF is present
     with warnings.catch_warnings():
         warnings.simplefilter("ignore", category=RuntimeWarning)
-        pf_maxmajoraxis = np.nanmax(pf_majoraxis, axis=2)
+        pf_maxmajoraxis = reduce_pf_var(ds_mcs, "pf_majoraxis", pf_dimname, "nanmax")
         pf_maxmajoraxis[pf_maxmajoraxis < mcs_pf_majoraxis_for_lifetime] = 0
         pf_maxmajoraxis[pf_maxmajoraxis > mcs_pf_majoraxis_for_lifetime] = 1
         pf_lifetime = np.multiply(np.nansum(pf_maxmajoraxis, axis=1), time_res)
@@ -193,205 +123,36 @@ def define_robust_mcs_radar(config):
     # 2 hours after genesis state and 2 hours before decay stage
     # Dissipiation (4): First hour after convective line is no longer observed
 
+    # Initialize arrays
+    cycle_complete = np.full(nmcs, fillval, dtype=int)
+    cycle_stage = np.full((nmcs, ntimes), fillval, dtype=int)
+    cycle_index = np.full((nmcs, 5), fillval, dtype=int)
+
     # Process only MCSs with duration > mcs_lifecycle_thresh
     lifetime = np.multiply(ir_trackduration, time_res)
     ilongmcs = np.array(np.where(lifetime >= mcs_lifecycle_thresh))[0, :]
     nlongmcs = len(ilongmcs)
 
     if nlongmcs > 0:
-        # Initialize arrays
-        cycle_complete = np.full(nmcs, fillval, dtype=int)
-        cycle_stage = np.full((nmcs, ntimes), fillval, dtype=int)
-        cycle_index = np.full((nmcs, 5), fillval, dtype=int)
-
-        # TODO: port MCS lifecycle stage definition codes
-        # import matplotlib.pyplot as plt
-        # import pdb;
-        # pdb.set_trace()
-
-        #mcs_basetime = np.empty((nmcs, ntimes), dtype="datetime64[s]")
-
-        # Loop through each mcs
-        for ilm in range(0, nlongmcs):
-            # Initialize arrays
-            ilm_index = np.ones(5, dtype=int) * fillval
-            ilm_cycle = np.ones(ntimes, dtype=int) * fillval
-
-            # Isolate data from this track
-            ilm_irtracklength = np.copy(ir_trackduration[ilongmcs[ilm]]).astype(int)
-            ilm_pfccmajoraxis = np.copy(pf_coremajoraxis[ilongmcs[ilm], 0:ilm_irtracklength, :])
-            ilm_pfccarea = np.copy(pf_corearea[ilongmcs[ilm], 0:ilm_irtracklength, :])
-            ilm_meansfarea = np.sum(np.copy(pf_sfarea[ilongmcs[ilm], 0:ilm_irtracklength, :]), axis=1)
-            ilm_pfarea = np.copy(pf_area[ilongmcs[ilm], 0:ilm_irtracklength, 0])
-
-            ilm_maxpfccmajoraxis = np.nanmax(ilm_pfccmajoraxis, axis=1)
-            ilm_maxpfccarea = np.nanmax(ilm_pfccarea, axis=1)
-
-            #TEMP_basetime = np.array(
-            #        [
-            #            pd.to_datetime(
-            #                ds_pf["basetime"][
-            #                    trackid_mcs[ilongmcs[ilm]], 0:ilm_irtracklength
-            #                ].data,
-            #                unit="s",
-            #            )
-            #        ]
-            #)
-            #mcs_basetime[ilm, 0:ilm_irtracklength] = TEMP_basetime
-
-            ##################################################################
-            # Find indices of when convective line present and absent and when stratiform present
-
-            # Find times with convective core area > 0
-            iccarea = np.array(np.where(ilm_maxpfccarea > 0))[0, :]
-            iccarea_groups = np.split(iccarea, np.where(np.diff(iccarea) > 2)[0] + 1)
-            if len(iccarea) > 0 and len(iccarea_groups) > 1:
-                grouplength = np.empty(len(iccarea_groups))
-                for igroup in range(0, len(iccarea_groups)):
-                    grouplength[igroup] = len(iccarea_groups[igroup][:])
-                maxgroup = np.nanargmax(grouplength)
-                iccarea = iccarea_groups[maxgroup][:]
-            elif len(iccarea) > 0:
-                iccarea = np.arange(iccarea[0], iccarea[-1] + 1)
-            nccarea = len(iccarea)
-
-            # Find times with convective major axis length greater than 100 km
-            iccline = np.array(np.where(ilm_maxpfccmajoraxis > 100))[0, :]
-            iccline_groups = np.split(iccline, np.where(np.diff(iccline) > 2)[0] + 1)
-            if len(iccline) > 0 and len(iccline_groups) > 1:
-                grouplength = np.empty(len(iccline_groups))
-                for igroup in range(0, len(iccline_groups)):
-                    grouplength[igroup] = len(iccline_groups[igroup][:])
-                maxgroup = np.nanargmax(grouplength)
-                iccline = iccline_groups[maxgroup][:]
-            elif len(iccline) > 0:
-                iccline = np.arange(iccline[0], iccline[-1] + 1)
-            nccline = len(iccline)
-
-            # Find times with convective major axis length greater than 100 km
-            # and stratiform area greater than the median amount of stratiform
-            # ilm_meansfarea[ilm_meansfarea == fillvalue] = np.nan
-            # print(ilm_maxpfccmajoraxis.shape)
-            # print(ilm_meansfarea.shape)
-            isfarea = np.array(
-                np.where((ilm_maxpfccmajoraxis > 100) &
-                         (ilm_meansfarea > np.nanmean(ilm_meansfarea)))
-            )[0, :]
-            isfarea_groups = np.split(isfarea, np.where(np.diff(isfarea) > 2)[0] + 1)
-            if len(isfarea) > 0 and len(isfarea_groups) > 1:
-                grouplength = np.empty(len(isfarea_groups))
-                for igroup in range(0, len(isfarea_groups)):
-                    grouplength[igroup] = len(isfarea_groups[igroup][:])
-                maxgroup = np.nanargmax(grouplength)
-                isfarea = isfarea_groups[maxgroup][:]
-            elif len(isfarea) > 0:
-                isfarea = np.arange(isfarea[0], isfarea[-1] + 1)
-            nsfarea = len(isfarea)
-
-            # Find times with convective major axis length less than 100 km
-            #if nsfarea > 0:
-            #    inoccline = np.array(np.where(ilm_maxpfccmajoraxis < 100))[0, :]
-            #    inoccline = inoccline[
-            #            np.where((inoccline > isfarea[-1]) & (inoccline > iccline[-1]))
-            #    ]
-            #    inoccline_groups = np.split(
-            #            inoccline, np.where(np.diff(inoccline) > 2)[0] + 1
-            #    )
-            #    if len(inoccline) > 0 and len(inoccline_groups) > 1:
-            #        grouplength = np.empty(len(inoccline_groups))
-            #        for igroup in range(0, len(inoccline_groups)):
-            #            grouplength[igroup] = len(inoccline_groups[igroup][:])
-            #        maxgroup = np.nanargmax(grouplength)
-            #        inoccline = inoccline_groups[maxgroup][:]
-            #    elif len(inoccline) > 0:
-            #        inoccline = np.arange(inoccline[0], inoccline[-1] + 1)
-            #    nnoccline = len(inoccline)
-
-            ###############################################################################
-            # Classify cloud only stage
-
-            # Cloud only stage
-            if nccarea > 0:
-                # If first convective time is after the first cloud time,
-                # label all hours before the convective core appearance time as pre-convective
-                if iccarea[0] > 0 and iccarea[0] < ilm_irtracklength - 1:
-                    # Start of cloud only
-                    ilm_index[0] = 0
-                    # Time period of cloud only
-                    ilm_cycle[0 : iccarea[0]] = 1
-                # Start of unorganized convective cells
-                ilm_index[1] = iccarea[0]
-
-            # If convective line exists
-            if nccline > 1:
-                # If the convective line occurs after the first storm time
-                # (use second index since convective line must be around for one hour prior to classifying as genesis)
-                # Label when convective cores first appear, but are not organized into a line
-                if iccline[1] > iccarea[0]:
-                    # Start of organized convection
-                    ilm_index[2] = iccline[1]
-                    # Time period of unorganzied convective cells
-                    ilm_cycle[iccarea[0] : iccline[1]] = 2
-                else:
-                    logger.warning(f"Lifecycle cannot be properly defined for track: {int(ilongmcs[ilm])}")
-
-                if nsfarea > 0:
-                    # Label MCS genesis.
-                    # Test if stratiform area time is two time steps after the convective line
-                    # and two time steps before the last time of the cloud track
-                    if isfarea[0] > iccline[1] + 2:
-                        # Start of mature MCS
-                        ilm_index[3] = isfarea[0]
-                        # Time period of organized cells before mature
-                        ilm_cycle[iccline[1] : isfarea[0]] = 3
-                        # Time period of mature MCS
-                        ilm_cycle[isfarea[0] : isfarea[-1] + 1] = 4
-                    else:
-                        matureindex = isfarea[np.array(np.where(isfarea == iccline[1] + 2))[0, :]]
-                        if len(matureindex) > 0:
-                            ilm_index[3] = np.copy(matureindex[0])
-                            # Time period of organized cells before mature
-                            ilm_cycle[iccline[1] : matureindex[0]] = 3
-                            # Time period of mature MCS
-                            ilm_cycle[matureindex[0] : isfarea[-1] + 1] = 4
-
-                            # if isfarea[0] > iccline[1] + 2
-                            #    ilm_index[3] = isfarea[0] # Start of mature MCS
-                            #    ilm_cycle[iccline[1]:isfarea[0]] = 3 # Time period of organized cells before maturation
-                            #    ilm_cycle[isfarea[0]:isfarea[-1]+1] = 4 # Time period of mature mcs
-                            # else:
-                            #    if nsfarea > 3:
-                            #        ilm_index[3] = isfarea[3] # Start of mature MCS
-                            #        ilm_cycle[iccline[1]:isfarea[3]] = 3 # Time period of organized cells before maturation
-                            #        ilm_cycle[isfarea[3]:isfarea[-1]+1] = 4 # Time period of mature MCS
-                            # Label dissipating times. Buy default this is all times after the mature stage
-                    if isfarea[-1] < ilm_irtracklength - 1:
-                        # If nsfarea > 0, the dissipation stage can be defined
-                        ilm_index[4] = isfarea[-1] + 1
-                        # Time period of dissipation
-                        ilm_cycle[isfarea[-1] + 1 : ilm_irtracklength] = 5
-
-            ############################################################
-            # Final life cycle processing
-            istage = np.array(np.where(ilm_cycle >= 0))[0, :]
-            nstage = len(istage)
-
-            if nstage > 0:
-                cyclepresent = np.copy(ilm_cycle[istage])
-                uniquecycle = np.unique(cyclepresent)
-
-                # Label as complete cycle if 1-4 present
-                if len(uniquecycle) >= 4:
-                    cycle_complete[ilongmcs[ilm]] = 1
-
-                # Save data
-                cycle_stage[ilongmcs[ilm], :] = np.copy(ilm_cycle)
-                cycle_index[ilongmcs[ilm], :] = np.copy(ilm_index)
-
-    # Subset robust MCS tracks from PF dataset
-    # Note: the tracks_dimname cannot be used here as Xarray does not seem to have
-    # a method to select data with a string variable
-    dsout = ds_pf.sel(tracks=trackid_mcs)
+        # Get the largest convective core and the total stratiform area of all PFs
+        maxpfccmajoraxis = reduce_pf_var(ds_mcs, "pf_coremajoraxis", pf_dimname, "nanmax")[ilongmcs, :]
+        maxpfccarea = reduce_pf_var(ds_mcs, "pf_corearea", pf_dimname, "nanmax")[ilongmcs, :]
+        meansfarea = reduce_pf_var(ds_mcs, "pf_sfarea", pf_dimname, "sum")[ilongmcs, :]
+
+        long_stage, long_index, long_complete, long_undefined = define_lifecycle_stages(
+            ir_trackduration[ilongmcs],
+            maxpfccmajoraxis,
+            maxpfccarea,
+            meansfarea,
+            fillval,
+        )
+        cycle_stage[ilongmcs, :] = long_stage
+        cycle_index[ilongmcs, :] = long_index
+        cycle_complete[ilongmcs] = long_complete
+        for ilm in np.where(long_undefined)[0]:
+            logger.warning(f"Lifecycle cannot be properly defined for track: {int(ilongmcs[ilm])}")
+
+    dsout = ds_mcs
     # Replace tracks index
     tracks_coord = np.arange(0, nmcs)
     times_coord = ds_pf[times_dimname]
@@ -489,3 +250,186 @@ def define_robust_mcs_radar(config):
     logger.info(f"{statistics_outfile}")
 
     return statistics_outfile
+
+
+def get_longest_period(mask, gap):
+    """
+    Select the longest continuous period of each row in a 2D mask, allowing gaps.
+
+    If a row has multiple periods, the indices of the longest (first if tied) are selected.
+    If a row has a single period, all indices between its first and last are selected.
+
+    Args:
+        mask: np.array
+            2D boolean array (rows, times).
+        gap: int
+            Maximum time index gap allowed within a period.
+
+    Returns:
+        selected: np.array
+            2D boolean array of the selected time indices.
+    """
+    nrows, ntimes = mask.shape
+    selected = np.zeros(mask.shape, dtype=bool)
+    rows, cols = np.nonzero(mask)
+    if len(rows) == 0:
+        return selected
+
+    period_id, period_starts, period_ends = get_continuous_periods(rows, cols, gap)
+    nperiods = len(period_starts)
+    period_length = period_ends - period_starts + 1
+    period_row = rows[period_starts]
+    nperiods_row = np.bincount(period_row, minlength=nrows)
+
+    # Longest period of each row, the first one if tied
+    order = np.lexsort((np.arange(0, nperiods), -period_length, period_row))
+    firstinrow = np.ones(nperiods, dtype=bool)
+    firstinrow[1:] = period_row[order][1:] != period_row[order][:-1]
+    longest = order[firstinrow]
+    multiple = nperiods_row[period_row[longest]] > 1
+
+    # Multiple periods: select indices of the longest period
+    keep = np.zeros(nperiods, dtype=bool)
+    keep[longest[multiple]] = True
+    keep = keep[period_id]
+    selected[rows[keep], cols[keep]] = True
+
+    # Single period: select all indices between the first and last
+    single = longest[~multiple]
+    times = np.arange(0, ntimes)[None, :]
+    selected[period_row[single], :] = (times >= cols[period_starts[single]][:, None]) & \
+                                      (times <= cols[period_ends[single]][:, None])
+    return selected
+
+
+def define_lifecycle_stages(
+        trackduration,
+        maxpfccmajoraxis,
+        maxpfccarea,
+        meansfarea,
+        fillval,
+):
+    """
+    Define MCS lifecycle stages for all tracks at once.
+
+    Args:
+        trackduration: np.array
+            Duration (number of times) of each track.
+        maxpfccmajoraxis: np.array
+            Maximum PF convective core major axis length (tracks, times).
+        maxpfccarea: np.array
+            Maximum PF convective core area (tracks, times).
+        meansfarea: np.array
+            Total PF stratiform area (tracks, times).
+        fillval: int
+            Missing value.
+
+    Returns:
+        cycle_stage: np.array
+            Lifecycle stage of each track and time.
+        cycle_index: np.array
+            Time index when each lifecycle stage starts (tracks, 5).
+        cycle_complete: np.array
+            Flag indicating if the track has each element in the lifecycle.
+        undefined: np.array
+            Flag indicating tracks where the convective line does not start after the convective cores.
+    """
+    ntracks, ntimes = maxpfccarea.shape
+    cycle_stage = np.full((ntracks, ntimes), fillval, dtype=int)
+    cycle_index = np.full((ntracks, 5), fillval, dtype=int)
+    cycle_complete = np.full(ntracks, fillval, dtype=int)
+    times = np.arange(0, ntimes)
+    intrack = times[None, :] < trackduration[:, None]
+
+    ##################################################################
+    # Find indices of when convective line present and absent and when stratiform present
+
+    # Find times with convective core area > 0
+    iccarea = get_longest_period(intrack & (maxpfccarea > 0), 2)
+    # Find times with convective major axis length greater than 100 km
+    iccline = get_longest_period(intrack & (maxpfccmajoraxis > 100), 2)
+    # Find times with convective major axis length greater than 100 km
+    # and stratiform area greater than the mean amount of stratiform
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        meansfarea_track = np.nanmean(np.where(intrack, meansfarea, np.nan), axis=1)
+    isfarea = get_longest_period(
+        intrack & (maxpfccmajoraxis > 100) & (meansfarea > meansfarea_track[:, None]), 2,
+    )
+
+    nccarea = np.count_nonzero(iccarea, axis=1)
+    nccline = np.count_nonzero(iccline, axis=1)
+    nsfarea = np.count_nonzero(isfarea, axis=1)
+    # First/second/last selected index of each track
+    iccarea_first = np.argmax(iccarea, axis=1)
+    iccline_second = np.argmax(np.cumsum(iccline, axis=1) >= 2, axis=1)
+    isfarea_first = np.argmax(isfarea, axis=1)
+    isfarea_last = ntimes - 1 - np.argmax(isfarea[:, ::-1], axis=1)
+
+    ###############################################################################
+    # Start/end (exclusive) time index of each stage
+    stage_start = np.zeros((ntracks, 5), dtype=int)
+    stage_end = np.zeros((ntracks, 5), dtype=int)
+
+    # Cloud only stage
+    # If first convective time is after the first cloud time,
+    # label all hours before the convective core appearance time as pre-convective
+    has_ccarea = nccarea > 0
+    cloudonly = has_ccarea & (iccarea_first > 0) & (iccarea_first < trackduration - 1)
+    cycle_index[cloudonly, 0] = 0
+    stage_end[cloudonly, 0] = iccarea_first[cloudonly]
+    # Start of unorganized convective cells
+    cycle_index[has_ccarea, 1] = iccarea_first[has_ccarea]
+
+    # If convective line exists
+    # (use second index since convective line must be around for one hour prior to classifying as genesis)
+    has_ccline = nccline > 1
+    genesis = has_ccline & has_ccarea & (iccline_second > iccarea_first)
+    undefined = has_ccline & ~genesis
+    # Start of organized convection
+    cycle_index[genesis, 2] = iccline_second[genesis]
+    # Time period of unorganized convective cells
+    stage_start[genesis, 1] = iccarea_first[genesis]
+    stage_end[genesis, 1] = iccline_second[genesis]
+
+    # Label MCS genesis.
+    # Test if stratiform area time is two time steps after the convective line
+    has_sfarea = has_ccline & (nsfarea > 0)
+    mature_start = np.where(isfarea_first > iccline_second + 2, isfarea_first, iccline_second + 2)
+    matureindex = np.zeros(ntracks, dtype=bool)
+    inrange = mature_start < ntimes
+    matureindex[inrange] = isfarea[np.where(inrange)[0], mature_start[inrange]]
+    mature = has_sfarea & ((isfarea_first > iccline_second + 2) | matureindex)
+    # Start of mature MCS
+    cycle_index[mature, 3] = mature_start[mature]
+    # Time period of organized cells before mature
+    stage_start[mature, 2] = iccline_second[mature]
+    stage_end[mature, 2] = mature_start[mature]
+    # Time period of mature MCS
+    stage_start[mature, 3] = mature_start[mature]
+    stage_end[mature, 3] = isfarea_last[mature] + 1
+
+    # Label dissipating times. By default this is all times after the mature stage
+    dissipation = has_sfarea & (isfarea_last < trackduration - 1)
+    cycle_index[dissipation, 4] = isfarea_last[dissipation] + 1
+    stage_start[dissipation, 4] = isfarea_last[dissipation] + 1
+    stage_end[dissipation, 4] = trackduration[dissipation]
+
+    # Label each stage in order, later stages overwrite earlier ones
+    for istage in range(0, 5):
+        instage = (times[None, :] >= stage_start[:, istage:istage + 1]) & \
+                  (times[None, :] < stage_end[:, istage:istage + 1])
+        cycle_stage[instage] = istage + 1
+
+    ############################################################
+    # Final life cycle processing
+    # Save only tracks with any stage defined
+    nostage = ~np.any(cycle_stage >= 0, axis=1)
+    cycle_stage[nostage, :] = fillval
+    cycle_index[nostage, :] = fillval
+    # Label as complete cycle if 1-4 present
+    nuniquecycle = np.zeros(ntracks, dtype=int)
+    for istage in range(0, 5):
+        nuniquecycle += np.any(cycle_stage == istage + 1, axis=1)
+    cycle_complete[nuniquecycle >= 4] = 1
+    return cycle_stage, cycle_index, cycle_complete, undefined
@@ -5,6 +5,8 @@ import sys
 import time
 import warnings
 import logging
+from pyflextrkr.ft_utilities import get_continuous_periods
+from pyflextrkr.pfstats_records import reduce_pf_var, subset_pf_tracks
 
 def define_robust_mcs_pf(config):
     """
@@ -55,11 +57,12 @@ def define_robust_mcs_pf(config):
     ntracks = ds_pf.sizes[tracks_dimname]
     ntimes = ds_pf.sizes[times_dimname]
 
-    ir_trackduration = ds_pf["track_duration"].data
-    pf_area = ds_pf["pf_area"].data
-    pf_majoraxis = ds_pf["pf_majoraxis"].data
-    pf_rainrate = ds_pf["pf_rainrate"].data
-    pf_skewness = ds_pf["pf_skewness"].data
+    ir_trackduration = ds_pf["track_duration"].data.astype(int)
+    # Get the largest precipitation (1st entry in 3rd dimension)
+    pf_area = reduce_pf_var(ds_pf, "pf_area", pf_dimname, "first")
+    pf_majoraxis = reduce_pf_var(ds_pf, "pf_majoraxis", pf_dimname, "first")
+    pf_rainrate = reduce_pf_var(ds_pf, "pf_rainrate", pf_dimname, "first")
+    pf_skewness = reduce_pf_var(ds_pf, "pf_skewness", pf_dimname, "first")
     # pf_accumrain = ds_pf['pf_accumrain'].data
     # pf_accumrainheavy = ds_pf['pf_accumrainheavy'].data
     time_res = float(ds_pf.attrs["time_resolution_hour"])
@@ -74,8 +77,8 @@ def define_robust_mcs_pf(config):
 
     # Calculate accumulate rain by summing over all PFs
     # This is the same approach as in the IDL version of the code
-    pf_volrain_all = ds_pf["pf_accumrain"].sum(dim=pf_dimname).data
-    pf_volrain_heavy = ds_pf["pf_accumrainheavy"].sum(dim=pf_dimname).data
+    pf_volrain_all = reduce_pf_var(ds_pf, "pf_accumrain", pf_dimname, "nansum")
+    pf_volrain_heavy = reduce_pf_var(ds_pf, "pf_accumrainheavy", pf_dimname, "nansum")
     # TODO: Technically should use "total_rain", "total_heavyrain" variables in the file
     # !!Test the impact of this later!!
     # pf_volrain_all = ds_pf["total_rain"]
@@ -83,135 +86,58 @@ def define_robust_mcs_pf(config):
 
     ##################################################
     # Initialize matrices
-    trackid_mcs = []
-    trackid_nonmcs = []
-
     # pf_mcstype = np.full(ntracks, fillval, dtype=int)
     pf_mcsstatus = np.full((ntracks, ntimes), fillval, dtype=int)
 
-    ###################################################
-    # Loop through each track
-    for nt in range(0, ntracks):
-        logger.debug(("Track # " + str(nt)))
-
-        ############################################
-        # Isolate data from this track
-        ilength = np.copy(ir_trackduration[nt]).astype(int)
-
-        # Get the largest precipitation (1st entry in 3rd dimension)
-        ipf_majoraxis = np.copy(pf_majoraxis[nt, 0:ilength, 0])
-        ipf_area = np.copy(pf_area[nt, 0:ilength, 0])
-        ipf_rainrate = np.copy(pf_rainrate[nt, 0:ilength, 0])
-        ipf_skewness = np.copy(pf_skewness[nt, 0:ilength, 0])
-        ipf_volrainall = np.copy(pf_volrain_all[nt, 0:ilength])
-        ifp_volrainheavy = np.copy(pf_volrain_heavy[nt, 0:ilength])
-
-        ######################################################
-        # Apply PF major axis length criteria
-        ipfmcs = np.array(
-            np.where(
-                (ipf_majoraxis >= mcs_pf_majoraxis_thresh)
-                & (ipf_majoraxis <= max_pf_majoraxis_thresh)
-            )[0]
-        )
-        nipfmcs = len(ipfmcs)
-
-        if nipfmcs > 0:
-            # Apply duration threshold to entire time period
-            if nipfmcs * time_res > mcs_pf_durationthresh:
-
-                # Find continuous duration indices
-                groups = np.split(
-                    ipfmcs, np.where(np.diff(ipfmcs) > mcs_pf_gap)[0] + 1
-                )
-                nbreaks = len(groups)
-
-                # Loop over each sub-period "group"
-                for igroup in range(0, nbreaks):
-
-                    ############################################################
-                    # Determine if each group satisfies duration threshold
-                    igroup_indices = np.array(np.copy(groups[igroup][:]))
-                    nigroup = len(igroup_indices)
-
-                    # Duration length should be group's last index - first index + 1
-                    igroup_duration = np.multiply(
-                        (groups[igroup][-1] - groups[igroup][0] + 1), time_res
-                    )
-
-                    # Compute PF fit values using the coefficients
-                    mcs_pfarea = coefs_pf_area[0] + coefs_pf_area[1] * igroup_duration
-                    mcs_rrskew = coefs_pf_skew[0] + coefs_pf_skew[1] * igroup_duration
-                    mcs_rravg = coefs_pf_rr[0] + coefs_pf_rr[1] * igroup_duration
-                    mcs_heavyratio = (
-                        coefs_pf_heavyratio[0] + coefs_pf_heavyratio[1] * igroup_duration
-                    )
-
-                    # Group satisfies duration threshold
-                    if igroup_duration >= mcs_pf_durationthresh:
-
-                        # Get PF variables for this group
-                        igroup_pfmajoraxis = np.copy(ipf_majoraxis[igroup_indices])
-
-                        igroup_pfarea = np.copy(ipf_area[igroup_indices])
-                        igroup_pfrate = np.copy(ipf_rainrate[igroup_indices])
-                        igroup_pfskew = np.copy(ipf_skewness[igroup_indices])
-                        igroup_volrainall = np.copy(ipf_volrainall[igroup_indices])
-                        igroup_volrainheavy = np.copy(ifp_volrainheavy[igroup_indices])
-
-                        # Count number of times when PF exceeds MCS criteria
-                        ct_pftimes = np.count_nonzero(
-                            (igroup_pfarea > mcs_pfarea)
-                            & (igroup_pfrate > mcs_rravg)
-                            & (igroup_pfskew > mcs_rrskew)
-                        )
-                        dur_pf = float(ct_pftimes) * time_res
-
-                        # Calculate volumetric heavy rain ratio during this sub-period
-                        heavyrain_ratio = (
-                            100
-                            * np.nansum(igroup_volrainheavy)
-                            / np.nansum(igroup_volrainall)
-                        )
-
-                        # Duration of PF satisfying MCS criteria >= pf_mcs_dur [hour] and
-                        # heavy rain ratio during the sub-period >= mcs_heavyratio
-                        if (dur_pf >= mcs_pf_durationthresh) & (
-                            heavyrain_ratio > mcs_heavyratio
-                        ):
-                            # Label this period as an mcs
-                            pf_mcsstatus[nt, igroup_indices] = 1
-                            logger.debug("MCS")
-                        else:
-                            trackid_nonmcs = np.append(trackid_nonmcs, int(nt))
-                        # import pdb; pdb.set_trace()
-
-                        ## Determine type of mcs (squall or non-squall)
-                        # isquall = np.array(np.where(igroup_ccaspectratio > aspectratiothresh))[0, :]
-                        # nisquall = len(isquall)
-
-                        # if nisquall > 0:
-                        #    # Label as squall
-                        #    pf_mcstype[nt] = 1
-                        #    pf_cctype[nt, igroup_indices[isquall]] = 1
-                        # else:
-                        #    # Label as non-squall
-                        #    pf_mcstype[nt] = 2
-                        #    pf_cctype[nt, igroup_indices[isquall]] = 2
-                    else:
-                        logger.debug("Not MCS")
-
-            # Group does not satistfy duration threshold
-            else:
-                trackid_nonmcs = np.append(trackid_nonmcs, int(nt))
-                logger.debug("Not MCS")
-        else:
-            logger.debug("Not MCS")
+    ######################################################
+    # Apply PF major axis length criteria to all tracks and times within the track duration
+    intrack = np.arange(0, ntimes)[None, :] < ir_trackduration[:, None]
+    pfmcs_mask = intrack & \
+                 (pf_majoraxis >= mcs_pf_majoraxis_thresh) & \
+                 (pf_majoraxis <= max_pf_majoraxis_thresh)
+    # Apply duration threshold to entire time period
+    pfmcs_mask &= (np.count_nonzero(pfmcs_mask, axis=1) * time_res > mcs_pf_durationthresh)[:, None]
+    track_idx, time_idx = np.nonzero(pfmcs_mask)
+
+    # Find continuous duration periods
+    period_id, period_starts, period_ends = get_continuous_periods(track_idx, time_idx, mcs_pf_gap)
+    nperiods = len(period_starts)
+
+    # Duration length should be period's last index - first index + 1
+    period_duration = (time_idx[period_ends] - time_idx[period_starts] + 1) * time_res
+
+    # Compute PF fit values using the coefficients
+    mcs_pfarea = coefs_pf_area[0] + coefs_pf_area[1] * period_duration
+    mcs_rrskew = coefs_pf_skew[0] + coefs_pf_skew[1] * period_duration
+    mcs_rravg = coefs_pf_rr[0] + coefs_pf_rr[1] * period_duration
+    mcs_heavyratio = coefs_pf_heavyratio[0] + coefs_pf_heavyratio[1] * period_duration
+
+    # Count number of times when PF exceeds MCS criteria in each period
+    pf_exceed = (pf_area[track_idx, time_idx] > mcs_pfarea[period_id]) & \
+                (pf_rainrate[track_idx, time_idx] > mcs_rravg[period_id]) & \
+                (pf_skewness[track_idx, time_idx] > mcs_rrskew[period_id])
+    dur_pf = np.bincount(period_id, weights=pf_exceed, minlength=nperiods) * time_res
+
+    # Calculate volumetric heavy rain ratio during each period
+    period_volrainall = np.bincount(period_id, minlength=nperiods,
+                                    weights=np.nan_to_num(pf_volrain_all[track_idx, time_idx]))
+    period_volrainheavy = np.bincount(period_id, minlength=nperiods,
+                                      weights=np.nan_to_num(pf_volrain_heavy[track_idx, time_idx]))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        heavyrain_ratio = 100 * period_volrainheavy / period_volrainall
+
+    # Period satisfies duration threshold,
+    # duration of PF satisfying MCS criteria >= pf_mcs_dur [hour] and
+    # heavy rain ratio during the period >= mcs_heavyratio
+    period_ismcs = (period_duration >= mcs_pf_durationthresh) & \
+                   (dur_pf >= mcs_pf_durationthresh) & \
+                   (heavyrain_ratio > mcs_heavyratio)
+    # Label these periods as MCS
+    ismcs = period_ismcs[period_id]
+    pf_mcsstatus[track_idx[ismcs], time_idx[ismcs]] = 1
 
     # Find track indices that are robust MCS
-    TEMP_mcsstatus = np.copy(pf_mcsstatus).astype(float)
-    TEMP_mcsstatus[TEMP_mcsstatus == fillval] = np.nan
-    trackid_mcs = np.array(np.where(np.nansum(TEMP_mcsstatus, axis=1) > 0))[0, :]
+    trackid_mcs = np.where(np.any(pf_mcsstatus == 1, axis=1))[0]
     nmcs = len(trackid_mcs)
 
     # Stop code if not robust MCS present
@@ -224,8 +150,8 @@ def define_robust_mcs_pf(config):
     ir_trackduration = ir_trackduration[trackid_mcs]
     # mcs_basetime = basetime[trackid_mcs]
     pf_mcsstatus = pf_mcsstatus[trackid_mcs, :]
-    pf_majoraxis = pf_majoraxis[trackid_mcs, :, :]
-    pf_area = pf_area[trackid_mcs, :, :]
+    # Subset robust MCS tracks from PF dataset
+    ds_mcs = subset_pf_tracks(ds_pf, trackid_mcs, tracks_dimname)
 
     # Determine how long MCS track criteria is satisfied
     # TEMP_mcsstatus = np.copy(pf_mcsstatus).astype(float)
@@ -236,7 +162,7 @@ def define_robust_mcs_pf(config):
     # warnings.filterwarnings("ignore")
     with warnings.catch_warnings():
         warnings.simplefilter("ignore", category=RuntimeWarning)
-        pf_maxmajoraxis = np.nanmax(pf_majoraxis, axis=2)
+        pf_maxmajoraxis = reduce_pf_var(ds_mcs, "pf_majoraxis", pf_dimname, "nanmax")
         pf_maxmajoraxis[pf_maxmajoraxis < mcs_pf_majoraxis_for_lifetime] = 0
         pf_maxmajoraxis[pf_maxmajoraxis > mcs_pf_majoraxis_for_lifetime] = 1
         pf_lifetime = np.multiply(np.nansum(pf_maxmajoraxis, axis=1), time_res)
@@ -349,10 +275,7 @@ def define_robust_mcs_pf(config):
     # #                 cycle_stage[ilongmcs[ilm], :] = np.copy(ilm_cycle)
     # #                 cycle_index[ilongmcs[ilm], :] = np.copy(ilm_index)
 
-    # Subset robust MCS tracks from PF dataset
-    # Note: the tracks_dimname cannot be used here as Xarray does not seem to have
-    # a method to select data with a string variable
-    dsout = ds_pf.sel(tracks=trackid_mcs)
+    dsout = ds_mcs
     # Replace tracks index
     tracks_coord = np.arange(0, nmcs)
     times_coord = ds_pf[times_dimname]
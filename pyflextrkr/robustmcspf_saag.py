@@ -5,6 +5,7 @@ import sys
 import time
 import warnings
 import logging
+from pyflextrkr.pfstats_records import reduce_pf_var, subset_pf_tracks
 
 def define_robust_mcs_pf(config):
     """
@@ -57,9 +58,9 @@ def define_robust_mcs_pf(config):
     ntimes = ds_pf.sizes[times_dimname]
 
     ir_trackduration = ds_pf["track_duration"].data
-    pf_area = ds_pf["pf_area"].data
-    pf_majoraxis = ds_pf["pf_majoraxis"].data
-    pf_maxrainrate = ds_pf["pf_maxrainrate"].max(dim=pf_dimname).data
+    # Get the largest precipitation (1st entry in 3rd dimension)
+    pf_majoraxis = reduce_pf_var(ds_pf, "pf_majoraxis", pf_dimname, "first")
+    pf_maxrainrate = reduce_pf_var(ds_pf, "pf_maxrainrate", pf_dimname, "nanmax")
     time_res = float(ds_pf.attrs["time_resolution_hour"])
     fillval = ds_pf["mcs_status"].attrs["_FillValue"]
 
@@ -83,8 +84,7 @@ def define_robust_mcs_pf(config):
         # Isolate data from this track
         ilength = np.copy(ir_trackduration[nt]).astype(int)
 
-        # Get the largest precipitation (1st entry in 3rd dimension)
-        ipf_majoraxis = np.copy(pf_majoraxis[nt, 0:ilength, 0])
+        ipf_majoraxis = np.copy(pf_majoraxis[nt, 0:ilength])
         # SAAG simplified variables
         ipf_maxrainrate = np.copy(pf_maxrainrate[nt, 0:ilength])
         ipf_volrainall = np.copy(pf_volrain_all[nt, 0:ilength])
@@ -178,8 +178,8 @@ def define_robust_mcs_pf(config):
     ir_trackduration = ir_trackduration[trackid_mcs]
     # mcs_basetime = basetime[trackid_mcs]
     pf_mcsstatus = pf_mcsstatus[trackid_mcs, :]
-    pf_majoraxis = pf_majoraxis[trackid_mcs, :, :]
-    pf_area = pf_area[trackid_mcs, :, :]
+    # Subset robust MCS tracks from PF dataset
+    ds_mcs = subset_pf_tracks(ds_pf, trackid_mcs, tracks_dimname)
 
     # Determine how long MCS track criteria is satisfied
     # TEMP_mcsstatus = np.copy(pf_mcsstatus).astype(float)
@@ -190,7 +190,7 @@ def define_robust_mcs_pf(config):
     # warnings.filterwarnings("ignore")
     with warnings.catch_warnings():
         warnings.simplefilter("ignore", category=RuntimeWarning)
-        pf_maxmajoraxis = np.nanmax(pf_majoraxis, axis=2)
+        pf_maxmajoraxis = reduce_pf_var(ds_mcs, "pf_majoraxis", pf_dimname, "nanmax")
         pf_maxmajoraxis[pf_maxmajoraxis < mcs_pf_majoraxis_for_lifetime] = 0
         pf_maxmajoraxis[pf_maxmajoraxis > mcs_pf_majoraxis_for_lifetime] = 1
         pf_lifetime = np.multiply(np.nansum(pf_maxmajoraxis, axis=1), time_res)
@@ -201,10 +201,7 @@ def define_robust_mcs_pf(config):
     # TODO: Should implement Zhixiao Zhang's Tb-based lifecycle definition code here down the road.
     ########################################################
 
-    # Subset robust MCS tracks from PF dataset
-    # Note: the tracks_dimname cannot be used here as Xarray does not seem to have
-    # a method to select data with a string variable
-    dsout = ds_pf.sel(tracks=trackid_mcs)
+    dsout = ds_mcs
     # Replace tracks index
     tracks_coord = np.arange(0, nmcs)
     times_coord = ds_pf[times_dimname]
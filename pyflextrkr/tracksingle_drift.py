@@ -5,6 +5,7 @@ import xarray as xr
 import pandas as pd
 import time
 import scipy.ndimage as ndi
+from scipy.sparse import coo_matrix
 import logging
 
 def trackclouds(
@@ -12,6 +13,7 @@ def trackclouds(
     cloudid_basetimepairs,
     config,
     drift_data=None,
+    label_cache=None,
 ):
     """
     Track clouds in successive pairs of cloudid files.
@@ -25,10 +27,15 @@ def trackclouds(
             Dictionary containing config parameters
         drift_data: tuple, optional. Default: None.
             Drift data (datetime_string, xdrift, ydrift)
+        label_cache: dictionary, optional. Default: None.
+            Cache of feature labels keyed by cloudid filename.
+            If provided, the new file labels are kept for the next pair.
 
     Returns:
         track_outfile: string
             Track file name.
+            If tracklinks_store is set in config, a link data dictionary is returned instead,
+            or None if the pair is not linked.
     """
 
     logger = logging.getLogger(__name__)
@@ -43,10 +50,13 @@ def trackclouds(
     dataoutpath = config["tracking_outpath"]
     feature_varname = config.get("feature_varname", "feature_number")
     nfeature_varname = config.get("nfeature_varname", "nfeatures")
+    featuresize_varname = config.get("featuresize_varname", "npix_feature")
+    tracklinks_store = config.get("tracklinks_store", 0)
     timegap = config["timegap"]
     nmaxlinks = config["nmaxlinks"]
     othresh = config["othresh"]
     fillval = config["fillval"]
+    overlap_method = config.get("overlap_method", "loop")
     if drift_data is not None:
         datetime_drift, xdrift, ydrift = drift_data[0], drift_data[1], drift_data[2]
 
@@ -87,32 +97,31 @@ def trackclouds(
         # Load cloudid file from before, called reference file
         logger.debug(reference_filedatetime)
 
-        # Open file
-        reference_data = xr.open_dataset(
-            reference_file, mask_and_scale=False, decode_times=False, chunks=-1,
+        reference_convcold_cloudnumber, \
+        nreference, \
+        reference_basetime_data, \
+        npix_reference = load_feature_labels(
+            reference_file, feature_varname, nfeature_varname, featuresize_varname,
+            label_cache=label_cache,
         )
-        reference_convcold_cloudnumber = reference_data[feature_varname].load().data
-        nreference = reference_data[nfeature_varname].load().data
-        reference_data.close()
 
         ##########################################################
         # Load next cloudid file, called new file
         logger.debug(f"new_filedattime: {new_filedatetime}")
 
-        # Open file
-        new_data = xr.open_dataset(
-            new_file, mask_and_scale=False, decode_times=False, chunks=-1,
+        new_convcold_cloudnumber, \
+        nnew, \
+        new_basetime_data, \
+        npix_new = load_feature_labels(
+            new_file, feature_varname, nfeature_varname, featuresize_varname,
+            label_cache=label_cache,
         )
-        new_convcold_cloudnumber = new_data[feature_varname].load().data
-        nnew = new_data[nfeature_varname].load().data
-        new_data.close()
 
-        # Convert float type to int, missing value to 0
-        # This should not be needed when setting mask_and_scale=False
-        reference_convcold_cloudnumber[np.isnan(reference_convcold_cloudnumber)] = 0
-        reference_convcold_cloudnumber = reference_convcold_cloudnumber.astype("int")
-        new_convcold_cloudnumber[np.isnan(new_convcold_cloudnumber)] = 0
-        new_convcold_cloudnumber = new_convcold_cloudnumber.astype("int")
+        # Only keep the new file labels in the cache for the next pair
+        if label_cache is not None:
+            for key in list(label_cache.keys()):
+                if key != new_file:
+                    label_cache.pop(key)
 
         if drift_data is not None:
             # Compare drift datetime with reference datetime
@@ -138,123 +147,171 @@ def trackclouds(
         nreference = nreference + 1
         nnew = nnew + 1
 
-        #######################################################
-        # Initialize matrices
-        reference_forward_index = (
-            np.ones((1, int(nreference), int(nmaxlinks)), dtype=int) * fillval
-        )
-        reference_forward_size = (
-            np.ones((1, int(nreference), int(nmaxlinks)), dtype=int) * fillval
-        )
-        new_backward_index = (
-            np.ones((1, int(nnew), int(nmaxlinks)), dtype=int) * fillval
-        )
-        new_backward_size = np.ones((1, int(nnew), int(nmaxlinks)), dtype=int) * fillval
-
-        ######################################################
-        # Loop through each cloud / feature in reference time and look for overlaping clouds / features in the new file
-        for refindex in np.arange(1, nreference + 1):
-            # Locate where the cloud in the reference file overlaps with any cloud in the new file
-            forward_matchindices = np.where(
-                (reference_convcold_cloudnumber == refindex)
-                & (new_convcold_cloudnumber != 0)
+        if overlap_method == "sparse":
+            # Build the reference-to-new overlap table in a single pass over the pixels
+            reference_forward_index, \
+            reference_forward_size, \
+            new_backward_index, \
+            new_backward_size = link_overlap_sparse(
+                reference_convcold_cloudnumber,
+                new_convcold_cloudnumber,
+                nreference,
+                nnew,
+                nmaxlinks,
+                othresh,
+                fillval,
+                reference_file,
+                new_file,
             )
-
-            # Get the convcold_cloudnumber of the clouds in the new file that overlap the cloud in the reference file
-            forward_newindex = new_convcold_cloudnumber[forward_matchindices]
-            unique_forwardnewindex = np.unique(forward_newindex)
-
-            # Calculate size of reference cloud in terms of number of pixels
-            sizeref = len(
-                np.extract(
-                    reference_convcold_cloudnumber == refindex,
-                    reference_convcold_cloudnumber,
-                )
+        else:
+            #######################################################
+            # Initialize matrices
+            reference_forward_index = (
+                np.ones((1, int(nreference), int(nmaxlinks)), dtype=int) * fillval
             )
-
-            # Loop through the overlapping clouds in the new file, determining if they statisfy the overlap requirement
-            forward_nmatch = 0  # Initialize overlap counter
-            for matchindex in unique_forwardnewindex:
-                sizematch = len(
-                    np.extract(forward_newindex == matchindex, forward_newindex)
+            reference_forward_size = (
+                np.ones((1, int(nreference), int(nmaxlinks)), dtype=int) * fillval
+            )
+            new_backward_index = (
+                np.ones((1, int(nnew), int(nmaxlinks)), dtype=int) * fillval
+            )
+            new_backward_size = np.ones((1, int(nnew), int(nmaxlinks)), dtype=int) * fillval
+
+            ######################################################
+            # Loop through each cloud / feature in reference time and look for overlaping clouds / features in the new file
+            for refindex in np.arange(1, nreference + 1):
+                # Locate where the cloud in the reference file overlaps with any cloud in the new file
+                forward_matchindices = np.where(
+                    (reference_convcold_cloudnumber == refindex)
+                    & (new_convcold_cloudnumber != 0)
                 )
 
-                if sizematch / float(sizeref) > othresh:
-                    if forward_nmatch > nmaxlinks:
-                        logger.debug(
-                            ("reference: " + reference_file)
-                        )
-                        logger.debug(("new: " + new_file))
-                        sys.exit(
-                            "More than "
-                            + str(int(nmaxlinks))
-                            + " clouds in new file match with reference cloud?!"
-                        )
-                    else:
-                        reference_forward_index[
-                            0, int(refindex) - 1, forward_nmatch
-                        ] = matchindex
-                        reference_forward_size[
-                            0, int(refindex) - 1, forward_nmatch
-                        ] = len(
-                            np.extract(
-                                new_convcold_cloudnumber == matchindex,
-                                new_convcold_cloudnumber,
-                            )
-                        )
+                # Get the convcold_cloudnumber of the clouds in the new file that overlap the cloud in the reference file
+                forward_newindex = new_convcold_cloudnumber[forward_matchindices]
+                unique_forwardnewindex = np.unique(forward_newindex)
 
-                        forward_nmatch = forward_nmatch + 1
+                # Calculate size of reference cloud in terms of number of pixels
+                sizeref = len(
+                    np.extract(
+                        reference_convcold_cloudnumber == refindex,
+                        reference_convcold_cloudnumber,
+                    )
+                )
 
-        ######################################################
-        # Loop through each cloud / feature at new time and look for overlaping clouds / features in the reference file
-        for newindex in np.arange(1, nnew + 1):
-            # Locate where the cloud in the new file overlaps with any cloud in the reference file
-            backward_matchindices = np.where(
-                (new_convcold_cloudnumber == newindex)
-                & (reference_convcold_cloudnumber != 0)
-            )
+                # Loop through the overlapping clouds in the new file, determining if they statisfy the overlap requirement
+                forward_nmatch = 0  # Initialize overlap counter
+                for matchindex in unique_forwardnewindex:
+                    sizematch = len(
+                        np.extract(forward_newindex == matchindex, forward_newindex)
+                    )
+
+                    if sizematch / float(sizeref) > othresh:
+                        if forward_nmatch > nmaxlinks:
+                            logger.debug(
+                                ("reference: " + reference_file)
+                            )
+                            logger.debug(("new: " + new_file))
+                            sys.exit(
+                                "More than "
+                                + str(int(nmaxlinks))
+                                + " clouds in new file match with reference cloud?!"
+                            )
+                        else:
+                            reference_forward_index[
+                                0, int(refindex) - 1, forward_nmatch
+                            ] = matchindex
+                            reference_forward_size[
+                                0, int(refindex) - 1, forward_nmatch
+                            ] = len(
+                                np.extract(
+                                    new_convcold_cloudnumber == matchindex,
+                                    new_convcold_cloudnumber,
+                                )
+                            )
 
-            # Get the convcold_cloudnumber of the clouds in the reference file that overlap the cloud in the new file
-            backward_refindex = reference_convcold_cloudnumber[backward_matchindices]
-            unique_backwardrefindex = np.unique(backward_refindex)
+                            forward_nmatch = forward_nmatch + 1
 
-            # Calculate size of reference cloud in terms of number of pixels
-            sizenew = len(
-                np.extract(
-                    new_convcold_cloudnumber == newindex, new_convcold_cloudnumber
+            ######################################################
+            # Loop through each cloud / feature at new time and look for overlaping clouds / features in the reference file
+            for newindex in np.arange(1, nnew + 1):
+                # Locate where the cloud in the new file overlaps with any cloud in the reference file
+                backward_matchindices = np.where(
+                    (new_convcold_cloudnumber == newindex)
+                    & (reference_convcold_cloudnumber != 0)
                 )
-            )
 
-            # Loop through the overlapping clouds in the new file, determining if they statisfy the overlap requirement
-            backward_nmatch = 0  # Initialize overlap counter
-            for matchindex in unique_backwardrefindex:
-                sizematch = len(
-                    np.extract(backward_refindex == matchindex, backward_refindex)
+                # Get the convcold_cloudnumber of the clouds in the reference file that overlap the cloud in the new file
+                backward_refindex = reference_convcold_cloudnumber[backward_matchindices]
+                unique_backwardrefindex = np.unique(backward_refindex)
+
+                # Calculate size of reference cloud in terms of number of pixels
+                sizenew = len(
+                    np.extract(
+                        new_convcold_cloudnumber == newindex, new_convcold_cloudnumber
+                    )
                 )
 
-                if sizematch / float(sizenew) > othresh:
-                    if backward_nmatch > nmaxlinks:
-                        logger.debug(
-                            ("reference: " + reference_file)
-                        )
-                        logger.debug(("new: " + new_file))
-                        sys.exit(
-                            "More than "
-                            + str(int(nmaxlinks))
-                            + " clouds in reference file match with new cloud?!"
-                        )
-                    else:
-                        new_backward_index[
-                            0, int(newindex) - 1, backward_nmatch
-                        ] = matchindex
-                        new_backward_size[0, int(newindex) - 1, backward_nmatch] = len(
-                            np.extract(
-                                reference_convcold_cloudnumber == matchindex,
-                                reference_convcold_cloudnumber,
+                # Loop through the overlapping clouds in the new file, determining if they statisfy the overlap requirement
+                backward_nmatch = 0  # Initialize overlap counter
+                for matchindex in unique_backwardrefindex:
+                    sizematch = len(
+                        np.extract(backward_refindex == matchindex, backward_refindex)
+                    )
+
+                    if sizematch / float(sizenew) > othresh:
+                        if backward_nmatch > nmaxlinks:
+                            logger.debug(
+                                ("reference: " + reference_file)
+                            )
+                            logger.debug(("new: " + new_file))
+                            sys.exit(
+                                "More than "
+                                + str(int(nmaxlinks))
+                                + " clouds in reference file match with new cloud?!"
+                            )
+                        else:
+                            new_backward_index[
+                                0, int(newindex) - 1, backward_nmatch
+                            ] = matchindex
+                            new_backward_size[0, int(newindex) - 1, backward_nmatch] = len(
+                                np.extract(
+                                    reference_convcold_cloudnumber == matchindex,
+                                    reference_convcold_cloudnumber,
+                                )
                             )
-                        )
 
-                        backward_nmatch = backward_nmatch + 1
+                            backward_nmatch = backward_nmatch + 1
+
+        #########################################################
+        # Return link records to be written in the consolidated link store
+        if tracklinks_store == 1:
+            fwd_row, fwd_rank = np.nonzero(reference_forward_index[0] > 0)
+            bwd_row, bwd_rank = np.nonzero(new_backward_index[0] > 0)
+            link_data = {
+                "basetime_ref": int(np.squeeze(reference_basetime_data)),
+                "basetime_new": int(np.squeeze(new_basetime_data)),
+                "nclouds_ref": int(nreference),
+                "nclouds_new": int(nnew),
+                "nlinks_forward": len(fwd_row),
+                "nlinks_backward": len(bwd_row),
+                "nfeatures_ref": len(npix_reference),
+                "nfeatures_new": len(npix_new),
+                "ref_file": reference_file_basename,
+                "new_file": new_file_basename,
+                "ref_date": reference_filedatetime,
+                "new_date": new_filedatetime,
+                "forward_ref": fwd_row + 1,
+                "forward_rank": fwd_rank,
+                "forward_new": reference_forward_index[0, fwd_row, fwd_rank],
+                "forward_size": reference_forward_size[0, fwd_row, fwd_rank],
+                "backward_new": bwd_row + 1,
+                "backward_rank": bwd_rank,
+                "backward_ref": new_backward_index[0, bwd_row, bwd_rank],
+                "backward_size": new_backward_size[0, bwd_row, bwd_rank],
+                "npix_ref": npix_reference,
+                "npix_new": npix_new,
+            }
+            return link_data
 
         #########################################################
         # Save forward and backward indices and linked sizes in netcdf file
@@ -266,11 +323,11 @@ def trackclouds(
         logger.debug("Writing single tracks")
 
         bt_new = np.array(
-                    [pd.to_datetime(new_data["base_time"].data, unit="s")],
+                    [pd.to_datetime(new_basetime_data, unit="s")],
                     dtype="datetime64[ns]",
                 )[0]
         bt_ref = np.array(
-                    [pd.to_datetime(reference_data["base_time"].data, unit="s")],
+                    [pd.to_datetime(reference_basetime_data, unit="s")],
                     dtype="datetime64[ns]",
                 )[0]
 
@@ -404,4 +461,240 @@ def trackclouds(
             },
         )
         logger.info(track_outfile)
-    return track_outfile
\ No newline at end of file
+    elif tracklinks_store == 1:
+        return None
+    return track_outfile
+
+
+def load_feature_labels(
+    filename,
+    feature_varname,
+    nfeature_varname,
+    featuresize_varname,
+    label_cache=None,
+):
+    """
+    Load feature labels from a cloudid file, reusing cached labels if available.
+
+    Arguments:
+        filename: string
+            Cloudid file name.
+        feature_varname: string
+            Feature number variable name.
+        nfeature_varname: string
+            Number of features variable name.
+        featuresize_varname: string
+            Feature size variable name.
+        label_cache: dictionary, optional. Default: None.
+            Cache of feature labels keyed by cloudid filename.
+
+    Returns:
+        cloudnumber: np.array
+            Feature number array (int, missing value as 0).
+        nfeatures: np.array
+            Number of features.
+        basetime: np.array
+            Base time of the file.
+        npix_feature: np.array
+            Number of pixels for each feature.
+    """
+    if (label_cache is not None) and (filename in label_cache):
+        return label_cache[filename]
+
+    # Open file
+    ds = xr.open_dataset(
+        filename, mask_and_scale=False, decode_times=False, chunks=-1,
+    )
+    cloudnumber = ds[feature_varname].load().data
+    nfeatures = ds[nfeature_varname].load().data
+    basetime = ds["base_time"].load().data
+    npix_feature = ds[featuresize_varname].load().data
+    ds.close()
+
+    # Convert float type to int, missing value to 0
+    # This should not be needed when setting mask_and_scale=False
+    cloudnumber[np.isnan(cloudnumber)] = 0
+    cloudnumber = cloudnumber.astype("int")
+
+    if label_cache is not None:
+        label_cache[filename] = (cloudnumber, nfeatures, basetime, npix_feature)
+    return (cloudnumber, nfeatures, basetime, npix_feature)
+
+
+def trackclouds_segment(
+    cloudid_filepairs,
+    cloudid_basetimepairs,
+    config,
+    drift_data=None,
+):
+    """
+    Track clouds in a contiguous segment of successive cloudid file pairs.
+
+    The new file labels from each pair are kept in memory and reused as the reference
+    for the next pair, so each cloudid file in the segment is only read once.
+
+    Arguments:
+        cloudid_filepairs: list
+            List of cloudid filename pairs.
+        cloudid_basetimepairs: list
+            List of cloudid basetime pairs.
+        config: dictionary
+            Dictionary containing config parameters
+        drift_data: list, optional. Default: None.
+            List of drift data (datetime_string, xdrift, ydrift) for each pair.
+
+    Returns:
+        track_outfiles: list
+            Track file names (or link data dictionaries if tracklinks_store is set).
+    """
+    label_cache = {}
+    track_outfiles = []
+    for ipair in range(0, len(cloudid_filepairs)):
+        track_outfile = trackclouds(
+            cloudid_filepairs[ipair],
+            cloudid_basetimepairs[ipair],
+            config,
+            drift_data=drift_data[ipair] if drift_data is not None else None,
+            label_cache=label_cache,
+        )
+        track_outfiles.append(track_outfile)
+    return track_outfiles
+
+
+def link_overlap_sparse(
+    reference_cloudnumber,
+    new_cloudnumber,
+    nreference,
+    nnew,
+    nmaxlinks,
+    othresh,
+    fillval,
+    reference_file,
+    new_file,
+):
+    """
+    Link overlapping features between a reference and a new label array using a sparse contingency table.
+
+    The overlap pixel counts between every (reference, new) feature pair are accumulated in one pass
+    over the overlapping pixels. The forward/backward link indices and sizes are then derived from the table.
+    The output is identical to the per-feature loop in trackclouds.
+
+    Arguments:
+        reference_cloudnumber: np.array
+            Feature number array in the reference file.
+        new_cloudnumber: np.array
+            Feature number array in the new file.
+        nreference: int
+            Number of features in the reference file (+1).
+        nnew: int
+            Number of features in the new file (+1).
+        nmaxlinks: int
+            Maximum number of features that any single feature can be linked to.
+        othresh: float
+            Overlap fraction threshold.
+        fillval: int
+            Missing value.
+        reference_file: string
+            Reference file name (for error message).
+        new_file: string
+            New file name (for error message).
+
+    Returns:
+        reference_forward_index: np.array
+            New feature indices linked to each reference feature.
+        reference_forward_size: np.array
+            Size of new features linked to each reference feature.
+        new_backward_index: np.array
+            Reference feature indices linked to each new feature.
+        new_backward_size: np.array
+            Size of reference features linked to each new feature.
+    """
+    logger = logging.getLogger(__name__)
+
+    nreference = int(nreference)
+    nnew = int(nnew)
+    nmaxlinks = int(nmaxlinks)
+
+    # Initialize matrices
+    reference_forward_index = np.full((1, nreference, nmaxlinks), fillval, dtype=int)
+    reference_forward_size = np.full((1, nreference, nmaxlinks), fillval, dtype=int)
+    new_backward_index = np.full((1, nnew, nmaxlinks), fillval, dtype=int)
+    new_backward_size = np.full((1, nnew, nmaxlinks), fillval, dtype=int)
+
+    refnum = reference_cloudnumber.ravel()
+    newnum = new_cloudnumber.ravel()
+    valid_ref = (refnum > 0) & (refnum <= nreference)
+    valid_new = (newnum > 0) & (newnum <= nnew)
+
+    # Number of pixels for each feature (index by feature number)
+    sizeref = np.bincount(refnum[valid_ref], minlength=nreference + 1)
+    sizenew = np.bincount(newnum[valid_new], minlength=nnew + 1)
+
+    # Contingency table of overlapping pixel counts
+    overlap = valid_ref & valid_new
+    npix_overlap = np.count_nonzero(overlap)
+    if npix_overlap == 0:
+        return (
+            reference_forward_index,
+            reference_forward_size,
+            new_backward_index,
+            new_backward_size,
+        )
+    table = coo_matrix(
+        (np.ones(npix_overlap, dtype=np.int64), (refnum[overlap], newnum[overlap])),
+        shape=(nreference + 1, nnew + 1),
+    ).tocsr()
+    # Sum duplicate entries and sort new feature numbers within each reference feature
+    table.sum_duplicates()
+    table = table.tocoo()
+    # Pairs are sorted by reference feature, then by new feature
+    pair_ref = table.row
+    pair_new = table.col
+    pair_npix = table.data
+
+    ######################################################
+    # Forward links: overlap fraction relative to the reference feature size
+    keep = pair_npix / sizeref[pair_ref].astype(float) > othresh
+    fwd_ref = pair_ref[keep]
+    fwd_new = pair_new[keep]
+    # Position of each link within its reference feature row
+    fwd_nmatch = np.arange(len(fwd_ref)) - np.searchsorted(fwd_ref, fwd_ref, side="left")
+    if (len(fwd_nmatch) > 0) and (np.max(fwd_nmatch) >= nmaxlinks):
+        logger.debug(("reference: " + reference_file))
+        logger.debug(("new: " + new_file))
+        sys.exit(
+            "More than "
+            + str(int(nmaxlinks))
+            + " clouds in new file match with reference cloud?!"
+        )
+    reference_forward_index[0, fwd_ref - 1, fwd_nmatch] = fwd_new
+    reference_forward_size[0, fwd_ref - 1, fwd_nmatch] = sizenew[fwd_new]
+
+    ######################################################
+    # Backward links: overlap fraction relative to the new feature size
+    # Reorder pairs by new feature, then by reference feature
+    order = np.lexsort((pair_ref, pair_new))
+    pair_ref = pair_ref[order]
+    pair_new = pair_new[order]
+    pair_npix = pair_npix[order]
+    keep = pair_npix / sizenew[pair_new].astype(float) > othresh
+    bwd_ref = pair_ref[keep]
+    bwd_new = pair_new[keep]
+    bwd_nmatch = np.arange(len(bwd_new)) - np.searchsorted(bwd_new, bwd_new, side="left")
+    if (len(bwd_nmatch) > 0) and (np.max(bwd_nmatch) >= nmaxlinks):
+        logger.debug(("reference: " + reference_file))
+        logger.debug(("new: " + new_file))
+        sys.exit(
+            "More than "
+            + str(int(nmaxlinks))
+            + " clouds in reference file match with new cloud?!"
+        )
+    new_backward_index[0, bwd_new - 1, bwd_nmatch] = bwd_ref
+    new_backward_size[0, bwd_new - 1, bwd_nmatch] = sizeref[bwd_ref]
+
+    return (
+        reference_forward_index,
+        reference_forward_size,
+        new_backward_index,
+        new_backward_size,
+    )
@@ -1,9 +1,12 @@
 import sys
 import logging
+import numpy as np
 import dask
 from dask.distributed import wait
 from pyflextrkr.ft_utilities import subset_files_timerange, match_drift_times
-from pyflextrkr.tracksingle_drift import trackclouds
+from pyflextrkr.tracksingle_drift import trackclouds, trackclouds_segment
+from pyflextrkr.netcdf_io_tracklinks import write_tracklinks_store, get_tracklinks_filename, \
+    read_tracklinks_basetimes
 
 def tracksingle_driver(config):
     """
@@ -15,6 +18,8 @@ def tracksingle_driver(config):
 
     Returns:
         Track data are written to netCDF files.
+        If tracklinks_store is set in config, all track data are written to a single link store file.
+        In append mode, pairs already in the link store are skipped and the new pairs are appended to it.
     """
 
     logger = logging.getLogger(__name__)
@@ -26,6 +31,12 @@ def tracksingle_driver(config):
     end_basetime = config["end_basetime"]
     run_parallel = config["run_parallel"]
     driftfile = config.get("driftfile", None)
+    # Windowed mode: walk contiguous segments of the timeline, reading each file once per segment
+    tracksingle_window = config.get("tracksingle_window", 0)
+    # Consolidated link store: write all pairs to a single file instead of one track file per pair
+    tracklinks_store = config.get("tracklinks_store", 0)
+    # Extend a previous run: append new pairs to its link store
+    append_mode = config.get("append_mode", 0)
 
     # Identify files to process
     cloudidfiles, \
@@ -54,28 +65,83 @@ def tracksingle_driver(config):
     # Create pairs of input filenames and times
     cloudid_filepairs = list(zip(cloudidfiles[0:-1], cloudidfiles[1::]))
     cloudid_basetimepairs = list(zip(cloudidfiles_basetime[0:-1], cloudidfiles_basetime[1::]))
+    pair_indices = np.arange(0, cloudidfilestep - 1)
+
+    link_store_mode = "w"
+    if (tracklinks_store == 1) & (append_mode == 1):
+        # Skip pairs already in the link store of the previous run
+        link_store_file = get_tracklinks_filename(config)
+        stored_basetime = read_tracklinks_basetimes(link_store_file)
+        pair_indices = pair_indices[~np.isin(cloudidfiles_basetime[1::], stored_basetime)]
+        link_store_mode = "a"
+        logger.info(f"Appending {len(pair_indices)} pairs to link store: {link_store_file}")
+        if len(pair_indices) == 0:
+            logger.info("No new pairs to track")
+            return
+
+    # Windowed version
+    if tracksingle_window == 1:
+        npairs = len(pair_indices)
+        if run_parallel == 0:
+            nsegments = 1
+        else:
+            # Default to one segment per worker
+            nsegments = config.get("tracksingle_nsegments", config.get("nprocesses", 1))
+        nsegments = max(min(nsegments, npairs), 1)
+        segment_indices = np.array_split(pair_indices, nsegments)
+        logger.info(f"Tracking in {nsegments} contiguous segments")
+
+        results = []
+        track_results = []
+        for iseg in segment_indices:
+            seg_filepairs = [cloudid_filepairs[ii] for ii in iseg]
+            seg_basetimepairs = [cloudid_basetimepairs[ii] for ii in iseg]
+            seg_drift_data = [drift_data[ii] for ii in iseg] if driftfile is not None else None
+            if run_parallel == 0:
+                result = trackclouds_segment(
+                    seg_filepairs,
+                    seg_basetimepairs,
+                    config,
+                    drift_data=seg_drift_data,
+                )
+                track_results.extend(result)
+            else:
+                result = dask.delayed(trackclouds_segment)(
+                    seg_filepairs,
+                    seg_basetimepairs,
+                    config,
+                    drift_data=seg_drift_data,
+                )
+                results.append(result)
+        if run_parallel >= 1:
+            final_result = dask.compute(*results)
+            wait(final_result)
+            for result in final_result:
+                track_results.extend(result)
 
     # Serial version
-    if run_parallel == 0:
-        for ifile in range(0, cloudidfilestep - 1):
+    elif run_parallel == 0:
+        track_results = []
+        for ifile in pair_indices:
             if driftfile is not None:
-                trackclouds(
+                result = trackclouds(
                     cloudid_filepairs[ifile],
                     cloudid_basetimepairs[ifile],
                     config,
                     drift_data=drift_data[ifile]
                 )
             else:
-                trackclouds(
+                result = trackclouds(
                     cloudid_filepairs[ifile],
                     cloudid_basetimepairs[ifile],
                     config
                 )
+            track_results.append(result)
 
     # Parallel version
     elif run_parallel >= 1:
         results = []
-        for ifile in range(0, cloudidfilestep - 1):
+        for ifile in pair_indices:
             if driftfile is not None:
                 result = dask.delayed(trackclouds)(
                     cloudid_filepairs[ifile],
@@ -92,8 +158,18 @@ def tracksingle_driver(config):
             results.append(result)
         final_result = dask.compute(*results)
         wait(final_result)
+        track_results = list(final_result)
     else:
         sys.exit('Valid parallelization flag not provided.')
 
+    # Write all links to the consolidated link store
+    if tracklinks_store == 1:
+        link_data_list = [result for result in track_results if result is not None]
+        link_data_list = sorted(link_data_list, key=lambda x: x["basetime_new"])
+        link_store_file = get_tracklinks_filename(config)
+        write_tracklinks_store(link_store_file, link_data_list, config, mode=link_store_mode)
+        logger.info(f"Link store: {link_store_file}")
+
     logger.info('Done with tracking sequential pairs of idfeature files')
-    return
\ No newline at end of file
+    return
+
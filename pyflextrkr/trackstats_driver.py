@@ -8,8 +8,10 @@ import copy
 import gc
 import logging
 import dask
-from dask.distributed import wait
+from dask.distributed import as_completed, get_client
 from pyflextrkr.trackstats_func import calc_stats_singlefile, adjust_mergesplit_numbers, get_track_startend_status
+from pyflextrkr.netcdf_io_tracknumbers import read_tracknumbers, read_tracknumbers_state, \
+    read_trackstats_state, write_trackstats_state
 
 def trackstats_driver(config):
     """
@@ -43,28 +45,43 @@ def trackstats_driver(config):
     times_dimname = config["times_dimname"]
     remove_shorttracks = config["remove_shorttracks"]
     trackstats_dense_netcdf = config["trackstats_dense_netcdf"]
+    trackstate_filebase = config.get("trackstate_filebase", "trackstate_")
+    # Save the collected feature statistics, to extend the run later in append mode
+    save_track_state = config.get("save_track_state", 0)
+    # Extend a previous run from its saved feature statistics
+    append_mode = config.get("append_mode", 0)
     fillval_f = np.nan
 
     # Set output filename
     trackstats_outfile = f"{stats_path}{trackstats_filebase}{startdate}_{enddate}.nc"
     trackstats_sparse_outfile = f"{stats_path}{trackstats_sparse_filebase}{startdate}_{enddate}.nc"
+    trackstate_file = f"{stats_path}{trackstate_filebase}trackstats_{startdate}.nc"
 
     # Load track data
     logger.debug("Loading tracknumbers data")
     cloudtrack_file = f"{stats_path}{tracknumbers_filebase}{startdate}_{enddate}.nc"
-    ds = xr.open_dataset(cloudtrack_file,
-                         mask_and_scale=False,
-                         decode_times=False,
-                         concat_characters=True)
-    numtracks = ds["ntracks"]
-    cloudidfiles = ds["cloudid_files"].values
-    nfiles = ds.sizes["nfiles"]
-    tracknumbers = ds["track_numbers"].squeeze()
-    trackreset = ds["track_reset"].squeeze()
-    tracksplit = ds["track_splitnumbers"].squeeze()
-    trackmerge = ds["track_mergenumbers"].squeeze()
-    trackstatus = ds["track_status"].squeeze()
-    ds.close()
+    if append_mode == 1:
+        # Use the latest tracknumbers file extended by gettracks
+        tail_state = read_tracknumbers_state(f"{stats_path}{trackstate_filebase}tracknumbers_{startdate}.nc")
+        cloudtrack_file = tail_state["tracknumbers_file"]
+    track_data = read_tracknumbers(cloudtrack_file)
+    numtracks = track_data["ntracks"]
+    cloudidfiles = track_data["cloudid_files"]
+    nfiles = len(cloudidfiles)
+    file_offsets = track_data["file_offsets"]
+    tracknumbers = track_data["track_numbers"]
+    trackreset = track_data["track_reset"]
+    tracksplit = track_data["track_splitnumbers"]
+    trackmerge = track_data["track_mergenumbers"]
+    trackstatus = track_data["track_status"]
+
+    # First file to process
+    ifile_start = 0
+    if append_mode == 1:
+        stats_state = read_trackstats_state(trackstate_file)
+        # Start from the last file of the previous run, since its track status may have been updated
+        ifile_start = stats_state["nfiles"] - 1
+        logger.info(f"Appending to previous run from file: {ifile_start}")
 
     #########################################################################################
     # loop over files. Calculate statistics and organize matrices by tracknumber and cloud
@@ -72,42 +89,53 @@ def trackstats_driver(config):
     logger.debug("Looping over pixel files and calculating feature statistics")
     t0_files = time.time()
 
-    results = []
+    # Create the collector of feature statistics
+    # The number of tracked clouds is an upper bound of the number of track features
+    nfeatures_max = np.count_nonzero(tracknumbers[file_offsets[ifile_start]:file_offsets[nfiles]] > 0)
+    if append_mode == 1:
+        collector = init_stats_collector(nfeatures_max, stats_state=stats_state, ifile_start=ifile_start)
+    else:
+        collector = init_stats_collector(nfeatures_max)
 
     # Serial
     if run_parallel == 0:
-        for nf in range(0, nfiles):
+        for nf in range(ifile_start, nfiles):
             result = calc_stats_singlefile(
-                tracknumbers[nf, :],
+                tracknumbers[file_offsets[nf]:file_offsets[nf + 1]],
                 cloudidfiles[nf],
-                trackstatus[nf, :],
-                trackmerge[nf, :],
-                tracksplit[nf, :],
-                trackreset[nf, :],
+                trackstatus[file_offsets[nf]:file_offsets[nf + 1]],
+                trackmerge[file_offsets[nf]:file_offsets[nf + 1]],
+                tracksplit[file_offsets[nf]:file_offsets[nf + 1]],
+                trackreset[file_offsets[nf]:file_offsets[nf + 1]],
                 config,
             )
-            results.append(result)
-
-        # Serial
-        final_result = results
+            collect_stats_result(collector, result, nf)
 
     # Parallel
     elif run_parallel >= 1:
-        for nf in range(0, nfiles):
+        results = []
+        for nf in range(ifile_start, nfiles):
             result = dask.delayed(calc_stats_singlefile)(
-                tracknumbers[nf, :],
+                tracknumbers[file_offsets[nf]:file_offsets[nf + 1]],
                 cloudidfiles[nf],
-                trackstatus[nf, :],
-                trackmerge[nf, :],
-                tracksplit[nf, :],
-                trackreset[nf, :],
+                trackstatus[file_offsets[nf]:file_offsets[nf + 1]],
+                trackmerge[file_offsets[nf]:file_offsets[nf + 1]],
+                tracksplit[file_offsets[nf]:file_offsets[nf + 1]],
+                trackreset[file_offsets[nf]:file_offsets[nf + 1]],
                 config,
             )
             results.append(result)
 
-        # Trigger dask computation
-        final_result = dask.compute(*results)
-        wait(final_result)
+        # Trigger dask computation, and collect each result as soon as it completes
+        client = get_client()
+        futures = client.compute(results)
+        future_file = {future.key: nf for nf, future in zip(range(ifile_start, nfiles), futures)}
+        completed = as_completed(futures, with_results=True)
+        del futures, results
+        for future, result in completed:
+            collect_stats_result(collector, result, future_file.pop(future.key))
+            # Release the result from the cluster memory
+            future.release()
 
     else:
         sys.exit('Valid parallelization flag not provided.')
@@ -120,19 +148,8 @@ def trackstats_driver(config):
     max_trackduration = int(max(duration_range))
     numtracks = int(numtracks)
 
-    # Make a variable list and get attributes from one of the returned dictionaries
-    # Loop over each return results till one that is not None
-    counter = 0
-    while counter < nfiles:
-        if final_result[counter] is not None:
-            var_names = list(final_result[counter][0].keys())
-            # Get variable attributes
-            var_attrs = final_result[counter][1]
-            break
-        counter += 1
-    # Drop variables from the list
-    var_names.remove("uniquetracknumbers")
-    var_names.remove("numtracks")
+    var_names = collector["var_names"]
+    var_attrs = collector["var_attrs"]
 
     # Sparse array indices
     tracks_idx_varname = f"{tracks_dimname}_indices"
@@ -157,45 +174,15 @@ def trackstats_driver(config):
                      "split_tracknumbers"]
     # Loop over variable list to create the dictionary entry
     for ivar in var_names:
-        out_dict[ivar] = np.array([])
         out_dict_attrs[ivar] = var_attrs[ivar]
 
-    # Initialize row/col indices arrays
-    row_idx = np.array([])
-    col_idx = np.array([])
-
-    # Collect results
-    for nf in range(0, nfiles):
-        # Get the return results for this pixel file
-        # The result is a tuple: (out_dict, out_dict_attrs)
-        # The first entry is the dictionary containing the variables
-        iResult = final_result[nf][0]
-        if iResult is not None:
-            # unique tracknumbers in the current file
-            tracknumbertmp = iResult["uniquetracknumbers"] - 1
-            # number of tracks in the current file
-            numtrackstmp = iResult["numtracks"]
-
-            # Record the current length of the track by adding 1
-            out_dict["track_duration"][tracknumbertmp] = (
-                    out_dict["track_duration"][tracknumbertmp] + 1
-            )
-
-            # Find track lengths that are within max_trackduration
-            # Only record these to avoid array index out of bounds
-            # itracklength = out_tracklength[tracknumbertmp]
-            itracklength = out_dict["track_duration"][tracknumbertmp]
-            ridx = itracklength <= max_trackduration
-            # Loop over each variable and assign values to output dictionary
-            for ivar in var_names:
-                # Concatenate arrays for 2D variables
-                out_dict[ivar] = np.concatenate(
-                    (out_dict[ivar], iResult[ivar])
-                )
-            # row, column indices for sparse matrix
-            # row:tracks, col:times
-            row_idx = np.concatenate((row_idx, tracknumbertmp[ridx])).astype(int)
-            col_idx = np.concatenate((col_idx, itracklength[ridx] - 1)).astype(int)
+    # Order the collected features in time for each track
+    out_dict["track_duration"][:], \
+    row_idx, col_idx, file_idx, \
+    feature_idx = order_stats_features(collector, numtracks, max_trackduration)
+    for ivar in var_names:
+        out_dict[ivar] = collector["out_dict"][ivar][feature_idx]
+    del collector
 
     #########################################################################################
     # Check data max duration against config set up
@@ -209,6 +196,12 @@ def trackstats_driver(config):
         logger.critical(f"Tracking will now exit.")
         sys.exit()
 
+    # Save the collected feature statistics to extend the run in append mode
+    if (save_track_state == 1) | (append_mode == 1):
+        write_trackstats_state(trackstate_file, nfiles, out_dict, out_dict_attrs, var_names,
+                               row_idx, col_idx, file_idx)
+        logger.info(f"Track statistics state saved: {trackstate_file}")
+
     # Convert 2D variables to sparse arrays
     row_col_ind = (row_idx, col_idx)
     shape_2d = (numtracks, max_trackduration)
@@ -343,6 +336,137 @@ def trackstats_driver(config):
     return trackstats_outfile
 
 
+def init_stats_collector(nfeatures, stats_state=None, ifile_start=0):
+    """
+    Create flat buffers to collect the feature statistics of each file.
+
+    Args:
+        nfeatures: int
+            Expected number of features to collect (buffers grow if exceeded).
+        stats_state: dictionary, optional. Default: None.
+            Feature statistics state of a previous run from read_trackstats_state.
+        ifile_start: int, optional. Default: 0.
+            First file to collect, features of the previous run from this file onward are dropped.
+
+    Returns:
+        collector: dictionary
+            Dictionary containing the collection buffers.
+    """
+    collector = {
+        "count": 0,
+        "var_names": None,
+        "var_attrs": None,
+        "out_dict": {},
+        "row_idx": np.empty(nfeatures, dtype=int),
+        "file_idx": np.empty(nfeatures, dtype=int),
+    }
+    if stats_state is not None:
+        # Start from the features of the previous run before the reprocessed files
+        keep = stats_state["file_idx"] < ifile_start
+        nkeep = np.count_nonzero(keep)
+        nfeatures = nfeatures + nkeep
+        collector["var_names"] = stats_state["var_names"]
+        collector["var_attrs"] = stats_state["out_dict_attrs"]
+        for key in ["row_idx", "file_idx"]:
+            collector[key] = np.empty(nfeatures, dtype=int)
+            collector[key][:nkeep] = stats_state[key][keep]
+        for ivar in collector["var_names"]:
+            values = stats_state["out_dict"][ivar]
+            collector["out_dict"][ivar] = np.empty(nfeatures, dtype=values.dtype)
+            collector["out_dict"][ivar][:nkeep] = values[keep]
+        collector["count"] = nkeep
+    return collector
+
+
+def collect_stats_result(collector, result, nf):
+    """
+    Copy the feature statistics of a single file into the collection buffers.
+
+    Args:
+        collector: dictionary
+            Dictionary containing the collection buffers from init_stats_collector.
+        result: tuple
+            Return results of calc_stats_singlefile: (out_dict, out_dict_attrs).
+        nf: int
+            File index of the result.
+
+    Returns:
+        None.
+    """
+    iResult = result[0]
+    if iResult is None:
+        return
+    if collector["var_names"] is None:
+        # Make a variable list and get attributes from the first returned dictionary
+        collector["var_names"] = [ivar for ivar in iResult.keys()
+                                  if ivar not in ["uniquetracknumbers", "numtracks"]]
+        collector["var_attrs"] = result[1]
+        nfeatures = len(collector["row_idx"])
+        for ivar in collector["var_names"]:
+            collector["out_dict"][ivar] = np.empty(nfeatures, dtype=np.asarray(iResult[ivar]).dtype)
+
+    # Grow the buffers if needed
+    i0 = collector["count"]
+    i1 = i0 + iResult["numtracks"]
+    nfeatures = len(collector["row_idx"])
+    if i1 > nfeatures:
+        nfeatures = max(2 * nfeatures, i1)
+        for key in ["row_idx", "file_idx"]:
+            collector[key] = np.resize(collector[key], nfeatures)
+        for ivar in collector["var_names"]:
+            collector["out_dict"][ivar] = np.resize(collector["out_dict"][ivar], nfeatures)
+
+    collector["row_idx"][i0:i1] = iResult["uniquetracknumbers"] - 1
+    collector["file_idx"][i0:i1] = nf
+    for ivar in collector["var_names"]:
+        collector["out_dict"][ivar][i0:i1] = iResult[ivar]
+    collector["count"] = i1
+    return
+
+
+def order_stats_features(collector, numtracks, max_trackduration):
+    """
+    Get the track and time indices of the collected features.
+
+    Features are collected in any file order, the time index is the rank of the file within each track.
+
+    Args:
+        collector: dictionary
+            Dictionary containing the collection buffers from init_stats_collector.
+        numtracks: int
+            Number of tracks.
+        max_trackduration: int
+            Maximum track duration, features beyond it are dropped.
+
+    Returns:
+        track_duration: numpy array
+            Duration of each track.
+        row_idx: numpy array
+            Track index of each kept feature.
+        col_idx: numpy array
+            Time index of each kept feature.
+        file_idx: numpy array
+            File index of each kept feature.
+        feature_idx: numpy array
+            Position of each kept feature in the collection buffers.
+    """
+    nfeatures = collector["count"]
+    row_idx = collector["row_idx"][:nfeatures]
+    file_idx = collector["file_idx"][:nfeatures]
+    track_duration = np.bincount(row_idx, minlength=numtracks)
+
+    # Sort features by track, then by file
+    feature_idx = np.lexsort((file_idx, row_idx))
+    row_idx = row_idx[feature_idx]
+    file_idx = file_idx[feature_idx]
+    # Rank within each track
+    col_idx = np.arange(nfeatures) - np.searchsorted(row_idx, row_idx, side="left")
+
+    # Only keep track lengths that are within max_trackduration to avoid array index out of bounds
+    ridx = col_idx < max_trackduration
+    return (track_duration, row_idx[ridx], col_idx[ridx], file_idx[ridx], feature_idx[ridx])
+
+
 def write_trackstats_sparse(config, numtracks, out_dict_attrs, out_dict, row_out, tracks_dimname,
                             trackstats_sparse_outfile):
     """
@@ -1,9 +1,13 @@
 import numpy as np
 from netCDF4 import chartostring
 import xarray as xr
+import os
 import sys
+import time
 import logging
-import warnings
+from pyflextrkr.trackstats_reducers import sort_by_segment, segment_nanmean, segment_nanmin, \
+    segment_nanmax, segment_nanargmin, calc_reducer_stats
+
 
 def calc_stats_singlefile(
         tracknumbers,
@@ -17,6 +21,9 @@ def calc_stats_singlefile(
     """
     Calculate statistics of track features from a single pixel file.
 
+    If feature_stats_table is set in config and the feature table from feature identification exists,
+    the feature statistics are gathered from the table instead of the pixel file.
+
     Args:
         tracknumbers: numpy array
             Cloud track numbers.
@@ -42,62 +49,16 @@ def calc_stats_singlefile(
     logger = logging.getLogger(__name__)
 
     tracking_outpath = config["tracking_outpath"]
-    pixel_radius = config["pixel_radius"]
-    feature_type = config.get("feature_type", None)
-    terrain_file = config.get("terrain_file", None)
-    rangemask_varname = config.get("rangemask_varname", 'None')
     feature_varname = config.get("feature_varname", "feature_number")
+    # Use the feature table written in feature identification
+    feature_stats_table = config.get("feature_stats_table", 0)
 
     # Only process file if that file contains a track
-    if np.nanmax(tracknumbers) > 0:
+    if (len(tracknumbers) > 0) and (np.nanmax(tracknumbers) > 0):
         # fname = "".join(chartostring(cloudidfile))
         fname = chartostring(cloudidfile).item()
         logger.info(fname)
-
-        # Load cloudid file
         cloudid_file = f"{tracking_outpath}{fname}"
-        ds = xr.open_dataset(cloudid_file,
-                             mask_and_scale=False,
-                             decode_times=False)
-        latitude = ds["latitude"].values
-        longitude = ds["longitude"].values
-        nx = ds.sizes["lon"]
-        ny = ds.sizes["lat"]
-        # file_cloudnumber = ds["cloudnumber"].squeeze().values
-        file_corecold_cloudnumber = ds[feature_varname].squeeze().values
-        file_basetime = ds["base_time"].squeeze()
-
-        # Read feature specific variables
-        if feature_type == "radar_cells":
-            ref_varname = config["ref_varname"]
-            # Convert x,y units to [km]
-            x_coords = ds["x"] / 1000.
-            y_coords = ds["y"] / 1000.
-            file_dbz = ds[ref_varname].squeeze().values
-            file_conv_core = ds["conv_core"].squeeze().values
-            file_conv_mask = ds["conv_mask"].squeeze().values
-            # Replace default cloudnumber with convective mask
-            # Cell tracking uses expanded cloud area for tracking purpose only,
-            # but the true cell mask is conv_mask
-            file_corecold_cloudnumber = file_conv_mask
-            # Convert echo-top height units to [km]
-            file_echotop10 = ds["echotop10"].squeeze().values / 1000.
-            file_echotop20 = ds["echotop20"].squeeze().values / 1000.
-            file_echotop30 = ds["echotop30"].squeeze().values / 1000.
-            file_echotop40 = ds["echotop40"].squeeze().values / 1000.
-            file_echotop50 = ds["echotop50"].squeeze().values / 1000.
-
-            # Range mask file
-            if terrain_file is not None:
-                dster = xr.open_dataset(terrain_file, decode_cf=False, mask_and_scale=False)
-                rangemask = dster[rangemask_varname].values.astype('int8')
-                dster.close()
-
-        if "tb" in feature_type:
-            file_tb = ds["tb"].squeeze().values
-            file_cloudtype = ds["cloudtype"].squeeze().values
-
-        # ds.close()
 
         # Find unique track numbers
         uniquetracknumbers = np.unique(tracknumbers)
@@ -109,233 +70,48 @@ def calc_stats_singlefile(
         fillval_f = np.nan
         numtracks = len(uniquetracknumbers)
         out_basetime = np.full(numtracks, fillval, dtype=np.float64)
-        out_meanlat = np.full(numtracks, fillval_f, dtype=np.float32)
-        out_meanlon = np.full(numtracks, fillval_f, dtype=np.float32)
-        out_area = np.full(numtracks, fillval_f, dtype=np.float32)
         out_cloudnumber = np.full(numtracks, fillval, dtype=np.int32)
         out_status = np.full(numtracks, fillval, dtype=np.int32)
         out_trackinterruptions = np.full(numtracks, fillval, dtype=np.int32)
         out_mergenumber = np.full(numtracks, fillval, dtype=np.int32)
         out_splitnumber = np.full(numtracks, fillval, dtype=np.int32)
 
-        # Create feature specific variables
-        # Radar cells
-        if feature_type == "radar_cells":
-            out_core_meanlat = np.full(numtracks, fillval_f, dtype=np.float32)
-            out_core_meanlon = np.full(numtracks, fillval_f, dtype=np.float32)
-            out_core_mean_x = np.full(numtracks, fillval_f, dtype=np.float32)
-            out_core_mean_y = np.full(numtracks, fillval_f, dtype=np.float32)
-            out_cell_meanlat = np.full(numtracks, fillval_f, dtype=np.float32)
-            out_cell_meanlon = np.full(numtracks, fillval_f, dtype=np.float32)
-            out_cell_mean_x = np.full(numtracks, fillval_f, dtype=np.float32)
-            out_cell_mean_y = np.full(numtracks, fillval_f, dtype=np.float32)
-            out_cell_max_dbz = np.full(numtracks, fillval_f, dtype=np.float32)
-            out_cell_maxETH10dbz = np.full(numtracks, fillval_f, dtype=np.float32)
-            out_cell_maxETH20dbz = np.full(numtracks, fillval_f, dtype=np.float32)
-            out_cell_maxETH30dbz = np.full(numtracks, fillval_f, dtype=np.float32)
-            out_cell_maxETH40dbz = np.full(numtracks, fillval_f, dtype=np.float32)
-            out_cell_maxETH50dbz = np.full(numtracks, fillval_f, dtype=np.float32)
-            out_core_area = np.full(numtracks, fillval_f, dtype=np.float32)
-            out_cell_area = np.full(numtracks, fillval_f, dtype=np.float32)
-            out_cell_rangeflag = np.full(numtracks, fillval, dtype=np.short)
-
-        # Satellite Tb
-        if "tb" in feature_type:
-            out_corecold_mintb = np.full(numtracks, fillval_f, dtype=np.float32)
-            out_corecold_meantb = np.full(numtracks, fillval_f, dtype=np.float32)
-            out_core_meantb = np.full(numtracks, fillval_f, dtype=np.float32)
-            out_mintb_lon = np.full(numtracks, fillval_f, dtype=np.float32)
-            out_mintb_lat = np.full(numtracks, fillval_f, dtype=np.float32)
-            out_core_area = np.full(numtracks, fillval_f, dtype=np.float32)
-            out_cold_area = np.full(numtracks, fillval_f, dtype=np.float32)
-
-
-        # Pre-sort cloudnumber to get location indices
-        fcn_gt_0 = file_corecold_cloudnumber > 0
-        corecold_cloudnumber_mask = file_corecold_cloudnumber * fcn_gt_0
-        cloudnumber1d_uniq, cloudnumber1d_counts, \
-        ast_corecoldarea, cumcounts_corecoldarea = pre_sort_cloudnumber(corecold_cloudnumber_mask)
-
-        if feature_type == "radar_cells":
-            # Pre-sort core number to get location indices
-            core_cloudnumber_mask = file_corecold_cloudnumber * file_conv_core
-            corenumber1d_uniq, corenumber1d_counts, \
-            ast_corearea, cumcounts_corearea = pre_sort_cloudnumber(core_cloudnumber_mask)
-
-            # Pre-sort dilated cell number to get location indices
-            dilated_cloudnumber_mask = ds[feature_varname].squeeze().values
-            dilatednumber1d_uniq, dilatednumber1d_counts, \
-            ast_dilatedcellarea, cumcounts_dilatedcellarea = pre_sort_cloudnumber(dilated_cloudnumber_mask)
-
-        if "tb" in feature_type:
-            # Pre-sort core number to get location indices
-            core_cloudnumber_mask = file_corecold_cloudnumber * (file_cloudtype == 1)
-            corenumber1d_uniq, corenumber1d_counts, \
-            ast_corearea, cumcounts_corearea = pre_sort_cloudnumber(core_cloudnumber_mask)
-
-            # Pre-sort cold anvil number to get location indices
-            cold_cloudnumber_mask = file_corecold_cloudnumber * (file_cloudtype == 2)
-            coldnumber1d_uniq, coldnumber1d_counts, \
-            ast_coldarea, cumcounts_coldarea = pre_sort_cloudnumber(cold_cloudnumber_mask)
-
-            # import matplotlib.pyplot as plt
-            # Zm = np.ma.masked_where(cold_cloudnumber_mask == 0, cold_cloudnumber_mask)
-            # import pdb;
-            # pdb.set_trace()
-            # plt.pcolormesh(Zm)
-
-
-        # Loop over unique tracknumbers
-        for itrack in range(numtracks):
-            # Map the tracknumbers in this frame to cloudnumbers
-            cloudnumber_map = np.where(tracknumbers == uniquetracknumbers[itrack])[0] + 1
-            # Handle edge case where more than 1 cloudnumber is returned
-            if len(cloudnumber_map) > 1:
-                logger.warning(f'Cloudid file: {cloudid_file}')
-                logger.warning(f'More than 1 {feature_varname} found for tracknumber: {uniquetracknumbers[itrack]}')
-                logger.warning(f'{feature_varname}: {cloudnumber_map}')
-                logger.warning(f'Only use {feature_varname}: {cloudnumber_map[0]}')
-                cloudnumber_map = cloudnumber_map[0]
-            cloudindex = cloudnumber_map - 1
-
-            # # Get the cloudmask for the current track (this is the slow method!)
-            # mask_corecold = file_corecold_cloudnumber == cloudnumber_map
-            # mask_cloud = file_cloudnumber == cloudnumber_map
-
-            # Get corecold cloud pixel location indices
-            corecold_npix, corecold_indices = get_loc_indices(
-                cloudnumber1d_uniq, cloudnumber1d_counts,
-                ast_corecoldarea, cumcounts_corecoldarea,
-                cloudnumber_map, nx, ny,
-            )
-
-            if corecold_npix > 0:
-                out_area[itrack] = corecold_npix * pixel_radius ** 2
-                corecold_lat = latitude[corecold_indices[0], corecold_indices[1]]
-                corecold_lon = longitude[corecold_indices[0], corecold_indices[1]]
-                out_meanlon[itrack] = np.nanmean(corecold_lon)
-                out_meanlat[itrack] = np.nanmean(corecold_lat)
-
-                # Calculate feature specific statistics
-                # Satellite Tb
-                if "tb" in feature_type:
-                    # Get cold core pixel location indices
-                    core_npix, core_indices = get_loc_indices(
-                        corenumber1d_uniq, corenumber1d_counts,
-                        ast_corearea, cumcounts_corearea,
-                        cloudnumber_map, nx, ny,
-                    )
-
-                    # Get cold anvil pixel location indices
-                    cold_npix, cold_indices = get_loc_indices(
-                        coldnumber1d_uniq, coldnumber1d_counts,
-                        ast_coldarea, cumcounts_coldarea,
-                        cloudnumber_map, nx, ny,
-                    )
-
-                    out_core_area[itrack] = core_npix * pixel_radius ** 2
-                    out_cold_area[itrack] = cold_npix * pixel_radius ** 2
-                    out_corecold_mintb[itrack] = np.nanmin(file_tb[corecold_indices[0], corecold_indices[1]])
-                    out_corecold_meantb[itrack] = np.nanmean(file_tb[corecold_indices[0], corecold_indices[1]])
-                    # Get min Tb location
-                    mintb_index = np.nanargmin(file_tb[corecold_indices[0], corecold_indices[1]])
-                    out_mintb_lat[itrack] = latitude[corecold_indices[0], corecold_indices[1]][mintb_index]
-                    out_mintb_lon[itrack] = longitude[corecold_indices[0], corecold_indices[1]][mintb_index]
-                    if core_npix > 0:
-                        out_core_meantb[itrack] = np.nanmean(file_tb[core_indices[0], core_indices[1]])
-
-                    # iy_min, iy_max = np.min(corecold_indices[0]), np.max(corecold_indices[0])
-                    # ix_min, ix_max = np.min(corecold_indices[1]), np.max(corecold_indices[1])
-                    # import pdb; pdb.set_trace()
-
-                # Calculate feature specific statistics
-                # Radar cells
-                if feature_type == "radar_cells":
-                    # Get core pixel location indices
-                    core_npix, core_indices = get_loc_indices(
-                        corenumber1d_uniq, corenumber1d_counts,
-                        ast_corearea, cumcounts_corearea,
-                        cloudnumber_map, nx, ny,
-                    )
-
-                    # Get dilated cell pixel location indices
-                    dilatedcell_npix, dilatedcell_indices = get_loc_indices(
-                        dilatednumber1d_uniq, dilatednumber1d_counts,
-                        ast_dilatedcellarea, cumcounts_dilatedcellarea,
-                        cloudnumber_map, nx, ny,
-                    )
-
-                    # Location of core
-                    core_lat = latitude[core_indices[0], core_indices[1]]
-                    core_lon = longitude[core_indices[0], core_indices[1]]
-                    core_y = y_coords[core_indices[0]]
-                    core_x = x_coords[core_indices[1]]
-
-                    # Location of cell (same as corecold location)
-                    cell_lat = corecold_lat
-                    cell_lon = corecold_lon
-                    cell_y = y_coords[corecold_indices[0]]
-                    cell_x = x_coords[corecold_indices[1]]
-
-                    # Core center location
-                    out_core_meanlat[itrack] = np.nanmean(core_lat)
-                    out_core_meanlon[itrack] = np.nanmean(core_lon)
-                    out_core_mean_y[itrack] = np.nanmean(core_y)
-                    out_core_mean_x[itrack] = np.nanmean(core_x)
-
-                    # Cell center location
-                    out_cell_meanlat[itrack] = np.nanmean(cell_lat)
-                    out_cell_meanlon[itrack] = np.nanmean(cell_lon)
-                    out_cell_mean_y[itrack] = np.nanmean(cell_y)
-                    out_cell_mean_x[itrack] = np.nanmean(cell_x)
-
-                    out_core_area[itrack] = core_npix * pixel_radius ** 2
-                    out_cell_area[itrack] = corecold_npix * pixel_radius ** 2
-
-                    out_cell_max_dbz[itrack] = np.nanmax(
-                        file_dbz[corecold_indices[0], corecold_indices[1]]
-                    )
-
-                    # Ignore "All-NaN slice encountered" error in ETH variables
-                    with warnings.catch_warnings():
-                        warnings.simplefilter("ignore", category=RuntimeWarning)
-
-                        out_cell_maxETH10dbz[itrack] = np.nanmax(
-                            file_echotop10[corecold_indices[0], corecold_indices[1]]
-                        )
-                        out_cell_maxETH20dbz[itrack] = np.nanmax(
-                            file_echotop20[corecold_indices[0], corecold_indices[1]]
-                        )
-                        out_cell_maxETH30dbz[itrack] = np.nanmax(
-                            file_echotop30[corecold_indices[0], corecold_indices[1]]
-                        )
-                        out_cell_maxETH40dbz[itrack] = np.nanmax(
-                            file_echotop40[corecold_indices[0], corecold_indices[1]]
-                        )
-                        out_cell_maxETH50dbz[itrack] = np.nanmax(
-                            file_echotop50[corecold_indices[0], corecold_indices[1]]
-                        )
-
-                    if terrain_file is not None:
-                        # The min range mask value within the dilated cell area
-                        # 1: cell completely within range mask
-                        # 0: some portion of the cell outside range mask
-                        out_cell_rangeflag[itrack] = np.min(
-                            rangemask[dilatedcell_indices[0], dilatedcell_indices[1]])
-
-            out_basetime[itrack] = file_basetime
-            out_cloudnumber[itrack] = cloudnumber_map
-            # out_cloudidfile[itrack][:] = fname
-            # out_area[itrack] = np.count_nonzero(mask_corecold) * pixel_radius ** 2
-            # out_meanlat[itrack] = np.nanmean(latitude[mask_corecold])
-            # out_meanlon[itrack] = np.nanmean(longitude[mask_corecold])
-            # out_cell_max_dbz[itrack] = np.nanmax(file_dbz[mask_corecold])
-
-            # Save track status, merge/split information
-            out_status[itrack] = trackstatus[cloudindex]
-            out_mergenumber[itrack] = trackmerge[cloudindex]
-            out_splitnumber[itrack] = tracksplit[cloudindex]
-            out_trackinterruptions[itrack] = trackreset[cloudindex]
+        # Map the tracknumbers in this frame to cloudnumbers (first cloud of each track)
+        cloudindex, ncloud_track = get_track_cloudindex(tracknumbers, uniquetracknumbers)
+        cloudnumber_map = cloudindex + 1
+        # Handle edge case where more than 1 cloudnumber is returned
+        for itrack in np.where(ncloud_track > 1)[0]:
+            cloudnumber_all = np.where(tracknumbers == uniquetracknumbers[itrack])[0] + 1
+            logger.warning(f'Cloudid file: {cloudid_file}')
+            logger.warning(f'More than 1 {feature_varname} found for tracknumber: {uniquetracknumbers[itrack]}')
+            logger.warning(f'{feature_varname}: {cloudnumber_all}')
+            logger.warning(f'Only use {feature_varname}: {cloudnumber_all[0]}')
+
+        # Get feature statistics of each track
+        feature_table_file = get_feature_table_filename(cloudid_file, config)
+        if (feature_stats_table == 1) & (os.path.isfile(feature_table_file)):
+            # Gather rows of the tracked features from the feature table
+            feature_dict, \
+            feature_dict_attrs, \
+            file_basetime = read_feature_table(feature_table_file, cloudnumber_map)
+        else:
+            # Load cloudid file
+            ds = xr.open_dataset(cloudid_file,
+                                 mask_and_scale=False,
+                                 decode_times=False)
+            feature_dict, \
+            feature_dict_attrs, \
+            file_basetime = calc_feature_stats(ds, cloudnumber_map, config)
+            ds.close()
+
+        out_basetime[:] = file_basetime
+        out_cloudnumber[:] = cloudnumber_map
+
+        # Save track status, merge/split information
+        out_status[:] = trackstatus[cloudindex]
+        out_mergenumber[:] = trackmerge[cloudindex]
+        out_splitnumber[:] = tracksplit[cloudindex]
+        out_trackinterruptions[:] = trackreset[cloudindex]
 
         # Track status explanation
         track_status_explanation = (
@@ -364,40 +140,17 @@ def calc_stats_singlefile(
 
         # Define baseline output variables and attributes dictionary
         out_dict, \
-        out_dict_attrs = define_base_vars_dict(file_basetime, fillval, fillval_f, numtracks, out_area,
-                                               out_basetime, out_cloudnumber, out_meanlat, out_meanlon,
-                                               out_mergenumber, out_splitnumber, out_status,
-                                               out_trackinterruptions, track_status_explanation,
+        out_dict_attrs = define_base_vars_dict(file_basetime, fillval, fillval_f, numtracks, feature_dict["area"],
+                                               out_basetime, out_cloudnumber, feature_dict["meanlat"],
+                                               feature_dict["meanlon"], out_mergenumber, out_splitnumber,
+                                               out_status, out_trackinterruptions, track_status_explanation,
                                                uniquetracknumbers)
 
-        # Define feature specific extra variables and attributes,
-        # and update the baseline dictionaries
-        if "tb" in feature_type:
-            out_dict_attrs_extra, \
-            out_dict_extra = define_extra_tb(
-                fillval_f, out_cold_area, out_core_area,
-                out_core_meantb, out_corecold_meantb,
-                out_corecold_mintb, out_mintb_lat, out_mintb_lon,
-            )
-            # Merge with the baseline dictionaries
-            out_dict.update(out_dict_extra)
-            out_dict_attrs.update(out_dict_attrs_extra)
-
-        if feature_type == "radar_cells":
-            out_dict_attrs_extra, \
-            out_dict_extra = define_extra_radar_cells(fillval, fillval_f, out_cell_area,
-                                                      out_cell_maxETH10dbz, out_cell_maxETH20dbz,
-                                                      out_cell_maxETH30dbz, out_cell_maxETH40dbz,
-                                                      out_cell_maxETH50dbz, out_cell_max_dbz,
-                                                      out_cell_mean_x, out_cell_mean_y,
-                                                      out_cell_meanlat, out_cell_meanlon,
-                                                      out_cell_rangeflag, out_core_area,
-                                                      out_core_mean_x, out_core_mean_y,
-                                                      out_core_meanlat, out_core_meanlon,
-                                                      rangemask_varname)
-            # Merge with the baseline dictionaries
-            out_dict.update(out_dict_extra)
-            out_dict_attrs.update(out_dict_attrs_extra)
+        # Add feature specific statistics to the baseline dictionaries
+        for ivar in feature_dict.keys():
+            if ivar not in out_dict:
+                out_dict[ivar] = feature_dict[ivar]
+                out_dict_attrs[ivar] = feature_dict_attrs[ivar]
 
     else:
         logger.info("No tracks in file.")
@@ -411,6 +164,361 @@ def calc_stats_singlefile(
 
 
 
+def calc_feature_stats(ds, cloudnumber_map, config):
+    """
+    Calculate statistics of features from a pixel file dataset.
+
+    Args:
+        ds: Xarray Dataset
+            Pixel file dataset (read with mask_and_scale=False).
+        cloudnumber_map: numpy array
+            Cloud numbers of the features.
+        config: dictionary
+            Dictionary containing config parameters.
+
+    Returns:
+        feature_dict: dictionary
+            Dictionary containing the statistics of each feature.
+        feature_dict_attrs: dictionary
+            Dictionary containing the attributes of the feature specific statistics.
+        file_basetime: Xarray DataArray
+            Base time of the pixel file.
+    """
+    pixel_radius = config["pixel_radius"]
+    feature_type = config.get("feature_type", None)
+    terrain_file = config.get("terrain_file", None)
+    rangemask_varname = config.get("rangemask_varname", 'None')
+    feature_varname = config.get("feature_varname", "feature_number")
+    # Config-declared statistics calculated with the reducer registry
+    trackstats_fields = config.get("trackstats_fields", None)
+
+    latitude = ds["latitude"].values
+    longitude = ds["longitude"].values
+    nx = ds.sizes["lon"]
+    ny = ds.sizes["lat"]
+    # file_cloudnumber = ds["cloudnumber"].squeeze().values
+    file_corecold_cloudnumber = ds[feature_varname].squeeze().values
+    file_basetime = ds["base_time"].squeeze().load()
+
+    # Read feature specific variables
+    if feature_type == "radar_cells":
+        ref_varname = config["ref_varname"]
+        # Convert x,y units to [km]
+        x_coords = ds["x"] / 1000.
+        y_coords = ds["y"] / 1000.
+        file_dbz = ds[ref_varname].squeeze().values
+        file_conv_core = ds["conv_core"].squeeze().values
+        file_conv_mask = ds["conv_mask"].squeeze().values
+        # Replace default cloudnumber with convective mask
+        # Cell tracking uses expanded cloud area for tracking purpose only,
+        # but the true cell mask is conv_mask
+        file_corecold_cloudnumber = file_conv_mask
+        # Convert echo-top height units to [km]
+        file_echotop10 = ds["echotop10"].squeeze().values / 1000.
+        file_echotop20 = ds["echotop20"].squeeze().values / 1000.
+        file_echotop30 = ds["echotop30"].squeeze().values / 1000.
+        file_echotop40 = ds["echotop40"].squeeze().values / 1000.
+        file_echotop50 = ds["echotop50"].squeeze().values / 1000.
+
+        # Range mask file
+        if terrain_file is not None:
+            dster = xr.open_dataset(terrain_file, decode_cf=False, mask_and_scale=False)
+            rangemask = dster[rangemask_varname].values.astype('int8')
+            dster.close()
+
+    if "tb" in feature_type:
+        file_tb = ds["tb"].squeeze().values
+        file_cloudtype = ds["cloudtype"].squeeze().values
+
+    # Create output variables
+    fillval = -9999
+    fillval_f = np.nan
+    numtracks = len(cloudnumber_map)
+    out_meanlat = np.full(numtracks, fillval_f, dtype=np.float32)
+    out_meanlon = np.full(numtracks, fillval_f, dtype=np.float32)
+    out_area = np.full(numtracks, fillval_f, dtype=np.float32)
+
+    # Create feature specific variables
+    # Radar cells
+    if feature_type == "radar_cells":
+        out_core_meanlat = np.full(numtracks, fillval_f, dtype=np.float32)
+        out_core_meanlon = np.full(numtracks, fillval_f, dtype=np.float32)
+        out_core_mean_x = np.full(numtracks, fillval_f, dtype=np.float32)
+        out_core_mean_y = np.full(numtracks, fillval_f, dtype=np.float32)
+        out_cell_meanlat = np.full(numtracks, fillval_f, dtype=np.float32)
+        out_cell_meanlon = np.full(numtracks, fillval_f, dtype=np.float32)
+        out_cell_mean_x = np.full(numtracks, fillval_f, dtype=np.float32)
+        out_cell_mean_y = np.full(numtracks, fillval_f, dtype=np.float32)
+        out_cell_max_dbz = np.full(numtracks, fillval_f, dtype=np.float32)
+        out_cell_maxETH10dbz = np.full(numtracks, fillval_f, dtype=np.float32)
+        out_cell_maxETH20dbz = np.full(numtracks, fillval_f, dtype=np.float32)
+        out_cell_maxETH30dbz = np.full(numtracks, fillval_f, dtype=np.float32)
+        out_cell_maxETH40dbz = np.full(numtracks, fillval_f, dtype=np.float32)
+        out_cell_maxETH50dbz = np.full(numtracks, fillval_f, dtype=np.float32)
+        out_core_area = np.full(numtracks, fillval_f, dtype=np.float32)
+        out_cell_area = np.full(numtracks, fillval_f, dtype=np.float32)
+        out_cell_rangeflag = np.full(numtracks, fillval, dtype=np.short)
+
+    # Satellite Tb
+    if "tb" in feature_type:
+        out_corecold_mintb = np.full(numtracks, fillval_f, dtype=np.float32)
+        out_corecold_meantb = np.full(numtracks, fillval_f, dtype=np.float32)
+        out_core_meantb = np.full(numtracks, fillval_f, dtype=np.float32)
+        out_mintb_lon = np.full(numtracks, fillval_f, dtype=np.float32)
+        out_mintb_lat = np.full(numtracks, fillval_f, dtype=np.float32)
+        out_core_area = np.full(numtracks, fillval_f, dtype=np.float32)
+        out_cold_area = np.full(numtracks, fillval_f, dtype=np.float32)
+
+    # Pre-sort cloudnumber to get pixel segments of each cloud
+    fcn_gt_0 = file_corecold_cloudnumber > 0
+    corecold_cloudnumber_mask = file_corecold_cloudnumber * fcn_gt_0
+    corecold_seg = pre_sort_segments(corecold_cloudnumber_mask, cloudnumber_map)
+    segments = {"feature": corecold_seg}
+    # Features with corecold pixels
+    itc = np.where(corecold_seg["npix"] > 0)[0]
+    segc = corecold_seg["segment"][itc]
+
+    out_area[itc] = corecold_seg["npix"][itc] * pixel_radius ** 2
+    corecold_lat = sort_by_segment(latitude, corecold_seg)
+    corecold_lon = sort_by_segment(longitude, corecold_seg)
+    out_meanlon[itc] = segment_nanmean(corecold_lon, corecold_seg)[segc]
+    out_meanlat[itc] = segment_nanmean(corecold_lat, corecold_seg)[segc]
+
+    # Calculate feature specific statistics
+    # Satellite Tb
+    if "tb" in feature_type:
+        # Pre-sort core number to get pixel segments
+        core_cloudnumber_mask = file_corecold_cloudnumber * (file_cloudtype == 1)
+        core_seg = pre_sort_segments(core_cloudnumber_mask, cloudnumber_map)
+
+        # Pre-sort cold anvil number to get pixel segments
+        cold_cloudnumber_mask = file_corecold_cloudnumber * (file_cloudtype == 2)
+        cold_seg = pre_sort_segments(cold_cloudnumber_mask, cloudnumber_map)
+        segments.update({"core": core_seg, "cold": cold_seg})
+
+        out_core_area[itc] = core_seg["npix"][itc] * pixel_radius ** 2
+        out_cold_area[itc] = cold_seg["npix"][itc] * pixel_radius ** 2
+        corecold_tb = sort_by_segment(file_tb, corecold_seg)
+        out_corecold_mintb[itc] = segment_nanmin(corecold_tb, corecold_seg)[segc]
+        out_corecold_meantb[itc] = segment_nanmean(corecold_tb, corecold_seg)[segc]
+        # Get min Tb location
+        mintb_index = segment_nanargmin(corecold_tb, corecold_seg)[segc]
+        itmin = itc[mintb_index >= 0]
+        out_mintb_lat[itmin] = corecold_lat[mintb_index[mintb_index >= 0]]
+        out_mintb_lon[itmin] = corecold_lon[mintb_index[mintb_index >= 0]]
+        # Tracks with cold core pixels
+        itcore = itc[core_seg["npix"][itc] > 0]
+        core_tb = sort_by_segment(file_tb, core_seg)
+        out_core_meantb[itcore] = segment_nanmean(core_tb, core_seg)[core_seg["segment"][itcore]]
+
+    # Radar cells
+    if feature_type == "radar_cells":
+        # Pre-sort core number to get pixel segments
+        core_cloudnumber_mask = file_corecold_cloudnumber * file_conv_core
+        core_seg = pre_sort_segments(core_cloudnumber_mask, cloudnumber_map)
+
+        # Pre-sort dilated cell number to get pixel segments
+        dilated_cloudnumber_mask = ds[feature_varname].squeeze().values
+        dilatedcell_seg = pre_sort_segments(dilated_cloudnumber_mask, cloudnumber_map)
+        segments.update({"core": core_seg, "dilated": dilatedcell_seg})
+
+        # Tracks with core pixels
+        itcore = itc[core_seg["npix"][itc] > 0]
+        segcore = core_seg["segment"][itcore]
+
+        # Core center location
+        out_core_meanlat[itcore] = segment_nanmean(sort_by_segment(latitude, core_seg), core_seg)[segcore]
+        out_core_meanlon[itcore] = segment_nanmean(sort_by_segment(longitude, core_seg), core_seg)[segcore]
+        core_y, core_x = np.unravel_index(core_seg["ast"], (ny, nx))
+        out_core_mean_y[itcore] = segment_nanmean(y_coords.values[core_y], core_seg)[segcore]
+        out_core_mean_x[itcore] = segment_nanmean(x_coords.values[core_x], core_seg)[segcore]
+
+        # Cell center location (same as corecold location)
+        out_cell_meanlat[itc] = out_meanlat[itc]
+        out_cell_meanlon[itc] = out_meanlon[itc]
+        cell_y, cell_x = np.unravel_index(corecold_seg["ast"], (ny, nx))
+        out_cell_mean_y[itc] = segment_nanmean(y_coords.values[cell_y], corecold_seg)[segc]
+        out_cell_mean_x[itc] = segment_nanmean(x_coords.values[cell_x], corecold_seg)[segc]
+
+        out_core_area[itc] = core_seg["npix"][itc] * pixel_radius ** 2
+        out_cell_area[itc] = corecold_seg["npix"][itc] * pixel_radius ** 2
+
+        out_cell_max_dbz[itc] = segment_nanmax(sort_by_segment(file_dbz, corecold_seg), corecold_seg)[segc]
+        out_cell_maxETH10dbz[itc] = segment_nanmax(sort_by_segment(file_echotop10, corecold_seg), corecold_seg)[segc]
+        out_cell_maxETH20dbz[itc] = segment_nanmax(sort_by_segment(file_echotop20, corecold_seg), corecold_seg)[segc]
+        out_cell_maxETH30dbz[itc] = segment_nanmax(sort_by_segment(file_echotop30, corecold_seg), corecold_seg)[segc]
+        out_cell_maxETH40dbz[itc] = segment_nanmax(sort_by_segment(file_echotop40, corecold_seg), corecold_seg)[segc]
+        out_cell_maxETH50dbz[itc] = segment_nanmax(sort_by_segment(file_echotop50, corecold_seg), corecold_seg)[segc]
+
+        if terrain_file is not None:
+            # The min range mask value within the dilated cell area
+            # 1: cell completely within range mask
+            # 0: some portion of the cell outside range mask
+            itcell = itc[dilatedcell_seg["npix"][itc] > 0]
+            out_cell_rangeflag[itcell] = np.minimum.reduceat(
+                sort_by_segment(rangemask, dilatedcell_seg), dilatedcell_seg["starts"],
+            )[dilatedcell_seg["segment"][itcell]]
+
+    feature_dict = {
+        "meanlat": out_meanlat,
+        "meanlon": out_meanlon,
+        "area": out_area,
+    }
+    feature_dict_attrs = {}
+
+    # Define feature specific extra variables and attributes,
+    # and update the feature dictionaries
+    if "tb" in feature_type:
+        out_dict_attrs_extra, \
+        out_dict_extra = define_extra_tb(
+            fillval_f, out_cold_area, out_core_area,
+            out_core_meantb, out_corecold_meantb,
+            out_corecold_mintb, out_mintb_lat, out_mintb_lon,
+        )
+        # Merge with the feature dictionaries
+        feature_dict.update(out_dict_extra)
+        feature_dict_attrs.update(out_dict_attrs_extra)
+
+    if feature_type == "radar_cells":
+        out_dict_attrs_extra, \
+        out_dict_extra = define_extra_radar_cells(fillval, fillval_f, out_cell_area,
+                                                  out_cell_maxETH10dbz, out_cell_maxETH20dbz,
+                                                  out_cell_maxETH30dbz, out_cell_maxETH40dbz,
+                                                  out_cell_maxETH50dbz, out_cell_max_dbz,
+                                                  out_cell_mean_x, out_cell_mean_y,
+                                                  out_cell_meanlat, out_cell_meanlon,
+                                                  out_cell_rangeflag, out_core_area,
+                                                  out_core_mean_x, out_core_mean_y,
+                                                  out_core_meanlat, out_core_meanlon,
+                                                  rangemask_varname)
+        # Merge with the feature dictionaries
+        feature_dict.update(out_dict_extra)
+        feature_dict_attrs.update(out_dict_attrs_extra)
+
+    # Config-declared statistics
+    if trackstats_fields is not None:
+        out_dict_extra, \
+        out_dict_attrs_extra = calc_reducer_stats(trackstats_fields, ds, segments, itc, fillval_f)
+        # Merge with the feature dictionaries
+        feature_dict.update(out_dict_extra)
+        feature_dict_attrs.update(out_dict_attrs_extra)
+
+    return (feature_dict, feature_dict_attrs, file_basetime)
+
+
+def get_feature_table_filename(cloudid_file, config):
+    """
+    Get the feature table filename of a cloudid file.
+
+    Args:
+        cloudid_file: string
+            Cloudid filename.
+        config: dictionary
+            Dictionary containing config parameters.
+
+    Returns:
+        feature_table_file: string
+            Feature table filename.
+    """
+    cloudid_filebase = config["cloudid_filebase"]
+    featurestats_filebase = config.get("featurestats_filebase", "featurestats_")
+    dirname, fname = os.path.split(cloudid_file)
+    if fname.startswith(cloudid_filebase):
+        fname = fname[len(cloudid_filebase):]
+    feature_table_file = os.path.join(dirname, f"{featurestats_filebase}{fname}")
+    return feature_table_file
+
+
+def write_feature_table(cloudid_file, ds, config):
+    """
+    Write the statistics of all features in a pixel file to a feature table, indexed by cloudnumber.
+
+    Called in feature identification with the pixel file dataset still in memory,
+    so that trackstats only gathers rows of the tracked features instead of reading the pixel file.
+
+    Args:
+        cloudid_file: string
+            Cloudid filename.
+        ds: Xarray Dataset
+            Pixel file dataset.
+        config: dictionary
+            Dictionary containing config parameters.
+
+    Returns:
+        feature_table_file: string
+            Feature table filename.
+    """
+    nfeature_varname = config.get("nfeature_varname", "nfeatures")
+    feature_table_file = get_feature_table_filename(cloudid_file, config)
+
+    nfeatures = int(np.max(ds[nfeature_varname].values))
+    cloudnumber_map = np.arange(1, nfeatures + 1)
+    feature_dict, feature_dict_attrs, file_basetime = calc_feature_stats(ds, cloudnumber_map, config)
+
+    # Baseline variable attributes
+    feature_dict_attrs.update({
+        "meanlat": {"long_name": "Mean latitude of a feature", "units": "degrees_north", "_FillValue": np.nan},
+        "meanlon": {"long_name": "Mean longitude of a feature", "units": "degrees_east", "_FillValue": np.nan},
+        "area": {"long_name": "Area of a feature", "units": "km^2", "_FillValue": np.nan},
+    })
+    var_dict = {
+        "base_time": (["time"], np.atleast_1d(file_basetime.values), file_basetime.attrs),
+    }
+    for ivar in feature_dict.keys():
+        var_dict[ivar] = (["features"], feature_dict[ivar], feature_dict_attrs[ivar])
+    coord_dict = {
+        "features": (["features"], cloudnumber_map),
+    }
+    gattr_dict = {
+        "Title": "Statistics of each feature in the cloudid file",
+        "cloudid_file": os.path.basename(cloudid_file),
+        "Institution": "Pacific Northwest National Laboratory",
+        "Contact": "Zhe Feng, zhe.feng@pnnl.gov",
+        "Created_on": time.ctime(time.time()),
+    }
+    dsout = xr.Dataset(var_dict, coords=coord_dict, attrs=gattr_dict)
+    # Set encoding/compression for all variables
+    comp = dict(zlib=True)
+    encoding = {var: comp for var in dsout.data_vars}
+    dsout.to_netcdf(path=feature_table_file, mode="w", format="NETCDF4", encoding=encoding)
+    return feature_table_file
+
+
+def read_feature_table(feature_table_file, cloudnumber_map):
+    """
+    Gather the statistics of given features from a feature table.
+
+    Args:
+        feature_table_file: string
+            Feature table filename.
+        cloudnumber_map: numpy array
+            Cloud numbers of the features.
+
+    Returns:
+        feature_dict: dictionary
+            Dictionary containing the statistics of each feature.
+        feature_dict_attrs: dictionary
+            Dictionary containing the attributes of the feature specific statistics.
+        file_basetime: Xarray DataArray
+            Base time of the pixel file.
+    """
+    ds = xr.open_dataset(feature_table_file, mask_and_scale=False, decode_times=False)
+    file_basetime = ds["base_time"].squeeze().load()
+    # Cloud numbers not in the table have no pixels
+    valid = (cloudnumber_map >= 1) & (cloudnumber_map <= ds.sizes["features"])
+    feature_dict = {}
+    feature_dict_attrs = {}
+    for ivar in ds.data_vars:
+        if ivar != "base_time":
+            values = ds[ivar].values
+            feature_dict[ivar] = np.full(len(cloudnumber_map), ds[ivar].attrs.get("_FillValue", np.nan),
+                                         dtype=values.dtype)
+            feature_dict[ivar][valid] = values[cloudnumber_map[valid] - 1]
+            feature_dict_attrs[ivar] = dict(ds[ivar].attrs)
+    ds.close()
+    return (feature_dict, feature_dict_attrs, file_basetime)
+
+
 def define_base_vars_dict(file_basetime, fillval, fillval_f, numtracks, out_area, out_basetime, out_cloudnumber,
                           out_meanlat, out_meanlon, out_mergenumber, out_splitnumber, out_status,
                           out_trackinterruptions, track_status_explanation, uniquetracknumbers):
@@ -846,6 +954,67 @@ def pre_sort_cloudnumber(cloudnumber_mask):
             cumcounts_cloudarea)
 
 
+def get_track_cloudindex(tracknumbers, uniquetracknumbers):
+    """
+    Get the cloud index of each unique track number in a single pixel file.
+
+    Args:
+        tracknumbers: numpy array
+            Cloud track numbers.
+        uniquetracknumbers: numpy array
+            Sorted unique track numbers.
+
+    Returns:
+        cloudindex: numpy array
+            Index of the first cloud of each track.
+        ncloud_track: numpy array
+            Number of clouds with each track number.
+    """
+    # A stable sort keeps the first cloud of each track at the start of its segment
+    order = np.argsort(tracknumbers, kind="stable")
+    tracknumbers_sorted = tracknumbers[order]
+    istart = np.searchsorted(tracknumbers_sorted, uniquetracknumbers, side="left")
+    iend = np.searchsorted(tracknumbers_sorted, uniquetracknumbers, side="right")
+    cloudindex = order[istart]
+    ncloud_track = iend - istart
+    return (cloudindex, ncloud_track)
+
+
+def pre_sort_segments(cloudnumber_mask, cloudnumber_map):
+    """
+    Pre-sort cloudnumber image to get the pixel segment of each cloud in the sorted order.
+
+    Args:
+        cloudnumber_mask: numpy array
+            Cloudnumber 2D image array from pixel file.
+        cloudnumber_map: numpy array
+            Cloud numbers to get the pixel segments for.
+
+    Returns:
+        seg: dictionary
+            Dictionary containing:
+            ast: flatten 1D pixel indices sorted by cloudnumber,
+            starts: start position of each unique cloudnumber in ast,
+            segment: segment index of each cloud in cloudnumber_map,
+            npix: number of pixels of each cloud in cloudnumber_map (0 if not found).
+    """
+    cloudnumber1d_uniq, cloudnumber1d_counts, \
+    ast_cloudarea, cumcounts_cloudarea = pre_sort_cloudnumber(cloudnumber_mask)
+    starts = cumcounts_cloudarea - cloudnumber1d_counts
+    # Find index of pre-sorted cloudnumber matching each cloud
+    segment = np.searchsorted(cloudnumber1d_uniq, cloudnumber_map)
+    segment = np.minimum(segment, len(cloudnumber1d_uniq) - 1)
+    found = cloudnumber1d_uniq[segment] == cloudnumber_map
+    npix = np.where(found, cloudnumber1d_counts[segment], 0)
+    seg = {
+        "ast": ast_cloudarea,
+        "starts": starts,
+        "segment": segment,
+        "npix": npix,
+    }
+    return seg
+
+
 def adjust_mergesplit_numbers(
         out_mergenumber,
         out_splitnumber,
@@ -956,9 +1125,9 @@ def get_track_startend_status(
     # causing inconsistency in the number of tracks
     # This makes sure numtracks match
     trackid_real = np.where(out_tracklength > 0)[0]
-    out_startbasetime[trackid_real] = out_dict["base_time"][:, 0].data
-    out_startstatus[trackid_real] = out_dict["track_status"][:, 0].data
-    out_startsplit_tracknumber[trackid_real] = out_dict["split_tracknumbers"][:, 0].data
+    out_startbasetime[trackid_real] = get_sparse_values(out_dict["base_time"], trackid_real, 0)
+    out_startstatus[trackid_real] = get_sparse_values(out_dict["track_status"], trackid_real, 0)
+    out_startsplit_tracknumber[trackid_real] = get_sparse_values(out_dict["split_tracknumbers"], trackid_real, 0)
 
     # Ending status
     out_endbasetime = np.full(numtracks, np.nan, dtype=np.float64)
@@ -967,105 +1136,58 @@ def get_track_startend_status(
     out_endmerge_timeindex = np.full(numtracks, fillval, dtype=np.int32)
     out_endmerge_cloudnumber = np.full(numtracks, fillval, dtype=np.int32)
 
-    # Loop over each track
-    for itrack in range(0, numtracks):
-
-        # Make sure the track length is < max_trackduration
-        # so array access would not be out of bounds
-        if (out_tracklength[itrack] > 0) & \
-                (out_tracklength[itrack] < max_trackduration):
-
-            # Get the end basetime
-            out_endbasetime[itrack] = out_dict["base_time"][
-                itrack, out_tracklength[itrack] - 1
-            ]
-            # Get the status at the last time step of the track
-            out_endstatus[itrack] = np.copy(
-                out_dict["track_status"][itrack, out_tracklength[itrack] - 1]
-            )
-            out_endmerge_tracknumber[itrack] = np.copy(
-                out_dict["merge_tracknumbers"][
-                    itrack, out_tracklength[itrack] - 1
-                ]
+    # Make sure the track length is < max_trackduration
+    # so array access would not be out of bounds
+    itracks = np.where((out_tracklength > 0) & (out_tracklength < max_trackduration))[0]
+    endidx = out_tracklength[itracks] - 1
+    # Get the end basetime, status and merge tracknumber at the last time step of the track
+    out_endbasetime[itracks] = get_sparse_values(out_dict["base_time"], itracks, endidx)
+    out_endstatus[itracks] = get_sparse_values(out_dict["track_status"], itracks, endidx)
+    out_endmerge_tracknumber[itracks] = get_sparse_values(out_dict["merge_tracknumbers"], itracks, endidx)
+
+    # Sorted (track, basetime) keys to match times with the tracks it merges with or splits from
+    time_keys = sort_track_times(out_dict["base_time"])
+
+    # If end merge tracknumber exists, this track ends by merge
+    imerge = itracks[out_endmerge_tracknumber[itracks] >= 0]
+    if len(imerge) > 0:
+        # Get the track number it merges with, -1 convert to track index
+        imerge_idx = out_endmerge_tracknumber[imerge] - 1
+        # Find the closest time matching the time when merging occurs
+        # If the time difference is < min_dt_thresh, consider it the same
+        match_timeidx, match_dt = match_track_times(time_keys, imerge_idx, out_endbasetime[imerge])
+        nomatch = ~(match_dt < min_dt_thresh)
+        if np.any(nomatch):
+            itrack = imerge[nomatch][0]
+            logger.debug(
+                f"Error: track {itrack} has no matching time in the track it merges with!"
             )
+            sys.exit(itrack)
+        # The time to connect to the track it merges with should be 1 time step after
+        valid = (match_timeidx + 1) < max_trackduration
+        if np.any(~valid):
+            logger.debug(f"Merge time occur after track ends??")
+        out_endmerge_timeindex[imerge[valid]] = match_timeidx[valid] + 1
+        out_endmerge_cloudnumber[imerge[valid]] = get_sparse_values(
+            out_dict["cloudnumber"], imerge_idx[valid], match_timeidx[valid] + 1,
+        )
 
-            # If end merge tracknumber exists, this track ends by merge
-            if out_endmerge_tracknumber[itrack] >= 0:
-                # Get the track number if merges with, -1 convert to track index
-                imerge_idx = out_endmerge_tracknumber[itrack] - 1
-                # Get all the basetime for the track it merges with
-                ibasetime = out_dict["base_time"][
-                            imerge_idx, 0: out_tracklength[imerge_idx]
-                            ].data
-
-                # Find the closest time matching the time when merging occurs
-                # If the time difference is < min_dt_thresh, consider it the same
-                dt = np.abs(ibasetime - out_endbasetime[itrack])
-                if np.nanmin(dt) < min_dt_thresh:
-                    match_timeidx = np.nanargmin(dt)
-                    #  The time to connect to the track it merges with should be 1 time step after
-                    if ((match_timeidx + 1) >= 0) & (
-                            (match_timeidx + 1) < max_trackduration
-                    ):
-                        out_endmerge_timeindex[itrack] = match_timeidx + 1
-                        out_endmerge_cloudnumber[
-                            itrack
-                        ] = out_dict["cloudnumber"][imerge_idx, match_timeidx + 1]
-                    else:
-                        logger.debug(f"Merge time occur after track ends??")
-                else:
-                    # import pdb; pdb.set_trace()
-                    logger.debug(
-                        f"Error: track {itrack} has no matching time in the track it merges with!"
-                    )
-                    # import pdb; pdb.set_trace()
-                    sys.exit(itrack)
-
-            # If start split tracknumber exists, this track starts from a split
-            if out_startsplit_tracknumber[itrack] >= 0:
-                # Get the tracknumber it splits from, -1 to convert to track index
-                isplit_idx = out_startsplit_tracknumber[itrack] - 1
-                # Get all the basetime for the track it splits from
-                ibasetime = out_dict["base_time"][
-                            isplit_idx, 0: out_tracklength[isplit_idx]
-                            ].data
-
-                # Find the time index matching the time when splitting occurs
-                # match_timeidx = np.where(ibasetime == out_startbasetime[itrack])[0]
-
-                # Find the closest time matching the time when merging occurs
-                # If the time difference is < min_dt_thresh, consider it the same
-                dt = np.abs(ibasetime - out_startbasetime[itrack])
-                if np.nanmin(dt) < min_dt_thresh:
-                    match_timeidx = np.nanargmin(dt)
-
-                    # Modified by Zhixiao: If there is no overlap time between split and reference tracks,
-                    # we test whether the reference cell end time is a time step earlier than the split cell initiation.
-                    # We take this as a resonable split, because the referecence cell can merge with other cells
-                    # after the split moment.
-                    # if len(match_timeidx) == 0:
-                    #     # Zhixiao
-                    #     match_timeidx = np.where(ibasetime == ibasetime[len(ibasetime) - 1])[0]
-                    #     if len(match_timeidx) == 1:
-                    #         match_timeidx = match_timeidx + 1
-                    #         logger.debug(
-                    #             f"Note: Track {itrack} splits from transient parent cloud."
-                    #         )
-
-                    # if len(match_timeidx) == 1:
-                    # The time to connect to the track it splits from should be 1 time step prior
-                    if (match_timeidx - 1) >= 0:
-                        out_startsplit_timeindex[itrack] = match_timeidx - 1
-                        out_startsplit_cloudnumber[
-                            itrack
-                        ] = out_dict["cloudnumber"][isplit_idx, match_timeidx - 1]
-                    else:
-                        logger.debug(f"Split time occur before track starts??")
-                    # else:
-                    #     logger.debug(
-                    #         f"Error: track {itrack} has no matching time in the track it splits from!"
-                    #     )
-                    #     sys.exit(itrack)
+    # If start split tracknumber exists, this track starts from a split
+    isplit = itracks[out_startsplit_tracknumber[itracks] >= 0]
+    if len(isplit) > 0:
+        # Get the tracknumber it splits from, -1 to convert to track index
+        isplit_idx = out_startsplit_tracknumber[isplit] - 1
+        # Find the closest time matching the time when splitting occurs
+        # If the time difference is < min_dt_thresh, consider it the same
+        match_timeidx, match_dt = match_track_times(time_keys, isplit_idx, out_startbasetime[isplit])
+        # The time to connect to the track it splits from should be 1 time step prior
+        valid = (match_dt < min_dt_thresh) & ((match_timeidx - 1) >= 0)
+        if np.any((match_dt < min_dt_thresh) & ~valid):
+            logger.debug(f"Split time occur before track starts??")
+        out_startsplit_timeindex[isplit[valid]] = match_timeidx[valid] - 1
+        out_startsplit_cloudnumber[isplit[valid]] = get_sparse_values(
+            out_dict["cloudnumber"], isplit_idx[valid], match_timeidx[valid] - 1,
+        )
 
     # Add new variables to the dictionary
     out_dict["start_status"] = out_startstatus
@@ -1134,4 +1256,107 @@ def get_track_startend_status(
         "units": "unitless",
         "_FillValue": fillval,
     }
-    return (out_dict, out_dict_attrs)
\ No newline at end of file
+    return (out_dict, out_dict_attrs)
+
+def get_sparse_values(sparse_array, track_idx, time_idx):
+    """
+    Get values from a sparse track statistics array at given track and time indices.
+
+    Args:
+        sparse_array: scipy.sparse.csr_matrix
+            Sparse array [tracks, times].
+        track_idx: numpy array
+            Track indices.
+        time_idx: numpy array or int
+            Time indices.
+
+    Returns:
+        values: numpy array
+            Values at each (track, time) index (0 if not stored).
+    """
+    time_idx = np.broadcast_to(time_idx, np.shape(track_idx))
+    if len(track_idx) == 0:
+        return np.array([], dtype=sparse_array.dtype)
+    values = np.asarray(sparse_array[track_idx, time_idx]).ravel()
+    return values
+
+
+def sort_track_times(base_time):
+    """
+    Sort the base time of each track by (track, base time) keys to match times between tracks.
+
+    Args:
+        base_time: scipy.sparse.csr_matrix
+            Sparse base time array [tracks, times].
+
+    Returns:
+        time_keys: dictionary
+            Dictionary containing the sorted keys, and the track index, time index,
+            base time of each key, and the unique base times.
+    """
+    coo = base_time.tocoo()
+    valid = ~np.isnan(coo.data)
+    row = coo.row[valid].astype(np.int64)
+    col = coo.col[valid]
+    basetime = coo.data[valid]
+    # Rank of each base time, a key for each track is in [track * (ntimes + 1), (track + 1) * (ntimes + 1))
+    unique_times, time_rank = np.unique(basetime, return_inverse=True)
+    keys = row * (len(unique_times) + 1) + time_rank
+    # Keep the first time index for the same base time within a track
+    order = np.lexsort((col, keys))
+    time_keys = {
+        "keys": keys[order],
+        "track_idx": row[order],
+        "time_idx": col[order],
+        "basetime": basetime[order],
+        "unique_times": unique_times,
+    }
+    return time_keys
+
+
+def match_track_times(time_keys, track_idx, basetime):
+    """
+    Find the time index of the closest base time in other tracks.
+
+    The first time index is returned if there are multiple closest times, same as np.nanargmin.
+
+    Args:
+        time_keys: dictionary
+            Sorted (track, base time) keys from sort_track_times.
+        track_idx: numpy array
+            Track index to match with.
+        basetime: numpy array
+            Base time to match.
+
+    Returns:
+        match_timeidx: numpy array
+            Time index of the closest base time in each track.
+        match_dt: numpy array
+            Absolute time difference to the closest base time (NaN if the track has no base time).
+    """
+    keys = time_keys["keys"]
+    nkeys = len(keys)
+    if nkeys == 0:
+        return (np.zeros(len(track_idx), dtype=int), np.full(len(track_idx), np.nan))
+    track_idx = np.asarray(track_idx, dtype=np.int64)
+    unique_times = time_keys["unique_times"]
+    query_keys = track_idx * (len(unique_times) + 1) + np.searchsorted(unique_times, basetime, side="left")
+    pos = np.searchsorted(keys, query_keys, side="left")
+
+    # Closest base time at or after the query time
+    iafter = np.minimum(pos, nkeys - 1)
+    has_after = (pos < nkeys) & (time_keys["track_idx"][iafter] == track_idx)
+    dt_after = np.where(has_after, time_keys["basetime"][iafter] - basetime, np.nan)
+    # Closest base time before the query time (first time index with that base time)
+    ibefore = np.maximum(pos - 1, 0)
+    has_before = (pos > 0) & (time_keys["track_idx"][ibefore] == track_idx)
+    ibefore = np.searchsorted(keys, keys[ibefore], side="left")
+    dt_before = np.where(has_before, basetime - time_keys["basetime"][ibefore], np.nan)
+
+    timeidx_after = time_keys["time_idx"][iafter]
+    timeidx_before = time_keys["time_idx"][ibefore]
+    use_before = has_before & (~has_after | (dt_before < dt_after) |
+                               ((dt_before == dt_after) & (timeidx_before < timeidx_after)))
+    match_timeidx = np.where(use_before, timeidx_before, timeidx_after)
+    match_dt = np.where(use_before, dt_before, dt_after)
+    return (match_timeidx, match_dt)
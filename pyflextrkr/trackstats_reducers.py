@@ -0,0 +1,308 @@
+import numpy as np
+
+# Registry of per-feature statistics reducers: {reducer name: function}
+reducer_registry = {}
+
+
+def register_reducer(name):
+    """
+    Decorator to register a per-feature statistics reducer.
+
+    A reducer is called as reducer(get_values, seg, field) and returns one value per pixel segment, where
+    get_values(varname) returns the values of a pixel file variable in the pre-sorted pixel order,
+    seg is the pixel segments from pre_sort_segments, and field is the config entry of the statistic.
+
+    Args:
+        name: string
+            Reducer name used in config.
+
+    Returns:
+        decorator: function
+            Decorator registering the reducer function.
+    """
+    def decorator(func):
+        reducer_registry[name] = func
+        return func
+    return decorator
+
+
+def sort_by_segment(data, seg):
+    """
+    Get 2D image values in the pre-sorted pixel order.
+
+    Args:
+        data: numpy array
+            2D image array from pixel file.
+        seg: dictionary
+            Pixel segments from pre_sort_segments.
+
+    Returns:
+        values: numpy array
+            1D values sorted by cloudnumber.
+    """
+    return np.ravel(data)[seg["ast"]]
+
+
+def segment_nanmean(values, seg):
+    """
+    Mean of each pixel segment ignoring NaN.
+
+    Args:
+        values: numpy array
+            1D values in the pre-sorted pixel order.
+        seg: dictionary
+            Pixel segments from pre_sort_segments.
+
+    Returns:
+        seg_mean: numpy array
+            Mean of each unique cloudnumber (NaN if all values are NaN).
+    """
+    valid = ~np.isnan(values)
+    seg_sum = np.add.reduceat(np.where(valid, values, 0).astype(np.float64), seg["starts"])
+    seg_count = np.add.reduceat(valid.astype(np.int64), seg["starts"])
+    with np.errstate(invalid="ignore", divide="ignore"):
+        seg_mean = seg_sum / seg_count
+    return seg_mean
+
+
+def segment_nanmin(values, seg):
+    """
+    Minimum of each pixel segment ignoring NaN.
+
+    Args:
+        values: numpy array
+            1D values in the pre-sorted pixel order.
+        seg: dictionary
+            Pixel segments from pre_sort_segments.
+
+    Returns:
+        seg_min: numpy array
+            Minimum of each unique cloudnumber (NaN if all values are NaN).
+    """
+    return np.fmin.reduceat(values, seg["starts"])
+
+
+def segment_nanmax(values, seg):
+    """
+    Maximum of each pixel segment ignoring NaN.
+
+    Args:
+        values: numpy array
+            1D values in the pre-sorted pixel order.
+        seg: dictionary
+            Pixel segments from pre_sort_segments.
+
+    Returns:
+        seg_max: numpy array
+            Maximum of each unique cloudnumber (NaN if all values are NaN).
+    """
+    return np.fmax.reduceat(values, seg["starts"])
+
+
+def segment_nanargmin(values, seg):
+    """
+    Position of the minimum of each pixel segment ignoring NaN.
+
+    Args:
+        values: numpy array
+            1D values in the pre-sorted pixel order.
+        seg: dictionary
+            Pixel segments from pre_sort_segments.
+
+    Returns:
+        seg_argmin: numpy array
+            Position in the pre-sorted order of the first minimum of each unique cloudnumber
+            (-1 if all values are NaN).
+    """
+    nvalues = len(values)
+    seg_counts = np.diff(np.append(seg["starts"], nvalues))
+    seg_min = np.repeat(segment_nanmin(values, seg), seg_counts)
+    position = np.where(values == seg_min, np.arange(nvalues), nvalues)
+    seg_argmin = np.minimum.reduceat(position, seg["starts"])
+    seg_argmin[seg_argmin == nvalues] = -1
+    return seg_argmin
+
+
+def segment_nansum(values, seg):
+    """
+    Sum of each pixel segment ignoring NaN.
+
+    Args:
+        values: numpy array
+            1D values in the pre-sorted pixel order.
+        seg: dictionary
+            Pixel segments from pre_sort_segments.
+
+    Returns:
+        seg_sum: numpy array
+            Sum of each unique cloudnumber.
+    """
+    valid = ~np.isnan(values)
+    return np.add.reduceat(np.where(valid, values, 0).astype(np.float64), seg["starts"])
+
+
+def segment_nanpercentile(values, seg, q):
+    """
+    Percentile of each pixel segment ignoring NaN, with linear interpolation as np.nanpercentile.
+
+    Args:
+        values: numpy array
+            1D values in the pre-sorted pixel order.
+        seg: dictionary
+            Pixel segments from pre_sort_segments.
+        q: float
+            Percentile in [0, 100].
+
+    Returns:
+        seg_percentile: numpy array
+            Percentile of each unique cloudnumber (NaN if all values are NaN).
+    """
+    nvalues = len(values)
+    starts = seg["starts"]
+    seg_counts = np.diff(np.append(starts, nvalues))
+    seg_id = np.repeat(np.arange(len(starts)), seg_counts)
+    # Sort values within each segment, NaN are sorted to the end of the segment
+    values_sorted = values[np.lexsort((values, seg_id))].astype(np.float64)
+    nvalid = np.add.reduceat((~np.isnan(values_sorted)).astype(np.int64), starts)
+    rank = q / 100. * np.maximum(nvalid - 1, 0)
+    ilow = np.floor(rank).astype(np.int64)
+    ihigh = np.ceil(rank).astype(np.int64)
+    vlow = values_sorted[starts + ilow]
+    vhigh = values_sorted[starts + ihigh]
+    seg_percentile = vlow + (vhigh - vlow) * (rank - ilow)
+    seg_percentile[nvalid == 0] = np.nan
+    return seg_percentile
+
+
+@register_reducer("mean")
+def reduce_mean(get_values, seg, field):
+    return segment_nanmean(get_values(field["varname"]), seg)
+
+
+@register_reducer("max")
+def reduce_max(get_values, seg, field):
+    return segment_nanmax(get_values(field["varname"]), seg)
+
+
+@register_reducer("min")
+def reduce_min(get_values, seg, field):
+    return segment_nanmin(get_values(field["varname"]), seg)
+
+
+@register_reducer("sum")
+def reduce_sum(get_values, seg, field):
+    return segment_nansum(get_values(field["varname"]), seg)
+
+
+@register_reducer("percentile")
+def reduce_percentile(get_values, seg, field):
+    return segment_nanpercentile(get_values(field["varname"]), seg, field["q"])
+
+
+@register_reducer("fraction_above")
+def reduce_fraction_above(get_values, seg, field):
+    values = get_values(field["varname"])
+    nabove = np.add.reduceat((values > field["threshold"]).astype(np.int64), seg["starts"])
+    nvalid = np.add.reduceat((~np.isnan(values)).astype(np.int64), seg["starts"])
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return nabove / nvalid
+
+
+@register_reducer("fraction_below")
+def reduce_fraction_below(get_values, seg, field):
+    values = get_values(field["varname"])
+    nbelow = np.add.reduceat((values < field["threshold"]).astype(np.int64), seg["starts"])
+    nvalid = np.add.reduceat((~np.isnan(values)).astype(np.int64), seg["starts"])
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return nbelow / nvalid
+
+
+@register_reducer("argmin_location")
+def reduce_argmin_location(get_values, seg, field):
+    # Value of the location variable (e.g., latitude) at the min value of the variable
+    location = get_values(field["location_varname"])
+    seg_argmin = segment_nanargmin(get_values(field["varname"]), seg)
+    out = np.full(len(seg_argmin), np.nan, dtype=np.float64)
+    out[seg_argmin >= 0] = location[seg_argmin[seg_argmin >= 0]]
+    return out
+
+
+@register_reducer("argmax_location")
+def reduce_argmax_location(get_values, seg, field):
+    # Value of the location variable (e.g., latitude) at the max value of the variable
+    location = get_values(field["location_varname"])
+    seg_argmax = segment_nanargmin(-get_values(field["varname"]).astype(np.float64), seg)
+    out = np.full(len(seg_argmax), np.nan, dtype=np.float64)
+    out[seg_argmax >= 0] = location[seg_argmax[seg_argmax >= 0]]
+    return out
+
+
+def calc_reducer_stats(
+        fields,
+        ds,
+        segments,
+        itracks,
+        fillval_f,
+):
+    """
+    Calculate config-declared statistics of track features in one grouped pass over the pre-sorted pixels.
+
+    Each variable is sorted once per region and shared by all reducers using it.
+
+    Args:
+        fields: list
+            List of statistics from config, each a dictionary containing:
+            name: output variable name,
+            varname: pixel file variable name,
+            reducer: reducer name in reducer_registry,
+            region: (optional) pixel segments to reduce over (default: 'feature'),
+            long_name, units: (optional) output variable attributes,
+            other reducer parameters (e.g., q for percentile, threshold for fraction_above).
+        ds: Xarray Dataset
+            Pixel file dataset.
+        segments: dictionary
+            Pixel segments of each region from pre_sort_segments.
+        itracks: numpy array
+            Track indices with feature pixels.
+        fillval_f: float
+            Default fill value for float arrays.
+
+    Returns:
+        out_dict_extra: dictionary
+            Output variable dictionary.
+        out_dict_attrs_extra: dictionary
+            Output variable attributes dictionary.
+    """
+    numtracks = len(segments["feature"]["npix"])
+    sorted_values = {}
+
+    def get_sorted(region, varname):
+        if (region, varname) not in sorted_values:
+            sorted_values[(region, varname)] = sort_by_segment(ds[varname].squeeze().values, segments[region])
+        return sorted_values[(region, varname)]
+
+    out_dict_extra = {}
+    out_dict_attrs_extra = {}
+    for field in fields:
+        region = field.get("region", "feature")
+        seg = segments[region]
+        reducer = reducer_registry[field["reducer"]]
+        seg_values = reducer(lambda varname: get_sorted(region, varname), seg, field)
+        # Tracks with pixels in the region
+        it = itracks[seg["npix"][itracks] > 0]
+        out_values = np.full(numtracks, fillval_f, dtype=np.float32)
+        out_values[it] = seg_values[seg["segment"][it]]
+        out_dict_extra[field["name"]] = out_values
+
+        # Get attributes from the pixel file variable
+        varname = field.get("location_varname", field["varname"])
+        if field["reducer"].startswith("fraction"):
+            units = "unitless"
+        else:
+            units = ds[varname].attrs.get("units", "unitless")
+        out_dict_attrs_extra[field["name"]] = {
+            "long_name": field.get("long_name", f"{field['reducer']} of {field['varname']} in {region} area"),
+            "units": field.get("units", units),
+            "_FillValue": fillval_f,
+        }
+    return out_dict_extra, out_dict_attrs_extra